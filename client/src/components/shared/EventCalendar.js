@@ -51,7 +51,8 @@ const EventCalendar = ({
               
               // Process events data
               const customEvents = eventsData.map(event => ({
-                id: `event-${event.id}`,
+                // Occurrences of a recurring event share its id
+                id: `event-${event.occurrence_key || event.id}`,
                 title: event.title,
                 start: new Date(event.start_date),
                 end: event.end_date ? new Date(event.end_date) : new Date(event.start_date),
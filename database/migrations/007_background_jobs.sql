@@ -0,0 +1,23 @@
+-- Migration: 007_background_jobs.sql
+-- Created: 2026-10-19
+-- Description: Persistent state of background jobs (event generation, rule processing)
+
+-- Create jobs table
+CREATE TABLE IF NOT EXISTS public.jobs (
+    id VARCHAR(32) PRIMARY KEY, -- Generated by the job runner
+    job_type VARCHAR(100) NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued', -- queued, running, succeeded, failed, cancelled
+    payload JSONB,
+    progress INTEGER DEFAULT 0,
+    total INTEGER,
+    message TEXT,
+    result JSONB,
+    error TEXT,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    started_at TIMESTAMPTZ,
+    finished_at TIMESTAMPTZ
+);
+
+-- Create indexes for better performance
+CREATE INDEX IF NOT EXISTS jobs_status_idx ON public.jobs (status);
+CREATE INDEX IF NOT EXISTS jobs_created_at_idx ON public.jobs (created_at);
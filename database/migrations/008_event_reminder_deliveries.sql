@@ -0,0 +1,18 @@
+-- Migration: 008_event_reminder_deliveries.sql
+-- Created: 2026-10-19
+-- Description: Delivery state of event reminders, so restarts never send a reminder twice
+
+-- Create event_reminder_deliveries table
+CREATE TABLE IF NOT EXISTS public.event_reminder_deliveries (
+    id SERIAL PRIMARY KEY,
+    reminder_key VARCHAR(100) NOT NULL UNIQUE, -- <event id>:<occurrence date>:<notify_days_before>
+    event_id INTEGER REFERENCES public.events(id) ON DELETE CASCADE,
+    occurrence_start TIMESTAMPTZ,
+    remind_at TIMESTAMPTZ,
+    status VARCHAR(20) DEFAULT 'notified', -- notified, emailed, email_failed
+    delivered_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- Create indexes for better performance
+CREATE INDEX IF NOT EXISTS event_reminder_deliveries_event_id_idx ON public.event_reminder_deliveries (event_id);
+CREATE INDEX IF NOT EXISTS events_notify_idx ON public.events (notify) WHERE notify = TRUE;
@@ -0,0 +1,6 @@
+-- Migration: 009_photo_derivatives.sql
+-- Created: 2026-10-19
+-- Description: Resized renditions of uploaded photos
+
+-- {"thumbnail": {"webp": url, "jpeg": url}, "medium": {...}, "large": {...}}
+ALTER TABLE public.photos ADD COLUMN IF NOT EXISTS derivatives JSONB;
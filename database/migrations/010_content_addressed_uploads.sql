@@ -0,0 +1,12 @@
+-- Migration: 010_content_addressed_uploads.sql
+-- Created: 2026-10-19
+-- Description: SHA-256 of the stored content on every row that references an upload
+
+ALTER TABLE public.photos ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64);
+ALTER TABLE public.documents ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64);
+ALTER TABLE public.file_uploads ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64);
+
+-- Reference counts are row counts per hash
+CREATE INDEX IF NOT EXISTS photos_content_hash_idx ON public.photos (content_hash);
+CREATE INDEX IF NOT EXISTS documents_content_hash_idx ON public.documents (content_hash);
+CREATE INDEX IF NOT EXISTS file_uploads_content_hash_idx ON public.file_uploads (content_hash);
@@ -0,0 +1,38 @@
+-- Migration: 011_cover_photo_function.sql
+-- Created: 2026-10-19
+-- Description: Set or clear an entity's cover photo in one transaction
+
+-- Flips is_cover on the entity's photos and writes the parent's cover_photo.
+-- p_photo_id NULL leaves the entity without a cover.
+CREATE OR REPLACE FUNCTION public.set_cover_photo(
+    p_related_type TEXT,
+    p_related_id INTEGER,
+    p_photo_id INTEGER
+) RETURNS VOID AS $$
+DECLARE
+    v_url TEXT;
+BEGIN
+    -- Only the rows whose flag changes are written
+    UPDATE public.photos
+       SET is_cover = COALESCE(id = p_photo_id, FALSE)
+     WHERE related_type = p_related_type
+       AND related_id = p_related_id
+       AND (is_cover OR id = p_photo_id);
+
+    IF p_photo_id IS NOT NULL THEN
+        SELECT url INTO v_url FROM public.photos WHERE id = p_photo_id;
+    END IF;
+
+    IF p_related_type = 'dog' THEN
+        UPDATE public.dogs SET cover_photo = v_url WHERE id = p_related_id;
+    ELSIF p_related_type = 'litter' THEN
+        UPDATE public.litters SET cover_photo = v_url WHERE id = p_related_id;
+    ELSIF p_related_type = 'puppy' THEN
+        UPDATE public.puppies SET cover_photo = v_url WHERE id = p_related_id;
+    END IF;
+END;
+$$ LANGUAGE plpgsql;
+
+-- At most one cover per entity, found without scanning its photos
+CREATE INDEX IF NOT EXISTS photos_cover_idx
+    ON public.photos (related_type, related_id) WHERE is_cover;
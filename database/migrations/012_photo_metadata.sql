@@ -0,0 +1,12 @@
+-- Migration: 012_photo_metadata.sql
+-- Created: 2026-10-19
+-- Description: Capture date, upright dimensions and perceptual hash of each photo
+
+ALTER TABLE public.photos ADD COLUMN IF NOT EXISTS taken_at TIMESTAMPTZ;
+ALTER TABLE public.photos ADD COLUMN IF NOT EXISTS width INTEGER;
+ALTER TABLE public.photos ADD COLUMN IF NOT EXISTS height INTEGER;
+-- 64-bit difference hash as 16 hex digits
+ALTER TABLE public.photos ADD COLUMN IF NOT EXISTS phash VARCHAR(16);
+
+-- Galleries sorted by capture date
+CREATE INDEX IF NOT EXISTS photos_taken_at_idx ON public.photos (related_type, related_id, taken_at);
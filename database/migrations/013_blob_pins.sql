@@ -0,0 +1,13 @@
+-- Migration: 013_blob_pins.sql
+-- Created: 2026-10-19
+-- Description: Blobs handed to an upload whose row is not written yet
+
+-- A pinned blob is not released or collected by any worker until its pin is
+-- removed or older than BLOB_PIN_MINUTES; the upload collector purges old pins.
+CREATE TABLE IF NOT EXISTS public.blob_pins (
+    id SERIAL PRIMARY KEY,
+    content_hash VARCHAR(64) NOT NULL,
+    pinned_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS blob_pins_content_hash_idx ON public.blob_pins (content_hash);
@@ -0,0 +1,8 @@
+-- Migration: 014_photo_source_hash.sql
+-- Created: 2026-10-19
+-- Description: Hash of each photo as uploaded, so re-uploads of a normalised photo are deduplicated
+
+-- content_hash moves to the normalised blob when a photo is rewritten; source_hash keeps the original
+ALTER TABLE public.photos ADD COLUMN IF NOT EXISTS source_hash VARCHAR(64);
+
+CREATE INDEX IF NOT EXISTS photos_source_hash_idx ON public.photos (source_hash);
@@ -2,73 +2,73 @@
 
 """
 Utility script to generate events for all existing entities in the database.
-This should be run once after setting up the events system to ensure all 
-existing data has corresponding events.
+This should be run once after setting up the events system, and can be re-run
+at any time: events that already exist are never created twice.
+
+The script talks to the database directly (no running API server needed),
+generates litter milestones in parallel batches and records its progress in a
+checkpoint file so an interrupted run can be resumed.
 
 Usage:
-python generate_all_events.py
+python generate_all_events.py [--workers 4] [--batch-size 50]
+                              [--checkpoint FILE] [--resume]
+                              [--litters-only | --birthdays-only] [--dry-run]
 """
 
-import requests
-import sys
+import argparse
 import os
-import json
+import sys
 import time
 
-def main():
-    # Set up base URL for the API
-    base_url = os.environ.get('API_URL', 'http://localhost:5000/api')
+# Allow imports from the server package
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from server.database.supabase_db import SupabaseDatabase
+from server.utils.event_rebuild import EventRebuilder
+
+DEFAULT_CHECKPOINT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.generate_all_events.checkpoint.json')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate litter milestone and birthday events for all entities")
+    parser.add_argument('--workers', type=int, default=4, help="Parallel litter batches (default: 4)")
+    parser.add_argument('--batch-size', type=int, default=50, help="Litters per batch and bulk insert (default: 50)")
+    parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT, help="Checkpoint file for resuming")
+    parser.add_argument('--resume', action='store_true', help="Skip litters completed by a previous run")
+    parser.add_argument('--dry-run', action='store_true', help="Report what would be created without writing")
+    scope = parser.add_mutually_exclusive_group()
+    scope.add_argument('--litters-only', action='store_true', help="Only generate litter events")
+    scope.add_argument('--birthdays-only', action='store_true', help="Only generate birthday events")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
     
-    print(f"Using API URL: {base_url}")
     print("Generating events for all existing entities...")
+    started = time.monotonic()
     
-    # Generate birthday events for all dogs
     try:
-        print("\nGenerating birthday events for all dogs...")
-        response = requests.post(f"{base_url}/events/generate/birthdays")
-        if response.status_code == 200:
-            data = response.json()
-            print(f"Success! Generated {len(data.get('events', []))} birthday events")
-        else:
-            print(f"Error generating birthday events: {response.status_code}")
-            print(response.text)
+        rebuilder = EventRebuilder(
+            SupabaseDatabase(),
+            workers=args.workers,
+            batch_size=args.batch_size,
+            checkpoint_path=args.checkpoint,
+            resume=args.resume,
+            dry_run=args.dry_run
+        )
+        stats = rebuilder.run(litters_only=args.litters_only, birthdays_only=args.birthdays_only)
     except Exception as e:
-        print(f"Exception generating birthday events: {str(e)}")
+        print(f"Event generation failed: {str(e)}")
+        print("Re-run with --resume to continue from the last checkpoint.")
+        return 1
     
-    # Generate events for all litters
-    try:
-        print("\nFetching all litters...")
-        litters_response = requests.get(f"{base_url}/litters/")
-        if litters_response.status_code == 200:
-            litters = litters_response.json()
-            print(f"Found {len(litters)} litters")
-            
-            # Generate events for each litter
-            for litter in litters:
-                litter_id = litter.get('id')
-                litter_name = litter.get('litter_name') or f"#{litter_id}"
-                print(f"Generating events for litter {litter_name}...")
-                
-                try:
-                    event_response = requests.post(f"{base_url}/events/generate/litter/{litter_id}")
-                    if event_response.status_code == 200:
-                        event_data = event_response.json()
-                        print(f"  Success! Generated {len(event_data.get('events', []))} events")
-                    else:
-                        print(f"  Error generating events for litter {litter_id}: {event_response.status_code}")
-                        print(f"  {event_response.text}")
-                except Exception as e:
-                    print(f"  Exception generating events for litter {litter_id}: {str(e)}")
-                
-                # Add a small delay to avoid overwhelming the server
-                time.sleep(0.2)
-        else:
-            print(f"Error fetching litters: {litters_response.status_code}")
-            print(litters_response.text)
-    except Exception as e:
-        print(f"Exception fetching litters: {str(e)}")
+    for failure in stats['failed']:
+        print(f"  Litter {failure['litter_id']}: {failure['error']}")
     
-    print("\nEvent generation complete!")
+    print(f"\nEvent generation complete in {time.monotonic() - started:.1f}s!")
+    return 0
+
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
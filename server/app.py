@@ -8,7 +8,7 @@ import os
 import sys
 import logging
 import traceback
-from flask import Flask, jsonify, send_from_directory, redirect, url_for, request
+from flask import Flask, jsonify, request
 from flask_cors import CORS  # Import CORS
 from werkzeug.exceptions import HTTPException, InternalServerError, NotFound
 
@@ -16,7 +16,6 @@ from werkzeug.exceptions import HTTPException, InternalServerError, NotFound
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from server.database.supabase_db import SupabaseDatabase
-from server.config import debug_log
 
 # Import blueprints
 from server.dogs import create_dogs_bp
@@ -29,6 +28,7 @@ from server.puppies import create_puppies_bp
 from server.photos import create_photos_bp
 from server.files import create_files_bp
 from server.events import create_events_bp
+from server.jobs import create_jobs_bp
 from server.search import create_search_bp
 from server.customers import create_customers_bp
 from server.applications import applications_bp
@@ -41,6 +41,15 @@ from server.uploads import create_uploads_bp
 from server.contracts import create_contracts_bp
 from server.application_forms import create_application_forms_bp
 from server.customer_leads import create_customer_leads_bp
+from server.utils.due_date_scheduler import get_due_date_scheduler
+from server.utils.event_calendar import get_event_calendar
+from server.utils.heat_prediction import get_heat_predictor
+from server.utils.jobs import get_job_runner
+from server.utils.notification_dispatcher import get_notification_dispatcher
+from server.utils.email_service import EmailService
+from server.utils.image_derivatives import pillow_available
+from server.utils.upload_serving import serve_stored
+from server.storage import get_storage
 
 # Try importing pages blueprint with exception handling
 try:
@@ -79,6 +88,43 @@ def create_app():
     # Register blueprints with error handling
     register_blueprints(app, db)
     
+    # Load the due-date scheduler once so dashboards don't re-scan the health tables
+    try:
+        get_due_date_scheduler(db).load()
+    except Exception as e:
+        app.logger.error(f"Due-date scheduler initialization error: {e}")
+    
+    # Index calendar events; range queries fall back to the database until this succeeds
+    try:
+        get_event_calendar(db).load()
+    except Exception as e:
+        app.logger.error(f"Event calendar initialization error: {e}")
+    
+    # Forecast every dam's next heat once; the heats endpoints keep the forecasts current
+    try:
+        get_heat_predictor(db).load()
+    except Exception as e:
+        app.logger.error(f"Heat predictor initialization error: {e}")
+    
+    # Pick up jobs queued before the last restart; handlers are registered by the blueprints
+    try:
+        get_job_runner(db).recover()
+    except Exception as e:
+        app.logger.error(f"Background job recovery error: {e}")
+    
+    # Deliver event reminders from a background thread that sleeps until the next one is due
+    if os.environ.get('EVENT_REMINDERS_ENABLED', 'true').lower() == 'true':
+        try:
+            dispatcher = get_notification_dispatcher(db)
+            dispatcher.send_emails = EmailService.send_bulk
+            dispatcher.start(app)
+        except Exception as e:
+            app.logger.error(f"Event reminder dispatcher initialization error: {e}")
+    
+    # Without Pillow uploads still work, but photos are never normalised or resized
+    if not pillow_available():
+        app.logger.error("Pillow is not installed (see requirements.txt): photo normalisation and renditions are disabled")
+    
     # Register error handlers
     register_error_handlers(app)
     
@@ -151,20 +197,22 @@ def configure_logging(app):
 
 def setup_file_serving(app):
     """Setup static file serving with proper error handling"""
+    uploads_path = os.path.join(app.root_path, 'uploads')
+    os.makedirs(uploads_path, exist_ok=True)
+    
+    # Let a front proxy stream the bytes: nginx via X-Accel-Redirect, Apache/lighttpd via X-Sendfile
+    accel_prefix = os.environ.get('UPLOADS_ACCEL_REDIRECT') or None
+    if os.environ.get('UPLOADS_X_SENDFILE', 'false').lower() == 'true':
+        app.config['USE_X_SENDFILE'] = True
+    
+    # On a remote backend, /uploads redirects to presigned downloads
+    storage = get_storage("uploads")
+    
     @app.route('/uploads/<path:filename>')
     def serve_upload(filename):
         """Serve uploaded files"""
         try:
-            debug_log(f"Serving uploaded file: {filename}")
-            uploads_path = os.path.join(app.root_path, 'uploads')
-            if not os.path.exists(uploads_path):
-                os.makedirs(uploads_path, exist_ok=True)
-                
-            if not os.path.exists(os.path.join(uploads_path, filename)):
-                app.logger.warning(f"Requested file not found: {filename}")
-                return jsonify({"error": "File not found"}), 404
-                
-            return send_from_directory(uploads_path, filename)
+            return serve_stored(storage, uploads_path, filename, accel_prefix)
         except Exception as e:
             app.logger.error(f"Error serving file {filename}: {e}")
             return jsonify({"error": "Error serving file", "details": str(e)}), 500
@@ -173,10 +221,9 @@ def setup_file_serving(app):
     def serve_api_upload(filename):
         """Serve uploaded files through the API path"""
         try:
-            debug_log(f"Serving uploaded file through API path: {filename}")
-            return redirect(url_for('serve_upload', filename=filename))
+            return serve_stored(storage, uploads_path, filename, accel_prefix)
         except Exception as e:
-            app.logger.error(f"Error redirecting for file {filename}: {e}")
+            app.logger.error(f"Error serving file {filename}: {e}")
             return jsonify({"error": "Error serving file", "details": str(e)}), 500
 
 def register_blueprints(app, db):
@@ -192,10 +239,11 @@ def register_blueprints(app, db):
         (create_photos_bp(db), '/api/photos'),
         (create_files_bp(db), '/api/files'),
         (create_events_bp(db), '/api/events'),
+        (create_jobs_bp(db), '/api/jobs'),
         (create_search_bp(db), '/api/search'),
         (create_customers_bp(db), '/api/customers'),
         (applications_bp, ''),  # Uses its own URL prefix
-        (create_health_bp(), '/api/health'),
+        (create_health_bp(db), '/api/health'),
         (leads_bp, '/api/leads'),
         (messages_bp, '/api/messages'),
         (notifications_bp, '/api'),  # Changed from empty string to '/api'
@@ -0,0 +1,56 @@
+"""
+Per-table change counters.
+
+Every write made through the database layer bumps the counter of the table it
+touched. Readers that derive data from a set of tables (e.g. cached dashboard
+responses) compare the counters to tell whether anything changed without
+querying the database.
+"""
+
+import threading
+import time
+import uuid
+from typing import Dict, Iterable, Tuple
+
+
+class ChangeTracker:
+    """Thread-safe version counter and last-modified time per table"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions: Dict[str, int] = {}
+        self._modified: Dict[str, float] = {}
+        # Counters restart with the process, so versions are qualified by a boot id
+        self.boot_id = uuid.uuid4().hex[:12]
+        self.started_at = time.time()
+
+    def bump(self, *tables: str) -> None:
+        """Record a write to one or more tables"""
+        now = time.time()
+        with self._lock:
+            for table in tables:
+                self._versions[table] = self._versions.get(table, 0) + 1
+                self._modified[table] = now
+
+    def version(self, table: str) -> int:
+        with self._lock:
+            return self._versions.get(table, 0)
+
+    def snapshot(self, tables: Iterable[str]) -> Tuple[str, float]:
+        """
+        Return (stamp, last_modified) for a set of tables.
+
+        The stamp changes whenever any of the tables is written to;
+        last_modified is the time of the latest such write (or process start).
+        """
+        tables = sorted(set(tables))
+        with self._lock:
+            stamp = ",".join(f"{table}={self._versions.get(table, 0)}" for table in tables)
+            last_modified = max(
+                [self._modified.get(table, self.started_at) for table in tables] or [self.started_at]
+            )
+        return f"{self.boot_id}:{stamp}", last_modified
+
+
+# Shared by the database implementations and everything that reads the counters
+change_tracker = ChangeTracker()
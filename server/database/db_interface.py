@@ -4,8 +4,9 @@ This should be implemented by all database providers.
 """
 
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterable, Iterator, Optional
 from ..config import debug_log
+from ..utils.dates import to_datetime
 
 class DatabaseInterface(ABC):
     """Abstract base class for database operations"""
@@ -80,3 +81,76 @@ class DatabaseInterface(ABC):
     def delete(self, table: str, id: int) -> bool:
         """Delete a record by ID"""
         pass
+        
+    # Optional bulk operations. Providers should override these with a single
+    # round trip; the defaults fall back to the per-record methods above.
+    
+    def create_many(self, table: str, records: List[Dict[str, Any]], chunk_size: int = 500,
+                    on_conflict: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Create several records, returning the created rows.
+        
+        With on_conflict (a unique column), records whose value already exists
+        are skipped instead of failing the insert, and only the new rows are returned.
+        """
+        if on_conflict:
+            existing = {str(record.get(on_conflict))
+                        for record in self.find_in(table, on_conflict, [r.get(on_conflict) for r in records])}
+            records = [record for record in records if str(record.get(on_conflict)) not in existing]
+        return [self.create(table, record) for record in records]
+    
+    def update_where(self, table: str, filters: Dict[str, Any], data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Apply the same update to every record matching filters, returning the updated rows.
+        
+        Unlike update(), None values are written (as NULL).
+        """
+        return [self.update(table, record["id"], data)
+                for record in self.find_by_field_values(table, filters)]
+    
+    def find_in(self, table: str, field: str, values: Iterable[Any],
+                filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Find records whose field is one of values (and that match filters), in one query"""
+        wanted = {str(value) for value in values}
+        if not wanted:
+            return []
+        return [record for record in self.find_by_field_values(table, filters or {})
+                if str(record.get(field)) in wanted]
+    
+    def scan(self, table: str, page_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """
+        Yield every record of a table, reading page_size records at a time.
+        
+        For whole-table passes that must not miss rows to a provider's
+        response size limit.
+        """
+        yield from self.find_by_field_values(table, {})
+    
+    def call_function(self, name: str, params: Dict[str, Any], writes: tuple = ()) -> Any:
+        """
+        Call a stored database function (all of its statements run in one transaction).
+        
+        writes names the tables the function modifies. Providers without
+        stored functions raise NotImplementedError, and callers fall back to
+        the methods above.
+        """
+        raise NotImplementedError(f"Stored function {name} is not supported by this database")
+    
+    def find_overlapping(self, table: str, start_field: str, end_field: str,
+                         window_start: Any, window_end: Any,
+                         filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Find records whose [start_field, end_field] span overlaps the window.
+        
+        A record without an end value is treated as a point at its start.
+        """
+        window_start, window_end = to_datetime(window_start), to_datetime(window_end)
+        matches = []
+        for record in self.find_by_field_values(table, filters or {}):
+            start = to_datetime(record.get(start_field))
+            if start is None or start > window_end:
+                continue
+            end = to_datetime(record.get(end_field)) or start
+            if end >= window_start:
+                matches.append(record)
+        return matches
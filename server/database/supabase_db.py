@@ -4,8 +4,9 @@ Supabase database implementation for the database interface.
 
 import os
 from supabase import create_client, Client
-from typing import Dict, List, Any, Optional
+from typing import Dict, Iterable, Iterator, List, Any, Optional
 from .db_interface import DatabaseInterface
+from .change_tracker import change_tracker
 from ..config import debug_log
 import time
 from functools import wraps
@@ -159,6 +160,7 @@ class SupabaseDatabase(DatabaseInterface):
                 raise DatabaseError(f"Failed to create record in {table}")
                 
             print(f"SUPABASE DEBUG - Created record: {response.data[0]}")
+            change_tracker.bump(table)
             return response.data[0]
         except Exception as e:
             print(f"Error in create operation for table {table}: {str(e)}")
@@ -176,6 +178,7 @@ class SupabaseDatabase(DatabaseInterface):
             if not response.data or len(response.data) == 0:
                 raise DatabaseError(f"Failed to update record in {table} with id {id}")
                 
+            change_tracker.bump(table)
             return response.data[0]
         except Exception as e:
             print(f"Error in update operation for table {table}, id {id}: {str(e)}")
@@ -186,7 +189,133 @@ class SupabaseDatabase(DatabaseInterface):
         """Delete a record by ID"""
         try:
             response = self.supabase.table(table).delete().eq("id", id).execute()
+            change_tracker.bump(table)
             return True
         except Exception as e:
             print(f"Error in delete operation for table {table}, id {id}: {str(e)}")
             return False
+    
+    @retry_on_disconnect()
+    def create_many(self, table: str, records: List[Dict[str, Any]], chunk_size: int = 500,
+                    on_conflict: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Create several records with one insert per chunk (ON CONFLICT DO NOTHING with on_conflict)"""
+        if not records:
+            return []
+        
+        # PostgREST bulk inserts need every row to carry the same columns
+        columns = []
+        for record in records:
+            for key in record:
+                if key not in columns:
+                    columns.append(key)
+        rows = [{column: record.get(column) for column in columns} for record in records]
+        
+        created = []
+        try:
+            for start in range(0, len(rows), chunk_size):
+                chunk = rows[start:start + chunk_size]
+                if on_conflict:
+                    response = self.supabase.table(table).upsert(
+                        chunk, on_conflict=on_conflict, ignore_duplicates=True).execute()
+                else:
+                    response = self.supabase.table(table).insert(chunk).execute()
+                created.extend(response.data or [])
+            change_tracker.bump(table)
+            debug_log(f"Supabase: Created {len(created)} records in {table}")
+            return created
+        except Exception as e:
+            if created:
+                change_tracker.bump(table)
+            print(f"Error in create_many operation for table {table}: {str(e)}")
+            raise DatabaseError(str(e))
+    
+    @retry_on_disconnect()
+    def update_where(self, table: str, filters: Dict[str, Any], data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Update every record matching filters with a single statement"""
+        try:
+            response = self.supabase.table(table).update(data).match(filters).execute()
+            change_tracker.bump(table)
+            return response.data or []
+        except Exception as e:
+            print(f"Error in update_where operation for table {table}: {str(e)}")
+            raise DatabaseError(str(e))
+    
+    def find_in(self, table: str, field: str, values: Iterable[Any],
+                filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Find records with a single field=in.(...) query, read in pages past PostgREST's row cap"""
+        values = list(dict.fromkeys(values))
+        if not values:
+            return []
+        records, page_size = [], 1000
+        while True:
+            page = self._find_in_page(table, field, values, filters or {}, len(records), page_size)
+            records.extend(page)
+            if len(page) < page_size:
+                return records
+    
+    @retry_on_disconnect()
+    def _find_in_page(self, table: str, field: str, values: List[Any], filters: Dict[str, Any],
+                      start: int, page_size: int) -> List[Dict[str, Any]]:
+        try:
+            query = self.supabase.table(table).select("*").in_(field, values)
+            for key, value in filters.items():
+                query = query.eq(key, value)
+            return query.order("id").range(start, start + page_size - 1).execute().data or []
+        except Exception as e:
+            print(f"Error in find_in operation for table {table}: {str(e)}")
+            raise DatabaseError(str(e))
+    
+    def scan(self, table: str, page_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """Yield every record in id order, one page per request (PostgREST caps unpaged reads)"""
+        last_id = None
+        while True:
+            page = self._scan_page(table, last_id, page_size)
+            yield from page
+            if len(page) < page_size:
+                return
+            last_id = page[-1]["id"]
+    
+    @retry_on_disconnect()
+    def _scan_page(self, table: str, after_id: Any, page_size: int) -> List[Dict[str, Any]]:
+        try:
+            query = self.supabase.table(table).select("*")
+            if after_id is not None:
+                query = query.gt("id", after_id)
+            return query.order("id").limit(page_size).execute().data or []
+        except Exception as e:
+            print(f"Error in scan operation for table {table}: {str(e)}")
+            raise DatabaseError(str(e))
+    
+    @retry_on_disconnect()
+    def call_function(self, name: str, params: Dict[str, Any], writes: tuple = ()) -> Any:
+        """Call a Postgres function through PostgREST RPC"""
+        try:
+            response = self.supabase.rpc(name, params).execute()
+            if writes:
+                change_tracker.bump(*writes)
+            return response.data
+        except Exception as e:
+            print(f"Error calling database function {name}: {str(e)}")
+            raise DatabaseError(str(e))
+    
+    @retry_on_disconnect(max_retries=5, delay=2)
+    def find_overlapping(self, table: str, start_field: str, end_field: str,
+                         window_start: Any, window_end: Any,
+                         filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Find records overlapping the window, filtered server-side"""
+        window_start = window_start.isoformat() if hasattr(window_start, "isoformat") else window_start
+        window_end = window_end.isoformat() if hasattr(window_end, "isoformat") else window_end
+        try:
+            query = (
+                self.supabase.table(table)
+                .select("*")
+                .lte(start_field, window_end)
+                .or_(f"{end_field}.gte.{window_start},and({end_field}.is.null,{start_field}.gte.{window_start})")
+            )
+            for field, value in (filters or {}).items():
+                query = query.eq(field, value)
+            response = query.order(start_field).execute()
+            return response.data
+        except Exception as e:
+            print(f"Error in find_overlapping operation for table {table}: {str(e)}")
+            raise DatabaseError(str(e))
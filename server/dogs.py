@@ -5,24 +5,27 @@ Blueprint for all dog-related endpoints (CRUD + file uploads).
 """
 
 import os
-import uuid
 import tempfile
 from flask import Blueprint, request, jsonify, current_app, make_response
 from werkzeug.utils import secure_filename
 from datetime import datetime
-from server.supabase_client import supabase
 from server.database.supabase_db import SupabaseDatabase, DatabaseError
 from server.database.db_interface import DatabaseInterface
 from .config import debug_log
+from .utils.health_risk import get_health_risk_engine
+from .utils.blob_store import hash_stream, normalise_extension
+from .storage import StorageError, get_storage
 
 def create_dogs_bp(db: DatabaseInterface) -> Blueprint:
     dogs_bp = Blueprint("dogs_bp", __name__)
+    risk_engine = get_health_risk_engine(db)
 
     SUPABASE_URL = os.getenv("SUPABASE_URL")
     if not SUPABASE_URL:
         raise ValueError("Missing SUPABASE_URL in environment variables.")
-    # Derive domain from SUPABASE_URL (e.g., if SUPABASE_URL is "https://xyz.supabase.co")
-    domain = SUPABASE_URL.split("://")[-1]
+
+    # Dog form images; Supabase Storage unless STORAGE_BACKEND_DOG_IMAGES says otherwise
+    dog_images = get_storage("dog_images")
 
     def parse_int_field_silent(form, field):
         if field in form:
@@ -155,6 +158,7 @@ def create_dogs_bp(db: DatabaseInterface) -> Blueprint:
             
             # Create the dog using the abstracted db interface
             dog = db.create("dogs", data)
+            risk_engine.upsert_dog(dog)
             
             # Add CORS headers to response
             response = jsonify(dog)
@@ -180,6 +184,7 @@ def create_dogs_bp(db: DatabaseInterface) -> Blueprint:
             
             # Update the dog using the abstracted db interface
             updated_dog = db.update("dogs", dog_id, data)
+            risk_engine.upsert_dog(updated_dog)
             
             # Add CORS headers to response
             response = jsonify(updated_dog)
@@ -203,6 +208,7 @@ def create_dogs_bp(db: DatabaseInterface) -> Blueprint:
             
             # Delete the dog using the abstracted db interface
             db.delete("dogs", dog_id)
+            risk_engine.remove_dog(dog_id)
             
             # Add CORS headers to response
             response = jsonify({"message": f"Dog with ID {dog_id} deleted successfully"})
@@ -222,25 +228,26 @@ def create_dogs_bp(db: DatabaseInterface) -> Blueprint:
             return jsonify({"error": "No file uploaded"}), 400
 
         original_filename = secure_filename(file.filename)
-        unique_id = str(uuid.uuid4())[:8]
-        final_filename = f"{unique_id}_{original_filename}"
-        filepath = f"dog_images/{final_filename}"
 
+        # Hash while spooling so identical images map to the same storage object
         with tempfile.NamedTemporaryFile(delete=False) as tmp:
-            file.save(tmp.name)
+            content_hash, _size = hash_stream(file.stream, tmp)
             tmp_path = tmp.name
 
+        extension = normalise_extension(original_filename)
+        key = f"{content_hash}.{extension}" if extension else content_hash
+
         try:
-            upload_response = supabase.storage.from_("uploads").upload(filepath, tmp_path)
+            # The same content is already stored under this key
+            if not dog_images.exists(key):
+                dog_images.put_file(key, tmp_path, content_type=file.mimetype, move=True)
+        except StorageError as e:
+            return jsonify({"error": str(e)}), 400
         finally:
             if os.path.exists(tmp_path):
                 os.remove(tmp_path)
 
-        if upload_response.error:
-            return jsonify({"error": upload_response.error.message}), 400
-
-        file_url = f"https://{domain}/storage/v1/object/public/uploads/{filepath}"
-        return jsonify({"file_url": file_url})
+        return jsonify({"file_url": dog_images.url(key), "content_hash": content_hash})
 
     @dogs_bp.route('/full', methods=['GET', 'OPTIONS'])
     def get_dogs_with_full_details():
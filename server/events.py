@@ -6,13 +6,118 @@ Blueprint for managing calendar events and event rules.
 
 import json
 import datetime
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, make_response, Response, stream_with_context
 from server.database.db_interface import DatabaseInterface
 from .config import debug_log
+from .utils.event_calendar import get_event_calendar, VIEW_MONTH
+from .utils.event_generation import (
+    generate_litter_events as generate_missing_litter_events,
+    generate_birthday_events as generate_missing_birthday_events,
+)
+from .utils.rule_engine import get_rule_engine, compile_conditions, RuleConditionError
+from .utils.jobs import get_job_runner
+from .utils.notification_dispatcher import get_notification_dispatcher
+from .utils.ical import ICalRenderer, feed_window
+from .utils.heat_prediction import get_heat_predictor, forecast_event
+from .utils.response_cache import validators, is_not_modified, with_validators
 
 def create_events_bp(db: DatabaseInterface) -> Blueprint:
     events_bp = Blueprint("events_bp", __name__)
     
+    # Interval-indexed calendar used for date-range queries
+    event_calendar = get_event_calendar(db)
+    
+    # Compiled event_rules, cached until the table changes
+    rule_engine = get_rule_engine(db)
+    
+    # Reminder queue for events with notify=true
+    reminders = get_notification_dispatcher(db)
+    
+    # Rendered VEVENT blocks, reused across feed requests until an event changes
+    ical_renderer = ICalRenderer()
+    
+    # Background jobs for long-running generation and rule processing
+    job_runner = get_job_runner(db)
+    
+    # Cached next-heat forecasts, shown in calendar views
+    heat_predictor = get_heat_predictor(db)
+    
+    def index_created(events):
+        """Keep the calendar and reminder queue in sync with generated events"""
+        event_calendar.upsert_many(events)
+        reminders.upsert_many(events)
+    
+    def litter_events_job(payload, job):
+        result = generate_missing_litter_events(db, payload["litter_id"])
+        index_created(result["events"])
+        job.progress(1, 1)
+        return {"litter_id": payload["litter_id"], "created": result["created"], "skipped": result["skipped"]}
+    
+    def all_litters_events_job(payload, job):
+        litters = db.find_by_field_values("litters", {})
+        totals = {"litters": len(litters), "created": 0, "skipped": 0, "failed": []}
+        for done, litter in enumerate(litters, 1):
+            try:
+                result = generate_missing_litter_events(db, litter["id"])
+                index_created(result["events"])
+                totals["created"] += result["created"]
+                totals["skipped"] += result["skipped"]
+            except (LookupError, ValueError) as e:
+                totals["failed"].append({"litter_id": litter["id"], "error": str(e)})
+            job.progress(done, len(litters), f"Litter {litter['id']}")
+        return totals
+    
+    def birthday_events_job(payload, job):
+        dogs = db.find_by_field_values("dogs", {"status": "Active"})
+        result = generate_missing_birthday_events(db, dogs, progress=job.progress)
+        index_created(result["events"])
+        return {"created": result["created"], "migrated": result["migrated"], "skipped": result["skipped"]}
+    
+    def process_rules_job(payload, job):
+        entity = db.get(f"{payload['entity_type']}s", payload["entity_id"])
+        if not entity:
+            raise LookupError(f"{payload['entity_type'].capitalize()} with ID {payload['entity_id']} not found")
+        outcome = rule_engine.evaluate(payload["trigger_type"], payload["entity_type"], entity)
+        index_created(outcome["events"])
+        job.progress(1, 1)
+        return {"results": outcome["results"]}
+    
+    job_runner.register("generate_litter_events", litter_events_job)
+    job_runner.register("generate_all_litter_events", all_litters_events_job)
+    job_runner.register("generate_birthday_events", birthday_events_job)
+    job_runner.register("process_event_rules", process_rules_job)
+    
+    def wants_async():
+        return request.args.get('async', '').lower() in ('1', 'true', 'yes')
+    
+    def job_accepted(job):
+        """202 response pointing the client at the job status endpoint"""
+        return jsonify({
+            "job_id": job["id"],
+            "job_type": job["job_type"],
+            "status": job["status"],
+            "status_url": f"/api/jobs/{job['id']}"
+        }), 202
+    
+    def force_requested(data):
+        """Clients confirm a double booking with ?force=true or "force": true"""
+        force = data.pop('force', False) if isinstance(data, dict) else False
+        return bool(force) or request.args.get('force', '').lower() in ('1', 'true', 'yes')
+    
+    def conflict_response(conflicts):
+        return jsonify({
+            "error": "Event overlaps other bookings for this dog",
+            "conflicts": conflicts
+        }), 409
+    
+    def event_filters():
+        """Optional equality filters shared by the list and calendar endpoints"""
+        return {
+            field: request.args[field]
+            for field in ('event_type', 'related_type', 'related_id')
+            if request.args.get(field)
+        }
+    
     # Get all events
     @events_bp.route("/", methods=["GET"])
     def get_events():
@@ -24,33 +129,133 @@ def create_events_bp(db: DatabaseInterface) -> Blueprint:
             end_date = request.args.get('end_date')
             
             if start_date and end_date:
-                # Convert string dates to datetime objects
-                start = datetime.datetime.fromisoformat(start_date.replace('Z', '+00:00'))
-                end = datetime.datetime.fromisoformat(end_date.replace('Z', '+00:00'))
-                
-                # Query with date filter
-                query = """
-                    start_date >= :start_date 
-                    AND (end_date IS NULL OR end_date <= :end_date)
-                """
-                events = db.find_with_query("events", query, {
-                    "start_date": start,
-                    "end_date": end
-                })
+                # Events overlapping the window, already ordered by start date
+                events = event_calendar.between(start_date, end_date, event_filters())
             else:
-                # No date filter, get all events
-                events = db.find_by_field_values("events", {})
-            
-            # Sort events by start date
-            events.sort(key=lambda x: x.get('start_date', ''))
+                # No date filter: every event, with recurring series (e.g. birthdays)
+                # expanded over the same window as the calendar feeds
+                events = event_calendar.all(event_filters(), window=feed_window())
             
             debug_log(f"Found {len(events)} events")
             return jsonify(events)
         
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         except Exception as e:
             debug_log(f"Error fetching events: {str(e)}")
             return jsonify({"error": str(e)}), 500
     
+    # Get the events visible in a day, week or month view
+    @events_bp.route("/calendar", methods=["GET"])
+    def get_calendar_view():
+        try:
+            view = request.args.get('view', VIEW_MONTH)
+            anchor = request.args.get('date')
+            anchor = datetime.date.fromisoformat(anchor[:10]) if anchor else datetime.date.today()
+            first_weekday = 0 if request.args.get('week_start', 'sunday').lower() == 'monday' else 6
+            
+            debug_log(f"Fetching {view} calendar view around {anchor}")
+            calendar_view = event_calendar.view(view, anchor, first_weekday, event_filters())
+            # Predicted heat windows are shown alongside, not mixed into, the stored events
+            calendar_view["forecasts"] = [
+                forecast_event(prediction)
+                for prediction in heat_predictor.between(calendar_view["start"], calendar_view["end"])
+            ]
+            return jsonify(calendar_view)
+        
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except Exception as e:
+            debug_log(f"Error fetching calendar view: {str(e)}")
+            return jsonify({"error": str(e)}), 500
+    
+    def ical_feed(feed_name, filters):
+        """
+        Stream an iCalendar feed, answering unchanged polls with 304.
+        
+        feed_name() returns the calendar name, or None if the feed's owner does not exist.
+        """
+        stamp, etag, last_modified = validators(request.full_path, ["events", "dogs", "litters"])
+        if is_not_modified(etag, last_modified):
+            return with_validators(make_response("", 304), etag, last_modified)
+        
+        name = feed_name()
+        if name is None:
+            return jsonify({"error": "Feed not found"}), 404
+        
+        events = event_calendar.all(filters)
+        window_start, window_end = feed_window()
+        body = ical_renderer.stream(
+            name,
+            events,
+            lambda event: event_calendar.occurrences(event, window_start, window_end)
+        )
+        response = Response(stream_with_context(body), mimetype="text/calendar")
+        response.headers["Content-Disposition"] = 'inline; filename="events.ics"'
+        return with_validators(response, etag, last_modified)
+    
+    # Overlapping bookings per dog in a date window
+    @events_bp.route("/conflicts", methods=["GET"])
+    def get_event_conflicts():
+        try:
+            start_date = request.args.get('start_date') or datetime.date.today().isoformat()
+            end_date = request.args.get('end_date')
+            if not end_date:
+                end_date = (datetime.date.fromisoformat(start_date[:10]) + datetime.timedelta(days=90)).isoformat()
+            if len(end_date) == 10:
+                # A bare end date includes that whole day
+                end_date += "T23:59:59.999999"
+            
+            debug_log(f"Fetching event conflicts between {start_date} and {end_date}")
+            conflicts = event_calendar.conflicts_between(start_date, end_date, request.args.get('dog_id'))
+            return jsonify(conflicts)
+        
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except Exception as e:
+            debug_log(f"Error fetching event conflicts: {str(e)}")
+            return jsonify({"error": str(e)}), 500
+    
+    # iCalendar feed of every event in the program
+    @events_bp.route("/feeds/program.ics", methods=["GET"])
+    def get_program_feed():
+        try:
+            debug_log("Serving program iCalendar feed")
+            return ical_feed(lambda: request.args.get('name', 'Breeding Program Events'), event_filters())
+        except Exception as e:
+            debug_log(f"Error serving program feed: {str(e)}")
+            return jsonify({"error": str(e)}), 500
+    
+    # iCalendar feed of one dog's events
+    @events_bp.route("/feeds/dogs/<int:dog_id>.ics", methods=["GET"])
+    def get_dog_feed(dog_id):
+        try:
+            debug_log(f"Serving iCalendar feed for dog {dog_id}")
+            
+            def feed_name():
+                dog = db.get("dogs", dog_id)
+                return f"{dog.get('call_name') or f'Dog #{dog_id}'} Events" if dog else None
+            
+            return ical_feed(feed_name, {"related_type": "dog", "related_id": dog_id})
+        except Exception as e:
+            debug_log(f"Error serving dog feed: {str(e)}")
+            return jsonify({"error": str(e)}), 500
+    
+    # iCalendar feed of one litter's events
+    @events_bp.route("/feeds/litters/<int:litter_id>.ics", methods=["GET"])
+    def get_litter_feed(litter_id):
+        try:
+            debug_log(f"Serving iCalendar feed for litter {litter_id}")
+            
+            def feed_name():
+                litter = db.get("litters", litter_id)
+                return f"{litter.get('litter_name') or f'Litter #{litter_id}'} Events" if litter else None
+            
+            return ical_feed(feed_name, {"related_type": "litter", "related_id": litter_id})
+        except Exception as e:
+            debug_log(f"Error serving litter feed: {str(e)}")
+            return jsonify({"error": str(e)}), 500
+    
     # Get single event
     @events_bp.route("/<int:event_id>", methods=["GET"])
     def get_event(event_id):
@@ -92,12 +297,20 @@ def create_events_bp(db: DatabaseInterface) -> Blueprint:
                             "error": f"Invalid date format for {date_field}. Use ISO format (YYYY-MM-DDTHH:MM:SS)."
                         }), 400
             
+            # Refuse double bookings of the same dog unless confirmed
+            force = force_requested(data)
+            conflicts = event_calendar.conflicts_for(data)
+            if conflicts and not force:
+                return conflict_response(conflicts)
+            
             # Add created_at and updated_at timestamps
             now = datetime.datetime.utcnow()
             data['created_at'] = now
             data['updated_at'] = now
             
             event = db.create("events", data)
+            event_calendar.upsert(event)
+            reminders.upsert(event)
             debug_log(f"Created event with ID: {event['id']}")
             
             return jsonify(event), 201
@@ -130,10 +343,18 @@ def create_events_bp(db: DatabaseInterface) -> Blueprint:
                             "error": f"Invalid date format for {date_field}. Use ISO format (YYYY-MM-DDTHH:MM:SS)."
                         }), 400
             
+            # Refuse moving the event onto another booking of the same dog unless confirmed
+            force = force_requested(data)
+            conflicts = event_calendar.conflicts_for(dict(event, **data))
+            if conflicts and not force:
+                return conflict_response(conflicts)
+            
             # Update the updated_at timestamp
             data['updated_at'] = datetime.datetime.utcnow()
             
             updated_event = db.update("events", event_id, data)
+            event_calendar.upsert(updated_event)
+            reminders.upsert(updated_event)
             debug_log(f"Updated event with ID: {event_id}")
             
             return jsonify(updated_event)
@@ -154,6 +375,8 @@ def create_events_bp(db: DatabaseInterface) -> Blueprint:
                 return jsonify({"error": f"Event with ID {event_id} not found"}), 404
             
             db.delete("events", event_id)
+            event_calendar.remove(event_id)
+            reminders.remove(event_id)
             debug_log(f"Deleted event with ID: {event_id}")
             
             return jsonify({"message": f"Event with ID {event_id} deleted successfully"})
@@ -168,7 +391,8 @@ def create_events_bp(db: DatabaseInterface) -> Blueprint:
         try:
             debug_log(f"Fetching events for {entity_type} with ID: {entity_id}")
             
-            events = db.find_by_field_values("events", {
+            # Series come back once, with their placeholders filled
+            events = event_calendar.all({
                 "related_type": entity_type,
                 "related_id": entity_id
             })
@@ -186,7 +410,8 @@ def create_events_bp(db: DatabaseInterface) -> Blueprint:
         try:
             debug_log(f"Fetching events of type: {event_type}")
             
-            events = db.find_by_field_values("events", {
+            # Series come back once, with their placeholders filled
+            events = event_calendar.all({
                 "event_type": event_type
             })
             
@@ -203,141 +428,37 @@ def create_events_bp(db: DatabaseInterface) -> Blueprint:
         try:
             debug_log(f"Generating events for litter with ID: {litter_id}")
             
-            # Get the litter data
-            litter = db.get("litters", litter_id)
-            if not litter:
-                return jsonify({"error": f"Litter with ID {litter_id} not found"}), 404
-            
-            # Look up the dam to get correct information
-            dam = None
-            if litter.get('dam_id'):
-                dam = db.get("dogs", litter['dam_id'])
-            
-            # Initialize list to track created events
-            created_events = []
-            
-            # Get whelp date as the base for calculations
-            whelp_date = None
-            if litter.get('whelp_date'):
-                whelp_date = litter['whelp_date']
-            elif litter.get('expected_date'):
-                whelp_date = litter['expected_date']
-            
-            if not whelp_date:
-                return jsonify({"error": "Litter has no whelp_date or expected_date"}), 400
-            
-            # Convert to datetime object if it's a string
-            if isinstance(whelp_date, str):
-                whelp_date = datetime.datetime.fromisoformat(whelp_date.replace('Z', '+00:00'))
-            
-            # Litter name for events
-            litter_name = litter.get('litter_name') or f"Litter #{litter_id}"
-            
-            # Helper function to create a milestone event
-            def create_milestone(days_offset, title, description=None, event_type="litter_milestone", notify=False):
-                event_date = whelp_date + datetime.timedelta(days=days_offset)
-                
-                event_data = {
-                    "title": title,
-                    "description": description,
-                    "start_date": event_date,
-                    "end_date": event_date,  # Same day events
-                    "all_day": True,
-                    "event_type": event_type,
-                    "related_type": "litter",
-                    "related_id": litter_id,
-                    "color": "#4CAF50",  # Green for litter events
-                    "notify": notify,
-                    "notify_days_before": 1 if notify else 0,
-                    "recurring": "none"
-                }
-                
-                # Check if a similar event already exists to avoid duplicates
-                existing_events = db.find_by_field_values("events", {
-                    "related_type": "litter",
-                    "related_id": litter_id,
-                    "event_type": event_type,
-                    "title": title
-                })
-                
-                if not existing_events:
-                    event = db.create("events", event_data)
-                    created_events.append(event)
-                    return event
-                return None
-            
-            # Create standard milestone events
-            milestones = [
-                # Puppy development milestones
-                (0, f"{litter_name} - Birth day", "Puppies born", True),
-                (7, f"{litter_name} - 1 week old", "Puppies are 1 week old. Eyes should start opening."),
-                (14, f"{litter_name} - 2 weeks old", "Puppies are 2 weeks old. Starting to crawl."),
-                (21, f"{litter_name} - 3 weeks old", "Puppies are 3 weeks old. Begin weaning process."),
-                (28, f"{litter_name} - 4 weeks old", "Puppies are 4 weeks old. First vaccinations."),
-                (35, f"{litter_name} - 5 weeks old", "Puppies are 5 weeks old. Fully weaned."),
-                (42, f"{litter_name} - 6 weeks old", "Puppies are 6 weeks old. Second vaccinations."),
-                (49, f"{litter_name} - 7 weeks old", "Puppies are 7 weeks old. Temperament evaluations."),
-                (56, f"{litter_name} - 8 weeks old", "Puppies are 8 weeks old. Ready to go to new homes.", True),
-                
-                # Additional events
-                (3, f"{litter_name} - Dewclaw removal", "Schedule dewclaw removal if needed."),
-                (10, f"{litter_name} - Start puppy recordings", "Begin recording puppies for future families."),
-                (42, f"{litter_name} - Start transition to puppy food", "Begin transitioning to puppy food."),
-            ]
+            if wants_async():
+                return job_accepted(job_runner.submit("generate_litter_events", {"litter_id": litter_id}))
             
-            # Create all milestone events
-            for days, title, description, *args in milestones:
-                notify = args[0] if args else False
-                create_milestone(days, title, description, notify=notify)
-            
-            # Dam care events if a dam is associated
-            if dam:
-                dam_name = dam.get('call_name') or f"Dam #{dam['id']}"
-                
-                dam_events = [
-                    (0, f"{dam_name} - Post-whelp checkup", "Schedule a vet checkup for the dam after whelping.", "vet_appointment", True),
-                    (14, f"{dam_name} - Special nutrition needs", "Dam needs extra nutrition during nursing period.", "dog_care"),
-                    (42, f"{dam_name} - Begin gradually reducing food", "Start reducing dam's food as puppies are weaned.", "dog_care")
-                ]
-                
-                for days, title, description, event_type, *args in dam_events:
-                    notify = args[0] if args else False
-                    event_data = {
-                        "title": title,
-                        "description": description,
-                        "start_date": whelp_date + datetime.timedelta(days=days),
-                        "end_date": whelp_date + datetime.timedelta(days=days),
-                        "all_day": True,
-                        "event_type": event_type,
-                        "related_type": "dog",
-                        "related_id": dam['id'],
-                        "color": "#9C27B0",  # Purple for dam events
-                        "notify": notify,
-                        "notify_days_before": 1 if notify else 0,
-                        "recurring": "none"
-                    }
-                    
-                    # Avoid duplicates
-                    existing_events = db.find_by_field_values("events", {
-                        "related_type": "dog",
-                        "related_id": dam['id'],
-                        "event_type": event_type,
-                        "title": title
-                    })
-                    
-                    if not existing_events:
-                        event = db.create("events", event_data)
-                        created_events.append(event)
+            result = generate_missing_litter_events(db, litter_id)
+            index_created(result["events"])
             
             return jsonify({
-                "message": f"Generated {len(created_events)} events for litter {litter_id}",
-                "events": created_events
+                "message": f"Generated {result['created']} events for litter {litter_id}",
+                "created": result["created"],
+                "skipped": result["skipped"],
+                "events": result["events"]
             })
         
+        except LookupError as e:
+            return jsonify({"error": str(e)}), 404
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         except Exception as e:
             debug_log(f"Error generating litter events: {str(e)}")
             return jsonify({"error": str(e)}), 500
     
+    # Generate events for every litter in the background
+    @events_bp.route("/generate/litters", methods=["POST"])
+    def generate_all_litter_events():
+        try:
+            debug_log("Queueing event generation for all litters")
+            return job_accepted(job_runner.submit("generate_all_litter_events"))
+        except Exception as e:
+            debug_log(f"Error queueing litter event generation: {str(e)}")
+            return jsonify({"error": str(e)}), 500
+    
     # CRUD operations for event rules
     
     # Get all event rules
@@ -392,12 +513,18 @@ def create_events_bp(db: DatabaseInterface) -> Blueprint:
                     elif json_field == 'action_data' and not isinstance(data[json_field], dict):
                         data[json_field] = {"data": data[json_field]}
             
+            try:
+                compile_conditions(data.get('conditions'))
+            except RuleConditionError as e:
+                return jsonify({"error": str(e)}), 400
+            
             # Add timestamps
             now = datetime.datetime.utcnow()
             data['created_at'] = now
             data['updated_at'] = now
             
             rule = db.create("event_rules", data)
+            rule_engine.invalidate()
             debug_log(f"Created event rule with ID: {rule['id']}")
             
             return jsonify(rule), 201
@@ -428,10 +555,17 @@ def create_events_bp(db: DatabaseInterface) -> Blueprint:
                                 "error": f"Invalid JSON format for {json_field}"
                             }), 400
             
+            if 'conditions' in data:
+                try:
+                    compile_conditions(data['conditions'])
+                except RuleConditionError as e:
+                    return jsonify({"error": str(e)}), 400
+            
             # Update timestamp
             data['updated_at'] = datetime.datetime.utcnow()
             
             updated_rule = db.update("event_rules", rule_id, data)
+            rule_engine.invalidate()
             debug_log(f"Updated event rule with ID: {rule_id}")
             
             return jsonify(updated_rule)
@@ -451,6 +585,7 @@ def create_events_bp(db: DatabaseInterface) -> Blueprint:
                 return jsonify({"error": f"Event rule with ID {rule_id} not found"}), 404
             
             db.delete("event_rules", rule_id)
+            rule_engine.invalidate()
             debug_log(f"Deleted event rule with ID: {rule_id}")
             
             return jsonify({"message": f"Event rule with ID {rule_id} deleted successfully"})
@@ -464,97 +599,23 @@ def create_events_bp(db: DatabaseInterface) -> Blueprint:
         try:
             debug_log(f"Processing {trigger_type} rules for {entity_type} with ID: {entity_id}")
             
+            if wants_async():
+                return job_accepted(job_runner.submit("process_event_rules", {
+                    "trigger_type": trigger_type,
+                    "entity_type": entity_type,
+                    "entity_id": entity_id
+                }))
+            
             # Get the entity
             entity = db.get(f"{entity_type}s", entity_id)
             if not entity:
                 return jsonify({"error": f"{entity_type.capitalize()} with ID {entity_id} not found"}), 404
             
-            # Get all active rules for this trigger type
-            rules = db.find_by_field_values("event_rules", {
-                "trigger_type": trigger_type,
-                "active": True
-            })
-            
-            debug_log(f"Found {len(rules)} rules for trigger {trigger_type}")
-            
-            # Process each rule
-            processed_rules = []
-            for rule in rules:
-                # Check if conditions match
-                conditions_met = True
-                if rule.get('conditions'):
-                    # Process conditions (simplified for now)
-                    # In a real implementation, you'd evaluate each condition against the entity
-                    # For now, assume all active rules should run
-                    pass
-                
-                if conditions_met:
-                    # Execute the rule's action
-                    if rule['action_type'] == 'create_event':
-                        action_data = rule['action_data']
-                        
-                        # Calculate event date based on delay
-                        base_date = None
-                        if entity_type == 'litter':
-                            base_date = entity.get('whelp_date') or entity.get('expected_date')
-                        elif entity_type == 'dog':
-                            base_date = entity.get('birth_date')
-                        
-                        if not base_date:
-                            continue
-                        
-                        # Convert to datetime if needed
-                        if isinstance(base_date, str):
-                            base_date = datetime.datetime.fromisoformat(base_date.replace('Z', '+00:00'))
-                        
-                        # Add delay
-                        days_delay = action_data.get('days_delay', 0)
-                        event_date = base_date + datetime.timedelta(days=days_delay)
-                        
-                        # Format the title and description with entity data
-                        title = action_data.get('title', 'Event')
-                        description = action_data.get('description', '')
-                        
-                        # Create the event
-                        event_data = {
-                            "title": title,
-                            "description": description,
-                            "start_date": event_date,
-                            "end_date": event_date,
-                            "all_day": action_data.get('all_day', True),
-                            "event_type": action_data.get('event_type', 'custom'),
-                            "related_type": entity_type,
-                            "related_id": entity_id,
-                            "color": action_data.get('color', '#2196F3'),
-                            "notify": action_data.get('notify', False),
-                            "notify_days_before": action_data.get('notify_days_before', 0),
-                            "recurring": action_data.get('recurring', 'none')
-                        }
-                        
-                        # Check for duplicates
-                        existing_events = db.find_by_field_values("events", {
-                            "related_type": entity_type,
-                            "related_id": entity_id,
-                            "title": title,
-                            "event_type": action_data.get('event_type', 'custom')
-                        })
-                        
-                        if not existing_events:
-                            event = db.create("events", event_data)
-                            processed_rules.append({
-                                "rule_id": rule['id'],
-                                "rule_name": rule['name'],
-                                "action": "create_event",
-                                "result": "Created event with ID " + str(event['id'])
-                            })
-                        else:
-                            processed_rules.append({
-                                "rule_id": rule['id'],
-                                "rule_name": rule['name'],
-                                "action": "create_event",
-                                "result": "Event already exists"
-                            })
+            # Compiled rules for (trigger, entity type), evaluated in one pass
+            outcome = rule_engine.evaluate(trigger_type, entity_type, entity)
+            index_created(outcome["events"])
             
+            processed_rules = outcome["results"]
             return jsonify({
                 "message": f"Processed {len(processed_rules)} rules for {entity_type} {entity_id}",
                 "results": processed_rules
@@ -570,79 +631,17 @@ def create_events_bp(db: DatabaseInterface) -> Blueprint:
         try:
             debug_log("Generating birthday events for all dogs")
             
+            if wants_async():
+                return job_accepted(job_runner.submit("generate_birthday_events"))
+            
             # Get all active dogs
             dogs = db.find_by_field_values("dogs", {"status": "Active"})
             if not dogs:
                 return jsonify({"message": "No active dogs found"}), 404
             
-            created_events = []
-            
-            for dog in dogs:
-                # Skip if no birth date
-                if not dog.get('birth_date'):
-                    continue
-                
-                # Convert to datetime if needed
-                birth_date = dog['birth_date']
-                if isinstance(birth_date, str):
-                    birth_date = datetime.datetime.fromisoformat(birth_date.replace('Z', '+00:00'))
-                
-                # Get dog's name
-                dog_name = dog.get('call_name') or f"Dog #{dog['id']}"
-                
-                # Create next birthday event (for current year)
-                now = datetime.datetime.utcnow()
-                current_year = now.year
-                
-                # Create birthday for current year
-                birthday = datetime.datetime(
-                    current_year, 
-                    birth_date.month, 
-                    birth_date.day
-                )
-                
-                # If birthday has passed this year, set for next year
-                if birthday < now:
-                    birthday = datetime.datetime(
-                        current_year + 1,
-                        birth_date.month,
-                        birth_date.day
-                    )
-                
-                # Calculate age for the upcoming birthday
-                age = birthday.year - birth_date.year
-                
-                # Create event data
-                event_data = {
-                    "title": f"{dog_name}'s {age}st Birthday",
-                    "description": f"{dog_name} turns {age} years old!",
-                    "start_date": birthday,
-                    "end_date": birthday,
-                    "all_day": True,
-                    "event_type": "birthday",
-                    "related_type": "dog",
-                    "related_id": dog['id'],
-                    "color": "#FF5722",  # Orange for birthdays
-                    "notify": True,
-                    "notify_days_before": 7,
-                    "recurring": "yearly"
-                }
-                
-                # Check if a similar event already exists
-                existing_events = db.find_by_field_values("events", {
-                    "related_type": "dog",
-                    "related_id": dog['id'],
-                    "event_type": "birthday",
-                    "recurring": "yearly"
-                })
-                
-                # Skip if already exists
-                if existing_events:
-                    continue
-                
-                # Create the event
-                event = db.create("events", event_data)
-                created_events.append(event)
+            result = generate_missing_birthday_events(db, dogs)
+            created_events = result["events"]
+            index_created(created_events)
             
             return jsonify({
                 "message": f"Generated {len(created_events)} birthday events",
@@ -6,17 +6,31 @@ Handles both photos and documents.
 """
 
 import os
-import uuid
 import traceback
-from flask import Blueprint, request, jsonify, make_response, current_app, send_from_directory
+from flask import Blueprint, request, jsonify, make_response, current_app
 from werkzeug.utils import secure_filename
 from datetime import datetime
 from server.database.db_interface import DatabaseInterface
 from .config import debug_log
+from .utils.image_derivatives import get_derivative_pipeline
+from .utils.blob_store import get_blob_store, normalise_extension
+from .utils.cover_photos import get_cover_photos
+from .utils.upload_serving import serve_stored
 
 def create_files_bp(db: DatabaseInterface) -> Blueprint:
     files_bp = Blueprint("files_bp", __name__)
     
+    # Thumbnail/medium/large renditions, rendered off-request after each image upload
+    derivatives = get_derivative_pipeline(db)
+    
+    # Uploads are stored once per distinct content
+    blob_store = get_blob_store(db)
+    
+    # Cover changes are one set-based operation; current covers are cached
+    cover_photos = get_cover_photos(db)
+    if cover_photos.record_changes not in derivatives.on_recorded:
+        derivatives.on_recorded.append(cover_photos.record_changes)
+    
     # Helper function to check if file extension is allowed
     def allowed_image(filename):
         ALLOWED_IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
@@ -26,12 +40,6 @@ def create_files_bp(db: DatabaseInterface) -> Blueprint:
         ALLOWED_DOC_EXTENSIONS = {'pdf', 'doc', 'docx', 'txt', 'xls', 'xlsx', 'csv'}
         return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_DOC_EXTENSIONS
     
-    # Helper function to generate a unique filename
-    def generate_unique_filename(filename):
-        ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
-        unique_name = f"{uuid.uuid4().hex}"
-        return f"{unique_name}.{ext}" if ext else unique_name
-    
     # Helper function to determine file type
     def get_file_type(filename):
         if not '.' in filename:
@@ -61,31 +69,15 @@ def create_files_bp(db: DatabaseInterface) -> Blueprint:
             return None, "File type not supported"
         
         try:
-            # Generate a unique filename to prevent collisions
-            unique_filename = generate_unique_filename(filename)
-            
-            # Define the upload directory
-            base_upload_dir = os.path.join(current_app.root_path, 'uploads')
-            upload_dir = os.path.join(base_upload_dir, file_type + 's')
-            
-            # Create directories if they don't exist
-            if not os.path.exists(upload_dir):
-                os.makedirs(upload_dir)
-            
-            # Define the complete path for saving
-            file_path = os.path.join(upload_dir, unique_filename)
-            
-            # Save the file
-            file.save(file_path)
-            
-            # Generate the URL
-            url = f"/uploads/{file_type}s/{unique_filename}"
+            # Store under the content hash; identical content is only stored once
+            blob = blob_store.put(file.stream, filename)
             
             # Return the file info
             return {
-                "url": url,
+                "url": blob["url"],
                 "original_filename": filename,
-                "file_type": file_type
+                "file_type": file_type,
+                "content_hash": blob["content_hash"]
             }, None
             
         except Exception as e:
@@ -94,12 +86,17 @@ def create_files_bp(db: DatabaseInterface) -> Blueprint:
     
     @files_bp.route("/", methods=["POST"])
     def upload_file():
+        # The blob stays pinned against release() until its row is written
+        pinned = None
         try:
+            # Finished resumable uploads and already stored content are referenced by hash
+            content_hash = request.form.get('content_hash')
+            
             # Ensure the request has files
-            if 'file' not in request.files:
+            if 'file' not in request.files and not content_hash:
                 return jsonify({"error": "No file part in the request"}), 400
                 
-            file = request.files['file']
+            file = request.files.get('file')
             
             # Get entity type and ID from the form data
             entity_type = request.form.get('entity_type')
@@ -122,11 +119,27 @@ def create_files_bp(db: DatabaseInterface) -> Blueprint:
             except ValueError:
                 return jsonify({"error": "entity_id and order must be integers"}), 400
             
-            # Save the file
-            file_info, error = save_file(file, entity_type, entity_id)
-            
-            if error:
-                return jsonify({"error": f"Failed to save file: {error}"}), 500
+            # Save the file, or reuse the stored blob it refers to
+            if file is None:
+                blob = blob_store.find(content_hash)
+                if blob is None:
+                    return jsonify({"error": "No stored file matches content_hash"}), 404
+                pinned = blob["content_hash"]
+                filename = secure_filename(request.form.get('original_filename', '')) or blob["url"].rsplit('/', 1)[-1]
+                file_info = {
+                    "url": blob["url"],
+                    "original_filename": filename,
+                    "file_type": get_file_type(blob["url"]),
+                    "content_hash": blob["content_hash"]
+                }
+                if file_info["file_type"] == 'unknown':
+                    return jsonify({"error": "File type not supported"}), 400
+            else:
+                file_info, error = save_file(file, entity_type, entity_id)
+                
+                if error:
+                    return jsonify({"error": f"Failed to save file: {error}"}), 500
+                pinned = file_info["content_hash"]
             
             file_type = file_info["file_type"]
             
@@ -138,7 +151,8 @@ def create_files_bp(db: DatabaseInterface) -> Blueprint:
                 "original_filename": file_info["original_filename"],
                 "title": title or file_info["original_filename"],
                 "description": description,
-                "file_type": file_type
+                "file_type": file_type,
+                "content_hash": file_info["content_hash"]
             }
             
             # If it's an image, store it in the photos table
@@ -150,46 +164,17 @@ def create_files_bp(db: DatabaseInterface) -> Blueprint:
                     "caption": caption
                 }
                 
-                # If this is a cover photo, first set all other photos as non-cover
-                if is_cover:
-                    try:
-                        # Find all photos for this entity
-                        photos = db.find_by_field_values("photos", {
-                            "related_type": entity_type,
-                            "related_id": entity_id
-                        })
-                        
-                        # Update them all to not be cover photos
-                        for photo in photos:
-                            if photo["is_cover"]:
-                                db.update("photos", photo["id"], {"is_cover": False})
-                    except Exception as e:
-                        debug_log(f"Error updating cover photos: {str(e)}")
+                # If the entity has no cover yet, this photo becomes it
+                if not is_cover and cover_photos.cover_for(entity_type, entity_id) is None:
+                    photo_data["is_cover"] = True
                 
                 # Create the photo record
                 record = db.create("photos", photo_data)
+                derivatives.submit(record)
                 
-                # If this is the first photo, set it as the cover photo
-                if not is_cover:
-                    photos = db.find_by_field_values("photos", {
-                        "related_type": entity_type,
-                        "related_id": entity_id
-                    })
-                    
-                    if len(photos) == 1:  # Only this new photo exists
-                        db.update("photos", record["id"], {"is_cover": True})
-                        record["is_cover"] = True
-                
-                # Update the entity's cover_photo field if this is a cover photo
+                # Make it the entity's only cover and update the entity's cover_photo field
                 if record["is_cover"]:
-                    table_name = {
-                        "dog": "dogs",
-                        "litter": "litters",
-                        "puppy": "puppies"
-                    }.get(entity_type)
-                    
-                    if table_name:
-                        db.update(table_name, entity_id, {"cover_photo": record["url"]})
+                    cover_photos.set_cover(record)
             
             # If it's a document, store it in the documents table
             elif file_type == 'document':
@@ -211,6 +196,8 @@ def create_files_bp(db: DatabaseInterface) -> Blueprint:
             debug_log(f"Error uploading file: {str(e)}")
             traceback.print_exc()
             return jsonify({"error": str(e)}), 500
+        finally:
+            blob_store.unpin(pinned)
     
     @files_bp.route("/documents/<entity_type>/<int:entity_id>", methods=["GET"])
     def get_documents(entity_type, entity_id):
@@ -243,21 +230,20 @@ def create_files_bp(db: DatabaseInterface) -> Blueprint:
             if not document:
                 return jsonify({"error": f"Document with ID {document_id} not found"}), 404
             
-            # Delete the physical file if it exists
-            if document["url"] and document["url"].startswith("/uploads/"):
+            # Delete the document record
+            db.delete("documents", document_id)
+            
+            # Delete the file once no other record uses the same content
+            key = blob_store.storage.key_for(document["url"])
+            if key is not None:
                 try:
-                    file_path = os.path.join(
-                        current_app.root_path, 
-                        document["url"].lstrip("/")
-                    )
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
+                    if document.get("content_hash"):
+                        blob_store.release(document["content_hash"], normalise_extension(document["url"]))
+                    else:
+                        blob_store.storage.delete(key)
                 except Exception as e:
                     debug_log(f"Error deleting file: {str(e)}")
-                    # Continue anyway, as we want to delete the DB record
-            
-            # Delete the document record
-            db.delete("documents", document_id)
+                    # Continue anyway, as the DB record is already deleted
             
             return jsonify({"message": "Document deleted successfully"}), 200
             
@@ -296,9 +282,7 @@ def create_files_bp(db: DatabaseInterface) -> Blueprint:
     # Serve static files from the uploads directory
     @files_bp.route('/uploads/<path:filename>')
     def uploaded_file(filename):
-        return send_from_directory(
-            os.path.join(current_app.root_path, 'uploads'),
-            filename
-        )
+        return serve_stored(blob_store.storage, os.path.join(current_app.root_path, 'uploads'), filename,
+                            os.environ.get('UPLOADS_ACCEL_REDIRECT') or None)
     
     return files_bp
\ No newline at end of file
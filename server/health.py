@@ -10,18 +10,91 @@ This module provides API endpoints for managing health-related records:
 """
 
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
 from flask import Blueprint, request, jsonify
 from .models import (
     HealthRecord, Vaccination, WeightRecord, 
     MedicationRecord, HealthCondition, HealthConditionTemplate
 )
 from .middleware.auth import token_required
+from .utils.due_date_scheduler import (
+    get_due_date_scheduler, KIND_VACCINATION, KIND_MEDICATION
+)
+from .utils.health_import import HealthRecordImporter, ImportFormatError, iter_rows
+from .utils.health_risk import get_health_risk_engine
+from .utils.columnar_snapshot import get_snapshot_store, SnapshotNotReady
+from .utils.health_reports import REPORTS
+from .utils.response_cache import cached_response
+from .utils.dates import to_datetime
+from .utils.jobs import get_job_runner
+from .database.change_tracker import change_tracker
+
+# Tables written by each group of endpoints (the models write to Supabase directly,
+# so these writes have to be reported to the change tracker here)
+WRITE_TABLES = {
+    'records': ['health_records'],
+    'vaccinations': ['vaccinations'],
+    'weights': ['weight_records'],
+    'medications': ['medication_records'],
+    'conditions': ['health_conditions'],
+    'condition-templates': ['health_condition_templates'],
+}
 
-def create_health_bp():
+def create_health_bp(db=None):
     """Create and return a blueprint for health management"""
     health_bp = Blueprint('health_bp', __name__)
     
+    # Due-date scheduler loaded at startup (only when a database is wired in)
+    scheduler = get_due_date_scheduler(db) if db is not None else None
+    
+    # Hereditary risk engine, kept current by the condition and template endpoints
+    risk_engine = get_health_risk_engine(db) if db is not None else None
+    
+    # Columnar snapshot the analytics reports read instead of the live tables
+    snapshot_store = get_snapshot_store(db) if db is not None else None
+    
+    # Stale snapshots are re-exported by a background job; reports keep reading the last one
+    if snapshot_store is not None:
+        job_runner = get_job_runner(db)
+        
+        def refresh_snapshot_job(payload, job):
+            manifest = snapshot_store.refresh()
+            return {
+                'generation': manifest['generation'],
+                'tables': {name: meta['rows'] for name, meta in manifest['tables'].items()}
+            }
+        
+        job_runner.register('refresh_analytics_snapshot', refresh_snapshot_job)
+        snapshot_store.schedule_refresh = lambda: job_runner.submit('refresh_analytics_snapshot')
+    
+    def save_record(table, data, record_id=None):
+        """Create or update a row through the database so the in-memory indexes see the stored record"""
+        now = datetime.utcnow().isoformat()
+        row = {key: value.isoformat() if isinstance(value, datetime) else value
+               for key, value in data.items()}
+        row['updated_at'] = now
+        if record_id is None:
+            row['created_at'] = now
+            return db.create(table, row)
+        return db.update(table, record_id, row)
+    
+    def database_unavailable():
+        return jsonify({
+            'success': False,
+            'error': 'Database is not available'
+        }), 503
+    
+    @health_bp.after_request
+    def track_writes(response):
+        """Bump the change counters of the tables a successful write touched"""
+        if request.method in ('POST', 'PUT', 'PATCH', 'DELETE') and response.status_code < 400:
+            parts = request.path.split('/')
+            resource = parts[3] if len(parts) > 3 else ''
+            tables = WRITE_TABLES.get(resource)
+            if tables:
+                change_tracker.bump(*tables)
+        return response
+    
     #===== Health Records Endpoints =====
     
     @health_bp.route('/records', methods=['GET'])
@@ -201,7 +274,10 @@ def create_health_bp():
             days = request.args.get('days', 30)
             
             if upcoming and upcoming.lower() == 'true':
-                vaccinations = Vaccination.get_upcoming_vaccinations(int(days))
+                if scheduler is not None:
+                    vaccinations = scheduler.upcoming_vaccinations(int(days))
+                else:
+                    vaccinations = Vaccination.get_upcoming_vaccinations(int(days))
             elif dog_id:
                 vaccinations = Vaccination.get_for_dog(int(dog_id))
             elif puppy_id:
@@ -250,9 +326,12 @@ def create_health_bp():
     
     @health_bp.route('/vaccinations', methods=['POST'])
     @token_required
-    def create_vaccination():
+    def create_vaccination(current_user):
         """Create a new vaccination record"""
         try:
+            if db is None:
+                return database_unavailable()
+            
             data = request.get_json()
             
             # Required fields
@@ -278,7 +357,8 @@ def create_health_bp():
                     data[field] = datetime.fromisoformat(data[field].replace('Z', '+00:00'))
             
             # Create the vaccination record
-            vaccination = Vaccination.create_vaccination(data)
+            vaccination = save_record('vaccinations', data)
+            scheduler.upsert(KIND_VACCINATION, vaccination)
             
             return jsonify({
                 'success': True,
@@ -294,13 +374,16 @@ def create_health_bp():
     
     @health_bp.route('/vaccinations/<int:vaccination_id>', methods=['PUT'])
     @token_required
-    def update_vaccination(vaccination_id):
+    def update_vaccination(current_user, vaccination_id):
         """Update an existing vaccination record"""
         try:
+            if db is None:
+                return database_unavailable()
+            
             data = request.get_json()
             
             # Check if vaccination exists
-            vaccination = Vaccination.get_by_id(vaccination_id)
+            vaccination = db.get('vaccinations', vaccination_id)
             if not vaccination:
                 return jsonify({
                     'success': False,
@@ -314,7 +397,8 @@ def create_health_bp():
                     data[field] = datetime.fromisoformat(data[field].replace('Z', '+00:00'))
             
             # Update the vaccination record
-            updated_vaccination = Vaccination.update_vaccination(vaccination_id, data)
+            updated_vaccination = save_record('vaccinations', data, vaccination_id)
+            scheduler.upsert(KIND_VACCINATION, updated_vaccination)
             
             return jsonify({
                 'success': True,
@@ -330,11 +414,14 @@ def create_health_bp():
     
     @health_bp.route('/vaccinations/<int:vaccination_id>', methods=['DELETE'])
     @token_required
-    def delete_vaccination(vaccination_id):
+    def delete_vaccination(current_user, vaccination_id):
         """Delete a vaccination record"""
         try:
+            if db is None:
+                return database_unavailable()
+            
             # Check if vaccination exists
-            vaccination = Vaccination.get_by_id(vaccination_id)
+            vaccination = db.get('vaccinations', vaccination_id)
             if not vaccination:
                 return jsonify({
                     'success': False,
@@ -342,7 +429,12 @@ def create_health_bp():
                 }), 404
             
             # Delete the vaccination record
-            Vaccination.delete_vaccination(vaccination_id)
+            if not db.delete('vaccinations', vaccination_id):
+                return jsonify({
+                    'success': False,
+                    'error': f'Vaccination with ID {vaccination_id} could not be deleted'
+                }), 500
+            scheduler.remove(KIND_VACCINATION, vaccination_id)
             
             return jsonify({
                 'success': True,
@@ -528,7 +620,10 @@ def create_health_bp():
             active_only = request.args.get('active_only')
             
             if active_only and active_only.lower() == 'true':
-                medications = MedicationRecord.get_active_medications()
+                if scheduler is not None:
+                    medications = scheduler.active_medications()
+                else:
+                    medications = MedicationRecord.get_active_medications()
             elif dog_id:
                 medications = MedicationRecord.get_for_dog(int(dog_id))
             elif puppy_id:
@@ -577,9 +672,12 @@ def create_health_bp():
     
     @health_bp.route('/medications', methods=['POST'])
     @token_required
-    def create_medication_record():
+    def create_medication_record(current_user):
         """Create a new medication record"""
         try:
+            if db is None:
+                return database_unavailable()
+            
             data = request.get_json()
             
             # Required fields
@@ -605,7 +703,8 @@ def create_health_bp():
                     data[field] = datetime.fromisoformat(data[field].replace('Z', '+00:00'))
             
             # Create the medication record
-            medication = MedicationRecord.create_record(data)
+            medication = save_record('medication_records', data)
+            scheduler.upsert(KIND_MEDICATION, medication)
             
             return jsonify({
                 'success': True,
@@ -621,13 +720,16 @@ def create_health_bp():
     
     @health_bp.route('/medications/<int:record_id>', methods=['PUT'])
     @token_required
-    def update_medication_record(record_id):
+    def update_medication_record(current_user, record_id):
         """Update an existing medication record"""
         try:
+            if db is None:
+                return database_unavailable()
+            
             data = request.get_json()
             
             # Check if medication record exists
-            medication = MedicationRecord.get_by_id(record_id)
+            medication = db.get('medication_records', record_id)
             if not medication:
                 return jsonify({
                     'success': False,
@@ -641,7 +743,8 @@ def create_health_bp():
                     data[field] = datetime.fromisoformat(data[field].replace('Z', '+00:00'))
             
             # Update the medication record
-            updated_medication = MedicationRecord.update_record(record_id, data)
+            updated_medication = save_record('medication_records', data, record_id)
+            scheduler.upsert(KIND_MEDICATION, updated_medication)
             
             return jsonify({
                 'success': True,
@@ -657,11 +760,14 @@ def create_health_bp():
     
     @health_bp.route('/medications/<int:record_id>', methods=['DELETE'])
     @token_required
-    def delete_medication_record(record_id):
+    def delete_medication_record(current_user, record_id):
         """Delete a medication record"""
         try:
+            if db is None:
+                return database_unavailable()
+            
             # Check if medication record exists
-            medication = MedicationRecord.get_by_id(record_id)
+            medication = db.get('medication_records', record_id)
             if not medication:
                 return jsonify({
                     'success': False,
@@ -669,7 +775,12 @@ def create_health_bp():
                 }), 404
             
             # Delete the medication record
-            MedicationRecord.delete_record(record_id)
+            if not db.delete('medication_records', record_id):
+                return jsonify({
+                    'success': False,
+                    'error': f'Medication record with ID {record_id} could not be deleted'
+                }), 500
+            scheduler.remove(KIND_MEDICATION, record_id)
             
             return jsonify({
                 'success': True,
@@ -741,9 +852,12 @@ def create_health_bp():
     
     @health_bp.route('/conditions', methods=['POST'])
     @token_required
-    def create_health_condition():
+    def create_health_condition(current_user):
         """Create a new health condition"""
         try:
+            if db is None:
+                return database_unavailable()
+            
             data = request.get_json()
             
             # Required fields
@@ -767,7 +881,8 @@ def create_health_bp():
                 data['diagnosis_date'] = datetime.fromisoformat(data['diagnosis_date'].replace('Z', '+00:00'))
             
             # Create the health condition
-            condition = HealthCondition.create_condition(data)
+            condition = save_record('health_conditions', data)
+            risk_engine.upsert_condition(condition)
             
             return jsonify({
                 'success': True,
@@ -783,13 +898,16 @@ def create_health_bp():
     
     @health_bp.route('/conditions/<int:condition_id>', methods=['PUT'])
     @token_required
-    def update_health_condition(condition_id):
+    def update_health_condition(current_user, condition_id):
         """Update an existing health condition"""
         try:
+            if db is None:
+                return database_unavailable()
+            
             data = request.get_json()
             
             # Check if health condition exists
-            condition = HealthCondition.get_by_id(condition_id)
+            condition = db.get('health_conditions', condition_id)
             if not condition:
                 return jsonify({
                     'success': False,
@@ -801,7 +919,8 @@ def create_health_bp():
                 data['diagnosis_date'] = datetime.fromisoformat(data['diagnosis_date'].replace('Z', '+00:00'))
             
             # Update the health condition
-            updated_condition = HealthCondition.update_condition(condition_id, data)
+            updated_condition = save_record('health_conditions', data, condition_id)
+            risk_engine.upsert_condition(updated_condition)
             
             return jsonify({
                 'success': True,
@@ -817,11 +936,14 @@ def create_health_bp():
     
     @health_bp.route('/conditions/<int:condition_id>', methods=['DELETE'])
     @token_required
-    def delete_health_condition(condition_id):
+    def delete_health_condition(current_user, condition_id):
         """Delete a health condition"""
         try:
+            if db is None:
+                return database_unavailable()
+            
             # Check if health condition exists
-            condition = HealthCondition.get_by_id(condition_id)
+            condition = db.get('health_conditions', condition_id)
             if not condition:
                 return jsonify({
                     'success': False,
@@ -829,7 +951,12 @@ def create_health_bp():
                 }), 404
             
             # Delete the health condition
-            HealthCondition.delete_condition(condition_id)
+            if not db.delete('health_conditions', condition_id):
+                return jsonify({
+                    'success': False,
+                    'error': f'Health condition with ID {condition_id} could not be deleted'
+                }), 500
+            risk_engine.remove_condition(condition_id)
             
             return jsonify({
                 'success': True,
@@ -895,9 +1022,12 @@ def create_health_bp():
     
     @health_bp.route('/condition-templates', methods=['POST'])
     @token_required
-    def create_condition_template():
+    def create_condition_template(current_user):
         """Create a new health condition template"""
         try:
+            if db is None:
+                return database_unavailable()
+            
             data = request.get_json()
             
             # Required fields
@@ -920,7 +1050,8 @@ def create_health_bp():
                     }), 400
             
             # Create the health condition template
-            template = HealthConditionTemplate.create_template(data)
+            template = save_record('health_condition_templates', data)
+            risk_engine.upsert_template(template)
             
             return jsonify({
                 'success': True,
@@ -936,13 +1067,16 @@ def create_health_bp():
     
     @health_bp.route('/condition-templates/<int:template_id>', methods=['PUT'])
     @token_required
-    def update_condition_template(template_id):
+    def update_condition_template(current_user, template_id):
         """Update an existing health condition template"""
         try:
+            if db is None:
+                return database_unavailable()
+            
             data = request.get_json()
             
             # Check if template exists
-            template = HealthConditionTemplate.get_by_id(template_id)
+            template = db.get('health_condition_templates', template_id)
             if not template:
                 return jsonify({
                     'success': False,
@@ -960,7 +1094,8 @@ def create_health_bp():
                     }), 400
             
             # Update the health condition template
-            updated_template = HealthConditionTemplate.update_template(template_id, data)
+            updated_template = save_record('health_condition_templates', data, template_id)
+            risk_engine.upsert_template(updated_template)
             
             return jsonify({
                 'success': True,
@@ -976,11 +1111,14 @@ def create_health_bp():
     
     @health_bp.route('/condition-templates/<int:template_id>', methods=['DELETE'])
     @token_required
-    def delete_condition_template(template_id):
+    def delete_condition_template(current_user, template_id):
         """Delete a health condition template"""
         try:
+            if db is None:
+                return database_unavailable()
+            
             # Check if template exists
-            template = HealthConditionTemplate.get_by_id(template_id)
+            template = db.get('health_condition_templates', template_id)
             if not template:
                 return jsonify({
                     'success': False,
@@ -988,7 +1126,12 @@ def create_health_bp():
                 }), 404
             
             # Delete the health condition template
-            HealthConditionTemplate.delete_template(template_id)
+            if not db.delete('health_condition_templates', template_id):
+                return jsonify({
+                    'success': False,
+                    'error': f'Health condition template with ID {template_id} could not be deleted'
+                }), 500
+            risk_engine.remove_template(template_id)
             
             return jsonify({
                 'success': True,
@@ -1001,28 +1144,340 @@ def create_health_bp():
                 'error': str(e)
             }), 500
     
+    #===== Hereditary Risk Endpoints =====
+
+    @health_bp.route('/risk', methods=['GET'])
+    @token_required
+    def get_risk_summaries(current_user):
+        """Get hereditary risk summaries for every dog, optionally filtered by risk level"""
+        try:
+            if risk_engine is None:
+                return jsonify({
+                    'success': False,
+                    'error': 'Health risk engine is not available'
+                }), 503
+
+            summaries = risk_engine.evaluate_all()
+
+            level = request.args.get('level')
+            if level:
+                summaries = [s for s in summaries if s['risk_level'] == level]
+
+            return jsonify({
+                'success': True,
+                'data': summaries,
+                'count': len(summaries)
+            })
+
+        except Exception as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 500
+
+    @health_bp.route('/risk/<int:dog_id>', methods=['GET'])
+    @token_required
+    def get_dog_risk_summary(current_user, dog_id):
+        """Get the hereditary risk summary of one dog"""
+        try:
+            if risk_engine is None:
+                return jsonify({
+                    'success': False,
+                    'error': 'Health risk engine is not available'
+                }), 503
+
+            summary = risk_engine.summary_for(dog_id)
+            if summary is None:
+                return jsonify({
+                    'success': False,
+                    'error': f'Dog with ID {dog_id} not found'
+                }), 404
+
+            return jsonify({
+                'success': True,
+                'data': summary
+            })
+
+        except Exception as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 500
+
+    #===== Analytics Endpoints =====
+
+    @health_bp.route('/analytics/snapshot', methods=['GET'])
+    @token_required
+    def get_analytics_snapshot(current_user):
+        """Describe the current analytics snapshot (tables, row counts, age)"""
+        try:
+            if snapshot_store is None:
+                return jsonify({
+                    'success': False,
+                    'error': 'Analytics snapshot is not available'
+                }), 503
+
+            manifest = snapshot_store.manifest()
+            if manifest is None:
+                return jsonify({
+                    'success': True,
+                    'data': None
+                })
+
+            return jsonify({
+                'success': True,
+                'data': {
+                    'generation': manifest['generation'],
+                    'created_at': manifest['created_at'],
+                    'age_seconds': int(snapshot_store.age()),
+                    'tables': {name: meta['rows'] for name, meta in manifest['tables'].items()}
+                }
+            })
+
+        except Exception as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 500
+
+    @health_bp.route('/analytics/snapshot', methods=['POST'])
+    @token_required
+    def refresh_analytics_snapshot(current_user):
+        """Export the health tables into a fresh analytics snapshot"""
+        try:
+            if snapshot_store is None:
+                return jsonify({
+                    'success': False,
+                    'error': 'Analytics snapshot is not available'
+                }), 503
+
+            manifest = snapshot_store.refresh()
+
+            return jsonify({
+                'success': True,
+                'data': {
+                    'generation': manifest['generation'],
+                    'created_at': manifest['created_at'],
+                    'tables': {name: meta['rows'] for name, meta in manifest['tables'].items()}
+                },
+                'message': 'Analytics snapshot refreshed'
+            }), 201
+
+        except Exception as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 500
+
+    @health_bp.route('/analytics/reports/<report_name>', methods=['GET'])
+    @token_required
+    def get_analytics_report(current_user, report_name):
+        """Compute a health report from the analytics snapshot"""
+        try:
+            if snapshot_store is None:
+                return jsonify({
+                    'success': False,
+                    'error': 'Analytics snapshot is not available'
+                }), 503
+
+            report = REPORTS.get(report_name)
+            if report is None:
+                return jsonify({
+                    'success': False,
+                    'error': f'Unknown report: {report_name}. Available: {", ".join(sorted(REPORTS))}'
+                }), 404
+
+            data = report(
+                snapshot_store,
+                start=request.args.get('start'),
+                end=request.args.get('end')
+            )
+
+            return jsonify({
+                'success': True,
+                'data': data,
+                'snapshot_created_at': snapshot_store.manifest()['created_at']
+            })
+
+        except SnapshotNotReady as e:
+            # The first snapshot is being exported in the background
+            response = jsonify({
+                'success': False,
+                'error': str(e)
+            })
+            response.headers['Retry-After'] = '30'
+            return response, 503
+
+        except Exception as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 500
+
+    #===== Due Date Endpoints =====
+
+    @health_bp.route('/due', methods=['GET'])
+    @token_required
+    def get_due_items(current_user):
+        """Get vaccinations and medications due in the next N days"""
+        try:
+            if scheduler is None:
+                return jsonify({
+                    'success': False,
+                    'error': 'Due-date scheduler is not available'
+                }), 503
+
+            days = int(request.args.get('days', 30))
+            kinds = request.args.get('kinds')
+            include_overdue = request.args.get('include_overdue', 'false').lower() == 'true'
+
+            items = scheduler.due_within(
+                days,
+                kinds=kinds.split(',') if kinds else None,
+                include_overdue=include_overdue
+            )
+
+            return jsonify({
+                'success': True,
+                'data': items,
+                'count': len(items)
+            })
+
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'error': 'days must be an integer'
+            }), 400
+        except Exception as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 500
+
+    @health_bp.route('/reminders', methods=['POST'])
+    @token_required
+    def send_due_reminders(current_user):
+        """Create notifications for items due in the next N days that were not reminded yet"""
+        try:
+            if scheduler is None:
+                return jsonify({
+                    'success': False,
+                    'error': 'Due-date scheduler is not available'
+                }), 503
+
+            data = request.get_json(silent=True) or {}
+            days = int(data.get('days', 7))
+
+            created = []
+            for payload in scheduler.reminders(days):
+                notification = {
+                    'user_id': current_user.get('id'),
+                    'type': payload['type'],
+                    'title': payload['title'],
+                    'message': payload['message'],
+                    'entity_type': payload['entity_type'],
+                    'entity_id': payload['entity_id'],
+                    'date': datetime.utcnow().isoformat(),
+                    'read': False
+                }
+                created.append(db.create('notifications', notification))
+                # Only remember the reminder once its notification is stored
+                scheduler.mark_reminded(payload)
+
+            return jsonify({
+                'success': True,
+                'data': created,
+                'count': len(created)
+            }), 201
+
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'error': 'days must be an integer'
+            }), 400
+        except Exception as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 500
+
+    #===== Bulk Import Endpoints =====
+
+    @health_bp.route('/import', methods=['POST'])
+    @token_required
+    def import_health_records(current_user):
+        """Import vaccination and weight records from a vet CSV/XLSX export"""
+        try:
+            if db is None:
+                return jsonify({
+                    'success': False,
+                    'error': 'Database is not available'
+                }), 503
+
+            upload = request.files.get('file')
+            if upload is None or not upload.filename:
+                return jsonify({
+                    'success': False,
+                    'error': 'No file provided'
+                }), 400
+
+            record_type = request.form.get('record_type') or None
+            dry_run = request.form.get('dry_run', 'false').lower() == 'true'
+
+            importer = HealthRecordImporter(db, default_record_type=record_type, dry_run=dry_run)
+            report = importer.run(iter_rows(upload.stream, upload.filename))
+
+            created_vaccinations = report.pop('created_vaccinations')
+            if scheduler is not None:
+                for vaccination in created_vaccinations:
+                    scheduler.upsert(KIND_VACCINATION, vaccination)
+
+            return jsonify({
+                'success': not report['errors'],
+                'data': report
+            }), 200 if dry_run else 201
+
+        except ImportFormatError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        except Exception as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 500
+
     #===== Health Dashboard Endpoints =====
-    
+
     @health_bp.route('/dashboard', methods=['GET'])
     @token_required
-    def get_health_dashboard():
+    @cached_response(['vaccinations', 'medication_records', 'health_conditions', 'health_records'])
+    def get_health_dashboard(current_user):
         """Get health dashboard data for dogs/puppies"""
         try:
-            # Get upcoming vaccinations (next 60 days)
-            upcoming_vaccinations = Vaccination.get_upcoming_vaccinations(60)
-            
-            # Get active medications
-            active_medications = MedicationRecord.get_active_medications()
-            
-            # Get active health conditions
-            active_conditions = HealthCondition.get_by_status('active')
+            # Get upcoming vaccinations (next 60 days) and active medications
+            if scheduler is not None:
+                upcoming_vaccinations = scheduler.upcoming_vaccinations(60)
+                active_medications = scheduler.active_medications()
+            else:
+                upcoming_vaccinations = Vaccination.get_upcoming_vaccinations(60)
+                active_medications = MedicationRecord.get_active_medications()
+            
+            # Get active health conditions and all health records (the models are
+            # placeholders, so read through the database when one is wired in)
+            if db is not None:
+                active_conditions = db.find_by_field_values('health_conditions', {'status': 'active'})
+                all_records = db.find_by_field_values('health_records', {})
+            else:
+                active_conditions = HealthCondition.get_by_status('active')
+                all_records = HealthRecord.get_all()
             
-            # Get recent health records (last 30 days)
-            all_records = HealthRecord.get_all()
-            thirty_days_ago = datetime.utcnow() - datetime.timedelta(days=30)
+            # Keep the recent health records (last 30 days)
+            thirty_days_ago = datetime.utcnow() - timedelta(days=30)
             recent_records = [
-                r for r in all_records 
-                if isinstance(r.get('record_date'), datetime) and r['record_date'] >= thirty_days_ago
+                r for r in all_records
+                if (to_datetime(r.get('record_date')) or datetime.min) >= thirty_days_ago
             ]
             
             # Return dashboard data
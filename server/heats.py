@@ -2,6 +2,7 @@ from flask import Blueprint, request, jsonify, url_for, redirect
 from .database import DatabaseInterface, DatabaseError
 from datetime import datetime
 from .config import debug_log
+from .utils.heat_prediction import get_heat_predictor
 
 heats_bp = Blueprint('heats', __name__)
 
@@ -45,9 +46,10 @@ def handle_heats():
             print(f"Heat created successfully: {new_heat}")
             # Check if new_heat is a dict or has data attribute
             if hasattr(new_heat, 'data'):
-                return jsonify(new_heat.data[0] if new_heat.data else {}), 201
-            else:
-                return jsonify(new_heat), 201  # If it's already a dict
+                new_heat = new_heat.data[0] if new_heat.data else {}
+            # A new heat moves the dam's next forecast
+            heat_predictor.upsert_heat(new_heat)
+            return jsonify(new_heat), 201
         except Exception as e:
             print(f"Error creating heat: {str(e)}")
             return jsonify({'error': 'Failed to save heat, please try again'}), 500
@@ -70,10 +72,12 @@ def handle_heat(heat_id):
         elif request.method == 'PUT':
             data = request.get_json()
             updated_heat = db.update('heats', heat_id, data)
+            heat_predictor.upsert_heat(updated_heat)
             return jsonify(updated_heat)
             
         elif request.method == 'DELETE':
             db.delete('heats', heat_id)
+            heat_predictor.remove_heat(heat_id)
             return jsonify({'message': 'Heat deleted successfully'}), 200
             
     except DatabaseError as e:
@@ -145,7 +149,36 @@ def get_heat(heat_id):
         debug_log(f"Error getting heat: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@heats_bp.route('/predictions', methods=['GET'])
+def get_heat_predictions():
+    """Next-heat forecasts for every dam, optionally limited to windows inside start_date/end_date"""
+    try:
+        start_date = request.args.get('start_date')
+        end_date = request.args.get('end_date')
+        if start_date and end_date:
+            predictions = heat_predictor.between(start_date, end_date)
+        else:
+            predictions = heat_predictor.forecasts()
+        return jsonify(predictions)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        debug_log(f"Error getting heat predictions: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@heats_bp.route('/predictions/<int:dog_id>', methods=['GET'])
+def get_heat_prediction(dog_id):
+    try:
+        prediction = heat_predictor.forecast_for(dog_id)
+        if prediction is None:
+            return jsonify({'error': 'No heats recorded for this dog'}), 404
+        return jsonify(prediction)
+    except Exception as e:
+        debug_log(f"Error getting heat prediction for dog {dog_id}: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 def create_heats_bp(database: DatabaseInterface):
-    global db
+    global db, heat_predictor
     db = database
+    heat_predictor = get_heat_predictor(database)
     return heats_bp
\ No newline at end of file
@@ -0,0 +1,59 @@
+"""
+jobs.py
+
+Blueprint for inspecting and cancelling background jobs.
+"""
+
+from flask import Blueprint, request, jsonify
+from server.database.db_interface import DatabaseInterface
+from .config import debug_log
+from .utils.jobs import get_job_runner
+
+
+def create_jobs_bp(db: DatabaseInterface) -> Blueprint:
+    jobs_bp = Blueprint("jobs_bp", __name__)
+
+    job_runner = get_job_runner(db)
+
+    # List recent jobs
+    @jobs_bp.route("/", methods=["GET"])
+    def list_jobs():
+        try:
+            limit = int(request.args.get("limit", 50))
+            jobs = job_runner.list(
+                status=request.args.get("status"),
+                job_type=request.args.get("job_type"),
+                limit=limit
+            )
+            return jsonify(jobs)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except Exception as e:
+            debug_log(f"Error listing jobs: {str(e)}")
+            return jsonify({"error": str(e)}), 500
+
+    # Get job status and progress
+    @jobs_bp.route("/<job_id>", methods=["GET"])
+    def get_job(job_id):
+        try:
+            job = job_runner.get(job_id)
+            if not job:
+                return jsonify({"error": f"Job {job_id} not found"}), 404
+            return jsonify(job)
+        except Exception as e:
+            debug_log(f"Error fetching job {job_id}: {str(e)}")
+            return jsonify({"error": str(e)}), 500
+
+    # Cancel a queued or running job
+    @jobs_bp.route("/<job_id>/cancel", methods=["POST"])
+    def cancel_job(job_id):
+        try:
+            job = job_runner.cancel(job_id)
+            if not job:
+                return jsonify({"error": f"Job {job_id} not found"}), 404
+            return jsonify(job)
+        except Exception as e:
+            debug_log(f"Error cancelling job {job_id}: {str(e)}")
+            return jsonify({"error": str(e)}), 500
+
+    return jobs_bp
@@ -5,6 +5,8 @@ Supports text messages and media attachments including photos and videos.
 
 from datetime import datetime
 from server.supabase_client import supabase
+from server.storage import get_storage
+import io
 import os
 import uuid
 
@@ -164,7 +166,7 @@ class Message:
         Upload media to storage
         
         Args:
-            file_data: Binary file data
+            file_data: Binary file data, or a binary stream
             file_name: Original file name
             file_type: MIME type of the file
             
@@ -183,21 +185,14 @@ class Message:
             elif not file_type.startswith("image/"):
                 folder = "documents"
                 
-            # Upload to Supabase Storage
+            # Upload to the message_media store (Supabase Storage unless configured otherwise)
             file_path = f"{folder}/{unique_name}"
-            response = supabase.storage.from_("message_media").upload(
-                file_path, 
-                file_data,
-                file_options={"contentType": file_type}
-            )
+            storage = get_storage("message_media")
+            stream = io.BytesIO(file_data) if isinstance(file_data, (bytes, bytearray)) else file_data
+            storage.put(file_path, stream, content_type=file_type)
             
-            if response.error:
-                raise Exception(response.error.message)
-                
             # Get the public URL
-            public_url = supabase.storage.from_("message_media").get_public_url(file_path)
-            
-            return public_url
+            return storage.url(file_path)
         except Exception as e:
             print(f"Error uploading media: {str(e)}")
             return None
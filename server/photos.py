@@ -5,28 +5,83 @@ Blueprint for managing photo uploads and retrievals for different entities.
 """
 
 import os
-import uuid
 import traceback
-from flask import Blueprint, request, jsonify, make_response, current_app
+from concurrent.futures import ThreadPoolExecutor
+from flask import Blueprint, request, jsonify, make_response
 from werkzeug.utils import secure_filename
 from datetime import datetime
 from server.database.db_interface import DatabaseInterface
 from .config import debug_log
+from .utils.image_derivatives import get_derivative_pipeline, with_display_urls
+from .utils.blob_store import get_blob_store, normalise_extension
+from .utils.cover_photos import get_cover_photos
+from .utils.image_normalization import skip_near_duplicates
+
+# Files stored concurrently by a batch upload, and the most one batch may carry
+BATCH_UPLOAD_WORKERS = int(os.getenv("BATCH_UPLOAD_WORKERS", 8))
+MAX_BATCH_FILES = int(os.getenv("MAX_BATCH_FILES", 100))
+
+# Columns filled by processing a photo, copied from an earlier upload of the same content
+PROCESSED_FIELDS = ("derivatives", "taken_at", "width", "height", "phash")
+
+# Entities one gallery request may ask for, and photos returned per entity by default / at most
+MAX_GALLERY_ENTITIES = 100
+GALLERY_PAGE_SIZE = 12
+MAX_GALLERY_PAGE_SIZE = 100
 
 def create_photos_bp(db: DatabaseInterface) -> Blueprint:
     photos_bp = Blueprint("photos_bp", __name__)
     
+    # Thumbnail/medium/large renditions, rendered off-request after each upload
+    derivatives = get_derivative_pipeline(db)
+    
+    # Uploads are stored once per distinct content
+    blob_store = get_blob_store(db)
+    
+    # Cover changes are one set-based operation; current covers are cached
+    cover_photos = get_cover_photos(db)
+    if cover_photos.record_changes not in derivatives.on_recorded:
+        derivatives.on_recorded.append(cover_photos.record_changes)
+    
+    def display_photos(photos):
+        """Add the display_url for ?size=thumbnail|medium|large, preferring WebP when accepted"""
+        accept_webp = "image/webp" in request.headers.get("Accept", "")
+        return with_display_urls(photos, request.args.get("size"), accept_webp)
+    
+    def arrange_photos(photos):
+        """Order photos for ?sort=order|taken_at and drop near-duplicates for ?distinct=true"""
+        # Sort by order field, or by capture date (undated photos last)
+        photos.sort(key=lambda p: (p.get("order") or 0, p.get("id") or 0))
+        if request.args.get("sort") == "taken_at":
+            photos.sort(key=lambda p: (p.get("taken_at") is None, p.get("taken_at") or ""))
+        
+        # Leave out near-duplicate shots, by their stored perceptual hashes
+        if request.args.get("distinct", "").lower() == "true":
+            photos = skip_near_duplicates(photos)
+        return photos
+    
+    def parse_entities(value):
+        """[(entity_type, entity_id)] from "dog:1,puppy:4", keeping the first of any repeats"""
+        entities = []
+        for pair in value.split(","):
+            if not pair.strip():
+                continue
+            entity_type, _, entity_id = pair.strip().partition(":")
+            if not entity_type or not entity_id.isdigit():
+                raise ValueError(f"Invalid entity {pair.strip()!r}; expected <entity_type>:<entity_id>")
+            if (entity_type, int(entity_id)) not in entities:
+                entities.append((entity_type, int(entity_id)))
+        if not entities:
+            raise ValueError("Missing required parameter: entities")
+        if len(entities) > MAX_GALLERY_ENTITIES:
+            raise ValueError(f"At most {MAX_GALLERY_ENTITIES} entities per request")
+        return entities
+    
     # Helper function to check if file extension is allowed
     def allowed_file(filename):
         ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
         return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
     
-    # Helper function to generate a unique filename
-    def generate_unique_filename(filename):
-        ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
-        unique_name = f"{uuid.uuid4().hex}"
-        return f"{unique_name}.{ext}" if ext else unique_name
-    
     # Helper function to save a file
     def save_file(file, entity_type, entity_id):
         if not file or file.filename == '':
@@ -39,35 +94,59 @@ def create_photos_bp(db: DatabaseInterface) -> Blueprint:
             # Secure the filename to prevent any malicious paths
             orig_filename = secure_filename(file.filename)
             
-            # Generate a unique filename to prevent collisions
-            unique_filename = generate_unique_filename(orig_filename)
-            
-            # Define the upload directory
-            upload_dir = os.path.join(current_app.root_path, 'uploads')
-            
-            # Create directory if it doesn't exist
-            if not os.path.exists(upload_dir):
-                os.makedirs(upload_dir)
-            
-            # Define the complete path for saving
-            file_path = os.path.join(upload_dir, unique_filename)
-            
-            # Save the file
-            file.save(file_path)
-            
-            # Generate the URL
-            url = f"/uploads/{unique_filename}"
+            # Store under the content hash; identical content is only stored once, and
+            # a photo that was normalised before reuses the normalised blob
+            blob = blob_store.put(file.stream, orig_filename, replacement=normalised_hash)
             
             # Return the file URL and original filename
             return {
-                "url": url,
-                "original_filename": orig_filename
+                "url": blob["url"],
+                "original_filename": orig_filename,
+                "content_hash": blob["content_hash"],
+                "source_hash": blob["source_hash"],
+                "deduplicated": blob["deduplicated"]
             }, None
             
         except Exception as e:
             debug_log(f"Error saving file: {str(e)}")
             return None, str(e)
     
+    def normalised_hash(source_hash):
+        """The blob a photo uploaded with this content was moved to when it was normalised, if any"""
+        try:
+            for photo in db.find_by_field_values("photos", {"source_hash": source_hash}):
+                if photo.get("content_hash"):
+                    return photo["content_hash"]
+        except Exception as e:
+            debug_log(f"Error looking up photos by source hash: {str(e)}")
+        return None
+    
+    def processed_fields(content_hash):
+        """Renditions and metadata already recorded for the same content, so re-uploads skip processing"""
+        for photo in db.find_by_field_values("photos", {"content_hash": content_hash}):
+            if photo.get("derivatives"):
+                return {field: photo.get(field) for field in PROCESSED_FIELDS}
+        return {}
+    
+    def delete_photo_files(photo):
+        """Release the photo's blob, or delete its files if it predates content addressing"""
+        if photo.get("content_hash"):
+            blob_store.release(photo["content_hash"], normalise_extension(photo["url"]))
+            return
+        
+        rendition_urls = [
+            url for renditions in (photo.get("derivatives") or {}).values()
+            for url in renditions.values()
+        ]
+        for url in [photo["url"]] + rendition_urls:
+            key = blob_store.storage.key_for(url)
+            if key is None:
+                continue
+            try:
+                blob_store.storage.delete(key)
+            except Exception as e:
+                debug_log(f"Error deleting file: {str(e)}")
+    
     @photos_bp.route("/test", methods=["GET"])
     def test_photos_api():
         """Test endpoint to verify the photos API is working"""
@@ -77,7 +156,10 @@ def create_photos_bp(db: DatabaseInterface) -> Blueprint:
             "message": "Photos API is working correctly",
             "endpoints": [
                 {"method": "POST", "path": "/api/photos", "description": "Upload a photo"},
-                {"method": "GET", "path": "/api/photos/<entity_type>/<entity_id>", "description": "Get photos for an entity"},
+                {"method": "POST", "path": "/api/photos/batch", "description": "Upload several photos of one entity"},
+                {"method": "GET", "path": "/api/photos/<entity_type>/<entity_id>?size=thumbnail|medium|large&sort=order|taken_at&distinct=true", "description": "Get photos for an entity"},
+                {"method": "GET", "path": "/api/photos/covers?entity_type=<type>&ids=1,2,3", "description": "Get the cover photos of many entities"},
+                {"method": "GET", "path": "/api/photos/gallery?entities=<type>:<id>,...&limit=12&offset=0&covers_only=true", "description": "Get the photos of many entities, grouped and paginated"},
                 {"method": "DELETE", "path": "/api/photos/<photo_id>", "description": "Delete a photo"},
                 {"method": "PUT", "path": "/api/photos/<photo_id>", "description": "Update a photo"}
             ]
@@ -86,6 +168,8 @@ def create_photos_bp(db: DatabaseInterface) -> Blueprint:
     @photos_bp.route("", methods=["POST"])
     @photos_bp.route("/", methods=["POST"])
     def upload_photo():
+        # The blob stays pinned against release() until its row is written
+        pinned = None
         debug_log(f"Photo upload endpoint called with method: {request.method}")
         debug_log(f"Content-Type: {request.content_type}")
         debug_log(f"Request URL: {request.url}")
@@ -97,13 +181,16 @@ def create_photos_bp(db: DatabaseInterface) -> Blueprint:
             debug_log(f"Request files: {request.files.keys() if request.files else 'No files'}")
             debug_log(f"Request form data: {dict(request.form) if request.form else 'No form data'}")
             
+            # Content that is already stored can be referenced by hash instead of re-sent
+            content_hash = request.form.get('content_hash')
+            
             # Ensure the request has files
-            if 'file' not in request.files:
+            if 'file' not in request.files and not content_hash:
                 debug_log("Error: No file found in request")
                 return jsonify({"error": "No file part in the request"}), 400
                 
-            file = request.files['file']
-            debug_log(f"File received: {file.filename}")
+            file = request.files.get('file')
+            debug_log(f"File received: {file.filename if file else content_hash}")
             
             # Get entity type and ID from the form data
             entity_type = request.form.get('entity_type')
@@ -126,26 +213,34 @@ def create_photos_bp(db: DatabaseInterface) -> Blueprint:
             except ValueError:
                 return jsonify({"error": "entity_id and order must be integers"}), 400
             
-            # Save the file
-            file_info, error = save_file(file, entity_type, entity_id)
-            
-            if error:
-                return jsonify({"error": f"Failed to save file: {error}"}), 500
+            # Save the file, or reuse the stored blob it refers to
+            if file is None:
+                blob = blob_store.find(content_hash)
+                if blob is None:
+                    return jsonify({"error": "No stored file matches content_hash"}), 404
+                pinned = blob["content_hash"]
+                file_info = {
+                    "url": blob["url"],
+                    "original_filename": request.form.get('original_filename', ''),
+                    "content_hash": blob["content_hash"],
+                    "source_hash": blob["content_hash"],
+                    "deduplicated": True
+                }
+            else:
+                file_info, error = save_file(file, entity_type, entity_id)
+                
+                if error:
+                    return jsonify({"error": f"Failed to save file: {error}"}), 500
+                pinned = file_info["content_hash"]
                 
-            # Find all existing photos for this entity
-            existing_photos = db.find_by_field_values("photos", {
-                "related_type": entity_type,
-                "related_id": entity_id
-            })
-            
             # Determine if this should be a cover photo
             # If is_cover is None (not specified in the upload):
-            # 1. If there are no existing photos, make it a cover (first photo is always cover)
-            # 2. If there are existing photos, don't make it a cover (preserve existing cover)
+            # 1. If the entity has no cover yet, make it a cover (first photo is always cover)
+            # 2. If it already has one, don't make it a cover (preserve existing cover)
             # This ensures uploading from Media Library won't change the cover photo status
             if is_cover is None:
-                is_cover = len(existing_photos) == 0
-                debug_log(f"is_cover not specified, setting to {is_cover} based on {len(existing_photos)} existing photos")
+                is_cover = not cover_photos.has_cover(entity_type, entity_id)
+                debug_log(f"is_cover not specified, setting to {is_cover}")
             
             # Create a new photo record
             photo_data = {
@@ -155,42 +250,24 @@ def create_photos_bp(db: DatabaseInterface) -> Blueprint:
                 "original_filename": file_info["original_filename"],
                 "is_cover": is_cover,
                 "order": order,
-                "caption": caption
+                "caption": caption,
+                "content_hash": file_info["content_hash"],
+                "source_hash": file_info["source_hash"]
             }
             
-            # If this is a cover photo, first set all other photos as non-cover
-            if is_cover:
-                try:
-                    # Update them all to not be cover photos
-                    for photo in existing_photos:
-                        if photo["is_cover"]:
-                            db.update("photos", photo["id"], {"is_cover": False})
-                except Exception as e:
-                    debug_log(f"Error updating cover photos: {str(e)}")
-                    # Continue anyway, Supabase constraint should handle this
+            # Identical content was uploaded before: reuse its renditions and metadata
+            if file_info["deduplicated"]:
+                photo_data.update(processed_fields(file_info["content_hash"]))
             
             # Create the photo record
             photo = db.create("photos", photo_data)
+            if not photo.get("derivatives"):
+                derivatives.submit(photo)
             
-            # Update the entity's cover_photo field if this is a cover photo
+            # Make it the entity's only cover and update the entity's cover_photo field
             if photo["is_cover"]:
-                table_name = {
-                    "dog": "dogs",
-                    "litter": "litters",
-                    "puppy": "puppies"
-                }.get(entity_type)
-                
-                if table_name:
-                    # Check if the file exists before setting it as cover
-                    file_path = None
-                    if photo["url"].startswith("/uploads/"):
-                        file_path = os.path.join(current_app.root_path, photo["url"].lstrip("/"))
-                    
-                    if not file_path or os.path.exists(file_path):
-                        debug_log(f"Setting cover photo for {entity_type} {entity_id} to {photo['url']}")
-                        db.update(table_name, entity_id, {"cover_photo": photo["url"]})
-                    else:
-                        debug_log(f"Warning: Cover photo file {file_path} does not exist")
+                debug_log(f"Setting cover photo for {entity_type} {entity_id} to {photo['url']}")
+                cover_photos.set_cover(photo)
             
             return jsonify(photo), 201
             
@@ -198,6 +275,103 @@ def create_photos_bp(db: DatabaseInterface) -> Blueprint:
             debug_log(f"Error uploading photo: {str(e)}")
             traceback.print_exc()
             return jsonify({"error": str(e)}), 500
+        finally:
+            blob_store.unpin(pinned)
+    
+    @photos_bp.route("/batch", methods=["POST"])
+    def upload_photos_batch():
+        """
+        Upload several photos of one entity in one request.
+        
+        The files (form field "files") are stored concurrently, all rows are
+        inserted with one bulk write, and renditions are queued for the process
+        pool. Every file gets its own status, so one bad file does not fail
+        the batch: 201 when all were stored, 207 when some were, 400 when none.
+        """
+        # Stored blobs stay pinned against release() until their rows are written
+        pinned = []
+        try:
+            files = request.files.getlist('files') or request.files.getlist('file')
+            if not files:
+                return jsonify({"error": "No files in the request"}), 400
+            if len(files) > MAX_BATCH_FILES:
+                return jsonify({"error": f"At most {MAX_BATCH_FILES} files per batch"}), 400
+            
+            entity_type = request.form.get('entity_type')
+            entity_id = request.form.get('entity_id')
+            caption = request.form.get('caption', '')
+            if not entity_type or not entity_id:
+                return jsonify({
+                    "error": "Missing required fields: entity_type and entity_id"
+                }), 400
+            try:
+                entity_id = int(entity_id)
+                order = int(request.form.get('order', '0'))
+            except ValueError:
+                return jsonify({"error": "entity_id and order must be integers"}), 400
+            
+            # Store every file concurrently; hashing and disk writes release the GIL
+            with ThreadPoolExecutor(max_workers=min(BATCH_UPLOAD_WORKERS, len(files))) as pool:
+                stored = list(pool.map(lambda f: save_file(f, entity_type, entity_id), files))
+            pinned = [file_info["content_hash"] for file_info, error in stored if not error]
+            
+            results = []
+            photo_rows = []
+            processed = {}
+            for file, (file_info, error) in zip(files, stored):
+                if error:
+                    results.append({"filename": file.filename, "ok": False, "error": error})
+                    continue
+                # Identical content was uploaded before: reuse its renditions and metadata
+                content_hash = file_info["content_hash"]
+                if file_info["deduplicated"] and content_hash not in processed:
+                    processed[content_hash] = processed_fields(content_hash)
+                results.append({"filename": file.filename, "ok": True})
+                row = {
+                    "related_type": entity_type,
+                    "related_id": entity_id,
+                    "url": file_info["url"],
+                    "original_filename": file_info["original_filename"],
+                    "is_cover": False,
+                    "order": order + len(photo_rows),
+                    "caption": caption,
+                    "content_hash": content_hash,
+                    "source_hash": file_info["source_hash"]
+                }
+                # Every row of a bulk insert carries the same columns
+                row.update(dict.fromkeys(PROCESSED_FIELDS), **processed.get(content_hash, {}))
+                photo_rows.append(row)
+            
+            # The first photo of an entity without a cover becomes its cover
+            if photo_rows and not cover_photos.has_cover(entity_type, entity_id):
+                photo_rows[0]["is_cover"] = True
+            
+            # One bulk insert for the whole batch
+            created = db.create_many("photos", photo_rows) if photo_rows else []
+            
+            for photo in created:
+                if not photo.get("derivatives"):
+                    derivatives.submit(photo)
+            if created and created[0]["is_cover"]:
+                cover_photos.set_cover(created[0])
+            
+            created_photos = iter(created)
+            for result in results:
+                if result["ok"]:
+                    result["photo"] = next(created_photos)
+            
+            failed = len(results) - len(created)
+            debug_log(f"Batch upload for {entity_type} {entity_id}: {len(created)} stored, {failed} failed")
+            status = 201 if not failed else (207 if created else 400)
+            return jsonify({"results": results, "created": len(created), "failed": failed}), status
+            
+        except Exception as e:
+            debug_log(f"Error uploading photo batch: {str(e)}")
+            traceback.print_exc()
+            return jsonify({"error": str(e)}), 500
+        finally:
+            for content_hash in pinned:
+                blob_store.unpin(content_hash)
     
     @photos_bp.route("/<entity_type>/<int:entity_id>", methods=["GET"])
     def get_photos(entity_type, entity_id):
@@ -208,15 +382,95 @@ def create_photos_bp(db: DatabaseInterface) -> Blueprint:
                 "related_id": entity_id
             })
             
-            # Sort by order field
-            photos.sort(key=lambda p: p.get("order", 0))
-            
-            return jsonify(photos), 200
+            return jsonify(display_photos(arrange_photos(photos))), 200
             
         except Exception as e:
             debug_log(f"Error getting photos: {str(e)}")
             return jsonify({"error": str(e)}), 500
     
+    @photos_bp.route("/gallery", methods=["GET"])
+    def get_gallery():
+        """
+        Photos of many entities in one request, e.g. every puppy card of a litter page
+        
+        Query:
+        - entities: comma-separated <entity_type>:<entity_id> pairs
+        - limit/offset: page of photos returned per entity
+        - covers_only=true: only each entity's cover (a thumbnail unless size says otherwise)
+        - size, sort and distinct as for GET /<entity_type>/<entity_id>
+        
+        Returns {"groups": [...]} in the order the entities were given.
+        """
+        try:
+            entities = parse_entities(request.args.get("entities", ""))
+            accept_webp = "image/webp" in request.headers.get("Accept", "")
+            
+            # Covers come from the cover cache without touching the photos table
+            if request.args.get("covers_only", "").lower() == "true":
+                covers = {}
+                for entity_type in dict.fromkeys(entity_type for entity_type, _ in entities):
+                    ids = [entity_id for t, entity_id in entities if t == entity_type]
+                    for entity_id, cover in cover_photos.covers_for(entity_type, ids).items():
+                        covers[(entity_type, entity_id)] = cover
+                with_display_urls([cover for cover in covers.values() if cover],
+                                  request.args.get("size", "thumbnail"), accept_webp)
+                return jsonify({"groups": [
+                    {"entity_type": entity_type, "entity_id": entity_id, "cover": covers[(entity_type, str(entity_id))]}
+                    for entity_type, entity_id in entities
+                ]}), 200
+            
+            limit = min(int(request.args.get("limit", GALLERY_PAGE_SIZE)), MAX_GALLERY_PAGE_SIZE)
+            offset = int(request.args.get("offset", 0))
+            if limit < 1 or offset < 0:
+                raise ValueError("limit must be positive and offset not negative")
+            
+            # One related_id IN (...) query for every entity
+            types = {entity_type for entity_type, _ in entities}
+            photos = db.find_in("photos", "related_id", [entity_id for _, entity_id in entities],
+                                {"related_type": next(iter(types))} if len(types) == 1 else None)
+            grouped = {entity: [] for entity in entities}
+            for photo in photos:
+                entity = (photo.get("related_type"), int(photo.get("related_id")))
+                if entity in grouped:
+                    grouped[entity].append(photo)
+            
+            groups = []
+            for (entity_type, entity_id), entity_photos in grouped.items():
+                entity_photos = arrange_photos(entity_photos)
+                page = entity_photos[offset:offset + limit]
+                groups.append({
+                    "entity_type": entity_type,
+                    "entity_id": entity_id,
+                    "photos": display_photos(page),
+                    "total": len(entity_photos),
+                    "has_more": offset + len(page) < len(entity_photos)
+                })
+            return jsonify({"groups": groups, "limit": limit, "offset": offset}), 200
+            
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except Exception as e:
+            debug_log(f"Error getting photo gallery: {str(e)}")
+            return jsonify({"error": str(e)}), 500
+    
+    @photos_bp.route("/covers", methods=["GET"])
+    def get_covers():
+        """Cover photos of many entities of one type, served from the cover cache"""
+        try:
+            entity_type = request.args.get("entity_type")
+            if not entity_type:
+                return jsonify({"error": "Missing required parameter: entity_type"}), 400
+            
+            ids = [i.strip() for i in request.args.get("ids", "").split(",") if i.strip()]
+            covers = cover_photos.covers_for(entity_type, ids)
+            display_photos([cover for cover in covers.values() if cover])
+            
+            return jsonify(covers), 200
+            
+        except Exception as e:
+            debug_log(f"Error getting cover photos: {str(e)}")
+            return jsonify({"error": str(e)}), 500
+    
     @photos_bp.route("/<int:photo_id>", methods=["DELETE"])
     def delete_photo(photo_id):
         try:
@@ -231,21 +485,13 @@ def create_photos_bp(db: DatabaseInterface) -> Blueprint:
             entity_id = photo["related_id"]
             was_cover = photo["is_cover"]
             
-            # Delete the physical file if it exists
-            if photo["url"] and photo["url"].startswith("/uploads/"):
-                try:
-                    file_path = os.path.join(
-                        current_app.root_path, 
-                        photo["url"].lstrip("/")
-                    )
-                    if os.path.exists(file_path):
-                        os.remove(file_path)
-                except Exception as e:
-                    debug_log(f"Error deleting file: {str(e)}")
-                    # Continue anyway, as we want to delete the DB record
-            
-            # Delete the photo record
+            # Delete the photo record, then its files once nothing else uses them
             db.delete("photos", photo_id)
+            try:
+                delete_photo_files(photo)
+            except Exception as e:
+                debug_log(f"Error deleting file: {str(e)}")
+                # Continue anyway, as the DB record is already deleted
             
             # If this was a cover photo, set another photo as cover
             if was_cover:
@@ -257,36 +503,11 @@ def create_photos_bp(db: DatabaseInterface) -> Blueprint:
                 if photos:  # There are other photos
                     # Set the first photo as cover
                     first_photo = photos[0]
-                    db.update("photos", first_photo["id"], {"is_cover": True})
-                    
-                    # Update the entity's cover_photo field
-                    table_name = {
-                        "dog": "dogs",
-                        "litter": "litters",
-                        "puppy": "puppies"
-                    }.get(entity_type)
-                    
-                    if table_name:
-                        # Check if the file exists before setting it as cover
-                        file_path = None
-                        if first_photo["url"].startswith("/uploads/"):
-                            file_path = os.path.join(current_app.root_path, first_photo["url"].lstrip("/"))
-                        
-                        if not file_path or os.path.exists(file_path):
-                            debug_log(f"Setting new cover photo for {entity_type} {entity_id} to {first_photo['url']}")
-                            db.update(table_name, entity_id, {"cover_photo": first_photo["url"]})
-                        else:
-                            debug_log(f"Warning: New cover photo file {file_path} does not exist")
+                    debug_log(f"Setting new cover photo for {entity_type} {entity_id} to {first_photo['url']}")
+                    cover_photos.set_cover(first_photo)
                 else:
                     # No other photos, clear the entity's cover_photo field
-                    table_name = {
-                        "dog": "dogs",
-                        "litter": "litters",
-                        "puppy": "puppies"
-                    }.get(entity_type)
-                    
-                    if table_name:
-                        db.update(table_name, entity_id, {"cover_photo": None})
+                    cover_photos.clear_cover(entity_type, entity_id)
             
             return jsonify({"message": "Photo deleted successfully"}), 200
             
@@ -303,42 +524,9 @@ def create_photos_bp(db: DatabaseInterface) -> Blueprint:
             if not photo:
                 return jsonify({"error": f"Photo with ID {photo_id} not found"}), 404
             
-            # Get entity type and ID
-            entity_type = photo["related_type"]
-            entity_id = photo["related_id"]
-            
-            # Find all photos for this entity
-            photos = db.find_by_field_values("photos", {
-                "related_type": entity_type,
-                "related_id": entity_id
-            })
-            
-            # Set all photos to not be cover
-            for p in photos:
-                if p["is_cover"]:
-                    db.update("photos", p["id"], {"is_cover": False})
-            
-            # Set this photo as cover
-            db.update("photos", photo_id, {"is_cover": True})
-            
-            # Update the entity's cover_photo field
-            table_name = {
-                "dog": "dogs",
-                "litter": "litters",
-                "puppy": "puppies"
-            }.get(entity_type)
-            
-            if table_name:
-                # Check if the file exists before setting it as cover
-                file_path = None
-                if photo["url"].startswith("/uploads/"):
-                    file_path = os.path.join(current_app.root_path, photo["url"].lstrip("/"))
-                
-                if not file_path or os.path.exists(file_path):
-                    debug_log(f"Setting cover photo for {entity_type} {entity_id} to {photo['url']}")
-                    db.update(table_name, entity_id, {"cover_photo": photo["url"]})
-                else:
-                    debug_log(f"Warning: Cover photo file {file_path} does not exist")
+            # Set this photo as the only cover and update the entity's cover_photo field
+            debug_log(f"Setting cover photo for {photo['related_type']} {photo['related_id']} to {photo['url']}")
+            cover_photos.set_cover(photo)
             
             return jsonify({"message": "Photo set as cover successfully"}), 200
             
@@ -416,7 +604,7 @@ def create_photos_bp(db: DatabaseInterface) -> Blueprint:
             # Sort by order field
             updated_photos.sort(key=lambda p: p.get("order", 0))
             
-            return jsonify(updated_photos), 200
+            return jsonify(display_photos(updated_photos)), 200
             
         except Exception as e:
             debug_log(f"Error reordering photos: {str(e)}")
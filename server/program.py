@@ -11,6 +11,8 @@ from flask import Blueprint, jsonify, request, make_response
 from server.database.supabase_db import SupabaseDatabase, DatabaseError
 from server.database.db_interface import DatabaseInterface
 from server.config import debug_log
+from server.utils.response_cache import ResponseCache
+from server.utils.heat_prediction import get_heat_predictor
 
 def create_program_bp(db: DatabaseInterface) -> Blueprint:
     program_bp = Blueprint("program_bp", __name__)
@@ -57,22 +59,31 @@ def create_program_bp(db: DatabaseInterface) -> Blueprint:
         except DatabaseError as e:
             return jsonify({"error": str(e)}), 500
 
+    # The dashboard is polled by every open admin tab; serve it from cache until these tables change
+    dashboard_cache = ResponseCache(["dogs", "litters", "heats", "messages"])
+    
+    # Cached next-heat forecasts, kept current by the heats endpoints
+    heat_predictor = get_heat_predictor(db)
+
     @program_bp.route("/dashboard", methods=["GET", "OPTIONS"])
     def get_dashboard_stats():
         if request.method == "OPTIONS":
             response = make_response()
             response.headers.add("Access-Control-Allow-Origin", "*")
-            response.headers.add("Access-Control-Allow-Headers", "Content-Type, Authorization")
+            response.headers.add("Access-Control-Allow-Headers", "Content-Type, Authorization, If-None-Match")
             response.headers.add("Access-Control-Allow-Methods", "GET, OPTIONS")
             return response
         
+        # Verify authentication
+        auth_header = request.headers.get("Authorization")
+        if not auth_header or not auth_header.startswith("Bearer "):
+            return jsonify({"error": "Authentication required"}), 401
+        
+        return dashboard_cache.respond(build_dashboard_stats)
+
+    def build_dashboard_stats():
         debug_log("Fetching dashboard statistics...")
         try:
-            # Verify authentication
-            auth_header = request.headers.get("Authorization")
-            if not auth_header or not auth_header.startswith("Bearer "):
-                return jsonify({"error": "Authentication required"}), 401
-            
             try:
                 # First, check if any dogs exist at all (for debugging)
                 all_dogs = db.get_filtered("dogs", {})
@@ -175,6 +186,16 @@ def create_program_bp(db: DatabaseInterface) -> Blueprint:
                 
                 debug_log(f"Found {len(upcoming_heats)} upcoming heats")
                 
+                # Forecast heat windows opening in the next 90 days
+                dog_names = {
+                    str(dog.get('id')): dog.get('registered_name') or dog.get('call_name') or f"Dog #{dog.get('id')}"
+                    for dog in all_dogs
+                }
+                predicted_heats = heat_predictor.upcoming(90)
+                for prediction in predicted_heats:
+                    prediction['dog_name'] = dog_names.get(prediction['dog_id'], f"Dog #{prediction['dog_id']}")
+                debug_log(f"Found {len(predicted_heats)} predicted heats")
+                
                 # Check if messages table exists before querying it
                 recent_messages = []
                 try:
@@ -204,6 +225,7 @@ def create_program_bp(db: DatabaseInterface) -> Blueprint:
                         },
                         "breeding_program": {
                             "upcoming_heats": len(upcoming_heats) if upcoming_heats else 0,
+                            "predicted_heats": len(predicted_heats),
                             "planned_breedings": 0
                         },
                         "engagement": {
@@ -220,6 +242,16 @@ def create_program_bp(db: DatabaseInterface) -> Blueprint:
                                 "expected_date": heat.get("expected_whelp_date") or heat.get("start_date", "Unknown Date")
                             } for heat in (upcoming_heats or [])
                         ],
+                        "predicted_heats": [
+                            {
+                                "dog_id": prediction["dog_id"],
+                                "dog_name": prediction["dog_name"],
+                                "expected_date": prediction["expected_date"],
+                                "window_start": prediction["window_start"],
+                                "window_end": prediction["window_end"],
+                                "confidence": prediction["confidence"]
+                            } for prediction in predicted_heats
+                        ],
                         "active_litters": [
                             {
                                 "id": litter.get("id", ""),
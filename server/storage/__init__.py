@@ -0,0 +1,85 @@
+"""
+Pluggable storage for uploaded files.
+
+Every upload path writes through a StorageBackend picked by name:
+
+- "uploads": photos, documents and other uploads (content-addressed blobs
+  and their renditions); local disk by default,
+- "dog_images": images from the dog form; Supabase Storage by default,
+- "message_media": message attachments; Supabase Storage by default.
+
+STORAGE_BACKEND=local|s3|supabase moves every store to one backend, and
+STORAGE_BACKEND_<NAME> (e.g. STORAGE_BACKEND_UPLOADS=s3) moves a single one.
+On S3 each store is a key prefix in S3_BUCKET ("uploads" at the root);
+S3_ENDPOINT_URL points at MinIO or another S3-compatible server.
+"""
+
+import os
+import threading
+from typing import Dict
+
+from .base import CHUNK_SIZE, StorageBackend, StorageError, check_key
+from .local import LocalStorage
+from .s3 import S3Storage
+from .supabase_storage import SupabaseStorage
+
+UPLOADS_ROOT = os.getenv(
+    "UPLOADS_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "uploads")
+)
+
+# Where each store lives unless configured otherwise: (backend, Supabase bucket, Supabase prefix)
+STORES = {
+    "uploads": ("local", "uploads", ""),
+    "dog_images": ("supabase", "uploads", "dog_images"),
+    "message_media": ("supabase", "message_media", ""),
+}
+
+
+def create_storage(name: str) -> StorageBackend:
+    """Build the configured backend for a store"""
+    if name not in STORES:
+        raise StorageError(f"Unknown store: {name}")
+    default, bucket, bucket_prefix = STORES[name]
+    backend = (os.getenv(f"STORAGE_BACKEND_{name.upper()}") or os.getenv("STORAGE_BACKEND") or default).lower()
+    # Stores other than "uploads" sit in a folder of their own on shared backends
+    folder = "" if name == "uploads" else name
+
+    if backend == "local":
+        root = os.path.join(UPLOADS_ROOT, folder) if folder else UPLOADS_ROOT
+        return LocalStorage(root, "/uploads" + (f"/{folder}" if folder else ""))
+    if backend == "s3":
+        return S3Storage(
+            bucket=os.getenv("S3_BUCKET", "uploads"),
+            prefix=folder,
+            endpoint_url=os.getenv("S3_ENDPOINT_URL") or None,
+            region=os.getenv("S3_REGION") or None,
+            access_key=os.getenv("S3_ACCESS_KEY_ID") or None,
+            secret_key=os.getenv("S3_SECRET_ACCESS_KEY") or None,
+            public_url=(os.getenv("S3_PUBLIC_URL", "").rstrip("/") + (f"/{folder}" if folder else "")
+                        if os.getenv("S3_PUBLIC_URL") else None),
+            base_url="/uploads" + (f"/{folder}" if folder else ""),
+        )
+    if backend == "supabase":
+        return SupabaseStorage(bucket, bucket_prefix)
+    raise StorageError(f"Unknown storage backend {backend!r} for {name}")
+
+
+_storages: Dict[str, StorageBackend] = {}
+_storages_lock = threading.Lock()
+
+
+def get_storage(name: str = "uploads") -> StorageBackend:
+    """Return the backend of a store, shared by every caller"""
+    with _storages_lock:
+        storage = _storages.get(name)
+        if storage is None:
+            storage = create_storage(name)
+            _storages[name] = storage
+        return storage
+
+
+__all__ = [
+    'StorageBackend', 'StorageError', 'LocalStorage', 'S3Storage', 'SupabaseStorage',
+    'check_key', 'create_storage', 'get_storage', 'CHUNK_SIZE', 'UPLOADS_ROOT',
+]
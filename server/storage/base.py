@@ -0,0 +1,137 @@
+"""
+Storage backend interface for uploaded files.
+This should be implemented by all storage providers.
+"""
+
+import contextlib
+import os
+import posixpath
+from abc import ABC, abstractmethod
+from typing import Any, BinaryIO, Dict, List, Optional
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class StorageError(Exception):
+    """Raised when a storage provider fails"""
+    pass
+
+
+def check_key(key: str) -> str:
+    """Keys are relative, '/'-separated paths that cannot leave the store"""
+    normalised = posixpath.normpath(key or "")
+    if not key or key.startswith("/") or normalised != key.rstrip("/") or normalised.startswith(".."):
+        raise StorageError(f"Invalid storage key: {key!r}")
+    return normalised
+
+
+class StorageBackend(ABC):
+    """
+    Abstract base class for object storage.
+
+    Objects are addressed by key ("blobs/ab/abcd….jpg"). Keys are listed in
+    lexicographic order so long scans can resume after the last key they saw.
+    Keys starting with "." are the backend's own scratch space and are never
+    listed.
+    """
+
+    # True when objects are plain files on this machine (see local_path())
+    local = False
+
+    @abstractmethod
+    def put(self, key: str, stream: BinaryIO, content_type: Optional[str] = None) -> int:
+        """Store a stream under key in CHUNK_SIZE pieces, replacing any object there; returns the size"""
+        raise NotImplementedError
+
+    def put_file(self, key: str, path: str, content_type: Optional[str] = None, move: bool = False) -> int:
+        """Store a local file under key; with move the file is consumed"""
+        with open(path, "rb") as f:
+            size = self.put(key, f, content_type)
+        if move:
+            os.remove(path)
+        return size
+
+    @abstractmethod
+    def open(self, key: str) -> BinaryIO:
+        """A readable stream of the object; raises FileNotFoundError if there is none"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def stat(self, key: str) -> Optional[Dict[str, Any]]:
+        """{"key", "size", "modified" (epoch seconds)} of an object, or None"""
+        raise NotImplementedError
+
+    def exists(self, key: str) -> bool:
+        return self.stat(key) is not None
+
+    @abstractmethod
+    def delete(self, key: str) -> bool:
+        """Delete an object; True if it existed"""
+        raise NotImplementedError
+
+    def move(self, key: str, target: str) -> None:
+        """Rename an object; raises FileNotFoundError if there is none"""
+        with contextlib.closing(self.open(key)) as stream:
+            self.put(target, stream)
+        self.delete(key)
+
+    @abstractmethod
+    def list(self, prefix: str = "", start_after: Optional[str] = None, limit: int = 1000) -> List[Dict[str, Any]]:
+        """Up to limit objects under prefix with keys after start_after, in key order, as stat() dicts"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def url(self, key: str) -> str:
+        """The URL stored on rows that reference the object"""
+        raise NotImplementedError
+
+    def key_for(self, url: Optional[str]) -> Optional[str]:
+        """The key of an object from its url(), or None if the URL is not in this store"""
+        base = self.url("")
+        if not url or not url.startswith(base) or len(url) == len(base):
+            return None
+        try:
+            return check_key(url[len(base):].split("?", 1)[0])
+        except StorageError:
+            return None
+
+    def local_path(self, key: str) -> Optional[str]:
+        """Filesystem path of the object for backends that keep files on this machine"""
+        return None
+
+    # ----- Direct uploads -----
+
+    def presigned_put(self, key: str, expires: int = 3600, content_type: Optional[str] = None,
+                      checksum_sha256: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        {"url", "method", "headers"} for a client to upload the object itself,
+        or None when the backend cannot sign uploads. checksum_sha256 (hex)
+        makes the backend reject any other content, where it supports that.
+        """
+        return None
+
+    def presigned_get(self, key: str, expires: int = 3600) -> Optional[str]:
+        """A time-limited URL to download the object, or None"""
+        return None
+
+    # ----- Multipart uploads -----
+
+    def create_multipart(self, key: str, content_type: Optional[str] = None) -> str:
+        """Start a multipart upload to key; returns its upload id"""
+        raise NotImplementedError(f"{type(self).__name__} does not support multipart uploads")
+
+    def upload_part(self, key: str, upload_id: str, part_number: int, stream: BinaryIO,
+                    length: Optional[int] = None) -> Dict[str, Any]:
+        """Store one part (numbered from 1); returns {"part_number", "etag"}"""
+        raise NotImplementedError(f"{type(self).__name__} does not support multipart uploads")
+
+    def presigned_part(self, key: str, upload_id: str, part_number: int, expires: int = 3600) -> Optional[str]:
+        """A URL for the client to PUT one part itself, or None"""
+        return None
+
+    def complete_multipart(self, key: str, upload_id: str, parts: List[Dict[str, Any]]) -> int:
+        """Join the parts, in part_number order, into the object; returns its size"""
+        raise NotImplementedError(f"{type(self).__name__} does not support multipart uploads")
+
+    def abort_multipart(self, key: str, upload_id: str) -> None:
+        raise NotImplementedError(f"{type(self).__name__} does not support multipart uploads")
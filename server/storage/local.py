@@ -0,0 +1,204 @@
+"""
+Local filesystem storage.
+
+Objects are files under root and are served by the app itself from base_url
+(/uploads). Writes go to a dot-file next to the target and are renamed into
+place, so readers never see a partial file. Multipart uploads keep their parts
+under root/.multipart/<upload id>/ until they are completed.
+
+The filesystem cannot sign URLs: clients that upload directly use the
+resumable upload sessions instead (see utils/resumable_uploads).
+"""
+
+import hashlib
+import os
+import re
+import shutil
+import stat
+import tempfile
+import uuid
+from typing import Any, BinaryIO, Dict, List, Optional
+
+from .base import CHUNK_SIZE, StorageBackend, StorageError, check_key
+
+MULTIPART_DIR = ".multipart"
+
+_UPLOAD_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+class LocalStorage(StorageBackend):
+    """Objects stored as files under a directory"""
+
+    local = True
+
+    def __init__(self, root: str, base_url: str = "/uploads"):
+        self.root = root
+        self.base_url = base_url.rstrip("/")
+
+    def local_path(self, key: str) -> str:
+        return os.path.join(self.root, *check_key(key).split("/"))
+
+    def url(self, key: str) -> str:
+        return f"{self.base_url}/{key}"
+
+    # ----- Objects -----
+
+    def _write(self, path: str, stream: BinaryIO) -> int:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), prefix=".", suffix=".tmp", delete=False) as tmp:
+            try:
+                size = 0
+                for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+                    tmp.write(chunk)
+                    size += len(chunk)
+            except Exception:
+                tmp.close()
+                os.unlink(tmp.name)
+                raise
+        self._place(tmp.name, path)
+        return size
+
+    @staticmethod
+    def _place(source: str, path: str) -> None:
+        # Temporary files are private; stored files are served
+        os.chmod(source, 0o644)
+        os.replace(source, path)
+
+    def put(self, key: str, stream: BinaryIO, content_type: Optional[str] = None) -> int:
+        return self._write(self.local_path(key), stream)
+
+    def put_file(self, key: str, path: str, content_type: Optional[str] = None, move: bool = False) -> int:
+        target = self.local_path(key)
+        if not move:
+            with open(path, "rb") as f:
+                return self._write(target, f)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        size = os.path.getsize(path)
+        try:
+            self._place(path, target)
+        except OSError:
+            # Another filesystem: copy, then drop the source
+            with open(path, "rb") as f:
+                size = self._write(target, f)
+            os.remove(path)
+        return size
+
+    def open(self, key: str) -> BinaryIO:
+        return open(self.local_path(key), "rb")
+
+    def stat(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            st = os.stat(self.local_path(key))
+        except (OSError, StorageError):
+            return None
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        return {"key": key, "size": st.st_size, "modified": st.st_mtime}
+
+    def delete(self, key: str) -> bool:
+        try:
+            os.remove(self.local_path(key))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def move(self, key: str, target: str) -> None:
+        target_path = self.local_path(target)
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        os.replace(self.local_path(key), target_path)
+
+    def list(self, prefix: str = "", start_after: Optional[str] = None, limit: int = 1000) -> List[Dict[str, Any]]:
+        """
+        Walk the tree in key order, skipping directories that lie entirely at
+        or before start_after, so a resumed scan does not re-read them.
+        """
+        found: List[Dict[str, Any]] = []
+        # Only the directories on the way to the prefix need to be walked
+        directory = prefix.rsplit("/", 1)[0] if "/" in prefix else ""
+        self._walk(directory, prefix, start_after or "", limit, found)
+        return found
+
+    def _walk(self, relative: str, prefix: str, start_after: str, limit: int, found: List[Dict[str, Any]]) -> None:
+        path = os.path.join(self.root, *relative.split("/")) if relative else self.root
+        try:
+            entries = list(os.scandir(path))
+        except (FileNotFoundError, NotADirectoryError):
+            return
+        # Sort as keys sort: a directory's keys carry a "/" after its name
+        entries.sort(key=lambda e: e.name + "/" if e.is_dir(follow_symlinks=False) else e.name)
+        for entry in entries:
+            if len(found) >= limit:
+                return
+            if entry.name.startswith("."):
+                continue
+            key = f"{relative}/{entry.name}" if relative else entry.name
+            if entry.is_dir(follow_symlinks=False):
+                subtree = key + "/"
+                if not (subtree.startswith(prefix) or prefix.startswith(subtree)):
+                    continue
+                if start_after >= subtree and not start_after.startswith(subtree):
+                    continue
+                self._walk(key, prefix, start_after, limit, found)
+            elif key.startswith(prefix) and key > start_after:
+                st = entry.stat(follow_symlinks=False)
+                found.append({"key": key, "size": st.st_size, "modified": st.st_mtime})
+
+    # ----- Multipart uploads -----
+
+    def _parts_dir(self, upload_id: str) -> str:
+        if not _UPLOAD_ID.match(upload_id or ""):
+            raise StorageError("Unknown multipart upload")
+        return os.path.join(self.root, MULTIPART_DIR, upload_id)
+
+    def create_multipart(self, key: str, content_type: Optional[str] = None) -> str:
+        check_key(key)
+        upload_id = uuid.uuid4().hex
+        os.makedirs(self._parts_dir(upload_id))
+        with open(os.path.join(self._parts_dir(upload_id), "key"), "w") as f:
+            f.write(key)
+        return upload_id
+
+    def _check_upload(self, key: str, upload_id: str) -> str:
+        directory = self._parts_dir(upload_id)
+        try:
+            with open(os.path.join(directory, "key")) as f:
+                if f.read() != key:
+                    raise StorageError("Multipart upload belongs to another key")
+        except FileNotFoundError:
+            raise StorageError("Unknown multipart upload")
+        return directory
+
+    def upload_part(self, key: str, upload_id: str, part_number: int, stream: BinaryIO,
+                    length: Optional[int] = None) -> Dict[str, Any]:
+        if not 1 <= part_number <= 10000:
+            raise StorageError("part_number must be between 1 and 10000")
+        directory = self._check_upload(key, upload_id)
+        digest = hashlib.md5()
+        with tempfile.NamedTemporaryFile(dir=directory, suffix=".tmp", delete=False) as tmp:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+                tmp.write(chunk)
+                digest.update(chunk)
+        os.replace(tmp.name, os.path.join(directory, f"{part_number:05d}"))
+        return {"part_number": part_number, "etag": digest.hexdigest()}
+
+    def complete_multipart(self, key: str, upload_id: str, parts: List[Dict[str, Any]]) -> int:
+        directory = self._check_upload(key, upload_id)
+        numbers = sorted(int(part["part_number"]) for part in parts)
+        paths = [os.path.join(directory, f"{number:05d}") for number in numbers]
+        missing = [number for number, path in zip(numbers, paths) if not os.path.isfile(path)]
+        if not numbers or missing:
+            raise StorageError(f"Missing parts: {missing or 'none uploaded'}")
+
+        target = self.local_path(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(target), prefix=".", suffix=".tmp",
+                                         delete=False) as joined:
+            for path in paths:
+                with open(path, "rb") as part:
+                    shutil.copyfileobj(part, joined, CHUNK_SIZE)
+        self._place(joined.name, target)
+        shutil.rmtree(directory, ignore_errors=True)
+        return os.path.getsize(target)
+
+    def abort_multipart(self, key: str, upload_id: str) -> None:
+        shutil.rmtree(self._check_upload(key, upload_id), ignore_errors=True)
@@ -0,0 +1,232 @@
+"""
+S3-compatible object storage (AWS S3, MinIO, Cloudflare R2, Backblaze B2).
+
+Uploads are streamed with boto3's managed transfer, so large files go up in
+parallel parts without being read into memory. Clients can also upload
+straight to the bucket with presigned PUT or multipart part URLs; presigned
+single uploads carry the expected SHA-256, so the bucket rejects any other
+content.
+
+Rows store public_url + key when the bucket (or a CDN in front of it) is
+public, and otherwise base_url + key on this app, which redirects to a
+short-lived presigned download.
+
+Needs boto3, which is optional: the backend is only built when configured.
+"""
+
+import base64
+import os
+from typing import Any, BinaryIO, Dict, List, Optional
+
+from .base import CHUNK_SIZE, StorageBackend, StorageError, check_key
+
+try:
+    import boto3
+    from botocore.config import Config
+    from botocore.exceptions import ClientError
+except ImportError:  # pragma: no cover - boto3 is optional
+    boto3 = None
+    Config = None
+    ClientError = Exception
+
+_MISSING = ("404", "NoSuchKey", "NotFound")
+
+
+class _CountingReader:
+    """Counts the bytes boto3 reads from a stream"""
+
+    def __init__(self, stream: BinaryIO):
+        self.stream = stream
+        self.size = 0
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self.stream.read(size)
+        self.size += len(chunk)
+        return chunk
+
+
+class S3Storage(StorageBackend):
+    """Objects stored in an S3-compatible bucket, optionally under a key prefix"""
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None,
+                 region: Optional[str] = None, access_key: Optional[str] = None,
+                 secret_key: Optional[str] = None, public_url: Optional[str] = None,
+                 base_url: str = "/uploads", client: Any = None):
+        if client is None and boto3 is None:
+            raise StorageError("S3 storage needs boto3 (pip install boto3)")
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self.endpoint_url = endpoint_url
+        self.region = region
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.public_url = public_url.rstrip("/") if public_url else None
+        self.base_url = base_url.rstrip("/")
+        self._client = client
+
+    def __getstate__(self):
+        # Clients do not cross process boundaries; workers build their own
+        state = dict(self.__dict__)
+        state["_client"] = None
+        return state
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = boto3.client(
+                "s3",
+                endpoint_url=self.endpoint_url,
+                region_name=self.region,
+                aws_access_key_id=self.access_key,
+                aws_secret_access_key=self.secret_key,
+                # MinIO and most S3-compatible servers expect path-style URLs
+                config=Config(signature_version="s3v4", s3={"addressing_style": "path"}),
+            )
+        return self._client
+
+    def _key(self, key: str) -> str:
+        return self.prefix + check_key(key)
+
+    @staticmethod
+    def _missing(error: Exception) -> bool:
+        return isinstance(error, ClientError) and str(
+            getattr(error, "response", {}).get("Error", {}).get("Code")) in _MISSING
+
+    def url(self, key: str) -> str:
+        return f"{self.public_url or self.base_url}/{key}"
+
+    # ----- Objects -----
+
+    def put(self, key: str, stream: BinaryIO, content_type: Optional[str] = None) -> int:
+        reader = _CountingReader(stream)
+        extra = {"ContentType": content_type} if content_type else None
+        try:
+            self.client.upload_fileobj(reader, self.bucket, self._key(key), ExtraArgs=extra)
+        except ClientError as e:
+            raise StorageError(str(e))
+        return reader.size
+
+    def put_file(self, key: str, path: str, content_type: Optional[str] = None, move: bool = False) -> int:
+        size = os.path.getsize(path)
+        extra = {"ContentType": content_type} if content_type else None
+        try:
+            self.client.upload_file(path, self.bucket, self._key(key), ExtraArgs=extra)
+        except ClientError as e:
+            raise StorageError(str(e))
+        if move:
+            os.remove(path)
+        return size
+
+    def open(self, key: str) -> BinaryIO:
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._key(key))["Body"]
+        except ClientError as e:
+            if self._missing(e):
+                raise FileNotFoundError(key)
+            raise StorageError(str(e))
+
+    def stat(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except ClientError as e:
+            if self._missing(e):
+                return None
+            raise StorageError(str(e))
+        return {"key": key, "size": head["ContentLength"], "modified": head["LastModified"].timestamp()}
+
+    def delete(self, key: str) -> bool:
+        # S3 deletes are idempotent and do not say whether the object existed
+        existed = self.exists(key)
+        if existed:
+            self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+        return existed
+
+    def move(self, key: str, target: str) -> None:
+        # Server-side copy: the bytes never pass through this process
+        try:
+            self.client.copy_object(Bucket=self.bucket, Key=self._key(target),
+                                    CopySource={"Bucket": self.bucket, "Key": self._key(key)})
+        except ClientError as e:
+            if self._missing(e):
+                raise FileNotFoundError(key)
+            raise StorageError(str(e))
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def list(self, prefix: str = "", start_after: Optional[str] = None, limit: int = 1000) -> List[Dict[str, Any]]:
+        params = {"Bucket": self.bucket, "Prefix": self.prefix + prefix, "MaxKeys": min(limit, 1000)}
+        if start_after:
+            params["StartAfter"] = self.prefix + start_after
+        found: List[Dict[str, Any]] = []
+        while len(found) < limit:
+            response = self.client.list_objects_v2(**params)
+            for item in response.get("Contents", []):
+                key = item["Key"][len(self.prefix):]
+                if not any(part.startswith(".") for part in key.split("/")):
+                    found.append({"key": key, "size": item["Size"], "modified": item["LastModified"].timestamp()})
+            if not response.get("IsTruncated"):
+                break
+            params["ContinuationToken"] = response["NextContinuationToken"]
+            params.pop("StartAfter", None)
+        return found[:limit]
+
+    # ----- Direct uploads -----
+
+    def presigned_put(self, key: str, expires: int = 3600, content_type: Optional[str] = None,
+                      checksum_sha256: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        params = {"Bucket": self.bucket, "Key": self._key(key)}
+        headers = {}
+        if content_type:
+            params["ContentType"] = headers["Content-Type"] = content_type
+        if checksum_sha256:
+            # Signed into the URL: the bucket refuses a body with another digest
+            checksum = base64.b64encode(bytes.fromhex(checksum_sha256)).decode()
+            params["ChecksumSHA256"] = headers["x-amz-checksum-sha256"] = checksum
+        url = self.client.generate_presigned_url("put_object", Params=params, ExpiresIn=expires)
+        return {"url": url, "method": "PUT", "headers": headers}
+
+    def presigned_get(self, key: str, expires: int = 3600) -> Optional[str]:
+        return self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": self._key(key)}, ExpiresIn=expires)
+
+    # ----- Multipart uploads -----
+
+    def create_multipart(self, key: str, content_type: Optional[str] = None) -> str:
+        params = {"Bucket": self.bucket, "Key": self._key(key)}
+        if content_type:
+            params["ContentType"] = content_type
+        return self.client.create_multipart_upload(**params)["UploadId"]
+
+    def upload_part(self, key: str, upload_id: str, part_number: int, stream: BinaryIO,
+                    length: Optional[int] = None) -> Dict[str, Any]:
+        params = {"Bucket": self.bucket, "Key": self._key(key), "UploadId": upload_id, "PartNumber": part_number}
+        if length is not None:
+            params.update(Body=stream, ContentLength=length)
+        else:
+            # Without a length the part has to be buffered (parts are at most a few MiB)
+            params["Body"] = b"".join(iter(lambda: stream.read(CHUNK_SIZE), b""))
+        try:
+            response = self.client.upload_part(**params)
+        except ClientError as e:
+            raise StorageError(str(e))
+        return {"part_number": part_number, "etag": response["ETag"]}
+
+    def presigned_part(self, key: str, upload_id: str, part_number: int, expires: int = 3600) -> Optional[str]:
+        return self.client.generate_presigned_url("upload_part", Params={
+            "Bucket": self.bucket, "Key": self._key(key), "UploadId": upload_id, "PartNumber": part_number,
+        }, ExpiresIn=expires)
+
+    def complete_multipart(self, key: str, upload_id: str, parts: List[Dict[str, Any]]) -> int:
+        ordered = sorted(parts, key=lambda part: int(part["part_number"]))
+        try:
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=self._key(key), UploadId=upload_id,
+                MultipartUpload={"Parts": [
+                    {"PartNumber": int(part["part_number"]), "ETag": part["etag"]} for part in ordered
+                ]},
+            )
+        except ClientError as e:
+            raise StorageError(str(e))
+        return self.stat(key)["size"]
+
+    def abort_multipart(self, key: str, upload_id: str) -> None:
+        self.client.abort_multipart_upload(Bucket=self.bucket, Key=self._key(key), UploadId=upload_id)
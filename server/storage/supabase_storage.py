@@ -0,0 +1,159 @@
+"""
+Supabase Storage.
+
+Dog images and message media have always lived in Supabase Storage buckets;
+this backend keeps them there behind the same interface as the others.
+Supabase has no multipart API, so large files are better sent through
+resumable upload sessions or stored on S3.
+"""
+
+import os
+import tempfile
+from datetime import datetime
+from typing import Any, BinaryIO, Dict, List, Optional
+
+from .base import CHUNK_SIZE, StorageBackend, StorageError, check_key
+
+
+class SupabaseStorage(StorageBackend):
+    """Objects stored in a public Supabase Storage bucket, optionally under a key prefix"""
+
+    def __init__(self, bucket: str, prefix: str = "", client: Any = None):
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self._client = client
+
+    def __getstate__(self):
+        # Clients do not cross process boundaries; workers build their own
+        state = dict(self.__dict__)
+        state["_client"] = None
+        return state
+
+    @property
+    def objects(self):
+        if self._client is None:
+            from server.supabase_client import supabase
+            self._client = supabase
+        return self._client.storage.from_(self.bucket)
+
+    def _key(self, key: str) -> str:
+        return self.prefix + check_key(key)
+
+    def url(self, key: str) -> str:
+        if not key:
+            # The public URL of the bucket (prefix) itself, for key_for()
+            return self.objects.get_public_url(self.prefix + "_")[:-1].rstrip("?")
+        return self.objects.get_public_url(self._key(key)).rstrip("?")
+
+    # ----- Objects -----
+
+    def put_file(self, key: str, path: str, content_type: Optional[str] = None, move: bool = False) -> int:
+        size = os.path.getsize(path)
+        options = {"upsert": "true"}
+        if content_type:
+            options["content-type"] = content_type
+        try:
+            self.objects.upload(self._key(key), path, file_options=options)
+        except Exception as e:
+            raise StorageError(str(e))
+        if move:
+            os.remove(path)
+        return size
+
+    def put(self, key: str, stream: BinaryIO, content_type: Optional[str] = None) -> int:
+        # The client uploads files from disk; spool the stream there first
+        with tempfile.NamedTemporaryFile(delete=False) as tmp:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+                tmp.write(chunk)
+        return self.put_file(key, tmp.name, content_type, move=True)
+
+    def open(self, key: str) -> BinaryIO:
+        try:
+            data = self.objects.download(self._key(key))
+        except Exception as e:
+            raise FileNotFoundError(f"{key}: {str(e)}")
+        spool = tempfile.SpooledTemporaryFile(max_size=8 * CHUNK_SIZE)
+        spool.write(data)
+        spool.seek(0)
+        return spool
+
+    def stat(self, key: str) -> Optional[Dict[str, Any]]:
+        directory, _, name = self._key(key).rpartition("/")
+        try:
+            entries = self.objects.list(directory or None, {"search": name, "limit": 100})
+        except Exception as e:
+            raise StorageError(str(e))
+        for entry in entries or []:
+            if entry.get("name") == name and entry.get("id"):
+                return self._describe(key, entry)
+        return None
+
+    @staticmethod
+    def _describe(key: str, entry: Dict[str, Any]) -> Dict[str, Any]:
+        metadata = entry.get("metadata") or {}
+        modified = entry.get("updated_at") or entry.get("created_at")
+        try:
+            modified = datetime.fromisoformat(modified.replace("Z", "+00:00")).timestamp()
+        except (AttributeError, ValueError):
+            modified = None
+        return {"key": key, "size": metadata.get("size", 0), "modified": modified}
+
+    def delete(self, key: str) -> bool:
+        try:
+            removed = self.objects.remove([self._key(key)])
+        except Exception as e:
+            raise StorageError(str(e))
+        return bool(removed)
+
+    def move(self, key: str, target: str) -> None:
+        if not self.exists(key):
+            raise FileNotFoundError(key)
+        try:
+            self.objects.move(self._key(key), self._key(target))
+        except Exception as e:
+            raise StorageError(str(e))
+
+    def list(self, prefix: str = "", start_after: Optional[str] = None, limit: int = 1000) -> List[Dict[str, Any]]:
+        found: List[Dict[str, Any]] = []
+        directory = prefix.rsplit("/", 1)[0] if "/" in prefix else ""
+        self._walk(directory, prefix, start_after or "", limit, found)
+        return found
+
+    def _walk(self, relative: str, prefix: str, start_after: str, limit: int, found: List[Dict[str, Any]]) -> None:
+        entries, offset = [], 0
+        while True:
+            page = self.objects.list((self.prefix + relative).rstrip("/") or None,
+                                     {"limit": 1000, "offset": offset, "sortBy": {"column": "name", "order": "asc"}})
+            entries.extend(page or [])
+            if not page or len(page) < 1000:
+                break
+            offset += len(page)
+        # Folders come back without an id; sort them as their keys sort
+        entries.sort(key=lambda e: e["name"] + ("/" if not e.get("id") else ""))
+        for entry in entries:
+            if len(found) >= limit:
+                return
+            if entry["name"].startswith("."):
+                continue
+            key = f"{relative}/{entry['name']}" if relative else entry["name"]
+            if not entry.get("id"):
+                subtree = key + "/"
+                if not (subtree.startswith(prefix) or prefix.startswith(subtree)):
+                    continue
+                if start_after >= subtree and not start_after.startswith(subtree):
+                    continue
+                self._walk(key, prefix, start_after, limit, found)
+            elif key.startswith(prefix) and key > start_after:
+                found.append(self._describe(key, entry))
+
+    # ----- Direct uploads -----
+
+    def presigned_put(self, key: str, expires: int = 3600, content_type: Optional[str] = None,
+                      checksum_sha256: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        signed = self.objects.create_signed_upload_url(self._key(key))
+        headers = {"Content-Type": content_type} if content_type else {}
+        return {"url": signed.get("signed_url") or signed.get("signedUrl"), "method": "PUT", "headers": headers}
+
+    def presigned_get(self, key: str, expires: int = 3600) -> Optional[str]:
+        signed = self.objects.create_signed_url(self._key(key), expires)
+        return signed.get("signedURL") or signed.get("signedUrl")
@@ -0,0 +1,125 @@
+"""
+test_blob_store.py
+
+Tests for content-addressed upload storage.
+"""
+
+import datetime
+import hashlib
+import io
+import os
+
+import pytest
+from server.utils.blob_store import BlobStore, PINS_TABLE, PIN_TTL, blob_url, normalise_extension
+
+
+class StubDatabase:
+    """Rows referencing blobs, per table"""
+
+    def __init__(self, rows=None, failing=()):
+        self.rows = rows or {}
+        self.failing = set(failing)
+
+    def find_by_field_values(self, table, filters):
+        if table in self.failing:
+            raise RuntimeError(f"relation {table} does not exist")
+        return [row for row in self.rows.get(table, [])
+                if all(row.get(k) == v for k, v in filters.items())]
+
+
+PHOTO = b"\xff\xd8\xff litter photo bytes" * 1000
+
+
+def test_put_streams_and_addresses_by_sha256(tmp_path):
+    store = BlobStore(StubDatabase(), root=str(tmp_path))
+    blob = store.put(io.BytesIO(PHOTO), "Litter.JPEG")
+
+    digest = hashlib.sha256(PHOTO).hexdigest()
+    assert blob["content_hash"] == digest
+    assert blob["size"] == len(PHOTO)
+    assert blob["url"] == blob_url(digest, "jpg") == f"/uploads/blobs/{digest[:2]}/{digest}.jpg"
+    assert not blob["deduplicated"]
+    with open(blob["path"], "rb") as stored:
+        assert stored.read() == PHOTO
+    assert os.listdir(tmp_path / ".incoming") == []
+
+
+def test_identical_content_is_stored_once(tmp_path):
+    store = BlobStore(StubDatabase(), root=str(tmp_path))
+    first = store.put(io.BytesIO(PHOTO), "a.jpg")
+    second = store.put(io.BytesIO(PHOTO), "puppy-2.jpeg")
+    assert second["deduplicated"]
+    assert second["url"] == first["url"]
+    assert len(os.listdir(os.path.dirname(first["path"]))) == 1
+    assert os.listdir(tmp_path / ".incoming") == []
+
+
+def test_find_by_hash(tmp_path):
+    store = BlobStore(StubDatabase(), root=str(tmp_path))
+    blob = store.put(io.BytesIO(PHOTO), "a.png")
+    assert store.find(blob["content_hash"])["url"] == blob["url"]
+    assert store.find("0" * 64) is None
+    assert store.find("../../etc/passwd") is None
+
+
+def test_release_keeps_referenced_blobs(tmp_path):
+    db = StubDatabase()
+    store = BlobStore(db, root=str(tmp_path))
+    blob = store.put(io.BytesIO(PHOTO), "a.jpg")
+    rendition = tmp_path / "derivatives" / f"{blob['content_hash']}_thumbnail.webp"
+    rendition.parent.mkdir()
+    rendition.write_bytes(b"thumb")
+
+    db.rows["documents"] = [{"id": 1, "content_hash": blob["content_hash"]}]
+    store.unpin(blob["content_hash"])
+    assert not store.release(blob["content_hash"], "jpg")
+    assert os.path.exists(blob["path"])
+
+    db.rows["documents"] = []
+    assert store.release(blob["content_hash"], "jpg")
+    assert not os.path.exists(blob["path"])
+    assert not rendition.exists()
+
+
+def test_blobs_are_pinned_until_their_row_is_written(tmp_path):
+    """A blob handed to an upload is not released before the upload's row exists."""
+    db = StubDatabase()
+    store = BlobStore(db, root=str(tmp_path))
+    first = store.put(io.BytesIO(PHOTO), "a.jpg")
+    store.unpin(first["content_hash"])
+
+    # A second upload dedups against the blob while the first row is being deleted
+    second = store.put(io.BytesIO(PHOTO), "b.jpg")
+    assert second["deduplicated"]
+    assert not store.release(first["content_hash"], "jpg")
+    assert os.path.exists(first["path"])
+
+    store.unpin(second["content_hash"])
+    assert store.release(first["content_hash"], "jpg")
+
+
+def test_pins_of_other_workers_are_read_from_the_database(tmp_path):
+    db = StubDatabase()
+    store = BlobStore(db, root=str(tmp_path))
+    blob = store.put(io.BytesIO(PHOTO), "a.jpg")
+    store.unpin(blob["content_hash"])
+
+    now = datetime.datetime.utcnow()
+    db.rows[PINS_TABLE] = [{"id": 1, "content_hash": blob["content_hash"], "pinned_at": now.isoformat()}]
+    assert not store.release(blob["content_hash"], "jpg")
+
+    # Pins of a worker that died before writing its row expire
+    db.rows[PINS_TABLE][0]["pinned_at"] = (now - PIN_TTL - datetime.timedelta(minutes=1)).isoformat()
+    assert store.release(blob["content_hash"], "jpg")
+
+
+def test_unqueryable_tables_count_as_references(tmp_path):
+    store = BlobStore(StubDatabase(failing={"file_uploads"}), root=str(tmp_path))
+    blob = store.put(io.BytesIO(PHOTO), "a.jpg")
+    assert not store.release(blob["content_hash"], "jpg")
+    assert os.path.exists(blob["path"])
+
+
+def test_extension_aliases():
+    assert normalise_extension("x.JPEG") == normalise_extension("y.jpg") == "jpg"
+    assert normalise_extension("noext") == ""
@@ -0,0 +1,130 @@
+"""
+test_columnar_snapshot.py
+
+Tests for the columnar analytics snapshot and the health reports built on it.
+"""
+
+import os
+import pytest
+from server.utils.columnar_snapshot import ColumnarSnapshotStore, SnapshotNotReady
+from server.utils.health_reports import REPORTS
+
+
+class StubDatabase:
+    """Minimal database stub counting table reads."""
+
+    def __init__(self, tables):
+        self.tables = tables
+        self.reads = 0
+
+    def scan(self, table, page_size=1000):
+        self.reads += 1
+        return iter(list(self.tables.get(table, [])))
+
+
+@pytest.fixture
+def db():
+    return StubDatabase({
+        "vaccinations": [
+            {"id": 1, "dog_id": 1, "vaccine_name": "Rabies", "administration_date": "2023-05-01",
+             "next_due_date": "2099-05-01"},
+            {"id": 2, "dog_id": 2, "vaccine_name": "Rabies", "administration_date": "2024-05-01",
+             "next_due_date": None},
+            {"id": 3, "puppy_id": 7, "vaccine_name": "DHPP", "administration_date": "2024-06-01T00:00:00Z",
+             "next_due_date": "2020-01-01"},
+        ],
+        "weight_records": [
+            {"id": 1, "dog_id": 1, "weight": 30.0, "measurement_date": "2024-01-01"},
+            {"id": 2, "dog_id": 1, "weight": 32.5, "measurement_date": "2024-03-01"},
+            {"id": 3, "puppy_id": 7, "weight": 4.2, "measurement_date": "2024-02-01"},
+        ],
+        "medication_records": [
+            {"id": 1, "dog_id": 1, "medication_name": "Heartworm", "start_date": "2024-01-01", "end_date": None},
+        ],
+        "health_conditions": [],
+    })
+
+
+@pytest.fixture
+def store(db, tmp_path):
+    return ColumnarSnapshotStore(db, directory=str(tmp_path))
+
+
+def test_refresh_writes_one_file_per_column(store, tmp_path):
+    """Each column is stored in its own file, strings dictionary-encoded."""
+    manifest = store.refresh()
+
+    vaccinations = manifest["tables"]["vaccinations"]
+    assert vaccinations["rows"] == 3
+    assert vaccinations["columns"]["administration_date"]["type"] == "date"
+    assert vaccinations["columns"]["vaccine_name"]["dictionary"] == ["Rabies", "DHPP"]
+    assert os.path.exists(tmp_path / manifest["generation"] / "vaccinations" / "vaccine_name.bin")
+
+
+def test_reports_read_snapshot_not_database(store, db):
+    """Reports are computed from the snapshot without querying the database again."""
+    store.refresh()
+    reads = db.reads
+
+    vaccinations = REPORTS["vaccinations"](store)
+    weights = REPORTS["weights"](store)
+    medications = REPORTS["medications"](store)
+
+    assert db.reads == reads
+    assert vaccinations["by_vaccine"] == {"Rabies": 2, "DHPP": 1}
+    assert vaccinations["by_year"] == {"2023": 1, "2024": 2}
+    assert vaccinations["overdue"] == 1
+    assert weights["subjects"]["dog:1"] == {
+        "count": 2, "min": 30.0, "max": 32.5, "average": 31.25,
+        "latest": 32.5, "latest_date": "2024-03-01",
+    }
+    assert weights["subjects"]["puppy:7"]["latest"] == 4.2
+    assert medications == {"total": 1, "by_medication": {"Heartworm": 1}, "active": 1}
+
+
+def test_report_date_range_filter(store):
+    """start/end restrict rows by the report's date column."""
+    report = REPORTS["vaccinations"](store, start="2024-01-01", end="2024-05-31")
+
+    assert report["total"] == 1
+    assert report["by_vaccine"] == {"Rabies": 1}
+
+
+def test_refresh_if_stale_swaps_generations(db, tmp_path):
+    """A stale snapshot is replaced and the old generation removed."""
+    store = ColumnarSnapshotStore(db, directory=str(tmp_path), max_age=0)
+    first = store.refresh()
+    reopened = ColumnarSnapshotStore(db, directory=str(tmp_path), max_age=3600)
+
+    assert reopened.refresh_if_stale()["generation"] == first["generation"]
+
+    store.max_age = -1
+    second = store.refresh_if_stale()
+    assert second["generation"] != first["generation"]
+    assert not os.path.exists(tmp_path / first["generation"])
+
+
+def test_stale_snapshots_are_refreshed_in_the_background(db, tmp_path):
+    """Reads schedule one refresh and keep serving the last snapshot until it is swapped in."""
+    store = ColumnarSnapshotStore(db, directory=str(tmp_path), max_age=3600)
+    scheduled = []
+    store.schedule_refresh = lambda: scheduled.append(True)
+
+    # Nothing to serve yet: the first export is scheduled, not run inside the request
+    with pytest.raises(SnapshotNotReady):
+        store.table("vaccinations")
+    assert scheduled == [True] and db.reads == 0
+
+    first = store.refresh()
+    store.max_age = -1
+    db.tables["vaccinations"].append({"id": 4, "dog_id": 3, "vaccine_name": "Lepto",
+                                      "administration_date": "2024-07-01", "next_due_date": None})
+    assert store.table("vaccinations").rows == 3
+    assert store.table("vaccinations").rows == 3
+    # Requested once until the refresh runs
+    assert scheduled == [True, True]
+
+    second = store.refresh()
+    assert second["generation"] != first["generation"]
+    assert store.manifest()["tables"]["vaccinations"]["rows"] == 4
+    assert not os.path.exists(tmp_path / first["generation"])
@@ -0,0 +1,133 @@
+"""
+test_cover_photos.py
+
+Tests for set-based cover photo changes and the cover cache.
+"""
+
+import pytest
+from server.utils.cover_photos import CoverPhotos, COVER_FUNCTION
+
+
+class StubDatabase:
+    """Photos in memory; records every round trip"""
+
+    def __init__(self, photos, with_function=True):
+        self.photos = {p["id"]: dict(p) for p in photos}
+        self.parents = {}
+        self.with_function = with_function
+        self.calls = []
+
+    def find_by_field_values(self, table, filters):
+        self.calls.append(("find", table))
+        return [dict(p) for p in self.photos.values()
+                if all(p.get(k) == v for k, v in filters.items())]
+
+    def find_in(self, table, field, values, filters=None):
+        self.calls.append(("find_in", table))
+        return [dict(p) for p in self.photos.values() if p.get(field) in values]
+
+    def update(self, table, record_id, data):
+        self.calls.append(("update", table))
+        self.photos[record_id].update(data)
+        return dict(self.photos[record_id])
+
+    def update_where(self, table, filters, data):
+        self.calls.append(("update_where", table))
+        if table != "photos":
+            self.parents[(table, filters["id"])] = data["cover_photo"]
+            return []
+        rows = [p for p in self.photos.values() if all(p.get(k) == v for k, v in filters.items())]
+        for p in rows:
+            p.update(data)
+        return rows
+
+    def call_function(self, name, params, writes=()):
+        self.calls.append(("rpc", name))
+        if not self.with_function:
+            raise NotImplementedError(name)
+        for p in self.photos.values():
+            if (p["related_type"], p["related_id"]) == (params["p_related_type"], params["p_related_id"]):
+                p["is_cover"] = p["id"] == params["p_photo_id"]
+        photo = self.photos.get(params["p_photo_id"])
+        self.parents[("dogs", params["p_related_id"])] = photo["url"] if photo else None
+
+
+def make_photos(count, cover_index=0):
+    return [{"id": i + 1, "related_type": "dog", "related_id": 5, "url": f"/uploads/{i + 1}.jpg",
+             "is_cover": i == cover_index} for i in range(count)]
+
+
+def test_load_caches_covers_with_one_query():
+    db = StubDatabase(make_photos(3) + [{"id": 9, "related_type": "litter", "related_id": 2,
+                                         "url": "/uploads/9.jpg", "is_cover": True}])
+    covers = CoverPhotos(db)
+    assert covers.cover_for("dog", 5)["id"] == 1
+    assert covers.covers_for("litter", [2, 3]) == {
+        "2": {"id": 9, "url": "/uploads/9.jpg", "derivatives": None, "related_type": "litter", "related_id": 2},
+        "3": None,
+    }
+    assert db.calls == [("find_in", "photos")]
+
+
+def test_set_cover_is_one_call_however_many_photos():
+    db = StubDatabase(make_photos(50))
+    covers = CoverPhotos(db)
+    covers.load()
+    db.calls.clear()
+
+    covers.set_cover(db.photos[30])
+
+    assert db.calls == [("rpc", COVER_FUNCTION)]
+    assert [p["id"] for p in db.photos.values() if p["is_cover"]] == [30]
+    assert db.parents[("dogs", 5)] == "/uploads/30.jpg"
+    assert covers.cover_for("dog", 5)["id"] == 30
+
+
+def test_set_based_fallback_without_the_function():
+    db = StubDatabase(make_photos(50), with_function=False)
+    covers = CoverPhotos(db)
+    covers.load()
+    db.calls.clear()
+
+    covers.set_cover(db.photos[30])
+    assert db.calls == [("rpc", COVER_FUNCTION), ("update_where", "photos"),
+                        ("update", "photos"), ("update_where", "dogs")]
+    assert [p["id"] for p in db.photos.values() if p["is_cover"]] == [30]
+    assert db.parents[("dogs", 5)] == "/uploads/30.jpg"
+
+    # The missing function is not tried again
+    db.calls.clear()
+    covers.clear_cover("dog", 5)
+    assert db.calls == [("update_where", "photos"), ("update_where", "dogs")]
+    assert not any(p["is_cover"] for p in db.photos.values())
+    assert db.parents[("dogs", 5)] is None
+    assert covers.cover_for("dog", 5) is None
+
+
+def test_cached_cover_follows_row_changes():
+    db = StubDatabase(make_photos(2))
+    covers = CoverPhotos(db)
+    covers.load()
+    covers.record_changes(1, {"derivatives": {"thumbnail": {"jpeg": "/uploads/derivatives/1_thumbnail.jpg"}}})
+    covers.record_changes(2, {"derivatives": {"thumbnail": {"jpeg": "/uploads/derivatives/2_thumbnail.jpg"}}})
+    assert covers.cover_for("dog", 5)["derivatives"] == {
+        "thumbnail": {"jpeg": "/uploads/derivatives/1_thumbnail.jpg"}}
+    assert db.parents == {}
+
+    # A cover moved to another blob also moves the parent's cover_photo
+    covers.record_changes(1, {"url": "/uploads/blobs/ab/ab.jpg", "content_hash": "ab"})
+    assert covers.cover_for("dog", 5)["url"] == "/uploads/blobs/ab/ab.jpg"
+    assert db.parents[("dogs", 5)] == "/uploads/blobs/ab/ab.jpg"
+
+
+def test_cache_misses_are_confirmed_before_a_cover_is_assumed_missing():
+    """A cover set by another worker after the cache loaded is found, and the cache learns it."""
+    db = StubDatabase(make_photos(2, cover_index=None))
+    covers = CoverPhotos(db)
+    assert not covers.has_cover("dog", 5)
+
+    db.photos[2]["is_cover"] = True
+    assert covers.has_cover("dog", 5)
+    assert covers.cover_for("dog", 5)["id"] == 2
+    calls = len(db.calls)
+    assert covers.has_cover("dog", 5) and len(db.calls) == calls
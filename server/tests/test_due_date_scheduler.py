@@ -0,0 +1,156 @@
+"""
+test_due_date_scheduler.py
+
+Tests for the in-memory due-date scheduler.
+"""
+
+import datetime
+import pytest
+from flask import Flask
+from server.utils.due_date_scheduler import (
+    DueDateScheduler, KIND_VACCINATION, KIND_MEDICATION
+)
+
+NOW = datetime.datetime(2025, 3, 1, 12, 0)
+
+
+class StubDatabase:
+    """In-memory tables exposing what the scheduler and the health endpoints use."""
+
+    def __init__(self, tables):
+        self.tables = tables
+        self.fail_creates = set()
+
+    def scan(self, table, page_size=1000):
+        return iter(list(self.tables.get(table, [])))
+
+    def get(self, table, id):
+        return next((row for row in self.tables.get(table, []) if row["id"] == id), None)
+
+    def create(self, table, data):
+        if table in self.fail_creates:
+            raise RuntimeError(f"insert into {table} failed")
+        rows = self.tables.setdefault(table, [])
+        row = dict(data, id=max([r["id"] for r in rows], default=0) + 1)
+        rows.append(row)
+        return row
+
+    def update(self, table, id, data):
+        row = self.get(table, id)
+        row.update(data)
+        return row
+
+    def delete(self, table, id):
+        self.tables[table] = [row for row in self.tables.get(table, []) if row["id"] != id]
+        return True
+
+
+@pytest.fixture
+def scheduler():
+    db = StubDatabase({
+        "vaccinations": [
+            {"id": 1, "vaccine_name": "Rabies", "dog_id": 1, "next_due_date": "2025-03-05"},
+            {"id": 2, "vaccine_name": "DHPP", "puppy_id": 4, "next_due_date": "2025-03-20T00:00:00Z"},
+            {"id": 3, "vaccine_name": "Lepto", "dog_id": 2, "next_due_date": "2025-06-01"},
+            {"id": 4, "vaccine_name": "Bordetella", "dog_id": 2, "next_due_date": "2025-02-20"},
+            {"id": 5, "vaccine_name": "Old", "dog_id": 2, "next_due_date": "2024-01-01"},
+        ],
+        "medication_records": [
+            {"id": 10, "medication_name": "Carprofen", "dog_id": 1, "end_date": "2025-03-10"},
+            {"id": 11, "medication_name": "Heartworm", "dog_id": 1, "end_date": None},
+            {"id": 12, "medication_name": "Antibiotic", "dog_id": 2, "end_date": "2025-02-01"},
+        ],
+    })
+    scheduler = DueDateScheduler(db)
+    scheduler.load()
+    return scheduler
+
+
+def test_due_within_returns_window_in_order(scheduler):
+    """Only items inside the window are returned, earliest first."""
+    items = scheduler.due_within(30, now=NOW)
+
+    assert [(i["kind"], i["record_id"]) for i in items] == [
+        (KIND_VACCINATION, "1"),
+        (KIND_MEDICATION, "10"),
+        (KIND_VACCINATION, "2"),
+    ]
+
+
+def test_due_within_filters_kinds_and_overdue(scheduler):
+    """Kinds can be filtered and overdue items are opt-in."""
+    items = scheduler.due_within(10, kinds=[KIND_VACCINATION], include_overdue=True, now=NOW)
+
+    assert [i["record_id"] for i in items] == ["4", "1"]
+    assert items[0]["overdue"] is True
+
+
+def test_upsert_and_remove_keep_heap_current(scheduler):
+    """Writes replace or drop the tracked due date."""
+    scheduler.upsert(KIND_VACCINATION, {"id": 3, "vaccine_name": "Lepto", "next_due_date": "2025-03-03"})
+    scheduler.remove(KIND_VACCINATION, 1)
+
+    items = scheduler.due_within(5, now=NOW)
+
+    assert [(i["kind"], i["record_id"]) for i in items] == [
+        (KIND_VACCINATION, "3"),
+    ]
+
+
+def test_active_medications_include_open_ended(scheduler):
+    """Open-ended and still running medications are active, finished ones are not."""
+    active_ids = sorted(m["id"] for m in scheduler.active_medications(now=NOW))
+
+    assert active_ids == [10, 11]
+
+
+def test_reminders_are_only_sent_once(scheduler):
+    """Marked reminders are not produced a second time."""
+    first = scheduler.reminders(7, now=NOW)
+    for payload in first:
+        scheduler.mark_reminded(payload)
+    second = scheduler.reminders(7, now=NOW)
+
+    assert {r["title"] for r in first} == {"Rabies due", "Bordetella due"}
+    assert second == []
+    rabies = next(r for r in first if r["title"] == "Rabies due")
+    assert rabies["entity_type"] == "dog" and rabies["entity_id"] == 1
+
+
+def test_health_endpoints_keep_the_scheduler_current():
+    """Vaccination writes reach the heap and failed notification writes are retried."""
+    from server.health import create_health_bp
+
+    today = datetime.date.today()
+    db = StubDatabase({"vaccinations": [], "medication_records": []})
+    app = Flask(__name__)
+    app.register_blueprint(create_health_bp(db), url_prefix="/api/health")
+    client = app.test_client()
+    auth = {"Authorization": "Bearer token"}
+
+    created = client.post("/api/health/vaccinations", headers=auth, json={
+        "vaccine_name": "Rabies", "dog_id": 1,
+        "administration_date": today.isoformat(),
+        "next_due_date": (today + datetime.timedelta(days=5)).isoformat(),
+    })
+    assert created.status_code == 201
+    vaccination_id = created.get_json()["data"]["id"]
+
+    due = client.get("/api/health/due?days=10", headers=auth).get_json()["data"]
+    assert [item["record_id"] for item in due] == [str(vaccination_id)]
+
+    db.fail_creates.add("notifications")
+    assert client.post("/api/health/reminders", headers=auth, json={"days": 10}).status_code == 500
+    db.fail_creates.clear()
+    sent = client.post("/api/health/reminders", headers=auth, json={"days": 10}).get_json()
+    assert [n["title"] for n in sent["data"]] == ["Rabies due"]
+    assert client.post("/api/health/reminders", headers=auth, json={"days": 10}).get_json()["count"] == 0
+
+    moved = client.put(f"/api/health/vaccinations/{vaccination_id}", headers=auth, json={
+        "next_due_date": (today + datetime.timedelta(days=40)).isoformat(),
+    })
+    assert moved.status_code == 200
+    assert client.get("/api/health/due?days=10", headers=auth).get_json()["count"] == 0
+
+    assert client.delete(f"/api/health/vaccinations/{vaccination_id}", headers=auth).status_code == 200
+    assert client.get("/api/health/due?days=60", headers=auth).get_json()["count"] == 0
@@ -0,0 +1,202 @@
+"""
+test_event_calendar.py
+
+Tests for the interval index and the date-range calendar query engine.
+"""
+
+import datetime
+import random
+import pytest
+from server.utils.interval_index import IntervalIndex
+from server.utils.event_calendar import EventCalendar, view_window
+
+
+class StubDatabase:
+    """Database stub counting table scans and range queries."""
+
+    def __init__(self, events):
+        self.events = events
+        self.range_queries = 0
+        self.scans = 0
+
+    def scan(self, table, page_size=1000):
+        self.scans += 1
+        return iter(list(self.events) if table == "events" else [])
+
+    def find_overlapping(self, table, start_field, end_field, window_start, window_end, filters=None):
+        self.range_queries += 1
+        return [
+            e for e in self.events
+            if e[start_field] <= window_end.isoformat()
+            and (e.get(end_field) or e[start_field]) >= window_start.isoformat()
+        ]
+
+
+EVENTS = [
+    {"id": 1, "title": "Whelping", "start_date": "2025-03-02T00:00:00", "end_date": "2025-03-02T00:00:00",
+     "event_type": "litter_milestone"},
+    {"id": 2, "title": "Show weekend", "start_date": "2025-02-27T09:00:00", "end_date": "2025-03-01T18:00:00",
+     "event_type": "show"},
+    {"id": 3, "title": "Vet visit", "start_date": "2025-04-10T10:00:00", "end_date": None,
+     "event_type": "vet_appointment"},
+]
+
+
+def test_interval_index_matches_brute_force():
+    """Overlap queries agree with a linear scan on random intervals."""
+    rng = random.Random(7)
+    index = IntervalIndex()
+    intervals = {}
+    for key in range(300):
+        start = rng.randint(0, 1000)
+        end = start + rng.randint(0, 50)
+        intervals[key] = (start, end)
+        index.add(key, start, end, key)
+    for key in range(0, 300, 3):
+        index.remove(key)
+        del intervals[key]
+
+    for _ in range(100):
+        lo = rng.randint(0, 1000)
+        hi = lo + rng.randint(0, 100)
+        expected = sorted(
+            (k for k, (s, e) in intervals.items() if s <= hi and e >= lo),
+            key=lambda k: intervals[k]
+        )
+        assert index.overlapping(lo, hi) == expected
+
+
+def test_interval_index_batches_rebuilds_between_queries(monkeypatch):
+    """Writes interleaved with queries are answered correctly without a rebuild per write."""
+    rng = random.Random(11)
+    index = IntervalIndex()
+    intervals = {}
+    for key in range(500):
+        start = rng.randint(0, 1000)
+        intervals[key] = (start, start + rng.randint(0, 50))
+        index.add(key, *intervals[key], key)
+    index.values()
+
+    rebuilds = []
+    rebuild = index._rebuild
+    monkeypatch.setattr(index, "_rebuild", lambda: rebuilds.append(1) or rebuild())
+    for step in range(300):
+        key = rng.randrange(600)
+        if key in intervals and rng.random() < 0.5:
+            index.remove(key)
+            del intervals[key]
+        else:
+            start = rng.randint(0, 1000)
+            intervals[key] = (start, start + rng.randint(0, 50))
+            index.add(key, *intervals[key], key)
+
+        lo = rng.randint(0, 1000)
+        hi = lo + rng.randint(0, 100)
+        expected = sorted(i for i in intervals.values() if i[0] <= hi and i[1] >= lo)
+        assert [intervals[k] for k in index.overlapping(lo, hi)] == expected
+    assert sorted(index.values()) == sorted(intervals)
+    assert 0 < len(rebuilds) < 20
+
+
+def test_view_window_covers_month_grid():
+    """Month views span whole weeks; week views honour the first weekday."""
+    start, end = view_window("month", datetime.date(2025, 3, 15))
+    assert (start.date(), end.date()) == (datetime.date(2025, 2, 23), datetime.date(2025, 4, 5))
+
+    start, end = view_window("week", datetime.date(2025, 3, 5), first_weekday=0)
+    assert (start.date(), end.date()) == (datetime.date(2025, 3, 3), datetime.date(2025, 3, 9))
+
+    with pytest.raises(ValueError):
+        view_window("year", datetime.date(2025, 3, 5))
+
+
+def test_between_uses_index_once_loaded():
+    """Loaded calendars answer from the index; multi-day events overlap the window."""
+    db = StubDatabase(EVENTS)
+    event_calendar = EventCalendar(db)
+    event_calendar.load()
+
+    events = event_calendar.between("2025-03-01T00:00:00", "2025-03-31T23:59:59")
+
+    assert [e["id"] for e in events] == [2, 1]
+    assert db.range_queries == 0
+    assert [e["id"] for e in event_calendar.between(
+        "2025-01-01", "2025-12-31", {"event_type": "vet_appointment"})] == [3]
+
+
+def test_load_indexes_every_page_of_events():
+    """The index is built from a full scan, not a single capped read."""
+    events = [{"id": i, "title": f"Event {i}", "start_date": f"2025-{1 + i % 12:02d}-01T00:00:00",
+               "end_date": None, "event_type": "custom"} for i in range(1, 1501)]
+
+    class CappedDatabase(StubDatabase):
+        def find_by_field_values(self, table, filters):
+            return list(self.events)[:1000]
+
+    db = CappedDatabase(events)
+    event_calendar = EventCalendar(db)
+    event_calendar.load()
+    assert db.scans == 1
+    assert len(event_calendar.between("2025-01-01", "2025-12-31T23:59:59")) == 1500
+
+
+def test_between_falls_back_to_database_range_query():
+    """If the index cannot be loaded, range filtering happens in the database."""
+    class UnloadableDatabase(StubDatabase):
+        def scan(self, table, page_size=1000):
+            raise RuntimeError("connection refused")
+
+    db = UnloadableDatabase(EVENTS)
+    event_calendar = EventCalendar(db)
+
+    events = event_calendar.between("2025-04-01", "2025-04-30")
+
+    assert [e["id"] for e in events] == [3]
+    assert db.range_queries == 1
+
+
+def test_write_hooks_keep_index_current():
+    """Upserted and removed events are reflected in later queries."""
+    event_calendar = EventCalendar(StubDatabase(EVENTS))
+    event_calendar.load()
+
+    event_calendar.upsert({"id": 3, "title": "Vet visit", "start_date": "2025-03-20T10:00:00"})
+    event_calendar.remove(1)
+    view = event_calendar.view("month", datetime.date(2025, 3, 1))
+
+    assert [e["id"] for e in view["events"]] == [2, 3]
+
+
+def test_series_are_listed_with_filled_titles_and_legacy_birthdays_once():
+    """all() fills series placeholders; legacy fixed-age birthdays are not expanded."""
+    series = {"id": 4, "title": "Bella's {occurrence_ordinal} Birthday", "start_date": "2022-06-01T00:00:00",
+              "end_date": "2022-06-01T00:00:00", "event_type": "birthday", "recurring": "RRULE:FREQ=YEARLY"}
+    legacy = {"id": 5, "title": "Rex's 3st Birthday", "start_date": "2024-05-01T00:00:00",
+              "end_date": "2024-05-01T00:00:00", "event_type": "birthday", "recurring": "yearly"}
+    calendar = EventCalendar(StubDatabase(EVENTS + [series, legacy]))
+
+    listed = {event["id"]: event for event in calendar.all()}
+    assert listed[4]["title"] == "Bella's 1st Birthday" and listed[4]["series_id"] == 4
+    assert listed[5]["title"] == "Rex's 3st Birthday"
+
+    titles = [event["title"] for event in calendar.between("2025-01-01", "2025-12-31")]
+    assert "Bella's 4th Birthday" in titles
+    assert "Rex's 3st Birthday" not in titles
+
+
+def test_unbounded_listing_expands_series_over_a_window():
+    """With a window, all() lists every one-off event plus the occurrences of each series inside it."""
+    series = {"id": 4, "title": "Bella's {occurrence_ordinal} Birthday", "start_date": "2022-06-01T00:00:00",
+              "end_date": "2022-06-01T00:00:00", "event_type": "birthday", "related_type": "dog",
+              "related_id": 1, "recurring": "RRULE:FREQ=YEARLY"}
+    calendar = EventCalendar(StubDatabase(EVENTS + [series]))
+
+    listed = calendar.all(window=("2025-01-01", "2026-12-31"))
+    assert [event["id"] for event in listed] == [2, 1, 3, 4, 4]
+    assert [event["title"] for event in listed if event["id"] == 4] == ["Bella's 4th Birthday", "Bella's 5th Birthday"]
+    assert len({event.get("occurrence_key") for event in listed if event["id"] == 4}) == 2
+
+    births = calendar.all({"related_type": "dog", "related_id": 1}, window=("2025-01-01", "2025-12-31"))
+    assert [event["start_date"] for event in births] == ["2025-06-01T00:00:00"]
+    # Without a window each series is listed once, filled
+    assert [event["title"] for event in calendar.all({"event_type": "birthday"})] == ["Bella's 1st Birthday"]
@@ -0,0 +1,76 @@
+"""
+test_event_conflicts.py
+
+Tests for per-dog booking conflict detection.
+"""
+
+import pytest
+from server.utils.event_conflicts import ConflictIndex
+from server.utils.event_calendar import EventCalendar
+
+
+class StubDatabase:
+    def __init__(self, events):
+        self.events = events
+
+    def scan(self, table, page_size=1000):
+        return iter(list(self.events))
+
+
+def booking(event_id, start, end=None, dog=1, event_type="vet_appointment", **extra):
+    return dict({"id": event_id, "title": f"Booking {event_id}", "start_date": start, "end_date": end or start,
+                 "event_type": event_type, "related_type": "dog", "related_id": dog, "all_day": False}, **extra)
+
+
+EVENTS = [
+    booking(1, "2025-03-03T10:00:00", "2025-03-03T11:00:00"),
+    booking(2, "2025-03-03T11:00:00", "2025-03-03T12:00:00"),          # touches 1: no conflict
+    booking(3, "2025-03-08T00:00:00", "2025-03-09T00:00:00", event_type="show", all_day=True),
+    booking(4, "2025-03-03T10:30:00", "2025-03-03T10:45:00", dog=2),    # other dog
+    booking(5, "2025-03-03T10:00:00", event_type="litter_milestone"),  # not a booking
+    booking(6, "2025-01-06T09:00:00", "2025-01-06T10:00:00", event_type="training",
+            recurring="RRULE:FREQ=WEEKLY"),                             # Mondays 9-10
+]
+
+
+def index():
+    conflicts = ConflictIndex()
+    for event in EVENTS:
+        conflicts.add(event)
+    return conflicts
+
+
+def test_conflicts_for_new_event():
+    """Overlaps are found for the same dog only; touching intervals are allowed."""
+    conflicts = index()
+    assert [e["id"] for e in conflicts.conflicts_for(booking(None, "2025-03-03T10:30:00", "2025-03-03T11:30:00"))] == [1, 2]
+    assert conflicts.conflicts_for(booking(None, "2025-03-03T12:00:00", "2025-03-03T13:00:00")) == []
+    assert conflicts.conflicts_for(booking(None, "2025-03-03T10:30:00", event_type="custom")) == []
+    # All-day show blocks any time on both days
+    assert [e["id"] for e in conflicts.conflicts_for(booking(None, "2025-03-09T15:00:00", "2025-03-09T16:00:00"))] == [3]
+    # Weekly training occurrence on Monday March 10th
+    hits = conflicts.conflicts_for(booking(None, "2025-03-10T09:30:00", "2025-03-10T09:45:00"))
+    assert [(e["id"], e["start_date"]) for e in hits] == [(6, "2025-03-10T09:00:00")]
+
+
+def test_update_ignores_the_event_itself():
+    """An edited event does not conflict with its own stored version."""
+    conflicts = index()
+    assert conflicts.conflicts_for(dict(EVENTS[0], end_date="2025-03-03T10:50:00")) == []
+    conflicts.remove(2)
+    assert conflicts.conflicts_for(dict(EVENTS[0], end_date="2025-03-03T11:30:00")) == []
+
+
+def test_conflicts_between_window():
+    """The window listing pairs overlapping bookings per dog."""
+    events = EVENTS + [booking(7, "2025-03-03T10:15:00", "2025-03-03T10:20:00")]
+    calendar = EventCalendar(StubDatabase(events))
+    pairs = calendar.conflicts_between("2025-03-01", "2025-03-31")
+    assert [(p["dog_id"], [e["id"] for e in p["events"]]) for p in pairs] == [("1", [1, 7])]
+    assert calendar.conflicts_between("2025-03-01", "2025-03-31", dog_id=2) == []
+
+    calendar.upsert(booking(8, "2025-03-17T08:30:00", "2025-03-17T09:30:00", event_type="grooming"))
+    pairs = calendar.conflicts_between("2025-03-17", "2025-03-18")
+    assert [[e["id"] for e in p["events"]] for p in pairs] == [[8, 6]]
+    with pytest.raises(ValueError):
+        calendar.conflicts_between("soon", "later")
@@ -0,0 +1,119 @@
+"""
+test_event_generation.py
+
+Tests for set-based litter milestone generation.
+"""
+
+import pytest
+from server.utils.event_generation import (
+    generate_litter_events, generate_birthday_events, litter_event_plan, LITTER_MILESTONES, DAM_CARE_EVENTS
+)
+
+
+class StubDatabase:
+    """Database stub counting event reads and writes."""
+
+    def __init__(self, litters, dogs, events=None):
+        self.tables = {"litters": litters, "dogs": dogs}
+        self.events = list(events or [])
+        self.event_reads = 0
+        self.bulk_inserts = 0
+
+    def get(self, table, record_id):
+        return self.tables[table].get(record_id)
+
+    def find_by_field_values(self, table, filters):
+        self.event_reads += 1
+        return [e for e in self.events if all(e.get(k) == v for k, v in filters.items())]
+
+    def update(self, table, record_id, data):
+        event = next(e for e in self.events if e["id"] == record_id)
+        event.update(data)
+        return event
+
+    def create_many(self, table, records):
+        self.bulk_inserts += 1
+        created = []
+        for record in records:
+            record = dict(record, id=len(self.events) + 1)
+            self.events.append(record)
+            created.append(record)
+        return created
+
+
+LITTER = {"id": 5, "litter_name": "Spring", "whelp_date": "2025-03-01", "dam_id": 9}
+DAM = {"id": 9, "call_name": "Bella"}
+
+
+def test_plan_covers_litter_and_dam_events():
+    """The plan holds every milestone plus the dam care events, dated from whelping."""
+    plan = litter_event_plan(LITTER, DAM)
+    assert len(plan) == len(LITTER_MILESTONES) + len(DAM_CARE_EVENTS)
+    assert plan[0]["title"] == "Spring - Birth day"
+    assert plan[0]["start_date"] == "2025-03-01T00:00:00"
+    assert {e["related_type"] for e in plan} == {"litter", "dog"}
+
+
+def test_plan_requires_a_date():
+    """Litters without whelp or expected date are rejected."""
+    with pytest.raises(ValueError):
+        litter_event_plan({"id": 1})
+
+
+def test_generation_uses_one_read_per_entity_and_one_insert():
+    """Duplicate checks read events once per related entity and insert in bulk."""
+    db = StubDatabase({5: LITTER}, {9: DAM})
+    result = generate_litter_events(db, 5)
+    assert result["created"] == len(LITTER_MILESTONES) + len(DAM_CARE_EVENTS)
+    assert result["skipped"] == 0
+    assert db.event_reads == 2
+    assert db.bulk_inserts == 1
+
+
+def test_generation_skips_existing_events():
+    """Re-running only creates the milestones that are missing."""
+    db = StubDatabase({5: LITTER}, {9: DAM})
+    generate_litter_events(db, 5)
+    del db.events[0]
+
+    result = generate_litter_events(db, 5)
+    assert result["created"] == 1
+    assert result["skipped"] == len(LITTER_MILESTONES) + len(DAM_CARE_EVENTS) - 1
+    assert result["events"][0]["title"] == "Spring - Birth day"
+
+    result = generate_litter_events(db, 5)
+    assert result["created"] == 0
+    assert db.bulk_inserts == 2
+
+
+def test_missing_litter_raises_lookup_error():
+    """Unknown litters surface as LookupError (404 at the endpoint)."""
+    with pytest.raises(LookupError):
+        generate_litter_events(StubDatabase({}, {}), 1)
+
+
+def test_birthdays_created_once_per_dog():
+    """Dogs with a recurring birthday series are skipped; the rest are inserted in bulk."""
+    dogs = [{"id": 1, "call_name": "Rex", "birth_date": "2020-02-29"},
+            {"id": 2, "call_name": "Bella", "birth_date": "2021-06-01"},
+            {"id": 3, "call_name": "Nobirth"}]
+    db = StubDatabase({}, {}, events=[{"id": 50, "related_type": "dog", "related_id": 2,
+                                       "event_type": "birthday", "recurring": "RRULE:FREQ=YEARLY"}])
+    result = generate_birthday_events(db, dogs)
+    assert result["created"] == 1
+    assert result["events"][0]["start_date"] == "2021-02-28T00:00:00"
+    assert db.bulk_inserts == 1
+    assert generate_birthday_events(db, dogs)["created"] == 0
+
+
+def test_legacy_birthdays_are_migrated_to_series():
+    """Old fixed-age "yearly" birthday rows do not block the series; they become it."""
+    dogs = [{"id": 2, "call_name": "Bella", "birth_date": "2021-06-01"}]
+    db = StubDatabase({}, {}, events=[{"id": 50, "related_type": "dog", "related_id": 2, "title": "Bella's 4st Birthday",
+                                       "event_type": "birthday", "recurring": "yearly"}])
+    result = generate_birthday_events(db, dogs)
+    assert result["created"] == 0 and result["migrated"] == 1
+    assert db.bulk_inserts == 0
+    assert db.events[0]["id"] == 50 and db.events[0]["recurring"] == "RRULE:FREQ=YEARLY"
+    assert db.events[0]["title"] == "Bella's {occurrence_ordinal} Birthday"
+    assert generate_birthday_events(db, dogs)["skipped"] == 1
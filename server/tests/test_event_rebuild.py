@@ -0,0 +1,131 @@
+"""
+test_event_rebuild.py
+
+Tests for the bulk event rebuild used by database/scripts/generate_all_events.py.
+"""
+
+import json
+import threading
+import pytest
+from server.utils.event_generation import LITTER_MILESTONES, DAM_CARE_EVENTS
+from server.utils.event_rebuild import EventRebuilder
+
+
+class StubDatabase:
+    """Database stub counting table scans and bulk inserts; can fail one insert."""
+
+    def __init__(self, litters, dogs, fail_on_litter=None):
+        self.tables = {"litters": litters, "dogs": dogs, "events": []}
+        self.reads = 0
+        self.bulk_inserts = 0
+        self.fail_on_litter = fail_on_litter
+        self._lock = threading.Lock()
+
+    def scan(self, table, page_size=1000):
+        self.reads += 1
+        return iter([dict(row) for row in self.tables[table]])
+
+    def update(self, table, record_id, data):
+        row = next(row for row in self.tables[table] if row["id"] == record_id)
+        row.update(data)
+        return dict(row)
+
+    def delete(self, table, record_id):
+        self.tables[table] = [row for row in self.tables[table] if row["id"] != record_id]
+        return True
+
+    def create_many(self, table, records, chunk_size=500):
+        with self._lock:
+            if self.fail_on_litter and any(r["related_id"] == self.fail_on_litter and r["related_type"] == "litter"
+                                           for r in records):
+                raise RuntimeError("connection reset")
+            self.bulk_inserts += 1
+            created = [dict(r, id=len(self.tables[table]) + i + 1) for i, r in enumerate(records)]
+            self.tables[table].extend(created)
+            return created
+
+
+DOGS = [{"id": 1, "call_name": "Bella", "status": "Active", "birth_date": "2020-05-01"},
+        {"id": 2, "call_name": "Max", "status": "Sold", "birth_date": "2021-05-01"}]
+LITTERS = [{"id": i, "dam_id": 1, "whelp_date": f"2025-0{1 + i % 9}-01"} for i in range(1, 21)] + \
+          [{"id": 99, "litter_name": "Planned"}]
+
+PER_LITTER = len(LITTER_MILESTONES)
+
+
+def quiet(**kwargs):
+    return dict(log=lambda message: None, **kwargs)
+
+
+def test_rebuild_creates_everything_once_and_is_idempotent(tmp_path):
+    """A full rebuild creates each event once; running it again creates nothing."""
+    db = StubDatabase(LITTERS, DOGS)
+    stats = EventRebuilder(db, **quiet(workers=4, batch_size=6, checkpoint_path=str(tmp_path / "cp.json"))).run()
+
+    # Dam care events share titles across litters of the same dam and are created once
+    assert stats["created"] == 20 * PER_LITTER + len(DAM_CARE_EVENTS)
+    assert stats["birthdays_created"] == 1
+    assert [f["litter_id"] for f in stats["failed"]] == [99]
+    assert db.reads == 3
+    assert db.bulk_inserts == 4 + 1
+    assert not (tmp_path / "cp.json").exists()
+
+    again = EventRebuilder(db, **quiet(workers=4, batch_size=6)).run()
+    assert again["created"] == 0 and again["birthdays_created"] == 0
+
+
+def test_legacy_birthdays_are_migrated_not_duplicated():
+    """A legacy "yearly" birthday row becomes the series; extra legacy rows are removed."""
+    dogs = DOGS + [{"id": 3, "call_name": "Luna", "status": "Active", "birth_date": "2019-02-01"}]
+    db = StubDatabase([], dogs)
+    legacy = {"event_type": "birthday", "related_type": "dog", "recurring": "yearly", "start_date": "2024-05-01"}
+    db.tables["events"] = [
+        dict(legacy, id=10, related_id=1, title="Bella's 4th Birthday"),
+        dict(legacy, id=11, related_id=1, title="Bella's 5th Birthday"),
+        {"id": 12, "event_type": "birthday", "related_type": "dog", "related_id": 3,
+         "recurring": "RRULE:FREQ=YEARLY", "title": "Luna's {occurrence_ordinal} Birthday"},
+        dict(legacy, id=13, related_id=3, title="Luna's 5th Birthday"),
+    ]
+
+    stats = EventRebuilder(db, **quiet()).run(birthdays_only=True)
+    assert stats["birthdays_created"] == 0
+    assert stats["birthdays_migrated"] == 1 and stats["legacy_birthdays_removed"] == 2
+    birthdays = {event["id"]: event for event in db.tables["events"]}
+    assert sorted(birthdays) == [10, 12]
+    assert birthdays[10]["recurring"] == "RRULE:FREQ=YEARLY"
+    assert birthdays[10]["title"] == "Bella's {occurrence_ordinal} Birthday"
+
+    again = EventRebuilder(db, **quiet()).run(birthdays_only=True)
+    assert again["birthdays_created"] == again["birthdays_migrated"] == again["legacy_birthdays_removed"] == 0
+
+
+def test_failed_batch_is_resumed_from_checkpoint(tmp_path):
+    """Batches that fail stay out of the checkpoint and are picked up by --resume."""
+    checkpoint = tmp_path / "cp.json"
+    db = StubDatabase(LITTERS, DOGS, fail_on_litter=7)
+    stats = EventRebuilder(db, **quiet(workers=2, batch_size=5, checkpoint_path=str(checkpoint))).run()
+    assert {f["litter_id"] for f in stats["failed"]} >= {6, 7, 8, 9, 10}
+
+    done = set(json.loads(checkpoint.read_text())["litters_done"])
+    assert "7" not in done and "1" in done
+
+    db.fail_on_litter = None
+    resumed = EventRebuilder(db, **quiet(workers=2, batch_size=5, checkpoint_path=str(checkpoint),
+                                         resume=True)).run()
+    assert resumed["litters_skipped"] == len(LITTERS) - 5
+    assert resumed["created"] == 5 * PER_LITTER
+    assert not checkpoint.exists()
+
+
+def test_dry_run_writes_nothing():
+    """Dry runs report planned events without inserting."""
+    db = StubDatabase(LITTERS, DOGS)
+    stats = EventRebuilder(db, **quiet(dry_run=True)).run(litters_only=True)
+    assert stats["created"] > 0
+    assert db.bulk_inserts == 0
+
+
+def test_invalid_pool_settings_are_rejected():
+    """Worker and batch counts must be positive."""
+    with pytest.raises(ValueError):
+        EventRebuilder(StubDatabase([], []), workers=0)
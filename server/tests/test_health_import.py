@@ -0,0 +1,109 @@
+"""
+test_health_import.py
+
+Tests for the bulk vaccination/weight import from vet spreadsheet exports.
+"""
+
+import io
+import pytest
+from server.utils.health_import import (
+    HealthRecordImporter, ImportFormatError, iter_rows, parse_date, parse_weight
+)
+
+
+class StubDatabase:
+    """Database stub recording bulk inserts."""
+
+    def __init__(self, tables):
+        self.tables = tables
+        self.inserts = []
+
+    def find_by_field_values(self, table, filters):
+        return list(self.tables.get(table, []))
+
+    def create_many(self, table, records, chunk_size=500):
+        self.inserts.append((table, len(records)))
+        start = len(self.tables.setdefault(table, []))
+        created = [dict(record, id=start + i + 1) for i, record in enumerate(records)]
+        self.tables[table].extend(created)
+        return created
+
+
+@pytest.fixture
+def db():
+    return StubDatabase({
+        "dogs": [{"id": 1, "microchip": "985000001"}, {"id": 2, "microchip": None}],
+        "puppies": [{"id": 7, "microchip": "985000007"}],
+    })
+
+
+def _csv(text):
+    return io.BytesIO(text.encode("utf-8-sig"))
+
+
+def test_parse_date_accepts_vet_formats():
+    """Common export date formats normalise to ISO dates."""
+    assert parse_date("2025-03-01") == "2025-03-01"
+    assert parse_date("03/01/2025") == "2025-03-01"
+    assert parse_date("01.03.2025") == "2025-03-01"
+    assert parse_date("2025-03-01T10:00:00Z") == "2025-03-01"
+    with pytest.raises(ValueError):
+        parse_date("yesterday")
+
+
+def test_import_resolves_microchips_and_reports_errors(db):
+    """Valid rows are bulk-inserted per table; invalid rows are reported by row number."""
+    rows = iter_rows(_csv(
+        "Microchip Number,Vaccine,Date Given,Next Due,Weight,Weight Date\n"
+        "985000001,Rabies,03/01/2025,03/01/2028,,\n"
+        "985000007,,,,4.2,2025-03-02\n"
+        "123,DHPP,2025-03-01,,,\n"
+        "985000001,DHPP,not a date,,,\n"
+        ",,,,,\n"
+    ), "export.csv")
+
+    report = HealthRecordImporter(db, chunk_size=2).run(rows)
+
+    assert report["total_rows"] == 4
+    assert report["imported"] == {"vaccinations": 1, "weight_records": 1}
+    assert [e["row"] for e in report["errors"]] == [4, 5]
+    assert "Unknown microchip '123'" in report["errors"][0]["errors"]
+
+    vaccination = db.tables["vaccinations"][0]
+    assert vaccination["dog_id"] == 1
+    assert vaccination["administration_date"] == "2025-03-01"
+    assert vaccination["next_due_date"] == "2028-03-01"
+    assert db.tables["weight_records"][0]["puppy_id"] == 7
+    assert db.tables["weight_records"][0]["weight"] == 4.2
+    assert report["created_vaccinations"] == [vaccination]
+
+
+def test_dry_run_validates_without_writing(db):
+    """A dry run counts importable rows but inserts nothing."""
+    rows = iter_rows(_csv(
+        "dog_id,weight,measurement_date\n"
+        "2,30.5,2025-01-01\n"
+        "2,-1,2025-01-02\n"
+    ), "weights.csv")
+
+    report = HealthRecordImporter(db, default_record_type="weight", dry_run=True).run(rows)
+
+    assert report["imported"]["weight_records"] == 1
+    assert report["errors"][0]["row"] == 3
+    assert db.inserts == []
+
+
+def test_weights_accept_thousands_separators():
+    """Grouped thousands are stripped before a comma is read as the decimal mark."""
+    assert parse_weight("1,234.5") == 1234.5
+    assert parse_weight("1.234,5") == 1234.5
+    assert parse_weight("4,2") == 4.2
+    assert parse_weight("30.5") == 30.5
+    with pytest.raises(ValueError):
+        parse_weight("1,2,3")
+
+
+def test_unsupported_file_type_is_rejected():
+    """Non-spreadsheet uploads raise ImportFormatError."""
+    with pytest.raises(ImportFormatError):
+        list(iter_rows(io.BytesIO(b""), "records.pdf"))
@@ -0,0 +1,161 @@
+"""
+test_health_risk.py
+
+Tests for the hereditary health risk engine.
+"""
+
+import pytest
+from flask import Flask
+from server.utils.health_risk import HealthRiskEngine
+
+
+class StubDatabase:
+    """Minimal database stub exposing only what the engine reads."""
+
+    def __init__(self, tables):
+        self.tables = tables
+        self.reads = 0
+
+    def scan(self, table, page_size=1000):
+        self.reads += 1
+        return iter(list(self.tables.get(table, [])))
+
+    def create(self, table, data):
+        rows = self.tables.setdefault(table, [])
+        row = dict(data, id=max([r["id"] for r in rows], default=0) + 1)
+        rows.append(row)
+        return row
+
+
+@pytest.fixture
+def db():
+    return StubDatabase({
+        "health_condition_templates": [
+            {"id": 1, "breed_id": 5, "condition_name": "Hip Dysplasia"},
+            {"id": 2, "breed_id": 5, "condition_name": "Progressive Retinal Atrophy"},
+            {"id": 3, "breed_id": 9, "condition_name": "Degenerative Myelopathy"},
+        ],
+        "dogs": [
+            {"id": 1, "call_name": "Grandsire", "breed_id": 5},
+            {"id": 2, "call_name": "Sire", "breed_id": 5, "sire_id": 1},
+            {"id": 3, "call_name": "Dam", "breed_id": 5},
+            {"id": 4, "call_name": "Pup", "breed_id": 5, "sire_id": 2, "dam_id": 3},
+            {"id": 5, "call_name": "Other", "breed_id": 9},
+        ],
+        "health_conditions": [
+            {"id": 10, "dog_id": 1, "condition_name": "hip dysplasia"},
+            {"id": 11, "dog_id": 3, "template_id": 2, "condition_name": "PRA"},
+            {"id": 12, "dog_id": 5, "condition_name": "Allergies"},
+        ],
+    })
+
+
+def _by_template(summary):
+    return {c["template_id"]: c for c in summary["conditions"]}
+
+
+def test_family_history_is_matched_through_pedigree(db):
+    """Diagnoses of parents and grandparents raise the matching template's risk."""
+    summary = HealthRiskEngine(db).summary_for(4)
+    matches = _by_template(summary)
+
+    assert matches[2]["status"] == "family_history"
+    assert matches[2]["affected_relatives"] == [{"dog_id": 3, "relation": "parent"}]
+    assert matches[1]["status"] == "family_history"
+    assert matches[1]["affected_relatives"] == [{"dog_id": 1, "relation": "grandparent"}]
+    assert summary["risk_level"] == "moderate"
+    assert 3 not in matches
+
+
+def test_own_diagnoses_are_affected_even_without_template(db):
+    """A dog's own diagnoses are reported, matched by name when no template id is set."""
+    engine = HealthRiskEngine(db)
+
+    assert _by_template(engine.summary_for(1))[1]["status"] == "affected"
+    other = engine.summary_for(5)
+    assert {c["condition_name"]: c["status"] for c in other["conditions"]} == {
+        "Degenerative Myelopathy": "breed_predisposition",
+        "Allergies": "affected",
+    }
+    assert other["risk_level"] == "high"
+
+
+def test_evaluate_all_uses_cache_and_invalidates_lineage(db):
+    """Summaries are cached; a new diagnosis only recomputes the dog and its descendants."""
+    engine = HealthRiskEngine(db)
+    first = {s["dog_id"]: s for s in engine.evaluate_all()}
+    reads = db.reads
+
+    engine.upsert_condition({"id": 13, "dog_id": 2, "template_id": 2, "condition_name": "PRA"})
+    second = {s["dog_id"]: s for s in engine.evaluate_all()}
+
+    assert db.reads == reads
+    assert second[3] is first[3]
+    assert second[4] is not first[4]
+    assert _by_template(second[2])[2]["status"] == "affected"
+
+    engine.remove_condition(13)
+    assert _by_template(engine.summary_for(2))[2]["status"] == "breed_predisposition"
+
+
+def test_template_changes_drop_all_summaries(db):
+    """Editing a template re-matches every dog."""
+    engine = HealthRiskEngine(db)
+    engine.evaluate_all()
+
+    engine.upsert_template({"id": 4, "breed_id": 5, "condition_name": "Elbow Dysplasia"})
+
+    assert 4 in _by_template(engine.summary_for(3))
+    engine.remove_template(4)
+    assert 4 not in _by_template(engine.summary_for(3))
+
+
+def test_templates_are_matched_within_the_dogs_breed(db):
+    """A diagnosis named like another breed's template only matches the dog's own breed."""
+    db.tables["health_condition_templates"].append(
+        {"id": 4, "breed_id": 9, "condition_name": "Hip Dysplasia"})
+    db.tables["health_conditions"].append({"id": 14, "dog_id": 5, "condition_name": "Hip dysplasia"})
+    engine = HealthRiskEngine(db)
+
+    assert _by_template(engine.summary_for(1))[1]["status"] == "affected"
+    assert _by_template(engine.summary_for(5))[4]["status"] == "affected"
+    assert 1 not in _by_template(engine.summary_for(5))
+
+
+def test_dog_changes_update_the_pedigree_in_place(db):
+    """Editing a dog re-links its parents without reloading the dogs table."""
+    engine = HealthRiskEngine(db)
+    first = {s["dog_id"]: s for s in engine.evaluate_all()}
+    reads = db.reads
+
+    engine.upsert_dog({"id": 6, "call_name": "Late pup", "breed_id": 5, "dam_id": 3})
+    engine.upsert_dog({"id": 4, "call_name": "Pup", "breed_id": 5, "sire_id": 2})
+    second = {s["dog_id"]: s for s in engine.evaluate_all()}
+
+    assert db.reads == reads
+    assert second[1] is first[1] and second[3] is first[3]
+    assert _by_template(second[6])[2]["status"] == "family_history"
+    assert _by_template(second[4])[2]["status"] == "breed_predisposition"
+
+    engine.remove_dog(6)
+    assert engine.summary_for(6) is None
+
+
+def test_condition_endpoint_updates_the_engine(db):
+    """A diagnosis recorded through the API shows up in the family's summaries."""
+    from server.health import create_health_bp
+
+    app = Flask(__name__)
+    app.register_blueprint(create_health_bp(db), url_prefix="/api/health")
+    client = app.test_client()
+    auth = {"Authorization": "Bearer token"}
+
+    before = client.get("/api/health/risk/4", headers=auth).get_json()["data"]
+    response = client.post("/api/health/conditions", headers=auth,
+                           json={"dog_id": 2, "template_id": 1, "condition_name": "Hip Dysplasia"})
+    assert response.status_code == 201
+
+    after = client.get("/api/health/risk/4", headers=auth).get_json()["data"]
+    assert _by_template(before)[1]["affected_relatives"] == [{"dog_id": 1, "relation": "grandparent"}]
+    assert _by_template(after)[1]["affected_relatives"] == [
+        {"dog_id": 2, "relation": "parent"}, {"dog_id": 1, "relation": "grandparent"}]
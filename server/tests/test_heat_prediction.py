@@ -0,0 +1,125 @@
+"""
+test_heat_prediction.py
+
+Tests for the heat cycle forecasts.
+"""
+
+import datetime
+
+import pytest
+from server.utils.heat_prediction import (
+    HeatPredictor, heat_columns, cycle_statistics, forecast_event,
+    DEFAULT_CYCLE_DAYS, CONFIDENCE_HIGH, CONFIDENCE_MEDIUM, CONFIDENCE_LOW, MIN_WINDOW_DAYS,
+)
+
+
+class StubDatabase:
+    def __init__(self, heats):
+        self.heats = heats
+        self.reads = 0
+
+    def find_by_field_values(self, table, filters):
+        self.reads += 1
+        return list(self.heats)
+
+
+def heat(heat_id, dog_id, start):
+    return {"id": heat_id, "dog_id": dog_id, "start_date": start}
+
+
+HEATS = [
+    # Dog 1: regular six-month cycles
+    heat(1, 1, "2023-01-01"), heat(2, 1, "2023-07-01"), heat(3, 1, "2023-12-29"), heat(4, 1, "2024-06-28"),
+    # Dog 2: two heats, one interval
+    heat(5, 2, "2024-02-01"), heat(6, 2, "2024-09-01"),
+    # Dog 3: a single heat
+    heat(7, 3, "2024-05-10"),
+    # Dog 4: split heat (12 days apart) is not an interval
+    heat(8, 4, "2024-01-01"), heat(9, 4, "2024-01-13"), heat(10, 4, "2024-07-01"),
+    # Ignored: no dog or no date
+    heat(11, None, "2024-01-01"), heat(12, 1, None),
+]
+
+
+def test_columns_are_sorted_by_dog_and_date():
+    """Heats without a dog or start date are dropped"""
+    dog_ids, days = heat_columns(reversed(HEATS))
+    assert dog_ids[:4] == ["1", "1", "1", "1"]
+    assert list(days[:4]) == sorted(days[:4])
+    assert len(days) == 10
+
+
+def test_cycle_statistics_per_dog():
+    stats = cycle_statistics(*heat_columns(HEATS))
+    assert stats["1"]["intervals"] == 3
+    assert stats["1"]["mean"] == pytest.approx((181 + 181 + 182) / 3)
+    assert stats["2"]["intervals"] == 1 and stats["2"]["std"] is None
+    assert stats["3"]["intervals"] == 0 and stats["3"]["mean"] is None
+    # The 12-day gap is ignored; the remaining 170-day gap is kept
+    assert stats["4"]["intervals"] == 1
+    assert stats["4"]["mean"] == 170
+
+
+def test_regular_dam_gets_narrow_high_confidence_window():
+    predictor = HeatPredictor(StubDatabase(HEATS))
+    prediction = predictor.forecast_for(1)
+    assert prediction["last_heat_date"] == "2024-06-28"
+    assert prediction["expected_date"] == "2024-12-26"
+    assert prediction["confidence"] == CONFIDENCE_HIGH
+    window = (datetime.date.fromisoformat(prediction["window_end"])
+              - datetime.date.fromisoformat(prediction["window_start"])).days
+    assert window < 30
+
+
+def test_short_history_falls_back_to_default_cycle():
+    predictor = HeatPredictor(StubDatabase(HEATS))
+    single = predictor.forecast_for(3)
+    assert single["confidence"] == CONFIDENCE_LOW
+    assert single["cycle_days"] == DEFAULT_CYCLE_DAYS
+    assert single["expected_date"] == (datetime.date(2024, 5, 10) + datetime.timedelta(days=DEFAULT_CYCLE_DAYS)).isoformat()
+    assert predictor.forecast_for(2)["confidence"] == CONFIDENCE_LOW
+    assert predictor.forecast_for(99) is None
+
+
+def test_forecasts_are_cached_until_a_heat_is_recorded():
+    db = StubDatabase(HEATS)
+    predictor = HeatPredictor(db)
+    predictor.forecasts()
+    predictor.forecast_for(1)
+    assert db.reads == 1
+
+    predictor.upsert_heat(heat(20, 3, "2024-11-05"))
+    updated = predictor.forecast_for(3)
+    assert updated["last_heat_date"] == "2024-11-05"
+    assert updated["based_on_intervals"] == 1
+    assert db.reads == 1
+
+    predictor.remove_heat(20)
+    assert predictor.forecast_for(3)["last_heat_date"] == "2024-05-10"
+
+
+def test_moving_a_heat_to_another_dog_updates_both():
+    predictor = HeatPredictor(StubDatabase(HEATS))
+    predictor.load()
+    predictor.upsert_heat(heat(7, 2, "2025-03-01"))
+    assert predictor.forecast_for(3) is None
+    assert predictor.forecast_for(2)["heats_recorded"] == 3
+    assert predictor.forecast_for(2)["confidence"] == CONFIDENCE_MEDIUM
+
+
+def test_between_returns_overlapping_windows():
+    predictor = HeatPredictor(StubDatabase(HEATS))
+    in_window = predictor.between("2024-12-20", "2024-12-31")
+    # Ordered by expected date; dog 4's wider window overlaps too, dog 2's opens later
+    assert [p["dog_id"] for p in in_window] == ["4", "1"]
+    with pytest.raises(ValueError):
+        predictor.between("not a date", "2024-12-31")
+
+
+def test_forecast_event_spans_the_window():
+    predictor = HeatPredictor(StubDatabase(HEATS))
+    event = forecast_event(predictor.forecast_for(2))
+    assert event["event_type"] == "heat_forecast"
+    assert event["related_id"] == "2"
+    assert (datetime.date.fromisoformat(event["end_date"])
+            - datetime.date.fromisoformat(event["start_date"])).days >= 2 * MIN_WINDOW_DAYS
@@ -0,0 +1,72 @@
+"""
+test_ical.py
+
+Tests for iCalendar feed rendering.
+"""
+
+import datetime
+from server.utils.ical import ICalRenderer, fold, escape_text, render_vevent
+from server.utils.event_calendar import EventCalendar
+
+DTSTAMP = datetime.datetime(2025, 1, 1, 12, 0, 0)
+
+
+class StubDatabase:
+    def __init__(self, events):
+        self.events = events
+
+    def scan(self, table, page_size=1000):
+        return iter(list(self.events))
+
+
+def test_fold_and_escape():
+    """Long lines fold at 75 octets without splitting UTF-8 sequences; text is escaped."""
+    line = "SUMMARY:" + "é" * 60
+    folded = fold(line)
+    assert all(len(part.encode("utf-8")) <= 75 for part in folded.rstrip("\r\n").split("\r\n"))
+    assert folded.replace("\r\n ", "").rstrip("\r\n") == line
+    assert escape_text("a,b;c\nd") == r"a\,b\;c\nd"
+
+
+def test_all_day_and_timed_events():
+    """All-day events use exclusive DATE end; timed events are UTC with an alarm when notifying."""
+    all_day = render_vevent({"id": 1, "title": "Whelping", "start_date": "2025-03-02", "end_date": "2025-03-02",
+                             "all_day": True}, DTSTAMP)
+    assert "DTSTART;VALUE=DATE:20250302" in all_day and "DTEND;VALUE=DATE:20250303" in all_day
+
+    timed = render_vevent({"id": 2, "title": "Vet", "start_date": "2025-03-02T10:00:00-05:00",
+                           "all_day": False, "notify": True, "notify_days_before": 2}, DTSTAMP)
+    assert "DTSTART:20250302T150000Z" in timed
+    assert "TRIGGER:-P2D" in timed
+
+
+def test_recurring_series_use_rrule_or_expand_placeholders():
+    """Plain series get an RRULE; placeholder series are expanded per occurrence."""
+    events = [
+        {"id": 1, "title": "Worming", "start_date": "2025-01-05", "recurring": "monthly", "all_day": True},
+        {"id": 2, "title": "Bella's {occurrence_ordinal} Birthday", "start_date": "2021-05-01",
+         "recurring": "RRULE:FREQ=YEARLY", "all_day": True},
+    ]
+    calendar = EventCalendar(StubDatabase(events))
+    window = (datetime.datetime(2025, 1, 1), datetime.datetime(2026, 12, 31))
+    feed = "".join(ICalRenderer().stream("Test", events,
+                                         lambda e: calendar.occurrences(e, *window), DTSTAMP))
+
+    assert feed.startswith("BEGIN:VCALENDAR\r\n") and feed.endswith("END:VCALENDAR\r\n")
+    assert "RRULE:FREQ=MONTHLY" in feed
+    assert "SUMMARY:Bella's 5th Birthday" in feed and "SUMMARY:Bella's 6th Birthday" in feed
+    assert "UID:event-2:2025-05-01@" in feed
+    assert feed.count("BEGIN:VEVENT") == 3
+
+
+def test_only_changed_events_are_rerendered():
+    """A second feed render reuses cached blocks except for the edited event."""
+    events = [{"id": i, "title": f"Event {i}", "start_date": "2025-03-01"} for i in range(50)]
+    renderer = ICalRenderer()
+    first = "".join(renderer.stream("Test", events, lambda e: [], DTSTAMP))
+    assert renderer.renders == 50
+
+    events[3] = dict(events[3], title="Renamed")
+    second = "".join(renderer.stream("Test", events, lambda e: [], DTSTAMP))
+    assert renderer.renders == 51
+    assert "SUMMARY:Renamed" in second and "SUMMARY:Event 3" in first
@@ -0,0 +1,98 @@
+"""
+test_image_derivatives.py
+
+Tests for photo rendition sizing, URL selection and recording.
+"""
+
+import concurrent.futures
+
+import pytest
+from server.utils.image_derivatives import (
+    DerivativePipeline, target_size, select_url, derivative_filename, FORMAT_WEBP, FORMAT_JPEG,
+)
+from server.storage import LocalStorage
+
+
+class StubDatabase:
+    def __init__(self):
+        self.updates = []
+
+    def update(self, table, record_id, data):
+        self.updates.append((table, record_id, data))
+        return data
+
+
+STORAGE = LocalStorage("/srv/uploads")
+
+PHOTO = {
+    "id": 7,
+    "url": "/uploads/abc.jpg",
+    "derivatives": {
+        "thumbnail": {"webp": "/uploads/derivatives/abc_thumbnail.webp",
+                      "jpeg": "/uploads/derivatives/abc_thumbnail.jpg"},
+        "medium": {"jpeg": "/uploads/derivatives/abc_medium.jpg"},
+    },
+}
+
+
+def test_target_size_never_upscales():
+    assert target_size(4032, 3024, 320) == (320, 240)
+    assert target_size(3024, 4032, 960) == (720, 960)
+    assert target_size(200, 100, 320) == (200, 100)
+
+
+def test_select_url_prefers_webp_and_falls_back():
+    assert select_url(PHOTO, "thumbnail") == "/uploads/derivatives/abc_thumbnail.webp"
+    assert select_url(PHOTO, "thumbnail", accept_webp=False) == "/uploads/derivatives/abc_thumbnail.jpg"
+    assert select_url(PHOTO, "medium") == "/uploads/derivatives/abc_medium.jpg"
+    # Not rendered (yet): the original
+    assert select_url(PHOTO, "large") == "/uploads/abc.jpg"
+    assert select_url(PHOTO, None) == "/uploads/abc.jpg"
+    assert select_url({"url": "/uploads/x.png"}, "thumbnail") == "/uploads/x.png"
+
+
+def test_renditions_are_recorded_on_the_photo():
+    db = StubDatabase()
+    calls = []
+
+    def render(source_path, target_dir, stem, formats):
+        calls.append((source_path, target_dir, stem, formats))
+        return {size: {fmt: derivative_filename(stem, size, fmt) for fmt in formats}
+                for size in ("thumbnail", "large")}
+
+    with concurrent.futures.ThreadPoolExecutor(1) as executor:
+        pipeline = DerivativePipeline(db, executor=executor, render=render)
+        future = pipeline.submit({"id": 7, "url": "/uploads/abc.jpg"}, STORAGE,
+                                 formats=(FORMAT_WEBP, FORMAT_JPEG))
+        future.result(timeout=5)
+    executor.shutdown(wait=True)
+
+    assert calls == [("/srv/uploads/abc.jpg", "/srv/uploads/derivatives", "abc", (FORMAT_WEBP, FORMAT_JPEG))]
+    table, photo_id, data = db.updates[0]
+    assert (table, photo_id) == ("photos", 7)
+    assert data["derivatives"]["thumbnail"] == {
+        "webp": "/uploads/derivatives/abc_thumbnail.webp",
+        "jpeg": "/uploads/derivatives/abc_thumbnail.jpg",
+    }
+
+
+def test_non_images_and_missing_pillow_are_skipped():
+    pipeline = DerivativePipeline(StubDatabase(), executor=concurrent.futures.ThreadPoolExecutor(1))
+    assert pipeline.submit({"id": 1, "url": "/uploads/contract.pdf"}, STORAGE, formats=(FORMAT_JPEG,)) is None
+    assert pipeline.submit({"id": 1, "url": "https://cdn.example.com/a.jpg"}, STORAGE, formats=(FORMAT_JPEG,)) is None
+    assert pipeline.submit({"id": 1, "url": "/uploads/a.jpg"}, STORAGE, formats=()) is None
+    pipeline.shutdown()
+
+
+def test_render_failures_leave_the_photo_untouched():
+    db = StubDatabase()
+
+    def render(*args):
+        raise IOError("truncated image")
+
+    with concurrent.futures.ThreadPoolExecutor(1) as executor:
+        pipeline = DerivativePipeline(db, executor=executor, render=render)
+        future = pipeline.submit({"id": 3, "url": "/uploads/bad.jpg"}, STORAGE, formats=(FORMAT_JPEG,))
+        with pytest.raises(IOError):
+            future.result(timeout=5)
+    assert db.updates == []
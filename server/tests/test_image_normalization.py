@@ -0,0 +1,79 @@
+"""
+test_image_normalization.py
+
+Tests for photo orientation, EXIF clean-up, metadata and near-duplicate detection.
+"""
+
+import os
+
+import pytest
+from server.utils.image_normalization import (
+    normalize_image, hamming_distance, skip_near_duplicates,
+    ORIENTATION, DATETIME_ORIGINAL, EXIF_IFD, GPS_IFD,
+)
+
+
+def test_hamming_distance():
+    assert hamming_distance("ffffffffffffffff", "ffffffffffffffff") == 0
+    assert hamming_distance("ffffffffffffffff", "fffffffffffffff0") == 4
+    assert hamming_distance("0000000000000000", "ffffffffffffffff") == 64
+
+
+def test_skip_near_duplicates_keeps_the_first_of_each_shot():
+    photos = [
+        {"id": 1, "phash": "f0f0f0f0f0f0f0f0"},
+        {"id": 2, "phash": "f0f0f0f0f0f0f0f1"},  # same shot, re-saved
+        {"id": 3, "phash": "0f0f0f0f0f0f0f0f"},
+        {"id": 4},                               # not hashed yet
+        {"id": 5, "phash": "0f0f0f0f0f0f0f0f"},
+    ]
+    assert [p["id"] for p in skip_near_duplicates(photos)] == [1, 3, 4]
+    assert [p["id"] for p in skip_near_duplicates(photos, max_distance=0)] == [1, 2, 3, 4]
+
+
+@pytest.fixture
+def sideways_photo(tmp_path):
+    """A 40x20 JPEG stored rotated, as phones do, with GPS and a capture date"""
+    Image = pytest.importorskip("PIL.Image")
+    image = Image.new("RGB", (40, 20), (200, 30, 30))
+    image.paste((30, 30, 200), (0, 0, 20, 20))
+    exif = Image.Exif()
+    exif[ORIENTATION] = 6
+    exif[0x010F] = "PhoneCo"
+    exif[EXIF_IFD] = {DATETIME_ORIGINAL: "2024:05:01 09:30:00", 0x9011: "+02:00"}
+    exif[GPS_IFD] = {1: "N", 2: (40.0, 26.0, 46.0)}
+    path = tmp_path / "raw.jpg"
+    image.save(path, "JPEG", exif=exif.tobytes())
+    return str(path)
+
+
+def test_sideways_photo_is_rotated_and_stripped(sideways_photo, tmp_path):
+    Image = pytest.importorskip("PIL.Image")
+    result = normalize_image(sideways_photo, str(tmp_path / "incoming"))
+
+    metadata = result["metadata"]
+    assert (metadata["width"], metadata["height"]) == (20, 40)
+    assert metadata["taken_at"] == "2024-05-01T09:30:00+02:00"
+    assert len(metadata["phash"]) == 16
+
+    normalized = result["normalized"]
+    assert normalized["extension"] == "jpg" and len(normalized["content_hash"]) == 64
+    with Image.open(normalized["path"]) as clean:
+        assert clean.size == (20, 40)
+        exif = clean.getexif()
+        assert ORIENTATION not in exif
+        assert GPS_IFD not in exif
+        assert exif[0x010F] == "PhoneCo"
+        assert exif.get_ifd(EXIF_IFD)[DATETIME_ORIGINAL] == "2024:05:01 09:30:00"
+
+    # The clean copy needs nothing more, and hashes like the rewritten one
+    again = normalize_image(normalized["path"], str(tmp_path / "incoming"))
+    assert again["normalized"] is None
+    assert hamming_distance(again["metadata"]["phash"], metadata["phash"]) <= 2
+
+
+def test_metadata_only_without_incoming_dir(sideways_photo):
+    result = normalize_image(sideways_photo)
+    assert result["normalized"] is None
+    assert (result["metadata"]["width"], result["metadata"]["height"]) == (20, 40)
+    assert os.path.exists(sideways_photo)
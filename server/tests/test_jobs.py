@@ -0,0 +1,111 @@
+"""
+test_jobs.py
+
+Tests for the in-process background job runner.
+"""
+
+import threading
+import pytest
+from server.utils.jobs import (
+    JobRunner, UnknownJobType, STATUS_SUCCEEDED, STATUS_FAILED, STATUS_CANCELLED, STATUS_QUEUED
+)
+
+
+class StubDatabase:
+    """Database stub recording job rows written by the runner."""
+
+    def __init__(self, rows=None):
+        self.rows = {row["id"]: dict(row) for row in rows or []}
+
+    def create(self, table, data):
+        self.rows[data["id"]] = dict(data)
+        return self.rows[data["id"]]
+
+    def update(self, table, record_id, data):
+        self.rows[record_id].update(data)
+        return self.rows[record_id]
+
+    def find_by_field_values(self, table, filters):
+        return [dict(row) for row in self.rows.values()
+                if all(row.get(k) == v for k, v in filters.items())]
+
+
+def test_submit_returns_immediately_and_reports_result():
+    """Jobs run on a worker thread; progress and result are persisted."""
+    db = StubDatabase()
+    runner = JobRunner(db, workers=2)
+
+    def count(payload, job):
+        for i in range(payload["n"]):
+            job.progress(i + 1, payload["n"])
+        return {"counted": payload["n"]}
+
+    runner.register("count", count)
+    job = runner.submit("count", {"n": 5})
+    assert job["status"] == STATUS_QUEUED
+    assert runner.wait(timeout=5)
+
+    finished = runner.get(job["id"])
+    assert finished["status"] == STATUS_SUCCEEDED
+    assert finished["result"] == {"counted": 5}
+    assert finished["progress"] == 5 and finished["total"] == 5
+    assert db.rows[job["id"]]["status"] == STATUS_SUCCEEDED
+    runner.shutdown()
+
+
+def test_failures_are_recorded():
+    """Handler exceptions mark the job failed with the error message."""
+    runner = JobRunner(None, workers=1)
+
+    def boom(payload, job):
+        raise LookupError("Litter with ID 3 not found")
+
+    runner.register("boom", boom)
+    job = runner.submit("boom")
+    runner.wait(timeout=5)
+    assert runner.get(job["id"])["status"] == STATUS_FAILED
+    assert "not found" in runner.get(job["id"])["error"]
+    runner.shutdown()
+
+
+def test_unknown_job_type_is_rejected():
+    """Submitting an unregistered job type raises."""
+    with pytest.raises(UnknownJobType):
+        JobRunner(None).submit("nope")
+
+
+def test_running_job_can_be_cancelled():
+    """A running job stops at its next progress report."""
+    runner = JobRunner(None, workers=1)
+    started, release = threading.Event(), threading.Event()
+
+    def slow(payload, job):
+        started.set()
+        release.wait(5)
+        job.progress(1, 2)
+        return "not reached"
+
+    runner.register("slow", slow)
+    job = runner.submit("slow")
+    started.wait(5)
+    runner.cancel(job["id"])
+    release.set()
+    runner.wait(timeout=5)
+    assert runner.get(job["id"])["status"] == STATUS_CANCELLED
+    runner.shutdown()
+
+
+def test_recover_requeues_queued_and_fails_interrupted_jobs():
+    """Queued rows from a previous process run again; running rows are marked failed."""
+    db = StubDatabase([
+        {"id": "a", "job_type": "noop", "status": "queued", "payload": {}},
+        {"id": "b", "job_type": "noop", "status": "running", "payload": {}},
+    ])
+    runner = JobRunner(db, workers=1)
+    runner.register("noop", lambda payload, job: "ok")
+
+    assert runner.recover() == 1
+    runner.wait(timeout=5)
+    assert db.rows["a"]["status"] == STATUS_SUCCEEDED
+    assert db.rows["b"]["status"] == STATUS_FAILED
+    runner.shutdown()
@@ -0,0 +1,158 @@
+"""
+test_notification_dispatcher.py
+
+Tests for the event reminder dispatcher.
+"""
+
+import datetime
+
+import pytest
+from server.utils.notification_dispatcher import NotificationDispatcher, DELIVERIES_TABLE, STATUS_EMAILED
+
+NOW = datetime.datetime(2025, 3, 1, 8, 0, 0)
+
+
+class StubDatabase:
+    """Database stub with events, users, notifications and delivery records."""
+
+    def __init__(self, events, deliveries=None):
+        self.tables = {"events": events, "users": [{"id": "u1", "email": "breeder@example.com"}],
+                       "notifications": [], DELIVERIES_TABLE: list(deliveries or [])}
+        self.bulk_inserts = []
+        self.lookups = []
+
+    def find_by_field_values(self, table, filters):
+        return [dict(r) for r in self.tables[table] if all(r.get(k) == v for k, v in filters.items())]
+
+    def find_in(self, table, field, values, filters=None):
+        self.lookups.append((table, field, list(values)))
+        return [r for r in self.find_by_field_values(table, filters or {}) if r.get(field) in values]
+
+    def create_many(self, table, records, chunk_size=500, on_conflict=None):
+        self.bulk_inserts.append((table, len(records)))
+        if on_conflict:
+            existing = {r.get(on_conflict) for r in self.tables[table]}
+            records = [r for r in records if r.get(on_conflict) not in existing]
+        created = [dict(r, id=len(self.tables[table]) + i + 1) for i, r in enumerate(records)]
+        self.tables[table].extend(created)
+        return created
+
+    def update(self, table, record_id, data):
+        row = next(r for r in self.tables[table] if r["id"] == record_id)
+        row.update(data)
+        return row
+
+
+EVENTS = [
+    {"id": 1, "title": "Vet visit", "start_date": "2025-03-05T10:00:00", "notify": True,
+     "notify_days_before": 2, "user_id": "u1"},
+    {"id": 2, "title": "Show", "start_date": "2025-03-02T09:00:00", "notify": True, "notify_days_before": 3},
+    {"id": 3, "title": "Past", "start_date": "2025-02-01T09:00:00", "notify": True, "notify_days_before": 1},
+    {"id": 4, "title": "Bella's Birthday", "start_date": "2021-03-10", "notify": True,
+     "notify_days_before": 7, "recurring": "yearly"},
+    {"id": 5, "title": "Silent", "start_date": "2025-03-04", "notify": False},
+]
+
+
+def test_next_due_and_batched_delivery():
+    """Overdue reminders for upcoming events go out at once, in one batch; later ones wait."""
+    sent = []
+    db = StubDatabase(EVENTS)
+    dispatcher = NotificationDispatcher(db, send_emails=lambda msgs: sent.extend(msgs) or [True] * len(msgs))
+    dispatcher.load(NOW)
+
+    # Show (reminder Feb 27) and birthday (reminder Mar 3) -> show is overdue, due now
+    assert dispatcher.next_due() == datetime.datetime(2025, 2, 27, 9, 0)
+    assert dispatcher.dispatch_due(NOW) == 1
+    assert dispatcher.next_due() == datetime.datetime(2025, 3, 3, 0, 0)
+
+    later = datetime.datetime(2025, 3, 3, 12, 0)
+    assert dispatcher.dispatch_due(later) == 2
+    assert ("notifications", 2) in db.bulk_inserts and (DELIVERIES_TABLE, 2) in db.bulk_inserts
+    assert [m[0] for m in sent] == ["breeder@example.com"]
+    assert {r["status"] for r in db.tables[DELIVERIES_TABLE] if r["event_id"] == 1} == {STATUS_EMAILED}
+
+
+def test_restart_does_not_resend():
+    """Delivery records loaded at startup suppress reminders that were already sent."""
+    db = StubDatabase(EVENTS)
+    first = NotificationDispatcher(db)
+    first.load(NOW)
+    first.dispatch_due(NOW)
+
+    restarted = NotificationDispatcher(db)
+    restarted.load(NOW)
+    assert restarted.dispatch_due(NOW) == 0
+
+
+def test_upsert_and_remove_reschedule():
+    """Event writes re-schedule reminders; deleted events are never reminded."""
+    db = StubDatabase([])
+    dispatcher = NotificationDispatcher(db)
+    dispatcher.load()
+    assert dispatcher.next_due() is None
+
+    start = datetime.datetime.utcnow().replace(microsecond=0) + datetime.timedelta(days=5)
+    dispatcher.upsert({"id": 9, "title": "Pickup", "start_date": start.isoformat(),
+                       "notify": True, "notify_days_before": 1})
+    assert dispatcher.next_due() == start - datetime.timedelta(days=1)
+
+    dispatcher.upsert({"id": 9, "title": "Pickup", "start_date": start.isoformat(),
+                       "notify": True, "notify_days_before": 3})
+    assert dispatcher.next_due() == start - datetime.timedelta(days=3)
+
+    dispatcher.remove(9)
+    assert dispatcher.next_due() is None
+
+
+def test_series_titles_are_filled_and_escaped():
+    """Birthday series placeholders get the occurrence number; email HTML is escaped."""
+    sent = []
+    db = StubDatabase([{"id": 6, "title": "Bella's {occurrence_ordinal} <Birthday>", "start_date": "2021-03-10",
+                        "notify": True, "notify_days_before": 7, "recurring": "RRULE:FREQ=YEARLY", "user_id": "u1"}])
+    dispatcher = NotificationDispatcher(db, send_emails=lambda msgs: sent.extend(msgs) or [True] * len(msgs))
+    dispatcher.load(NOW)
+    dispatcher.dispatch_due(datetime.datetime(2025, 3, 3, 12, 0))
+
+    notification = db.tables["notifications"][0]
+    assert notification["title"] == "Bella's 5th <Birthday>"
+    assert notification["message"].startswith("Bella's 5th <Birthday> is in 7 days")
+    assert sent[0][2].startswith("<p>Bella&#x27;s 5th &lt;Birthday&gt; is")
+
+
+def test_failed_delivery_records_send_nothing_and_retry():
+    """Notifications are only created once their delivery records are written."""
+    db = StubDatabase(EVENTS)
+    dispatcher = NotificationDispatcher(db)
+    dispatcher.load(NOW)
+    create_many = db.create_many
+
+    def failing(table, records, chunk_size=500, on_conflict=None):
+        if table == DELIVERIES_TABLE:
+            raise RuntimeError("deliveries unavailable")
+        return create_many(table, records, chunk_size, on_conflict)
+
+    db.create_many = failing
+    with pytest.raises(RuntimeError):
+        dispatcher.dispatch_due(NOW)
+    assert db.tables["notifications"] == []
+
+    db.create_many = create_many
+    assert dispatcher.dispatch_due(NOW) == 1
+    assert len(db.tables["notifications"]) == 1 and len(db.tables[DELIVERIES_TABLE]) == 1
+
+
+def test_already_recorded_reminders_do_not_block_their_batch():
+    """Only upcoming events' deliveries are read; keys recorded meanwhile are skipped, the rest delivered."""
+    db = StubDatabase(EVENTS)
+    dispatcher = NotificationDispatcher(db)
+    dispatcher.load(NOW)
+    # Past and silent events have no reminders to look up
+    assert [(table, sorted(ids)) for table, field, ids in db.lookups if table == DELIVERIES_TABLE] == \
+        [(DELIVERIES_TABLE, [1, 2, 4])]
+
+    # Another worker recorded the show's reminder after this one loaded
+    db.tables[DELIVERIES_TABLE].append({"id": 99, "reminder_key": "2:2025-03-02:3", "event_id": 2})
+    assert dispatcher.dispatch_due(datetime.datetime(2025, 3, 3, 12, 0)) == 2
+    assert {n["entity_id"] for n in db.tables["notifications"]} == {1, 4}
+    assert dispatcher.next_due() is None
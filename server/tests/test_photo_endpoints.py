@@ -0,0 +1,219 @@
+"""
+test_photo_endpoints.py
+
+Tests for the photo upload and gallery endpoints, against an in-memory database.
+"""
+
+import hashlib
+import io
+
+import pytest
+from flask import Flask
+from server import photos
+from server.utils.blob_store import BlobStore
+
+
+class StubDatabase:
+    """Tables of rows in memory; records every bulk write"""
+
+    def __init__(self, tables=None):
+        self.tables = {"photos": [], "dogs": [], "puppies": []}
+        self.tables.update(tables or {})
+        self.bulk_inserts = []
+
+    def _next_id(self, table):
+        return max([row["id"] for row in self.tables[table]] or [0]) + 1
+
+    def find_by_field_values(self, table, filters=None):
+        return [dict(row) for row in self.tables.get(table, [])
+                if all(row.get(k) == v for k, v in (filters or {}).items())]
+
+    def find_in(self, table, field, values, filters=None):
+        return [row for row in self.find_by_field_values(table, filters) if row.get(field) in values]
+
+    def create(self, table, data):
+        row = dict(data, id=self._next_id(table))
+        self.tables[table].append(row)
+        return dict(row)
+
+    def create_many(self, table, records, chunk_size=500):
+        self.bulk_inserts.append((table, len(records)))
+        return [self.create(table, record) for record in records]
+
+    def update(self, table, record_id, data):
+        row = next(row for row in self.tables[table] if row["id"] == record_id)
+        row.update(data)
+        return dict(row)
+
+    def update_where(self, table, filters, data):
+        rows = [row for row in self.tables.get(table, []) if all(row.get(k) == v for k, v in filters.items())]
+        for row in rows:
+            row.update(data)
+        return [dict(row) for row in rows]
+
+    def call_function(self, name, params, writes=()):
+        raise NotImplementedError(name)
+
+
+class StubPipeline:
+    """Records the photos queued for processing instead of rendering them"""
+
+    def __init__(self):
+        self.on_recorded = []
+        self.submitted = []
+
+    def submit(self, photo, storage=None, formats=None):
+        self.submitted.append(photo["id"])
+
+
+@pytest.fixture
+def api(tmp_path, monkeypatch):
+    db = StubDatabase()
+    store = BlobStore(db, root=str(tmp_path))
+    pipeline = StubPipeline()
+    monkeypatch.setattr(photos, "get_blob_store", lambda _db: store)
+    monkeypatch.setattr(photos, "get_derivative_pipeline", lambda _db: pipeline)
+
+    app = Flask(__name__)
+    app.register_blueprint(photos.create_photos_bp(db), url_prefix="/api/photos")
+    return app.test_client(), db, pipeline
+
+
+def upload(client, content, name="bella.jpg", entity_id=5):
+    return client.post("/api/photos", content_type="multipart/form-data", data={
+        "entity_type": "dog", "entity_id": str(entity_id), "file": (io.BytesIO(content), name)})
+
+
+def test_reuploads_copy_renditions_and_metadata(api):
+    """Identical content reuses the renditions, capture date, dimensions and hash of the first upload."""
+    client, db, pipeline = api
+    first = upload(client, b"jpeg bytes").get_json()
+    assert pipeline.submitted == [first["id"]]
+    processed = {"derivatives": {"thumbnail": {"jpeg": "/uploads/derivatives/x_thumbnail.jpg"}},
+                 "taken_at": "2025-04-01T10:00:00", "width": 4032, "height": 3024, "phash": "8f0e0c0c0e0f0f07"}
+    db.update("photos", first["id"], processed)
+
+    second = upload(client, b"jpeg bytes", name="again.jpg", entity_id=6).get_json()
+    assert second["content_hash"] == hashlib.sha256(b"jpeg bytes").hexdigest()
+    assert {field: second[field] for field in processed} == processed
+
+    response = client.post("/api/photos/batch", content_type="multipart/form-data", data={
+        "entity_type": "dog", "entity_id": "7",
+        "files": [(io.BytesIO(b"jpeg bytes"), "a.jpg"), (io.BytesIO(b"new bytes"), "b.jpg")]})
+    assert response.status_code == 201
+    reused, fresh = [result["photo"] for result in response.get_json()["results"]]
+    assert {field: reused[field] for field in processed} == processed
+    assert all(fresh[field] is None for field in processed)
+    # Only the photos without renditions were queued
+    assert pipeline.submitted == [first["id"], fresh["id"]]
+
+
+def test_batch_upload_reports_each_file(api):
+    """Each file of a batch gets its own status; the rows are written with one bulk insert."""
+    client, db, pipeline = api
+    response = client.post("/api/photos/batch", content_type="multipart/form-data", data={
+        "entity_type": "puppy", "entity_id": "1", "order": "5",
+        "files": [(io.BytesIO(b"first image"), "one.jpg"), (io.BytesIO(b"not an image"), "notes.txt"),
+                  (io.BytesIO(b"second image"), "two.png")]})
+
+    # Partial success: each file carries its own status
+    assert response.status_code == 207
+    data = response.get_json()
+    assert data["created"] == 2 and data["failed"] == 1
+    results = data["results"]
+    assert [result["ok"] for result in results] == [True, False, True]
+    assert results[1]["error"] == "File type not allowed"
+    first, second = results[0]["photo"], results[2]["photo"]
+    assert [first["order"], second["order"]] == [5, 6]
+    assert db.bulk_inserts == [("photos", 2)]
+    assert sorted(pipeline.submitted) == [first["id"], second["id"]]
+
+    # The puppy had no cover, so the first stored photo became it
+    assert first["is_cover"] is True and second["is_cover"] is False
+    assert first["content_hash"] == hashlib.sha256(b"first image").hexdigest()
+
+
+def test_batch_upload_rejects_bad_requests(api):
+    client, db, pipeline = api
+    assert client.post("/api/photos/batch", content_type="multipart/form-data",
+                       data={"entity_type": "dog", "entity_id": "1"}).status_code == 400
+    response = client.post("/api/photos/batch", content_type="multipart/form-data", data={
+        "entity_type": "dog", "files": [(io.BytesIO(b"x"), "a.jpg")]})
+    assert response.status_code == 400
+    response = client.post("/api/photos/batch", content_type="multipart/form-data", data={
+        "entity_type": "dog", "entity_id": "1", "files": [(io.BytesIO(b"x"), "a.txt")]})
+    assert response.status_code == 400 and response.get_json()["created"] == 0
+    assert db.tables["photos"] == []
+
+
+def test_gallery_groups_and_pages_photos_per_entity(api):
+    """One request returns a page of photos per entity, in the order the entities were given."""
+    client, db, pipeline = api
+    thumb = "/uploads/derivatives/a_thumbnail.jpg"
+    db.tables["photos"] = [
+        {"id": 1, "related_type": "dog", "related_id": 1, "url": "/uploads/a.jpg", "caption": "Beautiful dog",
+         "is_cover": True, "order": 0, "derivatives": {"thumbnail": {"jpeg": thumb}}},
+        {"id": 2, "related_type": "dog", "related_id": 1, "url": "/uploads/b.jpg", "caption": "Another dog photo",
+         "is_cover": False, "order": 1},
+        {"id": 3, "related_type": "litter", "related_id": 1, "url": "/uploads/c.jpg", "caption": "Litter",
+         "is_cover": True, "order": 0},
+    ]
+
+    response = client.get("/api/photos/gallery?entities=dog:1,litter:1,dog:999&limit=1")
+    assert response.status_code == 200
+    groups = response.get_json()["groups"]
+    assert [(g["entity_type"], g["entity_id"]) for g in groups] == [("dog", 1), ("litter", 1), ("dog", 999)]
+    assert [p["caption"] for p in groups[0]["photos"]] == ["Beautiful dog"]
+    assert groups[0]["total"] == 2 and groups[0]["has_more"] is True
+    assert groups[2]["photos"] == [] and groups[2]["total"] == 0
+
+    # The next page of each entity
+    groups = client.get("/api/photos/gallery?entities=dog:1&limit=1&offset=1").get_json()["groups"]
+    assert [p["caption"] for p in groups[0]["photos"]] == ["Another dog photo"]
+    assert groups[0]["has_more"] is False
+
+    # Covers only, as thumbnails
+    groups = client.get("/api/photos/gallery?entities=dog:1,dog:999&covers_only=true").get_json()["groups"]
+    assert groups[0]["cover"]["id"] == 1 and groups[0]["cover"]["display_url"] == thumb
+    assert groups[1]["cover"] is None
+
+
+def test_gallery_rejects_malformed_requests(api):
+    client, db, pipeline = api
+    assert client.get("/api/photos/gallery?entities=dog-1").status_code == 400
+    assert client.get("/api/photos/gallery").status_code == 400
+    assert client.get("/api/photos/gallery?entities=dog:1&limit=0").status_code == 400
+    too_many = ",".join(f"dog:{i}" for i in range(photos.MAX_GALLERY_ENTITIES + 1))
+    assert client.get(f"/api/photos/gallery?entities={too_many}").status_code == 400
+
+
+def test_reuploads_of_a_normalised_photo_reuse_the_normalised_blob(api, tmp_path):
+    """The original's hash stays on the row, so uploading the same file again stores and processes nothing."""
+    client, db, pipeline = api
+    store = photos.get_blob_store(db)
+    original, normalised = b"phone jpeg with exif", b"upright jpeg"
+    first = upload(client, original).get_json()
+    assert first["source_hash"] == first["content_hash"] == hashlib.sha256(original).hexdigest()
+
+    # The pipeline rewrote the photo: the row moved to the normalised blob and the original was released
+    blob = store.put(io.BytesIO(normalised), "bella.jpg")
+    store.unpin(blob["content_hash"])
+    db.update("photos", first["id"], {"url": blob["url"], "content_hash": blob["content_hash"],
+                                      "derivatives": {"thumbnail": {"jpeg": "/uploads/derivatives/n_thumbnail.jpg"}},
+                                      "width": 3024, "height": 4032})
+    store.release(first["content_hash"], "jpg")
+    assert store.find(first["content_hash"], pin=False) is None
+
+    again = upload(client, original, name="again.jpg").get_json()
+    assert again["content_hash"] == blob["content_hash"] and again["url"] == blob["url"]
+    assert again["source_hash"] == first["source_hash"]
+    assert again["derivatives"] and again["width"] == 3024
+    # Nothing was stored for the original, and nothing was queued
+    assert store.find(first["content_hash"], pin=False) is None
+    assert pipeline.submitted == [first["id"]]
+
+    response = client.post("/api/photos/batch", content_type="multipart/form-data", data={
+        "entity_type": "dog", "entity_id": "5", "files": [(io.BytesIO(original), "a.jpg")]})
+    reused = response.get_json()["results"][0]["photo"]
+    assert reused["content_hash"] == blob["content_hash"] and reused["derivatives"]
+    assert pipeline.submitted == [first["id"]]
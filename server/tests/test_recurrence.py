@@ -0,0 +1,81 @@
+"""
+test_recurrence.py
+
+Tests for lazy expansion of recurring events.
+"""
+
+import datetime
+import pytest
+from server.utils.recurrence import parse_rule, expand, format_occurrence_text, ordinal
+from server.utils.event_calendar import EventCalendar
+
+D = datetime.datetime
+
+
+def test_parse_rule_accepts_legacy_keywords_and_rrule():
+    """Legacy keywords and RRULE strings parse; 'none' means no recurrence."""
+    assert parse_rule("none") is None
+    assert parse_rule(None) is None
+    assert parse_rule("yearly").freq == "YEARLY"
+
+    rule = parse_rule("RRULE:FREQ=WEEKLY;INTERVAL=2;COUNT=4;BYDAY=MO,TH")
+    assert (rule.freq, rule.interval, rule.count, rule.byday) == ("WEEKLY", 2, 4, (0, 3))
+
+    with pytest.raises(ValueError):
+        parse_rule("FREQ=HOURLY")
+
+
+def test_expand_only_returns_window_occurrences():
+    """A yearly series far in the past expands to the single occurrence in the window."""
+    start = D(2015, 3, 10)
+    occurrences = expand(start, parse_rule("yearly"), D(2025, 3, 1), D(2025, 3, 31))
+
+    assert occurrences == [(10, D(2025, 3, 10))]
+
+
+def test_expand_respects_count_until_and_missing_days():
+    """COUNT/UNTIL end the series; months without the start day are skipped."""
+    monthly = expand(D(2025, 1, 31), parse_rule("monthly"), D(2025, 1, 1), D(2025, 6, 30))
+    assert [o.month for _, o in monthly] == [1, 3, 5]
+
+    counted = expand(D(2025, 1, 1), parse_rule("FREQ=DAILY;COUNT=3"), D(2025, 1, 2), D(2025, 12, 31))
+    assert counted == [(1, D(2025, 1, 2)), (2, D(2025, 1, 3))]
+
+    until = expand(D(2025, 1, 6), parse_rule("FREQ=WEEKLY;BYDAY=MO,WE;UNTIL=20250115"),
+                   D(2025, 1, 1), D(2025, 2, 28))
+    assert [o.day for _, o in until] == [6, 8, 13, 15]
+    assert [i for i, _ in until] == [0, 1, 2, 3]
+
+
+def test_multi_day_occurrences_overlapping_window_start_are_included():
+    """An occurrence that began before the window but is still running is returned."""
+    occurrences = expand(D(2025, 1, 1), parse_rule("weekly"), D(2025, 1, 16), D(2025, 1, 17),
+                         duration=datetime.timedelta(days=2))
+    assert occurrences == [(2, D(2025, 1, 15))]
+
+
+def test_occurrence_text_placeholders():
+    """Titles are numbered per occurrence."""
+    assert ordinal(1) == "1st" and ordinal(12) == "12th" and ordinal(23) == "23rd"
+    assert format_occurrence_text("Fido's {occurrence_ordinal} Birthday", 2) == "Fido's 3rd Birthday"
+    assert format_occurrence_text("No placeholders", 5) == "No placeholders"
+
+
+def test_calendar_expands_series_within_window():
+    """One stored birthday series yields one occurrence per visible year."""
+    class StubDatabase:
+        def scan(self, table, page_size=1000):
+            return iter([{
+                "id": 9, "title": "Fido's {occurrence_ordinal} Birthday", "event_type": "birthday",
+                "start_date": "2023-03-10T00:00:00", "end_date": "2023-03-10T00:00:00",
+                "recurring": "RRULE:FREQ=YEARLY",
+            }])
+
+    event_calendar = EventCalendar(StubDatabase())
+    events = event_calendar.between("2025-01-01", "2026-12-31")
+
+    assert [(e["title"], e["start_date"][:10]) for e in events] == [
+        ("Fido's 3rd Birthday", "2025-03-10"),
+        ("Fido's 4th Birthday", "2026-03-10"),
+    ]
+    assert all(e["series_id"] == 9 for e in events)
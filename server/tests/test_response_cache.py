@@ -0,0 +1,129 @@
+"""
+test_response_cache.py
+
+Tests for ETag/conditional-GET response caching driven by table change counters.
+"""
+
+import datetime
+
+import pytest
+from flask import Flask, jsonify
+from server.database.change_tracker import ChangeTracker
+from server.utils.response_cache import ResponseCache
+
+
+@pytest.fixture
+def tracker():
+    return ChangeTracker()
+
+
+@pytest.fixture
+def app(tracker):
+    app = Flask(__name__)
+    app.calls = 0
+    cache = ResponseCache(["dogs", "litters"], tracker=tracker)
+
+    @app.route("/dashboard")
+    def dashboard():
+        def build():
+            app.calls += 1
+            return jsonify({"calls": app.calls})
+        return cache.respond(build)
+
+    return app
+
+
+def test_body_is_cached_until_a_table_changes(app, tracker):
+    """Repeated polls reuse the cached body; a write triggers a rebuild."""
+    client = app.test_client()
+
+    first = client.get("/dashboard")
+    second = client.get("/dashboard")
+    tracker.bump("heats")  # not one of the dashboard tables
+    third = client.get("/dashboard")
+    tracker.bump("dogs")
+    fourth = client.get("/dashboard")
+
+    assert first.get_json() == second.get_json() == third.get_json() == {"calls": 1}
+    assert first.headers["ETag"] == third.headers["ETag"]
+    assert fourth.get_json() == {"calls": 2}
+    assert fourth.headers["ETag"] != first.headers["ETag"]
+
+
+def test_if_none_match_returns_304(app, tracker):
+    """A client presenting the current ETag gets an empty 304."""
+    client = app.test_client()
+    etag = client.get("/dashboard").headers["ETag"]
+
+    not_modified = client.get("/dashboard", headers={"If-None-Match": etag})
+    assert not_modified.status_code == 304
+    assert not_modified.data == b""
+    assert not_modified.headers["ETag"] == etag
+
+    tracker.bump("litters")
+    changed = client.get("/dashboard", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+
+
+def test_if_modified_since_returns_304(app):
+    """Last-Modified can be used for revalidation as well."""
+    client = app.test_client()
+    last_modified = client.get("/dashboard").headers["Last-Modified"]
+
+    response = client.get("/dashboard", headers={"If-Modified-Since": last_modified})
+    assert response.status_code == 304
+
+
+def test_tracker_stamp_only_covers_requested_tables(tracker):
+    """Stamps change only for writes to the tables they cover."""
+    before, _ = tracker.snapshot(["dogs"])
+    tracker.bump("litters")
+    assert tracker.snapshot(["dogs"])[0] == before
+    tracker.bump("dogs")
+    assert tracker.snapshot(["dogs"])[0] != before
+
+
+
+class StubDatabase:
+    """Tables of rows, filtered by field equality"""
+
+    def __init__(self, tables):
+        self.tables = tables
+
+    def find_by_field_values(self, table, filters=None):
+        return [row for row in self.tables.get(table, [])
+                if all(row.get(k) == v for k, v in (filters or {}).items())]
+
+    def scan(self, table, page_size=1000):
+        return iter(self.tables.get(table, []))
+
+
+def test_health_dashboard_behind_token_required():
+    """The cached dashboard view receives current_user and still answers 304s."""
+    from server.health import create_health_bp
+
+    today = datetime.date.today()
+    db = StubDatabase({
+        "vaccinations": [{"id": 1, "dog_id": 1, "vaccine_name": "Rabies",
+                          "next_due_date": (today + datetime.timedelta(days=10)).isoformat()}],
+        "health_conditions": [{"id": 2, "status": "active"}, {"id": 3, "status": "resolved"}],
+        "health_records": [{"id": 4, "record_date": today.isoformat()}, {"id": 5, "record_date": "2020-01-01"}],
+    })
+    app = Flask(__name__)
+    app.register_blueprint(create_health_bp(db), url_prefix="/api/health")
+    client = app.test_client()
+    auth = {"Authorization": "Bearer token"}
+
+    assert client.get("/api/health/dashboard").status_code == 401
+
+    response = client.get("/api/health/dashboard", headers=auth)
+    assert response.status_code == 200
+    data = response.get_json()["data"]
+    assert data["upcoming_vaccinations"]["count"] == 1
+    assert [c["id"] for c in data["active_conditions"]["items"]] == [2]
+    assert [r["id"] for r in data["recent_records"]["items"]] == [4]
+
+    etag = response.headers["ETag"]
+    not_modified = client.get("/api/health/dashboard", headers=dict(auth, **{"If-None-Match": etag}))
+    assert not_modified.status_code == 304
+    assert not_modified.headers["ETag"] == etag
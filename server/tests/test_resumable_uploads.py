@@ -0,0 +1,177 @@
+"""
+test_resumable_uploads.py
+
+Tests for resumable chunked uploads.
+"""
+
+import datetime
+import hashlib
+import io
+import os
+
+import pytest
+from server.utils.blob_store import BlobStore
+from server.utils.resumable_uploads import UploadSessions, UploadSessionError
+
+
+VIDEO = bytes(range(256)) * 4096  # 1 MiB
+
+
+class DroppedStream(io.BytesIO):
+    """A request body whose connection drops after limit bytes"""
+
+    def __init__(self, data, limit):
+        super().__init__(data[:limit])
+
+
+def sessions(tmp_path, **kwargs):
+    return UploadSessions(BlobStore(None, root=str(tmp_path)), **kwargs)
+
+
+def test_chunks_are_appended_and_finished_into_the_blob_store(tmp_path):
+    uploads = sessions(tmp_path)
+    session = uploads.create(len(VIDEO), "whelping.mp4", {"type": "video"})
+    assert session["offset"] == 0
+
+    half = len(VIDEO) // 2
+    session = uploads.append(session["id"], 0, io.BytesIO(VIDEO[:half]))
+    assert session["offset"] == half and "blob" not in session
+
+    session = uploads.append(session["id"], half, io.BytesIO(VIDEO[half:]))
+    blob = session["blob"]
+    assert blob["content_hash"] == hashlib.sha256(VIDEO).hexdigest()
+    assert blob["url"].endswith(".mp4")
+    with open(blob["path"], "rb") as stored:
+        assert stored.read() == VIDEO
+    # The session is gone once finished
+    assert uploads.get(session["id"]) is None
+
+
+def test_resume_from_acknowledged_offset_after_a_dropped_connection(tmp_path):
+    uploads = sessions(tmp_path)
+    session = uploads.create(len(VIDEO), "whelping.mp4")
+
+    uploads.append(session["id"], 0, DroppedStream(VIDEO, 300000), content_length=len(VIDEO))
+    # A fresh process sees the same offset
+    resumed = sessions(tmp_path).get(session["id"])
+    assert resumed["offset"] == 300000
+
+    done = uploads.append(session["id"], resumed["offset"], io.BytesIO(VIDEO[resumed["offset"]:]))
+    assert done["blob"]["content_hash"] == hashlib.sha256(VIDEO).hexdigest()
+
+
+def test_wrong_offset_and_overlong_chunks_are_rejected(tmp_path):
+    uploads = sessions(tmp_path)
+    session = uploads.create(100, "clip.mp4")
+    with pytest.raises(UploadSessionError) as error:
+        uploads.append(session["id"], 10, io.BytesIO(b"x" * 10))
+    assert error.value.status == 409
+
+    with pytest.raises(UploadSessionError) as error:
+        uploads.append(session["id"], 0, io.BytesIO(b"x" * 200), content_length=200)
+    assert error.value.status == 413
+
+    # Without a declared length, bytes past Upload-Length are not read
+    done = uploads.append(session["id"], 0, io.BytesIO(b"x" * 200))
+    assert done["blob"]["size"] == 100
+
+
+def test_limits_and_unknown_sessions(tmp_path):
+    uploads = sessions(tmp_path, max_bytes=1000)
+    with pytest.raises(UploadSessionError) as error:
+        uploads.create(1001, "big.mp4")
+    assert error.value.status == 413
+    with pytest.raises(UploadSessionError):
+        uploads.create(0, "empty.mp4")
+
+    assert uploads.get("../../etc/passwd") is None
+    with pytest.raises(UploadSessionError) as error:
+        uploads.append("0" * 32, 0, io.BytesIO(b"x"))
+    assert error.value.status == 404
+
+
+def test_expired_and_terminated_sessions_are_removed(tmp_path):
+    uploads = sessions(tmp_path)
+    old = uploads.create(10, "a.pdf")
+    kept = uploads.create(10, "b.pdf")
+    assert uploads.terminate(kept["id"])
+    assert not uploads.terminate(kept["id"])
+
+    later = datetime.datetime.utcnow() + datetime.timedelta(days=30)
+    assert uploads.expire(later) == [old["id"]]
+    assert os.listdir(uploads.directory) == []
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    from flask import Flask
+    from server import uploads as uploads_module
+
+    class StubJobRunner:
+        def register(self, job_type, handler):
+            pass
+
+    created = []
+
+    class StubDatabase:
+        def create(self, table, data):
+            created.append((table, data))
+            return dict(data, id=len(created))
+
+    store = BlobStore(None, root=str(tmp_path))
+    monkeypatch.setattr(uploads_module, "get_blob_store", lambda _db: store)
+    monkeypatch.setattr(uploads_module, "get_job_runner", lambda _db: StubJobRunner())
+    app = Flask(__name__)
+    app.register_blueprint(uploads_module.create_uploads_bp(StubDatabase()), url_prefix="/api/uploads")
+    return app.test_client(), created
+
+
+def test_videos_upload_in_chunks_through_the_api(client):
+    """A whelping video is sent in chunks through a session; videos need a chunked protocol."""
+    client, created = client
+    response = client.post("/api/uploads/sessions", json={"filename": "whelping.mp4", "type": "video"},
+                           headers={"Upload-Length": str(len(VIDEO))})
+    assert response.status_code == 201
+    location = response.headers["Location"]
+
+    chunk = 256 * 1024
+    for offset in range(0, len(VIDEO), chunk):
+        response = client.patch(location, data=VIDEO[offset:offset + chunk],
+                                headers={"Upload-Offset": str(offset),
+                                         "Content-Type": "application/offset+octet-stream"})
+        assert response.headers["Upload-Offset"] == str(min(offset + chunk, len(VIDEO)))
+    assert response.status_code == 200
+    stored = response.get_json()["data"]
+    assert stored["content_hash"] == hashlib.sha256(VIDEO).hexdigest() and stored["url"].endswith(".mp4")
+
+    for name in ("clip.mov", "clip.m4v", "clip.webm"):
+        assert client.post("/api/uploads/sessions", json={"filename": name},
+                           headers={"Upload-Length": "10"}).status_code == 201
+    assert client.post("/api/uploads/sessions", json={"filename": "clip.exe"},
+                       headers={"Upload-Length": "10"}).status_code == 400
+    # Single-request uploads stay limited to images and documents
+    response = client.post("/api/uploads", content_type="multipart/form-data",
+                           data={"file": (io.BytesIO(b"x"), "whelping.mp4")})
+    assert response.status_code == 400
+
+
+def test_videos_upload_in_parts_through_the_api(client):
+    client, created = client
+    digest = hashlib.sha256(VIDEO).hexdigest()
+    response = client.post("/api/uploads/multipart",
+                           json={"filename": "whelping.mov", "content_hash": digest, "size": len(VIDEO)})
+    assert response.status_code == 201
+    started = response.get_json()["data"]
+
+    half = len(VIDEO) // 2
+    parts = []
+    for number, data in ((1, VIDEO[:half]), (2, VIDEO[half:])):
+        response = client.put(f"/api/uploads/multipart/{started['upload_id']}/parts/{number}?key={started['key']}",
+                              data=data)
+        parts.append(response.get_json()["data"])
+
+    response = client.post(f"/api/uploads/multipart/{started['upload_id']}/complete",
+                           json={"key": started["key"], "filename": "whelping.mov", "parts": parts})
+    assert response.status_code == 201
+    assert response.get_json()["data"]["url"].endswith(f"{digest}.mov")
+    assert [(table, data["file_name"]) for table, data in created] == [("file_uploads", "whelping.mov")]
@@ -0,0 +1,103 @@
+"""
+test_rule_engine.py
+
+Tests for compiled event rule conditions and one-pass rule evaluation.
+"""
+
+import pytest
+from server.database.change_tracker import ChangeTracker
+from server.utils.rule_engine import RuleEngine, compile_conditions, RuleConditionError
+
+
+class StubDatabase:
+    """Database stub counting rule loads, event reads and bulk inserts."""
+
+    def __init__(self, rules, events=None):
+        self.rules = rules
+        self.events = list(events or [])
+        self.rule_loads = 0
+        self.event_reads = 0
+        self.bulk_inserts = 0
+
+    def find_by_field_values(self, table, filters):
+        if table == "event_rules":
+            self.rule_loads += 1
+            return list(self.rules)
+        self.event_reads += 1
+        return [e for e in self.events if all(e.get(k) == v for k, v in filters.items())]
+
+    def create_many(self, table, records):
+        self.bulk_inserts += 1
+        created = [dict(record, id=100 + len(self.events) + i) for i, record in enumerate(records)]
+        self.events.extend(created)
+        return created
+
+
+def rule(rule_id, title, conditions=None, entity_type=None, days=0, active=True):
+    return {
+        "id": rule_id, "name": f"Rule {rule_id}", "trigger_type": "litter_whelped",
+        "action_type": "create_event", "active": active, "conditions": conditions,
+        "action_data": {"title": title, "days_delay": days, "event_type": "reminder",
+                        **({"entity_type": entity_type} if entity_type else {})},
+    }
+
+
+LITTER = {"id": 7, "whelp_date": "2025-03-01", "num_puppies": "6", "status": "Born", "dam": {"breed": "Lab"}}
+
+
+def test_condition_forms():
+    """Shorthand, operator maps, lists and all/any/not combine as expected."""
+    assert compile_conditions(None)(LITTER)
+    assert compile_conditions({"status": "Born"})(LITTER)
+    assert not compile_conditions({"status": "Planned"})(LITTER)
+    assert compile_conditions({"num_puppies": {"gte": 5, "lt": 10}})(LITTER)
+    assert compile_conditions([{"field": "dam.breed", "operator": "==", "value": "Lab"}])(LITTER)
+    assert compile_conditions({"any": [{"status": "Planned"}, {"status": ["Born", "Sold"]}]})(LITTER)
+    assert compile_conditions({"not": {"whelp_date": {"gt": "2025-06-01"}}})(LITTER)
+    assert compile_conditions('{"missing": {"exists": false}}')(LITTER)
+    assert compile_conditions({"status": {"contains": "or"}})(LITTER)
+    assert not compile_conditions({"id": {"contains": 7}})(LITTER)
+
+
+def test_invalid_conditions_raise():
+    """Unknown operators and malformed JSON are rejected at compile time."""
+    with pytest.raises(RuleConditionError):
+        compile_conditions({"status": {"like": "B%"}})
+    with pytest.raises(RuleConditionError):
+        compile_conditions("{not json")
+
+
+def test_rules_are_indexed_and_cached_until_table_changes():
+    """Rules load once and reload only after event_rules is written."""
+    tracker = ChangeTracker()
+    db = StubDatabase([rule(1, "A", entity_type="litter"), rule(2, "B"), rule(3, "C", entity_type="dog"),
+                       rule(4, "D", active=False)])
+    engine = RuleEngine(db, tracker)
+
+    assert {r.rule["id"] for r in engine.rules_for("litter_whelped", "litter")} == {1, 2}
+    assert {r.rule["id"] for r in engine.rules_for("litter_whelped", "dog")} == {2, 3}
+    assert db.rule_loads == 1
+
+    db.rules.append(rule(5, "E", entity_type="litter"))
+    tracker.bump("event_rules")
+    assert {r.rule["id"] for r in engine.rules_for("litter_whelped", "litter")} == {1, 2, 5}
+    assert db.rule_loads == 2
+
+
+def test_evaluate_filters_by_conditions_and_batches_creation():
+    """Matching rules create their events with one read and one bulk insert."""
+    db = StubDatabase(
+        [rule(1, "Big litter check", {"num_puppies": {"gt": 5}}, days=3),
+         rule(2, "Small litter check", {"num_puppies": {"lte": 5}}),
+         rule(3, "Weigh puppies", days=1),
+         rule(4, "Already there")],
+        events=[{"id": 1, "related_type": "litter", "related_id": 7,
+                 "title": "Already there", "event_type": "reminder"}],
+    )
+    outcome = RuleEngine(db, ChangeTracker()).evaluate("litter_whelped", "litter", LITTER)
+
+    assert sorted(e["title"] for e in outcome["events"]) == ["Big litter check", "Weigh puppies"]
+    assert outcome["events"][0]["start_date"] == "2025-03-04T00:00:00"
+    assert {r["rule_id"]: r["result"] for r in outcome["results"]}[4] == "Event already exists"
+    assert db.event_reads == 1
+    assert db.bulk_inserts == 1
@@ -0,0 +1,164 @@
+"""
+test_storage.py
+
+Tests for the pluggable upload storage backends.
+"""
+
+import base64
+import datetime
+import hashlib
+import io
+import pickle
+
+import pytest
+from server.storage import LocalStorage, S3Storage, StorageError, check_key
+from server.utils.blob_store import BlobStore, BlobVerificationError, blob_key, parse_blob_key
+
+
+def put(storage, key, data=b"x"):
+    return storage.put(key, io.BytesIO(data))
+
+
+def test_keys_cannot_leave_the_store():
+    assert check_key("blobs/ab/abc.jpg") == "blobs/ab/abc.jpg"
+    for key in ("", "/etc/passwd", "../secrets", "blobs/../../x", "blobs//x", "blobs/./x"):
+        with pytest.raises(StorageError):
+            check_key(key)
+
+
+def test_local_put_open_stat_delete(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    assert put(storage, "blobs/ab/photo.jpg", b"photo bytes") == 11
+
+    with storage.open("blobs/ab/photo.jpg") as f:
+        assert f.read() == b"photo bytes"
+    assert storage.stat("blobs/ab/photo.jpg")["size"] == 11
+    assert storage.stat("blobs/ab") is None
+    assert storage.url("blobs/ab/photo.jpg") == "/uploads/blobs/ab/photo.jpg"
+    assert storage.key_for("/uploads/blobs/ab/photo.jpg") == "blobs/ab/photo.jpg"
+    assert storage.key_for("https://cdn.example.com/photo.jpg") is None
+
+    assert storage.delete("blobs/ab/photo.jpg")
+    assert not storage.delete("blobs/ab/photo.jpg")
+    with pytest.raises(FileNotFoundError):
+        storage.open("blobs/ab/photo.jpg")
+    # No temporary files are left behind
+    assert list((tmp_path / "blobs" / "ab").iterdir()) == []
+
+
+def test_local_list_is_in_key_order_and_resumable(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    keys = ["a.txt", "a/b.txt", "a/c/d.txt", "a-b.txt", "b/e.txt", "derivatives/x_thumbnail.webp"]
+    for key in keys:
+        put(storage, key)
+    put(storage, ".sessions/hidden.json")
+
+    assert [o["key"] for o in storage.list()] == sorted(keys)
+    assert [o["key"] for o in storage.list("a/")] == ["a/b.txt", "a/c/d.txt"]
+    assert [o["key"] for o in storage.list("derivatives/x_")] == ["derivatives/x_thumbnail.webp"]
+
+    # Scanning in pages of two visits every key once
+    seen, last = [], None
+    while True:
+        page = storage.list(start_after=last, limit=2)
+        if not page:
+            break
+        seen.extend(o["key"] for o in page)
+        last = page[-1]["key"]
+    assert seen == sorted(keys)
+
+
+def test_local_multipart_upload(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    upload_id = storage.create_multipart("blobs/ab/video.mp4")
+    second = storage.upload_part("blobs/ab/video.mp4", upload_id, 2, io.BytesIO(b"world"))
+    first = storage.upload_part("blobs/ab/video.mp4", upload_id, 1, io.BytesIO(b"hello "))
+    assert first["etag"] == hashlib.md5(b"hello ").hexdigest()
+
+    with pytest.raises(StorageError):
+        storage.upload_part("blobs/ab/other.mp4", upload_id, 3, io.BytesIO(b"!"))
+    with pytest.raises(StorageError):
+        storage.complete_multipart("blobs/ab/video.mp4", upload_id, [first, second, {"part_number": 3}])
+
+    assert storage.complete_multipart("blobs/ab/video.mp4", upload_id, [second, first]) == 11
+    with storage.open("blobs/ab/video.mp4") as f:
+        assert f.read() == b"hello world"
+    assert list((tmp_path / ".multipart").iterdir()) == []
+    with pytest.raises(StorageError):
+        storage.abort_multipart("blobs/ab/video.mp4", upload_id)
+
+
+def test_local_storage_cannot_presign(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    assert storage.presigned_put("blobs/ab/a.jpg") is None
+    assert storage.presigned_get("blobs/ab/a.jpg") is None
+
+
+def test_blob_store_verifies_direct_uploads(tmp_path):
+    store = BlobStore(None, root=str(tmp_path))
+    content = b"%PDF contract"
+    digest = hashlib.sha256(content).hexdigest()
+    assert parse_blob_key(blob_key(digest, "pdf")) == (digest, "pdf")
+    assert parse_blob_key("blobs/ab/../x.pdf") is None
+
+    assert store.verify(digest, "pdf") is None
+    put(store.storage, blob_key(digest, "pdf"), content)
+    assert store.verify(digest, "pdf")["size"] == len(content)
+
+    forged = hashlib.sha256(b"other").hexdigest()
+    put(store.storage, blob_key(forged, "pdf"), content)
+    with pytest.raises(BlobVerificationError):
+        store.verify(forged, "pdf")
+    assert not store.storage.exists(blob_key(forged, "pdf"))
+
+
+class FakeS3Client:
+    """The few boto3 S3 calls the backend lists and signs with"""
+
+    def __init__(self, keys):
+        self.keys = sorted(keys)
+        self.calls = []
+
+    def list_objects_v2(self, **params):
+        self.calls.append(params)
+        keys = [k for k in self.keys if k.startswith(params["Prefix"]) and k > params.get("StartAfter", "")]
+        start = int(params.get("ContinuationToken", 0))
+        page = keys[start:start + params["MaxKeys"]]
+        modified = datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc)
+        response = {"Contents": [{"Key": k, "Size": 1, "LastModified": modified} for k in page],
+                    "IsTruncated": start + len(page) < len(keys)}
+        if response["IsTruncated"]:
+            response["NextContinuationToken"] = str(start + len(page))
+        return response
+
+    def generate_presigned_url(self, operation, Params, ExpiresIn):
+        return f"https://s3.example.com/{Params['Bucket']}/{Params['Key']}?op={operation}"
+
+
+def test_s3_list_pages_strips_prefix_and_hides_scratch_keys():
+    client = FakeS3Client(["media/a.jpg", "media/.multipart/x", "media/b.jpg", "media/c.jpg", "other/d.jpg"])
+    storage = S3Storage("bucket", prefix="media", client=client)
+
+    assert [o["key"] for o in storage.list(limit=10)] == ["a.jpg", "b.jpg", "c.jpg"]
+    assert [o["key"] for o in storage.list(start_after="a.jpg", limit=1)] == ["b.jpg"]
+    assert client.calls[-1]["StartAfter"] == "media/a.jpg"
+
+
+def test_s3_presigned_put_pins_the_checksum():
+    storage = S3Storage("bucket", client=FakeS3Client([]), public_url="https://cdn.example.com/")
+    digest = hashlib.sha256(b"photo").hexdigest()
+    upload = storage.presigned_put("blobs/ab/a.jpg", content_type="image/jpeg", checksum_sha256=digest)
+
+    assert upload["method"] == "PUT"
+    assert upload["url"].startswith("https://s3.example.com/bucket/blobs/ab/a.jpg")
+    # S3 wants the raw digest base64-encoded, not the hex string
+    assert upload["headers"]["x-amz-checksum-sha256"] == base64.b64encode(hashlib.sha256(b"photo").digest()).decode()
+    assert upload["headers"]["Content-Type"] == "image/jpeg"
+    assert storage.url("blobs/ab/a.jpg") == "https://cdn.example.com/blobs/ab/a.jpg"
+
+
+def test_backends_pickle_without_their_clients(tmp_path):
+    s3 = pickle.loads(pickle.dumps(S3Storage("bucket", client=FakeS3Client([]))))
+    assert s3._client is None and s3.bucket == "bucket"
+    local = pickle.loads(pickle.dumps(LocalStorage(str(tmp_path))))
+    assert local.root == str(tmp_path)
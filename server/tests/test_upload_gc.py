@@ -0,0 +1,228 @@
+"""
+test_upload_gc.py
+
+Tests for collecting uploaded files that no row refers to.
+"""
+
+import datetime
+import functools
+import hashlib
+import io
+import os
+import time
+
+import pytest
+from server.utils.blob_store import BlobStore, PINS_TABLE, PIN_TTL, blob_key
+from server.utils.upload_gc import UploadCollector, QUARANTINE_DIR, References
+
+DAY = datetime.timedelta(days=1)
+
+
+class StubDatabase:
+    """Tables of rows, scanned like a paged provider"""
+
+    def __init__(self, tables):
+        self.tables = tables
+        self.scanned = []
+
+    def scan(self, table, page_size=1000):
+        self.scanned.append((table, page_size))
+        yield from self.tables.get(table, [])
+
+    def find_by_field_values(self, table, filters):
+        return [row for row in self.tables.get(table, [])
+                if all(row.get(k) == v for k, v in filters.items())]
+
+    def delete(self, table, record_id):
+        self.tables[table] = [row for row in self.tables[table] if row["id"] != record_id]
+        return True
+
+
+def digest_of(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+def store_file(store, key, content=b"x", age=10 * DAY):
+    store.storage.put(key, io.BytesIO(content))
+    path = store.storage.local_path(key)
+    old = time.time() - age.total_seconds()
+    os.utime(path, (old, old))
+
+
+def keys(store, prefix=""):
+    return [stored["key"] for stored in store.storage.list(prefix)]
+
+
+@pytest.fixture
+def uploads(tmp_path):
+    """A store with a referenced photo, an orphaned blob, a legacy orphan and a fresh upload"""
+    kept, orphan = b"kept photo", b"orphaned photo"
+    db = StubDatabase({
+        "photos": [{"id": 1, "url": "/uploads/" + blob_key(digest_of(kept), "jpg"), "content_hash": digest_of(kept),
+                    "derivatives": {"thumbnail": {"webp": f"/uploads/derivatives/{digest_of(kept)}_thumbnail.webp"}}}],
+        "dogs": [{"id": 3, "cover_photo": "/uploads/legacy-cover.jpeg"}],
+    })
+    store = BlobStore(db, root=str(tmp_path))
+    store_file(store, blob_key(digest_of(kept), "jpg"), kept)
+    store_file(store, f"derivatives/{digest_of(kept)}_thumbnail.webp")
+    store_file(store, blob_key(digest_of(orphan), "jpg"), orphan)
+    store_file(store, f"derivatives/{digest_of(orphan)}_thumbnail.webp")
+    store_file(store, "legacy-cover.jpeg")
+    store_file(store, "legacy-orphan.jpeg", b"12345")
+    store_file(store, "blobs/ff/still-uploading.jpg", age=datetime.timedelta(minutes=5))
+    store_file(store, "dog_images/other-store.jpg")
+    return db, store, orphan
+
+
+def test_references_come_from_urls_and_hashes_in_any_column(tmp_path):
+    references = References(BlobStore(None, root=str(tmp_path)).storage.key_for)
+    digest = digest_of(b"a")
+    references.add({"sizes": [f"/uploads/derivatives/{digest}_medium.jpg"]})
+    references.add("https://cdn.example.com/elsewhere.jpg")
+
+    assert blob_key(digest, "png") in references
+    assert f"blobs/{digest[:2]}/{digest}.txt.gz" in references
+    assert "elsewhere.jpg" not in references
+
+
+def test_orphans_are_quarantined_then_deleted(uploads, tmp_path):
+    db, store, orphan = uploads
+    now = datetime.datetime.utcnow()
+    checkpoint = str(tmp_path / ".gc" / "checkpoint.json")
+
+    stats = UploadCollector(db, store, page_size=2, checkpoint_path=checkpoint, now=lambda: now).run()
+    assert stats["quarantined"] == 3 and stats["young"] == 1 and stats["deleted"] == 0
+    assert stats["quarantined_bytes"] == len(orphan) + 1 + 5
+    quarantined = keys(store, QUARANTINE_DIR + "/")
+    assert sorted(key.split("/", 2)[2] for key in quarantined) == sorted([
+        blob_key(digest_of(orphan), "jpg"), f"derivatives/{digest_of(orphan)}_thumbnail.webp", "legacy-orphan.jpeg"])
+    assert "legacy-cover.jpeg" in keys(store) and "dog_images/other-store.jpg" in keys(store)
+    assert ("photos", 2) in db.scanned
+
+    # Nothing is deleted until the quarantine period has passed
+    later = now + 8 * DAY
+    stats = UploadCollector(db, store, checkpoint_path=checkpoint, now=lambda: later).run()
+    assert stats["deleted"] == 3 and stats["reclaimed_bytes"] == len(orphan) + 1 + 5
+    # Only the upload that was too young last time is quarantined now
+    assert [key.split("/", 2)[2] for key in keys(store, QUARANTINE_DIR + "/")] == ["blobs/ff/still-uploading.jpg"]
+    assert store.find(digest_of(b"kept photo")) is not None
+
+
+def test_quarantined_files_referenced_again_are_restored(uploads):
+    db, store, orphan = uploads
+    now = datetime.datetime.utcnow()
+    UploadCollector(db, store, now=lambda: now).run()
+
+    db.tables["file_uploads"] = [{"id": 9, "file_path": "/uploads/legacy-orphan.jpeg"}]
+    stats = UploadCollector(db, store, now=lambda: now + 8 * DAY).run()
+    assert stats["restored"] == 1 and stats["deleted"] == 2
+    assert "legacy-orphan.jpeg" in keys(store)
+
+
+def test_blobs_referenced_since_the_scan_started_are_kept(uploads):
+    db, store, orphan = uploads
+
+    class LateReference(UploadCollector):
+        def references(self):
+            found = super().references()
+            # A row for the orphan's content is created after the tables were read
+            db.tables["documents"] = [{"id": 5, "content_hash": digest_of(orphan)}]
+            return found
+
+    stats = LateReference(db, store).run()
+    assert stats["quarantined"] == 1
+    assert [key.split("/", 2)[2] for key in keys(store, QUARANTINE_DIR + "/")] == ["legacy-orphan.jpeg"]
+
+
+def test_dry_run_touches_nothing(uploads):
+    db, store, orphan = uploads
+    before = keys(store)
+    stats = UploadCollector(db, store, dry_run=True).run()
+    assert stats["quarantined"] == 3 and stats["dry_run"]
+    assert keys(store) == before
+
+
+def test_interrupted_scans_resume_after_the_last_page(uploads, tmp_path):
+    db, store, orphan = uploads
+    checkpoint = str(tmp_path / ".gc" / "checkpoint.json")
+    pages = []
+
+    def stop_after_first_page(done, total=None, message=None):
+        pages.append(message)
+        if len(pages) == 1:
+            raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        UploadCollector(db, store, page_size=3, checkpoint_path=checkpoint, progress=stop_after_first_page).run()
+    stats = UploadCollector(db, store, page_size=3, checkpoint_path=checkpoint).run()
+
+    # Every file was scanned exactly once across both runs
+    assert stats["scanned"] == 7 and stats["quarantined"] == 3
+
+
+def test_unreadable_reference_tables_stop_the_run(uploads):
+    db, store, orphan = uploads
+
+    def broken_scan(table, page_size=1000):
+        raise RuntimeError("relation photos does not exist")
+        yield
+
+    db.scan = broken_scan
+    with pytest.raises(RuntimeError):
+        UploadCollector(db, store).run()
+    assert keys(store, QUARANTINE_DIR + "/") == []
+
+
+def test_pinned_blobs_are_kept_and_expired_pins_removed(uploads):
+    db, store, orphan = uploads
+    now = datetime.datetime.utcnow()
+    db.tables[PINS_TABLE] = [
+        {"id": 1, "content_hash": digest_of(orphan), "pinned_at": now.isoformat()},
+        {"id": 2, "content_hash": "ab" * 32, "pinned_at": (now - PIN_TTL - DAY).isoformat()},
+    ]
+
+    stats = UploadCollector(db, store, now=lambda: now).run()
+    # The orphan's row is being written by another worker
+    assert blob_key(digest_of(orphan), "jpg") in keys(store)
+    assert stats["expired_pins"] == 1 and [row["id"] for row in db.tables[PINS_TABLE]] == [1]
+
+
+
+def test_collection_endpoint_is_for_admins_only(uploads, monkeypatch):
+    from flask import Flask
+    from server import uploads as uploads_module
+
+    db, store, orphan = uploads
+    submitted = []
+
+    class StubJobRunner:
+        def register(self, job_type, handler):
+            pass
+
+        def submit(self, job_type, payload=None):
+            submitted.append((job_type, payload))
+            return {"id": "job-1", "status": "queued"}
+
+    def client_for_app():
+        app = Flask(__name__)
+        app.register_blueprint(uploads_module.create_uploads_bp(db), url_prefix="/api/uploads")
+        return app.test_client()
+
+    monkeypatch.setattr(uploads_module, "get_blob_store", lambda _db: store)
+    monkeypatch.setattr(uploads_module, "get_job_runner", lambda _db: StubJobRunner())
+    client = client_for_app()
+    assert client.post("/api/uploads/gc").status_code == 401
+    # The development middleware signs in a user without the admin role
+    assert client.post("/api/uploads/gc", headers={"Authorization": "Bearer token"}).status_code == 403
+    assert submitted == []
+
+    def as_admin(view):
+        @functools.wraps(view)
+        def decorated(*args, **kwargs):
+            return view({"id": 1, "role": "ADMIN"}, *args, **kwargs)
+        return decorated
+
+    monkeypatch.setattr(uploads_module, "token_required", as_admin)
+    response = client_for_app().post("/api/uploads/gc?dry_run=true")
+    assert response.status_code == 202
+    assert submitted == [("collect_orphaned_uploads", {"dry_run": True, "resume": True})]
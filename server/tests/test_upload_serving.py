@@ -0,0 +1,115 @@
+"""
+test_upload_serving.py
+
+Tests for /uploads serving: cache headers, validators, ranges and offload.
+"""
+
+import gzip
+import io
+
+import pytest
+from flask import Flask
+from server.storage import LocalStorage
+from server.utils.blob_store import BlobStore
+from server.utils.upload_serving import serve_upload, serve_stored, content_hash_of
+
+
+@pytest.fixture
+def uploads(tmp_path):
+    store = BlobStore(None, root=str(tmp_path))
+    photo = store.put(io.BytesIO(b"\xff\xd8" + b"p" * 4000), "litter.jpg")
+    notes = store.put(io.BytesIO(b"feeding schedule\n" * 200), "notes.txt")
+    (tmp_path / "legacy.jpeg").write_bytes(b"legacy")
+
+    app = Flask(__name__)
+
+    @app.route("/uploads/<path:filename>")
+    def upload(filename):
+        return serve_upload(str(tmp_path), filename)
+
+    @app.route("/offloaded/<path:filename>")
+    def offloaded(filename):
+        return serve_upload(str(tmp_path), filename, "/internal-uploads/")
+
+    return app.test_client(), photo, notes
+
+
+def test_blobs_are_immutable_with_hash_etag(uploads):
+    client, photo, _ = uploads
+    response = client.get(photo["url"])
+    assert response.status_code == 200
+    assert "immutable" in response.headers["Cache-Control"]
+    assert response.headers["ETag"] == f'"{photo["content_hash"]}"'
+
+    revalidated = client.get(photo["url"], headers={"If-None-Match": response.headers["ETag"]})
+    assert revalidated.status_code == 304
+
+
+def test_legacy_uploads_are_revalidated(uploads):
+    client, _, _ = uploads
+    response = client.get("/uploads/legacy.jpeg")
+    assert response.status_code == 200
+    assert "immutable" not in response.headers["Cache-Control"]
+    assert response.headers.get("ETag")
+
+
+def test_range_requests(uploads):
+    client, photo, _ = uploads
+    response = client.get(photo["url"], headers={"Range": "bytes=0-1"})
+    assert response.status_code == 206
+    assert response.data == b"\xff\xd8"
+    assert response.headers["Content-Range"] == f"bytes 0-1/{photo['size']}"
+
+
+def test_precompressed_variants(uploads):
+    client, _, notes = uploads
+    response = client.get(notes["url"], headers={"Accept-Encoding": "gzip, deflate"})
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(response.data) == b"feeding schedule\n" * 200
+    assert "Accept-Encoding" in response.headers["Vary"]
+
+    plain = client.get(notes["url"])
+    assert "Content-Encoding" not in plain.headers
+    assert plain.data == b"feeding schedule\n" * 200
+
+
+def test_missing_and_traversal_paths_are_404(uploads):
+    client, _, _ = uploads
+    assert client.get("/uploads/nope.jpg").status_code == 404
+    assert client.get("/uploads/blobs").status_code == 404
+    assert client.get("/uploads/../app.py").status_code == 404
+
+
+def test_accel_redirect_offload(uploads):
+    client, photo, _ = uploads
+    filename = photo["url"][len("/uploads/"):]
+    response = client.get(f"/offloaded/{filename}")
+    assert response.headers["X-Accel-Redirect"] == f"/internal-uploads/{filename}"
+    assert response.data == b""
+    assert "immutable" in response.headers["Cache-Control"]
+
+
+def test_content_hash_of():
+    digest = "a" * 64
+    assert content_hash_of(f"blobs/aa/{digest}.jpg") == digest
+    assert content_hash_of(f"derivatives/{digest}_thumbnail.webp") == digest
+    assert content_hash_of("derivatives/3f63_thumbnail.webp") is None
+    assert content_hash_of(f"{digest}.jpg") is None
+
+
+def test_bookkeeping_files_are_never_served(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    for key in (".sessions/abc.json", ".gc/checkpoint.json", "blobs/.incoming/x.jpg", "quarantine/20260101T000000/a.jpg"):
+        storage.put(key, io.BytesIO(b"private"))
+    storage.put("a.jpg", io.BytesIO(b"public"))
+
+    app = Flask(__name__)
+
+    @app.route("/uploads/<path:filename>")
+    def upload(filename):
+        return serve_stored(storage, str(tmp_path), filename)
+
+    client = app.test_client()
+    assert client.get("/uploads/a.jpg").status_code == 200
+    for key in (".sessions/abc.json", ".gc/checkpoint.json", "blobs/.incoming/x.jpg", "quarantine/20260101T000000/a.jpg"):
+        assert client.get(f"/uploads/{key}").status_code == 404
@@ -2,29 +2,136 @@
 uploads.py
 
 Blueprint for managing general file uploads.
+
+Besides uploads through the app (single request or resumable sessions),
+clients can send large files straight to object storage: /direct hands out a
+presigned PUT for the blob's key and /multipart runs an S3-style multipart
+upload. Either way the stored object is re-hashed before it is recorded.
+
+POST /gc starts a background job that collects files no row refers to (see
+utils/upload_gc).
 """
 
 import os
-import uuid
-import tempfile
-from flask import Blueprint, request, jsonify, current_app
+
+from flask import Blueprint, request, jsonify, make_response
 from werkzeug.utils import secure_filename
 from server.database.db_interface import DatabaseInterface
 from .config import debug_log
+from .middleware.auth import token_required
+from .storage import StorageError
+from .utils.blob_store import (
+    get_blob_store, blob_key, is_content_hash, normalise_extension, parse_blob_key, BlobVerificationError,
+)
+from .utils.resumable_uploads import get_upload_sessions, UploadSessionError, MAX_UPLOAD_BYTES
+from .utils.upload_gc import UploadCollector
+from .utils.jobs import get_job_runner
+
+# Lifetime of presigned upload URLs
+DIRECT_UPLOAD_EXPIRES = 60 * 60
 
 def create_uploads_bp(db: DatabaseInterface) -> Blueprint:
     uploads_bp = Blueprint("uploads_bp", __name__)
     
+    # Uploads are stored once per distinct content
+    blob_store = get_blob_store(db)
+    
+    # Resumable uploads, finished into the blob store
+    upload_sessions = get_upload_sessions(blob_store)
+    
+    # Orphaned files are collected in a background job that resumes from its checkpoint
+    job_runner = get_job_runner(db)
+    gc_checkpoint = os.path.join(blob_store.root, ".gc", "checkpoint.json")
+    
+    def collect_orphans_job(payload, job):
+        collector = UploadCollector(db, blob_store, checkpoint_path=gc_checkpoint,
+                                    dry_run=bool(payload.get("dry_run")), progress=job.progress)
+        return collector.run(resume=payload.get("resume", True))
+    
+    job_runner.register("collect_orphaned_uploads", collect_orphans_job)
+    
+    # Headers browsers may read from resumable upload responses
+    SESSION_HEADERS = "Location, Upload-Offset, Upload-Length, Tus-Resumable"
+    
+    def session_response(session, status=204, body=None):
+        response = make_response(jsonify(body) if body is not None else "", status)
+        response.headers["Tus-Resumable"] = "1.0.0"
+        response.headers["Upload-Offset"] = str(session["offset"])
+        response.headers["Upload-Length"] = str(session["length"])
+        response.headers["Cache-Control"] = "no-store"
+        response.headers["Access-Control-Expose-Headers"] = SESSION_HEADERS
+        return response
+    
+    def header_int(name):
+        value = request.headers.get(name)
+        try:
+            return int(value) if value is not None else None
+        except ValueError:
+            raise UploadSessionError(f"{name} must be an integer")
+    
+    def query_flag(name, default):
+        return request.args.get(name, default).lower() in ('1', 'true', 'yes')
+    
     # Helper function to check if file extension is allowed
-    def allowed_file(filename):
+    def allowed_file(filename, videos=False):
         ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp', 'pdf', 'doc', 'docx', 'xls', 'xlsx'}
-        return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+        # Videos only through resumable, direct and multipart uploads, not one request body
+        VIDEO_EXTENSIONS = {'mp4', 'mov', 'm4v', 'webm'}
+        if '.' not in filename:
+            return False
+        extension = filename.rsplit('.', 1)[1].lower()
+        return extension in ALLOWED_EXTENSIONS or (videos and extension in VIDEO_EXTENSIONS)
     
-    # Helper function to generate a unique filename
-    def generate_unique_filename(filename):
-        ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
-        unique_name = f"{uuid.uuid4().hex}"
-        return f"{unique_name}.{ext}" if ext else unique_name
+    def record_upload(orig_filename, file_type, blob):
+        """Record the upload so the blob counts as referenced, then unpin it"""
+        try:
+            db.create("file_uploads", {
+                "file_name": orig_filename,
+                "file_path": blob["url"],
+                "file_type": file_type,
+                "file_size": blob["size"],
+                "content_hash": blob["content_hash"]
+            })
+        except Exception as e:
+            debug_log(f"Error recording upload {blob['url']}: {str(e)}")
+        finally:
+            blob_store.unpin(blob["content_hash"])
+    
+    def uploaded(orig_filename, file_type, blob, status=200):
+        return jsonify({
+            "ok": True,
+            "data": {
+                "url": blob["url"],
+                "original_filename": orig_filename,
+                "file_type": file_type,
+                "content_hash": blob["content_hash"],
+                "size": blob["size"]
+            }
+        }), status
+    
+    def direct_upload_request():
+        """(filename, content_hash, extension, data) of a direct/multipart upload request"""
+        data = request.get_json(silent=True) or {}
+        filename = secure_filename(data.get('filename', '') or '')
+        if not filename or not allowed_file(filename, videos=True):
+            raise UploadSessionError("File type not allowed")
+        content_hash = (data.get('content_hash') or '').lower()
+        if not is_content_hash(content_hash):
+            raise UploadSessionError("content_hash must be the file's hex SHA-256")
+        try:
+            size = int(data.get('size') or 0)
+        except (TypeError, ValueError):
+            raise UploadSessionError("size must be an integer")
+        if size > MAX_UPLOAD_BYTES:
+            raise UploadSessionError(f"Uploads are limited to {MAX_UPLOAD_BYTES} bytes", 413)
+        return filename, content_hash, normalise_extension(filename), data
+    
+    def requested_key():
+        """The blob key a multipart request names, as returned when it was started"""
+        key = request.args.get('key') or (request.get_json(silent=True) or {}).get('key')
+        if parse_blob_key(key) is None:
+            raise UploadSessionError("key must be the key returned when the upload was started")
+        return key
     
     @uploads_bp.route("", methods=["POST"])
     def upload_file():
@@ -57,40 +164,333 @@ def create_uploads_bp(db: DatabaseInterface) -> Blueprint:
             # Secure the filename to prevent any malicious paths
             orig_filename = secure_filename(file.filename)
             
-            # Generate a unique filename to prevent collisions
-            unique_filename = generate_unique_filename(orig_filename)
+            # Store under the content hash; identical content is only stored once
+            blob = blob_store.put(file.stream, orig_filename)
+            record_upload(orig_filename, file_type, blob)
             
-            # Define the upload directory
-            upload_dir = os.path.join(current_app.root_path, 'uploads', file_type)
+            # Return success response
+            return uploaded(orig_filename, file_type, blob)
             
-            # Create directory if it doesn't exist
-            if not os.path.exists(upload_dir):
-                os.makedirs(upload_dir)
+        except Exception as e:
+            debug_log(f"Error uploading file: {str(e)}")
+            return jsonify({
+                "ok": False,
+                "error": f"Error uploading file: {str(e)}"
+            }), 500
+    
+    @uploads_bp.route("/blobs/<content_hash>", methods=["GET"])
+    def get_blob(content_hash):
+        """
+        Check whether content is already stored
+        
+        Clients hash a file before uploading it; if the blob exists they can
+        pass its content_hash instead of the file and skip the upload.
+        """
+        blob = blob_store.find(content_hash, pin=False)
+        if blob is None:
+            return jsonify({"ok": False, "error": "Blob not found"}), 404
+        return jsonify({
+            "ok": True,
+            "data": {
+                "url": blob["url"],
+                "content_hash": blob["content_hash"],
+                "size": blob["size"]
+            }
+        })
+    
+    @uploads_bp.route("/sessions", methods=["POST"])
+    def create_upload_session():
+        """
+        Start a resumable upload
+        
+        Expects:
+        - Upload-Length header: total size in bytes
+        - JSON body or form: filename, plus optional metadata (e.g. type)
+        
+        Returns 201 with the session in Location; send the bytes with PATCH.
+        """
+        try:
+            data = request.get_json(silent=True) or request.form.to_dict()
+            filename = secure_filename(data.pop('filename', '') or '')
+            if not filename or not allowed_file(filename, videos=True):
+                return jsonify({"ok": False, "error": "File type not allowed"}), 400
             
-            # Define the complete path for saving
-            file_path = os.path.join(upload_dir, unique_filename)
+            length = header_int("Upload-Length")
+            if length is None:
+                length = int(data.pop('length', 0) or 0)
             
-            # Save the file
-            file.save(file_path)
+            # Abandoned sessions are cleaned up as new ones start
+            upload_sessions.expire()
+            session = upload_sessions.create(length, filename, data)
             
-            # Generate the URL
-            url = f"/uploads/{file_type}/{unique_filename}"
+            response = session_response(session, 201, {"ok": True, "data": session})
+            response.headers["Location"] = f"{request.base_url.rstrip('/')}/{session['id']}"
+            return response
             
-            # Return success response
-            return jsonify({
+        except UploadSessionError as e:
+            return jsonify({"ok": False, "error": str(e)}), e.status
+        except ValueError:
+            return jsonify({"ok": False, "error": "length must be an integer"}), 400
+        except Exception as e:
+            debug_log(f"Error creating upload session: {str(e)}")
+            return jsonify({"ok": False, "error": str(e)}), 500
+    
+    @uploads_bp.route("/sessions/<session_id>", methods=["HEAD", "GET"])
+    def get_upload_session(session_id):
+        """Acknowledged offset of a resumable upload; resume sending from there"""
+        session = upload_sessions.get(session_id)
+        if session is None:
+            return jsonify({"ok": False, "error": "Upload not found"}), 404
+        return session_response(session, 200, {"ok": True, "data": session})
+    
+    @uploads_bp.route("/sessions/<session_id>", methods=["PATCH"])
+    def append_upload_chunk(session_id):
+        """
+        Append a chunk to a resumable upload
+        
+        Expects:
+        - Upload-Offset header: the offset this chunk starts at
+        - Raw bytes as the request body (application/offset+octet-stream)
+        
+        Returns 204 with the new Upload-Offset, or 200 with the stored file
+        (url, content_hash) once the last byte has arrived.
+        """
+        try:
+            offset = header_int("Upload-Offset")
+            if offset is None:
+                return jsonify({"ok": False, "error": "Upload-Offset header is required"}), 400
+            
+            # request.stream reads the body as it arrives instead of buffering it
+            session = upload_sessions.append(session_id, offset, request.stream, request.content_length)
+            
+            if "blob" not in session:
+                return session_response(session)
+            
+            blob = session["blob"]
+            return session_response(session, 200, {
                 "ok": True,
                 "data": {
-                    "url": url,
-                    "original_filename": orig_filename,
-                    "file_type": file_type
+                    "url": blob["url"],
+                    "original_filename": session["filename"],
+                    "content_hash": blob["content_hash"],
+                    "size": blob["size"],
+                    "metadata": session["metadata"]
                 }
             })
             
+        except UploadSessionError as e:
+            return jsonify({"ok": False, "error": str(e)}), e.status
         except Exception as e:
-            debug_log(f"Error uploading file: {str(e)}")
+            debug_log(f"Error appending to upload {session_id}: {str(e)}")
+            return jsonify({"ok": False, "error": str(e)}), 500
+    
+    @uploads_bp.route("/sessions/<session_id>", methods=["DELETE"])
+    def delete_upload_session(session_id):
+        """Abandon a resumable upload"""
+        if not upload_sessions.terminate(session_id):
+            return jsonify({"ok": False, "error": "Upload not found"}), 404
+        return "", 204
+    
+    @uploads_bp.route("/direct", methods=["POST"])
+    def create_direct_upload():
+        """
+        Upload a file straight to storage
+        
+        Expects JSON: filename, content_hash (hex SHA-256), size, optional
+        content_type and type.
+        
+        Returns the stored file if the content is already stored; otherwise
+        upload (url, method, headers) to send the bytes to, then POST
+        /direct/complete with the same body. Backends that cannot sign uploads
+        answer 501: use /sessions instead.
+        """
+        try:
+            filename, content_hash, extension, data = direct_upload_request()
+            file_type = data.get('type', 'general')
+            
+            existing = blob_store.claim(content_hash, extension)
+            if existing is not None:
+                record_upload(filename, file_type, existing)
+                return uploaded(filename, file_type, existing)
+            
+            key = blob_key(content_hash, extension)
+            # The backend only accepts content with this hash, where it can check it
+            upload = blob_store.storage.presigned_put(
+                key, DIRECT_UPLOAD_EXPIRES, data.get('content_type'), checksum_sha256=content_hash)
+            if upload is None:
+                return jsonify({
+                    "ok": False,
+                    "error": "Storage does not accept direct uploads; use /api/uploads/sessions"
+                }), 501
+            return jsonify({"ok": True, "data": {"key": key, "upload": upload, "expires_in": DIRECT_UPLOAD_EXPIRES}}), 201
+            
+        except UploadSessionError as e:
+            return jsonify({"ok": False, "error": str(e)}), e.status
+        except Exception as e:
+            debug_log(f"Error creating direct upload: {str(e)}")
+            return jsonify({"ok": False, "error": str(e)}), 500
+    
+    @uploads_bp.route("/direct/complete", methods=["POST"])
+    def complete_direct_upload():
+        """Check a direct upload against its content_hash and record it"""
+        try:
+            filename, content_hash, extension, data = direct_upload_request()
+            file_type = data.get('type', 'general')
+            
+            blob = blob_store.verify(content_hash, extension)
+            if blob is None:
+                return jsonify({"ok": False, "error": "Nothing was uploaded"}), 404
+            record_upload(filename, file_type, blob)
+            return uploaded(filename, file_type, blob, 201)
+            
+        except BlobVerificationError as e:
+            return jsonify({"ok": False, "error": str(e)}), 422
+        except UploadSessionError as e:
+            return jsonify({"ok": False, "error": str(e)}), e.status
+        except Exception as e:
+            debug_log(f"Error completing direct upload: {str(e)}")
+            return jsonify({"ok": False, "error": str(e)}), 500
+    
+    @uploads_bp.route("/multipart", methods=["POST"])
+    def create_multipart_upload():
+        """
+        Start a multipart upload
+        
+        Expects JSON: filename, content_hash, size, optional content_type,
+        type and parts (the number of parts, for presigned part URLs).
+        
+        Returns upload_id and key; send each part with PUT
+        /multipart/<upload_id>/parts/<n>?key=<key> (or to part_urls[n - 1]
+        when the backend signs them), then POST /multipart/<upload_id>/complete.
+        """
+        try:
+            filename, content_hash, extension, data = direct_upload_request()
+            file_type = data.get('type', 'general')
+            
+            existing = blob_store.claim(content_hash, extension)
+            if existing is not None:
+                record_upload(filename, file_type, existing)
+                return uploaded(filename, file_type, existing)
+            
+            key = blob_key(content_hash, extension)
+            storage = blob_store.storage
+            upload_id = storage.create_multipart(key, data.get('content_type'))
+            
+            part_urls = None
+            parts = int(data.get('parts') or 0)
+            if 0 < parts <= 10000:
+                part_urls = [storage.presigned_part(key, upload_id, number, DIRECT_UPLOAD_EXPIRES)
+                             for number in range(1, parts + 1)]
+                if None in part_urls:
+                    part_urls = None
+            return jsonify({"ok": True, "data": {"upload_id": upload_id, "key": key, "part_urls": part_urls}}), 201
+            
+        except NotImplementedError as e:
+            return jsonify({"ok": False, "error": f"{str(e)}; use /api/uploads/sessions"}), 501
+        except UploadSessionError as e:
+            return jsonify({"ok": False, "error": str(e)}), e.status
+        except (StorageError, ValueError) as e:
+            return jsonify({"ok": False, "error": str(e)}), 400
+        except Exception as e:
+            debug_log(f"Error creating multipart upload: {str(e)}")
+            return jsonify({"ok": False, "error": str(e)}), 500
+    
+    @uploads_bp.route("/multipart/<upload_id>/parts/<int:part_number>", methods=["PUT"])
+    def upload_multipart_part(upload_id, part_number):
+        """Store one part (raw bytes as the body); returns its etag for /complete"""
+        try:
+            # request.stream reads the body as it arrives instead of buffering it
+            part = blob_store.storage.upload_part(
+                requested_key(), upload_id, part_number, request.stream, request.content_length)
+            return jsonify({"ok": True, "data": part})
+            
+        except UploadSessionError as e:
+            return jsonify({"ok": False, "error": str(e)}), e.status
+        except StorageError as e:
+            return jsonify({"ok": False, "error": str(e)}), 400
+        except Exception as e:
+            debug_log(f"Error uploading part {part_number} of {upload_id}: {str(e)}")
+            return jsonify({"ok": False, "error": str(e)}), 500
+    
+    @uploads_bp.route("/multipart/<upload_id>/complete", methods=["POST"])
+    def complete_multipart_upload(upload_id):
+        """
+        Join the parts and record the file
+        
+        Expects JSON: key, filename, parts ([{part_number, etag}]) and optional
+        type. The joined file is re-hashed; content that does not match its
+        hash is discarded with 422.
+        """
+        try:
+            key = requested_key()
+            data = request.get_json(silent=True) or {}
+            filename = secure_filename(data.get('filename', '') or '') or key.rsplit("/", 1)[-1]
+            file_type = data.get('type', 'general')
+            parts = data.get('parts') or []
+            if not parts:
+                return jsonify({"ok": False, "error": "parts is required"}), 400
+            
+            blob_store.storage.complete_multipart(key, upload_id, parts)
+            content_hash, extension = parse_blob_key(key)
+            blob = blob_store.verify(content_hash, extension)
+            if blob is None:
+                return jsonify({"ok": False, "error": "Upload not found"}), 404
+            record_upload(filename, file_type, blob)
+            return uploaded(filename, file_type, blob, 201)
+            
+        except BlobVerificationError as e:
+            return jsonify({"ok": False, "error": str(e)}), 422
+        except UploadSessionError as e:
+            return jsonify({"ok": False, "error": str(e)}), e.status
+        except (StorageError, KeyError, ValueError) as e:
+            return jsonify({"ok": False, "error": str(e)}), 400
+        except Exception as e:
+            debug_log(f"Error completing multipart upload {upload_id}: {str(e)}")
+            return jsonify({"ok": False, "error": str(e)}), 500
+    
+    @uploads_bp.route("/multipart/<upload_id>", methods=["DELETE"])
+    def abort_multipart_upload(upload_id):
+        """Abandon a multipart upload and its parts"""
+        try:
+            blob_store.storage.abort_multipart(requested_key(), upload_id)
+            return "", 204
+        except UploadSessionError as e:
+            return jsonify({"ok": False, "error": str(e)}), e.status
+        except StorageError as e:
+            return jsonify({"ok": False, "error": str(e)}), 404
+        except Exception as e:
+            debug_log(f"Error aborting multipart upload {upload_id}: {str(e)}")
+            return jsonify({"ok": False, "error": str(e)}), 500
+    
+    @uploads_bp.route("/gc", methods=["POST"])
+    @token_required
+    def collect_orphaned_uploads(current_user):
+        """
+        Start collecting files no row refers to (admins only)
+        
+        Query: dry_run=true to only report, resume=false to start over
+        instead of continuing an interrupted run.
+        
+        Returns 202 with the job; its result reports quarantined, deleted
+        and reclaimed_bytes.
+        """
+        if str(current_user.get('role', '')).upper() != 'ADMIN':
+            return jsonify({"ok": False, "error": "Unauthorized"}), 403
+        try:
+            job = job_runner.submit("collect_orphaned_uploads", {
+                "dry_run": query_flag('dry_run', 'false'),
+                "resume": query_flag('resume', 'true')
+            })
             return jsonify({
-                "ok": False,
-                "error": f"Error uploading file: {str(e)}"
-            }), 500
+                "ok": True,
+                "data": {
+                    "job_id": job["id"],
+                    "status": job["status"],
+                    "status_url": f"/api/jobs/{job['id']}"
+                }
+            }), 202
+        except Exception as e:
+            debug_log(f"Error starting upload collection: {str(e)}")
+            return jsonify({"ok": False, "error": str(e)}), 500
     
-    return uploads_bp
\ No newline at end of file
+    return uploads_bp
@@ -0,0 +1,363 @@
+"""
+blob_store.py
+
+Content-addressed storage for uploaded files.
+
+Uploads are streamed to a temporary file while their SHA-256 is computed, then
+stored under blobs/<first two hex digits>/<sha256>.<ext> in the "uploads"
+storage backend (local disk or S3; see server.storage). A file whose content
+is already stored is discarded after hashing, so the same litter photo
+attached to five puppies is kept once and every row points at the same URL.
+The URL never changes for a given content, which also makes it safe to cache
+forever.
+
+Temporary files (and resumable upload sessions) always live on local disk
+under root, whatever the backend.
+
+Rows that use a blob carry its hash in a content_hash column. The reference
+count of a blob is the number of such rows in REFERENCE_TABLES: after a row is
+deleted, release() removes the file (and its photo renditions) once nothing
+references it any more.
+
+Between handing out a blob (put, adopt, claim, find, verify) and writing the
+row that uses it, the blob is referenced by nothing, so it is pinned: release()
+and the upload collector leave pinned blobs alone until the caller calls
+unpin() or PIN_TTL has passed. Pins are kept in memory for this process and
+recorded in the blob_pins table for the other workers.
+"""
+
+import contextlib
+import datetime
+import gzip
+import hashlib
+import os
+import tempfile
+import threading
+import time
+import weakref
+from typing import Any, BinaryIO, Callable, Dict, Iterable, Optional, Tuple
+
+from server.database.db_interface import DatabaseInterface
+from server.config import debug_log
+from server.storage import LocalStorage, StorageBackend, UPLOADS_ROOT, get_storage
+from .dates import to_datetime
+from .image_derivatives import DERIVATIVES_DIR
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+DEFAULT_ROOT = UPLOADS_ROOT
+
+BLOBS_DIR = "blobs"
+INCOMING_DIR = ".incoming"
+CHUNK_SIZE = 1024 * 1024
+
+# Tables whose rows reference blobs through content_hash
+REFERENCE_TABLES = ("photos", "documents", "file_uploads")
+
+# Pins of blobs whose rows are being written, visible to every worker
+PINS_TABLE = "blob_pins"
+# How long a blob stays pinned if its row is never written
+PIN_TTL = datetime.timedelta(minutes=float(os.getenv("BLOB_PIN_MINUTES", 30)))
+
+# Text-like formats get .gz (and .br, with brotli installed) siblings for serving
+COMPRESSED_VARIANTS = {"txt", "csv", "svg", "json", "xml", "html"}
+
+# Spellings of the same format share one blob
+_EXTENSION_ALIASES = {"jpeg": "jpg", "tiff": "tif"}
+
+
+class BlobVerificationError(Exception):
+    """Raised when a directly uploaded blob does not hash to its name"""
+    pass
+
+
+def is_content_hash(digest: Optional[str]) -> bool:
+    return len(digest or "") == 64 and all(c in "0123456789abcdef" for c in digest)
+
+
+def normalise_extension(filename: str) -> str:
+    ext = filename.rsplit(".", 1)[1].lower() if "." in filename else ""
+    return _EXTENSION_ALIASES.get(ext, ext)
+
+
+def blob_key(digest: str, extension: str) -> str:
+    """Path of a blob relative to the uploads root"""
+    name = f"{digest}.{extension}" if extension else digest
+    return f"{BLOBS_DIR}/{digest[:2]}/{name}"
+
+
+def parse_blob_key(key: Optional[str]) -> Optional[Tuple[str, str]]:
+    """(digest, extension) of a blob key, or None if key is not one"""
+    parts = (key or "").split("/")
+    if len(parts) != 3 or parts[0] != BLOBS_DIR:
+        return None
+    digest, _, extension = parts[2].partition(".")
+    if not is_content_hash(digest) or parts[1] != digest[:2] or blob_key(digest, extension) != key:
+        return None
+    return digest, extension
+
+
+def blob_url(digest: str, extension: str) -> str:
+    return f"/uploads/{blob_key(digest, extension)}"
+
+
+def hash_stream(stream: BinaryIO, sink: Optional[BinaryIO] = None,
+                chunk_size: int = CHUNK_SIZE) -> Tuple[str, int]:
+    """SHA-256 and size of a stream, copying it to sink on the way"""
+    digest = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        digest.update(chunk)
+        size += len(chunk)
+        if sink is not None:
+            sink.write(chunk)
+    return digest.hexdigest(), size
+
+
+def write_compressed_variants(path: str) -> None:
+    """Write the .gz/.br siblings of a text-like file"""
+    with open(path, "rb") as source, gzip.open(path + ".gz.tmp", "wb", compresslevel=9) as target:
+        for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+            target.write(chunk)
+    os.replace(path + ".gz.tmp", path + ".gz")
+    if brotli is not None:
+        compressor = brotli.Compressor(quality=11)
+        with open(path, "rb") as source, open(path + ".br.tmp", "wb") as target:
+            for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+                target.write(compressor.process(chunk))
+            target.write(compressor.finish())
+        os.replace(path + ".br.tmp", path + ".br")
+
+
+class BlobStore:
+    """Stores each distinct upload once, under its SHA-256"""
+
+    def __init__(self, db: Optional[DatabaseInterface], root: str = DEFAULT_ROOT,
+                 reference_tables: Iterable[str] = REFERENCE_TABLES,
+                 storage: Optional[StorageBackend] = None):
+        self.db = db
+        self.root = root
+        self.storage = storage if storage is not None else LocalStorage(root)
+        self.reference_tables = tuple(reference_tables)
+        # Serialises "is it still referenced?" against new puts of the same content
+        self._lock = threading.Lock()
+        # digest -> [pending rows, last pinned (monotonic), blob_pins row ids]
+        self._pins: Dict[str, list] = {}
+
+    def describe(self, digest: str, extension: str, deduplicated: bool = True) -> Optional[Dict[str, Any]]:
+        """The stored blob for a hash, or None if it is not stored"""
+        key = blob_key(digest, extension)
+        stored = self.storage.stat(key)
+        if stored is None:
+            return None
+        return {
+            "content_hash": digest,
+            "extension": extension,
+            "size": stored["size"],
+            "key": key,
+            "path": self.storage.local_path(key),
+            "url": self.storage.url(key),
+            "deduplicated": deduplicated,
+        }
+
+    def find(self, digest: str, pin: bool = True) -> Optional[Dict[str, Any]]:
+        """The stored blob for a hash, whatever its extension (pinned unless pin is False)"""
+        digest = (digest or "").lower()
+        if not is_content_hash(digest):
+            return None
+        for stored in self.storage.list(f"{BLOBS_DIR}/{digest[:2]}/{digest}", limit=10):
+            name = stored["key"].rsplit("/", 1)[-1]
+            if name.endswith((".gz", ".br", ".tmp")):
+                continue  # compressed siblings
+            extension = name[len(digest) + 1:] if "." in name else ""
+            return self.claim(digest, extension) if pin else self.describe(digest, extension)
+        return None
+
+    def claim(self, digest: str, extension: str) -> Optional[Dict[str, Any]]:
+        """Describe a stored blob and pin it for a row about to be written; None if not stored"""
+        with self._lock:
+            blob = self.describe(digest, extension)
+            if blob is not None:
+                self._pin(digest)
+        return blob
+
+    def verify(self, digest: str, extension: str) -> Optional[Dict[str, Any]]:
+        """
+        Describe a blob a client uploaded straight to its key (presigned or
+        multipart), after re-hashing it; None if nothing was uploaded.
+
+        Content that does not match its hash is deleted and raises
+        BlobVerificationError, so a key always holds the content it names.
+        """
+        key = blob_key(digest, extension)
+        try:
+            with contextlib.closing(self.storage.open(key)) as stream:
+                actual, _size = hash_stream(stream)
+        except FileNotFoundError:
+            return None
+        if actual != digest:
+            self.storage.delete(key)
+            raise BlobVerificationError("Uploaded content does not match its content_hash")
+        local_path = self.storage.local_path(key)
+        if extension in COMPRESSED_VARIANTS and local_path:
+            try:
+                write_compressed_variants(local_path)
+            except OSError as e:
+                debug_log(f"BlobStore: could not precompress {key}: {str(e)}")
+        with self._lock:
+            self._pin(digest)
+            return self.describe(digest, extension, deduplicated=False)
+
+    def put(self, stream: BinaryIO, filename: str,
+            replacement: Optional[Callable[[str], Optional[str]]] = None) -> Dict[str, Any]:
+        """
+        Store a stream and describe the blob.
+
+        deduplicated is True when identical content was already stored and
+        nothing new was written. replacement(digest) may name the hash of a
+        blob stored in place of this content (e.g. the normalised version of a
+        photo); if that blob exists it is described instead and nothing is
+        stored. source_hash is always the hash of the stream itself.
+        """
+        extension = normalise_extension(filename)
+        incoming = os.path.join(self.root, INCOMING_DIR)
+        os.makedirs(incoming, exist_ok=True)
+
+        with tempfile.NamedTemporaryFile(dir=incoming, delete=False) as tmp:
+            try:
+                digest, size = hash_stream(stream, tmp)
+            except Exception:
+                tmp.close()
+                os.unlink(tmp.name)
+                raise
+
+        replaced = replacement(digest) if replacement is not None else None
+        blob = self.find(replaced) if replaced and replaced != digest else None
+        if blob is not None:
+            os.unlink(tmp.name)
+        else:
+            blob = self.adopt(tmp.name, digest, extension)
+        return dict(blob, source_hash=digest)
+
+    def adopt(self, temp_path: str, digest: str, extension: str) -> Dict[str, Any]:
+        """Move an already hashed file into storage, or drop it if the content is stored"""
+        key = blob_key(digest, extension)
+        with self._lock:
+            self._pin(digest)
+            if self.storage.exists(key):
+                os.unlink(temp_path)
+                return self.describe(digest, extension, deduplicated=True)
+            if extension in COMPRESSED_VARIANTS:
+                try:
+                    write_compressed_variants(temp_path)
+                except OSError as e:
+                    debug_log(f"BlobStore: could not precompress {key}: {str(e)}")
+            # Siblings first, so the blob never exists without them
+            for suffix in (".gz", ".br"):
+                if os.path.exists(temp_path + suffix):
+                    self.storage.put_file(key + suffix, temp_path + suffix, move=True)
+            self.storage.put_file(key, temp_path, move=True)
+        return self.describe(digest, extension, deduplicated=False)
+
+    def _pin(self, digest: str) -> None:
+        """Keep a blob from being released until unpin(); called with the lock held"""
+        now = time.monotonic()
+        for pinned, (_count, since, _rows) in list(self._pins.items()):
+            if now - since >= PIN_TTL.total_seconds():
+                del self._pins[pinned]  # their blob_pins rows are purged by the upload collector
+        pin = self._pins.setdefault(digest, [0, now, []])
+        pin[0] += 1
+        pin[1] = now
+        if self.db is None:
+            return
+        try:
+            row = self.db.create(PINS_TABLE, {"content_hash": digest,
+                                              "pinned_at": datetime.datetime.utcnow().isoformat()})
+            pin[2].append(row.get("id"))
+        except Exception as e:
+            debug_log(f"BlobStore: could not record pin of {digest}: {str(e)}")
+
+    def unpin(self, digest: Optional[str]) -> None:
+        """The row using a blob handed out by this store was written (or will not be)"""
+        with self._lock:
+            pin = self._pins.get(digest or "")
+            if pin is None:
+                return
+            pin[0] -= 1
+            if pin[0] > 0:
+                return
+            del self._pins[digest]
+        for row_id in pin[2]:
+            try:
+                self.db.delete(PINS_TABLE, row_id)
+            except Exception as e:
+                debug_log(f"BlobStore: could not remove pin of {digest}: {str(e)}")
+
+    def pinned(self, digest: str) -> bool:
+        """Whether a row using the blob is being written, here or by another worker"""
+        pin = self._pins.get(digest)
+        if pin is not None and time.monotonic() - pin[1] < PIN_TTL.total_seconds():
+            return True
+        if self.db is None:
+            return False
+        try:
+            rows = self.db.find_by_field_values(PINS_TABLE, {"content_hash": digest}) or []
+        except Exception as e:
+            debug_log(f"BlobStore: could not read {PINS_TABLE}: {str(e)}")
+            return False
+        cutoff = datetime.datetime.utcnow() - PIN_TTL
+        return any((to_datetime(row.get("pinned_at")) or datetime.datetime.min) > cutoff for row in rows)
+
+    def in_use(self, digest: str) -> bool:
+        """Referenced by a row or pinned; call with the lock held"""
+        return self.pinned(digest) or self.references(digest) > 0
+
+    def references(self, digest: str) -> int:
+        """Rows referencing a blob; tables that cannot be queried count as referencing it"""
+        count = 0
+        for table in self.reference_tables:
+            try:
+                count += len(self.db.find_by_field_values(table, {"content_hash": digest}) or [])
+            except Exception as e:
+                debug_log(f"BlobStore: could not count references in {table}: {str(e)}")
+                return count + 1
+        return count
+
+    def release(self, digest: Optional[str], extension: str) -> bool:
+        """Delete a blob and its renditions once no row references it; True if deleted"""
+        if not digest:
+            return False
+        with self._lock:
+            if self.in_use(digest):
+                return False
+            removed = False
+            key = blob_key(digest, extension)
+            renditions = [stored["key"] for stored in self.storage.list(f"{DERIVATIVES_DIR}/{digest}_", limit=100)]
+            for stored_key in [key, key + ".gz", key + ".br"] + renditions:
+                try:
+                    removed = self.storage.delete(stored_key) or removed
+                except Exception as e:
+                    debug_log(f"BlobStore: could not delete {stored_key}: {str(e)}")
+        if removed:
+            debug_log(f"BlobStore: released blob {digest}")
+        return removed
+
+
+_stores: "weakref.WeakKeyDictionary[Any, BlobStore]" = weakref.WeakKeyDictionary()
+_stores_lock = threading.Lock()
+
+
+def get_blob_store(db: DatabaseInterface) -> BlobStore:
+    """Return the blob store shared by every blueprint using this database"""
+    with _stores_lock:
+        store = _stores.get(db)
+        if store is None:
+            store = BlobStore(db, storage=get_storage("uploads"))
+            _stores[db] = store
+        return store
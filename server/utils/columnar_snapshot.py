@@ -0,0 +1,368 @@
+"""
+columnar_snapshot.py
+
+Compact columnar snapshots of database tables for analytics.
+
+A snapshot stores every column of a table in its own binary file:
+
+- numeric and boolean columns as float64 (NaN for null)
+- date/datetime columns as int32 day numbers since 1970-01-01 (NULL_DATE for null)
+- everything else dictionary-encoded: int32 codes (-1 for null) plus the list
+  of distinct values in the manifest
+
+Files are memory-mapped on read and exposed as typed memoryviews, so reports
+scan plain arrays without building row dicts or touching the live database.
+Each refresh reads every table page by page (db.scan, so nothing is lost to
+the provider's row cap), writes a new generation directory and then
+atomically swaps the manifest, so readers never see a half-written snapshot.
+
+Readers do not wait for a refresh: when the snapshot is stale, table() hands
+the refresh to schedule_refresh (the health blueprint submits it to the job
+runner) and keeps serving the current generation until the new one is
+swapped in. Only a store without a scheduler refreshes inline.
+"""
+
+import datetime
+import json
+import math
+import mmap
+import os
+import shutil
+import threading
+import time
+import weakref
+from array import array
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from server.database.db_interface import DatabaseInterface
+from server.config import debug_log
+from .dates import to_datetime
+
+TYPE_FLOAT = "float64"
+TYPE_DATE = "date"
+TYPE_STRING = "string"
+
+NULL_DATE = -(2 ** 31)
+NULL_CODE = -1
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+_TYPECODES = {TYPE_FLOAT: "d", TYPE_DATE: "i", TYPE_STRING: "i"}
+
+DEFAULT_DIRECTORY = os.getenv(
+    "ANALYTICS_SNAPSHOT_DIR",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "analytics_snapshots")
+)
+DEFAULT_MAX_AGE = int(os.getenv("ANALYTICS_SNAPSHOT_MAX_AGE", 6 * 60 * 60))
+
+HEALTH_TABLES = ["vaccinations", "weight_records", "medication_records", "health_conditions"]
+
+# A scheduled refresh that has not finished after this long is requested again
+REFRESH_RETRY_AFTER = 60 * 60
+
+
+class SnapshotNotReady(Exception):
+    """Raised by reads before the first snapshot has been written by a scheduled refresh"""
+
+
+def date_to_day(value: Any) -> int:
+    """Convert a stored date value to days since the epoch (NULL_DATE if empty)"""
+    parsed = to_datetime(value)
+    if parsed is None:
+        return NULL_DATE
+    return (parsed - _EPOCH).days
+
+
+def day_to_date(day: int) -> Optional[datetime.date]:
+    """Inverse of date_to_day"""
+    if day == NULL_DATE:
+        return None
+    return (_EPOCH + datetime.timedelta(days=day)).date()
+
+
+def _infer_type(values: Iterable[Any]) -> str:
+    column_type = None
+    for value in values:
+        if value is None or value == "":
+            continue
+        if isinstance(value, (bool, int, float)):
+            value_type = TYPE_FLOAT
+        elif isinstance(value, (datetime.date, datetime.datetime)):
+            value_type = TYPE_DATE
+        elif isinstance(value, str) and len(value) >= 10 and value[4] == "-" and to_datetime(value) is not None:
+            value_type = TYPE_DATE
+        else:
+            return TYPE_STRING
+        if column_type is None:
+            column_type = value_type
+        elif column_type != value_type:
+            return TYPE_STRING
+    return column_type or TYPE_STRING
+
+
+def _encode(column_type: str, values: List[Any]):
+    """Encode a column into (array, dictionary)"""
+    if column_type == TYPE_FLOAT:
+        return array("d", (math.nan if v is None or v == "" else float(v) for v in values)), None
+
+    if column_type == TYPE_DATE:
+        return array("i", (date_to_day(v) for v in values)), None
+
+    dictionary: List[Any] = []
+    codes_by_value: Dict[Any, int] = {}
+    codes = array("i")
+    for value in values:
+        if value is None:
+            codes.append(NULL_CODE)
+            continue
+        if isinstance(value, (dict, list)):
+            value = json.dumps(value, sort_keys=True)
+        else:
+            value = str(value)
+        code = codes_by_value.get(value)
+        if code is None:
+            code = codes_by_value[value] = len(dictionary)
+            dictionary.append(value)
+        codes.append(code)
+    return codes, dictionary
+
+
+class SnapshotColumn:
+    """One memory-mapped column of a snapshot table"""
+
+    def __init__(self, name: str, column_type: str, path: str, rows: int,
+                 dictionary: Optional[List[str]] = None):
+        self.name = name
+        self.type = column_type
+        self.path = path
+        self.rows = rows
+        self.dictionary = dictionary
+        self._values: Optional[memoryview] = None
+
+    @property
+    def values(self) -> memoryview:
+        """Raw column values (float64, int32 day numbers or int32 dictionary codes)"""
+        if self._values is None:
+            typecode = _TYPECODES[self.type]
+            if self.rows == 0:
+                self._values = memoryview(array(typecode))
+            else:
+                with open(self.path, "rb") as handle:
+                    mapped = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+                self._values = memoryview(mapped).cast(typecode)
+        return self._values
+
+    def decode(self, index: int) -> Any:
+        """Return the value at a row index as a Python value"""
+        value = self.values[index]
+        if self.type == TYPE_FLOAT:
+            return None if math.isnan(value) else value
+        if self.type == TYPE_DATE:
+            return day_to_date(value)
+        return None if value == NULL_CODE else self.dictionary[value]
+
+    def code_of(self, value: Any) -> int:
+        """Dictionary code of a string value (NULL_CODE if absent)"""
+        if self.type != TYPE_STRING:
+            raise TypeError(f"Column {self.name} is not dictionary-encoded")
+        try:
+            return self.dictionary.index(str(value))
+        except ValueError:
+            return NULL_CODE
+
+
+class SnapshotTable:
+    """A table in a snapshot: row count plus lazily mapped columns"""
+
+    def __init__(self, name: str, directory: str, meta: Dict[str, Any]):
+        self.name = name
+        self.rows = meta["rows"]
+        self.columns = {
+            column: SnapshotColumn(
+                column, info["type"], os.path.join(directory, f"{column}.bin"),
+                self.rows, info.get("dictionary")
+            )
+            for column, info in meta["columns"].items()
+        }
+
+    def __contains__(self, column: str) -> bool:
+        return column in self.columns
+
+    def column(self, name: str) -> Optional[SnapshotColumn]:
+        return self.columns.get(name)
+
+
+class ColumnarSnapshotStore:
+    """Writes and reads columnar snapshots of a set of tables"""
+
+    def __init__(self, db: DatabaseInterface, directory: str = DEFAULT_DIRECTORY,
+                 tables: Optional[List[str]] = None, max_age: int = DEFAULT_MAX_AGE):
+        self.db = db
+        self.directory = directory
+        self.tables = list(tables or HEALTH_TABLES)
+        self.max_age = max_age
+        # Called (without arguments) to run refresh() in the background
+        self.schedule_refresh: Optional[Callable[[], Any]] = None
+        self._lock = threading.RLock()
+        # Serialises refreshes; readers only take _lock for the swap
+        self._refresh_lock = threading.Lock()
+        self._refresh_requested: Optional[float] = None
+        self._manifest: Optional[Dict[str, Any]] = None
+        self._open_tables: Dict[str, SnapshotTable] = {}
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.directory, "manifest.json")
+
+    # ----- Writing -----
+
+    def refresh(self) -> Dict[str, Any]:
+        """Export every table into a new snapshot generation and swap it in"""
+        with self._refresh_lock:
+            try:
+                return self._refresh()
+            finally:
+                with self._lock:
+                    self._refresh_requested = None
+
+    def _refresh(self) -> Dict[str, Any]:
+        stamp = int(time.time() * 1000)
+        # Refreshes within the same millisecond still get their own directory
+        while os.path.exists(os.path.join(self.directory, f"gen-{stamp}")):
+            stamp += 1
+        generation = f"gen-{stamp}"
+        generation_dir = os.path.join(self.directory, generation)
+        os.makedirs(generation_dir, exist_ok=True)
+
+        manifest = {
+            "generation": generation,
+            "created_at": datetime.datetime.utcnow().isoformat(),
+            "tables": {},
+        }
+        for table in self.tables:
+            try:
+                records = list(self.db.scan(table))
+            except Exception as e:
+                debug_log(f"Columnar snapshot: could not export {table}: {str(e)}")
+                continue
+            manifest["tables"][table] = self._write_table(
+                os.path.join(generation_dir, table), records
+            )
+
+        with self._lock:
+            previous = self.manifest()
+            tmp_path = self.manifest_path + ".tmp"
+            with open(tmp_path, "w") as handle:
+                json.dump(manifest, handle)
+            os.replace(tmp_path, self.manifest_path)
+
+            self._manifest = manifest
+            self._open_tables = {}
+        if previous and previous.get("generation") != generation:
+            # Tables mapped from it stay readable: unlinked files live on while mapped
+            shutil.rmtree(os.path.join(self.directory, previous["generation"]), ignore_errors=True)
+
+        debug_log(f"Columnar snapshot: wrote {generation} "
+                  f"({sum(t['rows'] for t in manifest['tables'].values())} rows)")
+        return manifest
+
+    def _write_table(self, directory: str, records: List[Dict[str, Any]]) -> Dict[str, Any]:
+        os.makedirs(directory, exist_ok=True)
+
+        names: List[str] = []
+        for record in records:
+            for name in record:
+                if name not in names:
+                    names.append(name)
+
+        columns = {}
+        for name in names:
+            values = [record.get(name) for record in records]
+            column_type = _infer_type(values)
+            encoded, dictionary = _encode(column_type, values)
+            with open(os.path.join(directory, f"{name}.bin"), "wb") as handle:
+                encoded.tofile(handle)
+            columns[name] = {"type": column_type}
+            if dictionary is not None:
+                columns[name]["dictionary"] = dictionary
+
+        return {"rows": len(records), "columns": columns}
+
+    # ----- Reading -----
+
+    def manifest(self) -> Optional[Dict[str, Any]]:
+        """The manifest of the current snapshot, or None if none was written yet"""
+        with self._lock:
+            if self._manifest is None and os.path.exists(self.manifest_path):
+                with open(self.manifest_path) as handle:
+                    self._manifest = json.load(handle)
+            return self._manifest
+
+    def age(self) -> Optional[float]:
+        """Seconds since the current snapshot was written"""
+        manifest = self.manifest()
+        if manifest is None:
+            return None
+        created_at = datetime.datetime.fromisoformat(manifest["created_at"])
+        return (datetime.datetime.utcnow() - created_at).total_seconds()
+
+    def stale(self) -> bool:
+        age = self.age()
+        return age is None or age > self.max_age
+
+    def refresh_if_stale(self) -> Optional[Dict[str, Any]]:
+        """
+        Refresh when there is no snapshot or it is older than max_age.
+
+        With schedule_refresh set, the refresh is scheduled (once until it
+        finishes) and the current manifest, None before the first snapshot,
+        is returned straight away.
+        """
+        # refresh() takes _refresh_lock before _lock, so it is not called with _lock held
+        if self.schedule_refresh is None:
+            return self.refresh() if self.stale() else self.manifest()
+        with self._lock:
+            if not self.stale():
+                return self._manifest
+            now = time.monotonic()
+            if self._refresh_requested is None or now - self._refresh_requested > REFRESH_RETRY_AFTER:
+                self._refresh_requested = now
+                try:
+                    self.schedule_refresh()
+                except Exception as e:
+                    self._refresh_requested = None
+                    debug_log(f"Columnar snapshot: could not schedule a refresh: {str(e)}")
+            return self._manifest
+
+    def table(self, name: str) -> Optional[SnapshotTable]:
+        """Open a table of the current snapshot (a stale snapshot is refreshed, or scheduled for refresh)"""
+        manifest = self.refresh_if_stale()
+        if manifest is None:
+            raise SnapshotNotReady("The analytics snapshot is being built")
+        with self._lock:
+            # A refresh may have swapped generations meanwhile
+            manifest = self._manifest or manifest
+            if name not in manifest["tables"]:
+                return None
+            table = self._open_tables.get(name)
+            if table is None:
+                table = SnapshotTable(
+                    name,
+                    os.path.join(self.directory, manifest["generation"], name),
+                    manifest["tables"][name]
+                )
+                self._open_tables[name] = table
+            return table
+
+
+_stores: "weakref.WeakKeyDictionary[Any, ColumnarSnapshotStore]" = weakref.WeakKeyDictionary()
+_stores_lock = threading.Lock()
+
+
+def get_snapshot_store(db: DatabaseInterface) -> ColumnarSnapshotStore:
+    """Return the health snapshot store shared by every blueprint using this database"""
+    with _stores_lock:
+        store = _stores.get(db)
+        if store is None:
+            store = ColumnarSnapshotStore(db)
+            _stores[db] = store
+        return store
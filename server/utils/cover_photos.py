@@ -0,0 +1,183 @@
+"""
+cover_photos.py
+
+Cover photo changes as one set-based operation per entity, plus a cache of
+every entity's current cover.
+
+Setting a cover used to clear is_cover photo by photo and then update the
+parent row. set_cover() instead calls the set_cover_photo database function,
+which flips is_cover for the entity's photos and writes the parent's
+cover_photo in one transaction. Where the function is not available it falls
+back to three set-based statements, however many photos the entity has.
+
+The cache maps (entity type, entity id) to the cover photo. It is loaded with
+one paged query and kept current by set_cover()/clear_cover(), so listing
+pages can show covers for many entities without touching the photos table.
+
+The cache lives in each process: with several workers, a cover set through
+another worker is not seen here until the next load. Listings may show a stale
+cover for that long, but decisions that would overwrite a cover do not trust a
+miss: has_cover() confirms it against the database first.
+"""
+
+import threading
+import weakref
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from server.database.db_interface import DatabaseInterface
+from server.config import debug_log
+
+# Entities whose rows carry a denormalised cover_photo column
+ENTITY_TABLES = {
+    "dog": "dogs",
+    "litter": "litters",
+    "puppy": "puppies",
+}
+
+COVER_FUNCTION = "set_cover_photo"
+
+# Fields of a photo kept in the cache
+_CACHED_FIELDS = ("id", "url", "derivatives", "related_type", "related_id")
+
+
+def _key(entity_type: Any, entity_id: Any) -> Tuple[str, str]:
+    return str(entity_type), str(entity_id)
+
+
+class CoverPhotos:
+    """Set-based cover photo updates and a cache of the current covers"""
+
+    def __init__(self, db: DatabaseInterface):
+        self.db = db
+        self._covers: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._lock = threading.RLock()
+        self.loaded = False
+        # Set once the database function turns out to be missing
+        self._use_function = True
+
+    def load(self) -> None:
+        # find_in reads in pages, past the provider's row cap
+        covers = self.db.find_in("photos", "is_cover", [True]) or []
+        with self._lock:
+            self._covers = {}
+            for photo in covers:
+                self._cache(photo)
+            self.loaded = True
+        debug_log(f"CoverPhotos: cached {len(self._covers)} covers")
+
+    def _ensure_loaded(self) -> None:
+        if not self.loaded:
+            try:
+                self.load()
+            except Exception as e:
+                debug_log(f"CoverPhotos: could not load covers: {str(e)}")
+
+    def _cache(self, photo: Dict[str, Any]) -> None:
+        self._covers[_key(photo.get("related_type"), photo.get("related_id"))] = {
+            field: photo.get(field) for field in _CACHED_FIELDS
+        }
+
+    # ----- Writes -----
+
+    def set_cover(self, photo: Dict[str, Any]) -> None:
+        """Make photo the only cover of its entity and update the entity's cover_photo"""
+        entity_type, entity_id = photo["related_type"], photo["related_id"]
+        self._apply(entity_type, entity_id, photo)
+        with self._lock:
+            self._cache(dict(photo, is_cover=True))
+
+    def clear_cover(self, entity_type: str, entity_id: Any) -> None:
+        """Leave the entity without a cover"""
+        self._apply(entity_type, entity_id, None)
+        with self._lock:
+            self._covers.pop(_key(entity_type, entity_id), None)
+
+    def _apply(self, entity_type: str, entity_id: Any, photo: Optional[Dict[str, Any]]) -> None:
+        table = ENTITY_TABLES.get(entity_type)
+        if self._use_function:
+            try:
+                self.db.call_function(COVER_FUNCTION, {
+                    "p_related_type": entity_type,
+                    "p_related_id": entity_id,
+                    "p_photo_id": photo["id"] if photo else None,
+                }, writes=("photos",) + ((table,) if table else ()))
+                return
+            except NotImplementedError:
+                self._use_function = False
+            except Exception as e:
+                debug_log(f"CoverPhotos: {COVER_FUNCTION} failed, using set-based updates: {str(e)}")
+
+        self.db.update_where("photos", {
+            "related_type": entity_type, "related_id": entity_id, "is_cover": True
+        }, {"is_cover": False})
+        if photo:
+            self.db.update("photos", photo["id"], {"is_cover": True})
+        if table:
+            self.db.update_where(table, {"id": entity_id}, {"cover_photo": photo["url"] if photo else None})
+
+    def record_changes(self, photo_id: Any, changes: Dict[str, Any]) -> None:
+        """
+        Keep a cached cover current when its row is updated after upload
+        (renditions rendered, or the photo moved to a normalised blob).
+        """
+        self._ensure_loaded()
+        with self._lock:
+            cover = next((c for c in self._covers.values() if str(c.get("id")) == str(photo_id)), None)
+            if cover is None:
+                return
+            moved = "url" in changes and changes["url"] != cover.get("url")
+            cover.update((field, changes[field]) for field in _CACHED_FIELDS if field in changes)
+        table = ENTITY_TABLES.get(cover.get("related_type"))
+        if moved and table:
+            self.db.update_where(table, {"id": cover["related_id"]}, {"cover_photo": cover["url"]})
+
+    def invalidate(self, entity_type: str, entity_id: Any) -> None:
+        """Forget a cached cover whose photo row changed elsewhere"""
+        with self._lock:
+            self._covers.pop(_key(entity_type, entity_id), None)
+
+    # ----- Reads -----
+
+    def cover_for(self, entity_type: str, entity_id: Any) -> Optional[Dict[str, Any]]:
+        self._ensure_loaded()
+        with self._lock:
+            cover = self._covers.get(_key(entity_type, entity_id))
+            return dict(cover) if cover else None
+
+    def has_cover(self, entity_type: str, entity_id: Any) -> bool:
+        """Whether the entity has a cover, checking the database when the cache has none"""
+        if self.cover_for(entity_type, entity_id) is not None:
+            return True
+        covers = self.db.find_by_field_values("photos", {
+            "related_type": entity_type, "related_id": entity_id, "is_cover": True
+        })
+        if not covers:
+            return False
+        # Set by another process since this cache was loaded
+        with self._lock:
+            self._cache(covers[0])
+        return True
+
+    def covers_for(self, entity_type: str, entity_ids: Iterable[Any]) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Covers of many entities of one type, keyed by entity id"""
+        self._ensure_loaded()
+        with self._lock:
+            return {
+                str(entity_id): dict(self._covers[_key(entity_type, entity_id)])
+                if _key(entity_type, entity_id) in self._covers else None
+                for entity_id in entity_ids
+            }
+
+
+_covers: "weakref.WeakKeyDictionary[Any, CoverPhotos]" = weakref.WeakKeyDictionary()
+_covers_lock = threading.Lock()
+
+
+def get_cover_photos(db: DatabaseInterface) -> CoverPhotos:
+    """Return the cover photo cache shared by every blueprint using this database"""
+    with _covers_lock:
+        covers = _covers.get(db)
+        if covers is None:
+            covers = CoverPhotos(db)
+            _covers[db] = covers
+        return covers
@@ -0,0 +1,38 @@
+"""
+dates.py
+
+Helpers for normalising the mix of date representations stored in the
+database (ISO strings with or without a trailing 'Z', date objects and
+datetime objects) into naive UTC datetimes that can be compared safely.
+"""
+
+import datetime
+from typing import Any, Optional
+
+
+def to_datetime(value: Any) -> Optional[datetime.datetime]:
+    """Convert a stored date value to a naive UTC datetime, or None if empty/invalid"""
+    if value is None or value == "":
+        return None
+
+    if isinstance(value, datetime.datetime):
+        parsed = value
+    elif isinstance(value, datetime.date):
+        return datetime.datetime(value.year, value.month, value.day)
+    elif isinstance(value, str):
+        try:
+            parsed = datetime.datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    else:
+        return None
+
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def to_date(value: Any) -> Optional[datetime.date]:
+    """Convert a stored date value to a date, or None if empty/invalid"""
+    parsed = to_datetime(value)
+    return parsed.date() if parsed else None
@@ -0,0 +1,294 @@
+"""
+due_date_scheduler.py
+
+In-memory scheduler of upcoming vaccination and medication due dates.
+
+The scheduler keeps every tracked due date in a binary min-heap so that the
+dashboard question "what is due in the next N days" can be answered by walking
+only the part of the heap that falls inside the window (O(k log k) for k
+results) instead of re-scanning the tables on every request. It is loaded once
+at startup and kept current by the health endpoints, which call
+upsert()/remove() after each write. Event reminders are handled by the
+notification dispatcher, not here.
+"""
+
+import datetime
+import heapq
+import itertools
+import threading
+import weakref
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from server.database.db_interface import DatabaseInterface
+from server.config import debug_log
+from .dates import to_datetime
+
+KIND_VACCINATION = "vaccination"
+KIND_MEDICATION = "medication"
+
+# Which column holds the due date for each tracked table
+TRACKED_TABLES = {
+    KIND_VACCINATION: ("vaccinations", "next_due_date"),
+    KIND_MEDICATION: ("medication_records", "end_date"),
+}
+
+# Index positions inside a heap entry (a list, so entries can be invalidated in place)
+_DUE, _SEQ, _KEY, _RECORD, _ACTIVE = range(5)
+
+
+class DueDateScheduler:
+    """Min-heap of due dates for vaccinations and medications"""
+
+    def __init__(self, db: DatabaseInterface, overdue_grace_days: int = 30):
+        self.db = db
+        self.overdue_grace = datetime.timedelta(days=overdue_grace_days)
+        self._heap: List[list] = []
+        self._entries: Dict[Tuple[str, str], list] = {}
+        self._open_ended: Dict[str, Dict[str, Any]] = {}  # medications without an end_date
+        self._reminded: set = set()
+        self._stale = 0
+        self._counter = itertools.count()
+        self._lock = threading.RLock()
+        self.loaded = False
+
+    # ----- Loading and maintenance -----
+
+    def load(self) -> None:
+        """(Re)build the heap from the database"""
+        with self._lock:
+            self._heap = []
+            self._entries = {}
+            self._open_ended = {}
+            self._stale = 0
+
+            for kind, (table, _field) in TRACKED_TABLES.items():
+                try:
+                    records = list(self.db.scan(table))
+                except Exception as e:
+                    debug_log(f"DueDateScheduler: could not load {table}: {str(e)}")
+                    continue
+
+                for record in records or []:
+                    self._add(kind, record)
+
+            heapq.heapify(self._heap)
+            self.loaded = True
+            debug_log(f"DueDateScheduler: loaded {len(self._entries)} due dates")
+
+    def _ensure_loaded(self) -> None:
+        if not self.loaded:
+            self.load()
+
+    def _add(self, kind: str, record: Dict[str, Any]) -> Optional[list]:
+        """Register a record without restoring the heap invariant (used by load)"""
+        record_id = record.get("id")
+        if record_id is None:
+            return None
+
+        _table, field = TRACKED_TABLES[kind]
+        due = to_datetime(record.get(field))
+
+        if due is None:
+            if kind == KIND_MEDICATION:
+                self._open_ended[str(record_id)] = record
+            return None
+
+        entry = [due, next(self._counter), (kind, str(record_id)), record, True]
+        self._entries[entry[_KEY]] = entry
+        self._heap.append(entry)
+        return entry
+
+    def _invalidate(self, key: Tuple[str, str]) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            entry[_ACTIVE] = False
+            self._stale += 1
+        if key[0] == KIND_MEDICATION:
+            self._open_ended.pop(key[1], None)
+
+    def _compact(self) -> None:
+        """Drop invalidated entries once they make up more than half the heap"""
+        if self._stale > len(self._entries):
+            self._heap = [entry for entry in self._heap if entry[_ACTIVE]]
+            heapq.heapify(self._heap)
+            self._stale = 0
+
+    def _expire(self, before: datetime.datetime) -> None:
+        """Pop entries whose due date lies before the retention window"""
+        while self._heap and self._heap[0][_DUE] < before:
+            entry = heapq.heappop(self._heap)
+            if entry[_ACTIVE]:
+                self._entries.pop(entry[_KEY], None)
+            else:
+                self._stale -= 1
+
+    # ----- Write hooks -----
+
+    def upsert(self, kind: str, record: Optional[Dict[str, Any]]) -> None:
+        """Add or replace the due date tracked for a record"""
+        if not record or record.get("id") is None or kind not in TRACKED_TABLES:
+            return
+
+        with self._lock:
+            self._ensure_loaded()
+            self._invalidate((kind, str(record["id"])))
+            entry = self._add(kind, record)
+            if entry is not None:
+                # _add appended the entry; restore the heap invariant for it
+                self._heap.pop()
+                heapq.heappush(self._heap, entry)
+            self._compact()
+
+    def remove(self, kind: str, record_id: Any) -> None:
+        """Stop tracking a record (e.g. after it was deleted)"""
+        with self._lock:
+            self._invalidate((kind, str(record_id)))
+            self._compact()
+
+    # ----- Queries -----
+
+    def _walk(self, start: datetime.datetime, cutoff: datetime.datetime) -> Iterable[list]:
+        """
+        Yield active entries due in [start, cutoff] in due-date order.
+
+        Uses a frontier heap over heap indices, so only entries that are at most
+        one level beyond the window are ever inspected.
+        """
+        heap = self._heap
+        if not heap:
+            return
+
+        frontier = [(heap[0][_DUE], heap[0][_SEQ], 0)]
+        while frontier:
+            due, _seq, index = heapq.heappop(frontier)
+            if due > cutoff:
+                break
+
+            entry = heap[index]
+            if entry[_ACTIVE] and due >= start:
+                yield entry
+
+            for child in (2 * index + 1, 2 * index + 2):
+                if child < len(heap):
+                    heapq.heappush(frontier, (heap[child][_DUE], heap[child][_SEQ], child))
+
+    def due_within(self, days: int = 30, kinds: Optional[Iterable[str]] = None,
+                   include_overdue: bool = False,
+                   now: Optional[datetime.datetime] = None) -> List[Dict[str, Any]]:
+        """
+        Return the items due between today and today + days, earliest first.
+
+        Each item is a dict with kind, record_id, due_date and the stored record.
+        """
+        now = now or datetime.datetime.utcnow()
+        today = datetime.datetime(now.year, now.month, now.day)
+        cutoff = today + datetime.timedelta(days=days, hours=23, minutes=59, seconds=59)
+        start = today - self.overdue_grace if include_overdue else today
+        kinds = set(kinds) if kinds else None
+
+        with self._lock:
+            self._ensure_loaded()
+            self._expire(today - self.overdue_grace)
+
+            items = []
+            for entry in self._walk(start, cutoff):
+                kind, record_id = entry[_KEY]
+                if kinds and kind not in kinds:
+                    continue
+                items.append({
+                    "kind": kind,
+                    "record_id": record_id,
+                    "due_date": entry[_DUE].isoformat(),
+                    "overdue": entry[_DUE] < today,
+                    "record": entry[_RECORD],
+                })
+            return items
+
+    def upcoming_vaccinations(self, days: int = 30) -> List[Dict[str, Any]]:
+        """Vaccination records with a next_due_date in the next N days"""
+        return [item["record"] for item in self.due_within(days, kinds=[KIND_VACCINATION])]
+
+    def active_medications(self, now: Optional[datetime.datetime] = None) -> List[Dict[str, Any]]:
+        """Medication records without an end_date or ending today or later"""
+        now = now or datetime.datetime.utcnow()
+        today = datetime.datetime(now.year, now.month, now.day)
+
+        with self._lock:
+            self._ensure_loaded()
+            active = list(self._open_ended.values())
+            active.extend(
+                entry[_RECORD] for key, entry in self._entries.items()
+                if key[0] == KIND_MEDICATION and entry[_DUE] >= today
+            )
+            return active
+
+    def reminders(self, days: int = 7, now: Optional[datetime.datetime] = None) -> List[Dict[str, Any]]:
+        """
+        Build notification payloads for items due in the next N days.
+
+        Overdue vaccinations are included; finished medication courses are not.
+        Items passed to mark_reminded() are skipped, so once its notification
+        was written the same due date is only reminded about once per process.
+        """
+        payloads = []
+        for item in self.due_within(days, include_overdue=True, now=now):
+            if item["overdue"] and item["kind"] != KIND_VACCINATION:
+                continue
+
+            reminder_key = (item["kind"], item["record_id"], item["due_date"])
+            if reminder_key in self._reminded:
+                continue
+
+            payloads.append(dict(_build_reminder(item), reminder_key=reminder_key))
+        return payloads
+
+    def mark_reminded(self, payload: Dict[str, Any]) -> None:
+        """Remember a reminder payload once its notification has been stored"""
+        with self._lock:
+            self._reminded.add(payload["reminder_key"])
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def _build_reminder(item: Dict[str, Any]) -> Dict[str, Any]:
+    """Shape a due item like a row of the notifications table"""
+    record = item["record"]
+    due_date = item["due_date"][:10]
+    kind = item["kind"]
+
+    if record.get("puppy_id") and not record.get("dog_id"):
+        entity_type, entity_id = "puppy", record.get("puppy_id")
+    else:
+        entity_type, entity_id = "dog", record.get("dog_id")
+
+    if kind == KIND_VACCINATION:
+        name = record.get("vaccine_name") or record.get("name") or "Vaccination"
+        title = f"{name} due"
+    else:
+        name = record.get("medication_name") or record.get("name") or "Medication"
+        title = f"{name} course ends"
+
+    status = "was due" if item["overdue"] else "is due"
+    return {
+        "type": f"{kind}_due",
+        "title": title,
+        "message": f"{title} {status} on {due_date}",
+        "entity_type": entity_type,
+        "entity_id": entity_id,
+        "due_date": item["due_date"],
+    }
+
+
+_schedulers: "weakref.WeakKeyDictionary[Any, DueDateScheduler]" = weakref.WeakKeyDictionary()
+_schedulers_lock = threading.Lock()
+
+
+def get_due_date_scheduler(db: DatabaseInterface) -> DueDateScheduler:
+    """Return the scheduler shared by every blueprint using this database"""
+    with _schedulers_lock:
+        scheduler = _schedulers.get(db)
+        if scheduler is None:
+            scheduler = DueDateScheduler(db)
+            _schedulers[db] = scheduler
+        return scheduler
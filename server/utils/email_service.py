@@ -66,7 +66,61 @@ class EmailService:
         except Exception as e:
             current_app.logger.error("Failed to send email: %s", str(e))
             return False
-    
+
+    @staticmethod
+    def send_bulk(messages):
+        """
+        Send several emails over a single SMTP connection.
+
+        Args:
+            messages (list): (recipient, subject, html_content, text_content) tuples
+
+        Returns:
+            list: True/False per message, in order
+        """
+        results = [False] * len(messages)
+        if not messages:
+            return results
+
+        try:
+            smtp_server = os.environ.get('SMTP_SERVER', '')
+            smtp_port = int(os.environ.get('SMTP_PORT', 587))
+            smtp_username = os.environ.get('SMTP_USERNAME', '')
+            smtp_password = os.environ.get('SMTP_PASSWORD', '')
+            sender_email = os.environ.get('SENDER_EMAIL', '')
+
+            if not all([smtp_server, smtp_port, smtp_username, smtp_password, sender_email]):
+                current_app.logger.warning(
+                    "Email not configured. Would have sent %d emails", len(messages)
+                )
+                return results
+
+            with smtplib.SMTP(smtp_server, smtp_port) as server:
+                server.starttls()
+                server.login(smtp_username, smtp_password)
+
+                for index, (recipient, subject, html_content, text_content) in enumerate(messages):
+                    message = MIMEMultipart("alternative")
+                    message["Subject"] = subject
+                    message["From"] = sender_email
+                    message["To"] = recipient
+                    if text_content:
+                        message.attach(MIMEText(text_content, "plain"))
+                    message.attach(MIMEText(html_content, "html"))
+
+                    try:
+                        server.sendmail(sender_email, recipient, message.as_string())
+                        results[index] = True
+                    except smtplib.SMTPException as e:
+                        current_app.logger.error("Failed to send email to %s: %s", recipient, str(e))
+
+            current_app.logger.info("Sent %d of %d emails", sum(results), len(messages))
+            return results
+
+        except Exception as e:
+            current_app.logger.error("Failed to send emails: %s", str(e))
+            return results
+
     @staticmethod
     def send_application_submitted_notification(breeder_email, applicant_name, form_name):
         """
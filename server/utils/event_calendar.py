@@ -0,0 +1,287 @@
+"""
+event_calendar.py
+
+Date-range query engine for calendar events.
+
+Events are held in an IntervalIndex keyed by event id, loaded once and kept
+current by the events endpoints, so a month or week view is answered with an
+overlap query over the visible window instead of loading and sorting the whole
+table. Recurring events are kept as one series each and expanded lazily into
+the occurrences that fall inside the queried window. If the index cannot be
+loaded, range queries go to the database, which filters on start_date/end_date
+server-side.
+"""
+
+import calendar
+import datetime
+import threading
+import weakref
+from typing import Any, Dict, List, Optional, Tuple
+
+from server.database.db_interface import DatabaseInterface
+from server.config import debug_log
+from .dates import to_datetime
+from .interval_index import IntervalIndex
+from .event_conflicts import ConflictIndex
+from .recurrence import parse_rule, expand, format_occurrence_text
+from .event_generation import is_legacy_birthday
+
+VIEW_DAY = "day"
+VIEW_WEEK = "week"
+VIEW_MONTH = "month"
+
+
+def view_window(view: str, anchor: datetime.date,
+                first_weekday: int = calendar.SUNDAY) -> Tuple[datetime.datetime, datetime.datetime]:
+    """
+    Return the [start, end] datetimes visible in a calendar view around anchor.
+
+    Month views cover the full weeks of the month grid, including the leading
+    and trailing days of the neighbouring months.
+    """
+    if view == VIEW_DAY:
+        first = last = anchor
+    elif view == VIEW_WEEK:
+        first = anchor - datetime.timedelta(days=(anchor.weekday() - first_weekday) % 7)
+        last = first + datetime.timedelta(days=6)
+    elif view == VIEW_MONTH:
+        weeks = calendar.Calendar(first_weekday).monthdatescalendar(anchor.year, anchor.month)
+        first, last = weeks[0][0], weeks[-1][-1]
+    else:
+        raise ValueError(f"Unknown calendar view '{view}'. Use day, week or month.")
+
+    return (
+        datetime.datetime(first.year, first.month, first.day),
+        datetime.datetime(last.year, last.month, last.day, 23, 59, 59, 999999),
+    )
+
+
+def _matches(event: Dict[str, Any], filters: Optional[Dict[str, Any]]) -> bool:
+    if not filters:
+        return True
+    return all(str(event.get(field)) == str(value) for field, value in filters.items())
+
+
+def _start_key(event: Dict[str, Any]):
+    return to_datetime(event.get("start_date")) or datetime.datetime.min
+
+
+def _series_entry(event: Dict[str, Any]) -> Optional[tuple]:
+    """(event, start, rule, duration) for a recurring event, None for a one-off"""
+    start = to_datetime(event.get("start_date"))
+    if start is None or is_legacy_birthday(event):
+        return None
+    try:
+        rule = parse_rule(event.get("recurring"))
+    except ValueError as e:
+        debug_log(f"EventCalendar: ignoring recurrence of event {event.get('id')}: {str(e)}")
+        return None
+    if rule is None:
+        return None
+
+    end = to_datetime(event.get("end_date"))
+    duration = max(end - start, datetime.timedelta(0)) if end else datetime.timedelta(0)
+    return event, start, rule, duration
+
+
+def _series_row(series: tuple) -> Dict[str, Any]:
+    """A series row with its placeholders filled for the first occurrence"""
+    event = series[0]
+    return dict(event,
+                title=format_occurrence_text(event.get("title"), 0),
+                description=format_occurrence_text(event.get("description"), 0),
+                series_id=event.get("id"))
+
+
+class EventCalendar:
+    """Interval-indexed view of the events table"""
+
+    def __init__(self, db: DatabaseInterface):
+        self.db = db
+        self._index = IntervalIndex()
+        self._series: Dict[str, tuple] = {}
+        # Per-dog bookings for overlap checks, kept in step with the index
+        self.conflicts = ConflictIndex()
+        self._lock = threading.RLock()
+        self.loaded = False
+
+    def load(self) -> None:
+        """(Re)build the index from the events table, read page by page past the provider's row cap"""
+        events = list(self.db.scan("events"))
+        with self._lock:
+            self._index.clear()
+            self._series = {}
+            self.conflicts.clear()
+            for event in events or []:
+                self._add(event)
+            self.loaded = True
+        debug_log(f"EventCalendar: indexed {len(self._index)} events")
+
+    def _add(self, event: Dict[str, Any]) -> None:
+        start = to_datetime(event.get("start_date"))
+        if event.get("id") is None or start is None:
+            return
+
+        self.conflicts.add(event)
+        series = _series_entry(event)
+        if series is not None:
+            self._series[str(event["id"])] = series
+        else:
+            self._index.add(str(event["id"]), start, to_datetime(event.get("end_date")), event)
+
+    def _occurrences(self, series: tuple, window_start: datetime.datetime,
+                     window_end: datetime.datetime) -> List[Dict[str, Any]]:
+        """Materialise the occurrences of one series that overlap the window"""
+        event, start, rule, duration = series
+        occurrences = []
+        for index, occurrence_start in expand(start, rule, window_start, window_end, duration):
+            occurrence = dict(event)
+            occurrence.update({
+                "start_date": occurrence_start.isoformat(),
+                "end_date": (occurrence_start + duration).isoformat(),
+                "title": format_occurrence_text(event.get("title"), index),
+                "description": format_occurrence_text(event.get("description"), index),
+                "series_id": event.get("id"),
+                "occurrence_index": index,
+                "occurrence_key": f"{event.get('id')}:{occurrence_start.date().isoformat()}",
+            })
+            occurrences.append(occurrence)
+        return occurrences
+
+    # ----- Write hooks -----
+
+    def upsert(self, event: Optional[Dict[str, Any]]) -> None:
+        if not event or event.get("id") is None:
+            return
+        with self._lock:
+            self._index.remove(str(event["id"]))
+            self._series.pop(str(event["id"]), None)
+            self.conflicts.remove(event["id"])
+            self._add(event)
+
+    def upsert_many(self, events: List[Dict[str, Any]]) -> None:
+        for event in events or []:
+            self.upsert(event)
+
+    def remove(self, event_id: Any) -> None:
+        with self._lock:
+            self._index.remove(str(event_id))
+            self._series.pop(str(event_id), None)
+            self.conflicts.remove(event_id)
+
+    # ----- Queries -----
+
+    def _try_load(self) -> bool:
+        if not self.loaded:
+            try:
+                self.load()
+            except Exception as e:
+                debug_log(f"EventCalendar: could not load events: {str(e)}")
+        return self.loaded
+
+    def between(self, start: Any, end: Any,
+                filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Events and recurring occurrences overlapping [start, end], ordered by start date"""
+        start, end = to_datetime(start), to_datetime(end)
+        if start is None or end is None:
+            raise ValueError("start and end must be valid ISO dates")
+
+        if self._try_load():
+            with self._lock:
+                events = self._index.overlapping(start, end)
+                series = [s for s in self._series.values() if _matches(s[0], filters)]
+            if series:
+                for entry in series:
+                    events.extend(self._occurrences(entry, start, end))
+                events.sort(key=_start_key)
+        else:
+            # Degraded mode: only series starting inside the window are expanded
+            events = []
+            for event in self.db.find_overlapping("events", "start_date", "end_date", start, end):
+                series = _series_entry(event)
+                if series is not None:
+                    events.extend(self._occurrences(series, start, end))
+                else:
+                    events.append(event)
+            events.sort(key=_start_key)
+        return [event for event in events if _matches(event, filters)]
+
+    def all(self, filters: Optional[Dict[str, Any]] = None,
+            window: Optional[Tuple[Any, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Every event (recurring events once, as their series), ordered by start date.
+
+        Series are listed as their first occurrence, with the title and
+        description placeholders filled like the occurrences in range queries.
+        With a (start, end) window, series are expanded into their occurrences
+        inside it instead, while one-off events are listed whatever their date.
+        """
+        if self._try_load():
+            with self._lock:
+                events = self._index.values()
+                series = list(self._series.values())
+        else:
+            events, series = [], []
+            for event in self.db.scan("events"):
+                entry = _series_entry(event)
+                if entry is not None:
+                    series.append(entry)
+                else:
+                    events.append(event)
+        if window is None:
+            events.extend(_series_row(entry) for entry in series)
+        else:
+            window_start, window_end = to_datetime(window[0]), to_datetime(window[1])
+            for entry in series:
+                if _matches(entry[0], filters):
+                    events.extend(self._occurrences(entry, window_start, window_end))
+        events.sort(key=_start_key)
+        return [event for event in events if _matches(event, filters)]
+
+    def occurrences(self, event: Dict[str, Any], start: Any, end: Any) -> List[Dict[str, Any]]:
+        """Occurrences of one recurring event inside [start, end] (empty for one-off events)"""
+        series = _series_entry(event)
+        if series is None:
+            return []
+        return self._occurrences(series, to_datetime(start), to_datetime(end))
+
+    def conflicts_for(self, event: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Bookings of the same dog overlapping an event about to be saved"""
+        self._try_load()
+        return self.conflicts.conflicts_for(event)
+
+    def conflicts_between(self, start: Any, end: Any, dog_id: Optional[Any] = None) -> List[Dict[str, Any]]:
+        """Overlapping bookings per dog inside a window"""
+        if not self._try_load():
+            # Degraded mode: index the window's events from the database
+            index = ConflictIndex()
+            for event in self.db.find_overlapping("events", "start_date", "end_date",
+                                                  to_datetime(start), to_datetime(end)):
+                index.add(event)
+            return index.conflicts_between(start, end, dog_id)
+        return self.conflicts.conflicts_between(start, end, dog_id)
+
+    def view(self, view: str, anchor: datetime.date, first_weekday: int = calendar.SUNDAY,
+             filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Events visible in a day/week/month view"""
+        start, end = view_window(view, anchor, first_weekday)
+        return {
+            "view": view,
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "events": self.between(start, end, filters),
+        }
+
+
+_calendars: "weakref.WeakKeyDictionary[Any, EventCalendar]" = weakref.WeakKeyDictionary()
+_calendars_lock = threading.Lock()
+
+
+def get_event_calendar(db: DatabaseInterface) -> EventCalendar:
+    """Return the calendar shared by every blueprint using this database"""
+    with _calendars_lock:
+        event_calendar = _calendars.get(db)
+        if event_calendar is None:
+            event_calendar = EventCalendar(db)
+            _calendars[db] = event_calendar
+        return event_calendar
@@ -0,0 +1,176 @@
+"""
+event_conflicts.py
+
+Per-dog conflict detection for booked calendar events.
+
+Vet appointments, breedings, shows and similar bookings occupy the dog, so
+two of them must not overlap for the same dog. Booked events are kept in one
+IntervalIndex per dog, so checking a new or edited event costs an overlap
+query over that dog's bookings instead of loading the calendar. All-day events
+occupy the whole day. Intervals that merely touch (one ends when the next
+starts) do not conflict.
+
+Recurring bookings are checked through their occurrences inside the queried
+window; a new recurring booking is checked with its first occurrence.
+"""
+
+import datetime
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from .dates import to_datetime
+from .interval_index import IntervalIndex
+from .recurrence import parse_rule, expand
+
+# Event types that occupy the dog
+BOOKED_EVENT_TYPES = frozenset({
+    "vet_appointment", "breeding", "show", "grooming", "training", "stud_service",
+})
+
+_EPSILON = datetime.timedelta(microseconds=1)
+
+
+def event_dog_id(event: Dict[str, Any]) -> Optional[str]:
+    """The dog an event belongs to, if any"""
+    if event.get("related_type") == "dog" and event.get("related_id") is not None:
+        return str(event["related_id"])
+    if event.get("related_dog_id") is not None:
+        return str(event["related_dog_id"])
+    return None
+
+
+def event_span(event: Dict[str, Any]) -> Optional[Tuple[datetime.datetime, datetime.datetime]]:
+    """[start, end) occupied by an event; all-day events cover whole days"""
+    start = to_datetime(event.get("start_date"))
+    if start is None:
+        return None
+    end = to_datetime(event.get("end_date")) or start
+    if end < start:
+        end = start
+    if event.get("all_day"):
+        start = datetime.datetime(start.year, start.month, start.day)
+        end = datetime.datetime(end.year, end.month, end.day) + datetime.timedelta(days=1)
+    elif end == start:
+        # Treat instantaneous bookings as one minute long so they can still collide
+        end = start + datetime.timedelta(minutes=1)
+    return start, end
+
+
+def is_booking(event: Dict[str, Any]) -> bool:
+    return event.get("event_type") in BOOKED_EVENT_TYPES and event_dog_id(event) is not None
+
+
+def _rule(event: Dict[str, Any]):
+    try:
+        return parse_rule(event.get("recurring"))
+    except ValueError:
+        return None
+
+
+class ConflictIndex:
+    """Booked events per dog, indexed by their occupied interval"""
+
+    def __init__(self):
+        self._dogs: Dict[str, IntervalIndex] = {}
+        self._series: Dict[str, Dict[str, Tuple[Dict[str, Any], datetime.datetime, Any, datetime.timedelta]]] = {}
+        self._event_dogs: Dict[str, str] = {}
+        self._lock = threading.RLock()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._dogs = {}
+            self._series = {}
+            self._event_dogs = {}
+
+    def add(self, event: Dict[str, Any]) -> None:
+        """Index (or re-index) an event; non-bookings are ignored"""
+        if event.get("id") is None:
+            return
+        event_id = str(event["id"])
+        with self._lock:
+            self.remove(event_id)
+            if not is_booking(event):
+                return
+            span = event_span(event)
+            if span is None:
+                return
+            dog_id = event_dog_id(event)
+            rule = _rule(event)
+            if rule is not None:
+                self._series.setdefault(dog_id, {})[event_id] = (event, span[0], rule, span[1] - span[0])
+            else:
+                self._dogs.setdefault(dog_id, IntervalIndex()).add(event_id, span[0], span[1], event)
+            self._event_dogs[event_id] = dog_id
+
+    def remove(self, event_id: Any) -> None:
+        with self._lock:
+            dog_id = self._event_dogs.pop(str(event_id), None)
+            if dog_id is None:
+                return
+            if dog_id in self._dogs:
+                self._dogs[dog_id].remove(str(event_id))
+            self._series.get(dog_id, {}).pop(str(event_id), None)
+
+    def _bookings(self, dog_id: str, start: datetime.datetime,
+                  end: datetime.datetime) -> List[Tuple[datetime.datetime, datetime.datetime, Dict[str, Any]]]:
+        """(start, end, event) of a dog's bookings overlapping [start, end)"""
+        results = []
+        index = self._dogs.get(dog_id)
+        if index is not None:
+            # Shrink the closed query so intervals that only touch the window are excluded
+            for event in index.overlapping(start + _EPSILON, end - _EPSILON):
+                span = event_span(event)
+                results.append((span[0], span[1], event))
+        for series_event, series_start, rule, duration in self._series.get(dog_id, {}).values():
+            for occurrence_index, occurrence in expand(series_start, rule, start + _EPSILON, end - _EPSILON, duration):
+                if occurrence < end and occurrence + duration > start:
+                    occurrence_event = dict(series_event, start_date=occurrence.isoformat(),
+                                            end_date=(occurrence + duration).isoformat(),
+                                            occurrence_index=occurrence_index)
+                    results.append((occurrence, occurrence + duration, occurrence_event))
+        return results
+
+    def conflicts_for(self, event: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Existing bookings of the same dog that overlap an (unsaved) event"""
+        if not is_booking(event):
+            return []
+        span = event_span(event)
+        if span is None:
+            return []
+        own_id = str(event["id"]) if event.get("id") is not None else None
+        with self._lock:
+            bookings = self._bookings(event_dog_id(event), span[0], span[1])
+        return [booking for _start, _end, booking in sorted(bookings, key=lambda b: b[0])
+                if own_id is None or str(booking.get("id")) != own_id]
+
+    def conflicts_between(self, start: Any, end: Any,
+                          dog_id: Optional[Any] = None) -> List[Dict[str, Any]]:
+        """
+        Overlapping pairs of bookings inside [start, end], per dog.
+
+        Returns [{"dog_id", "events": [first, second], "overlap_start", "overlap_end"}].
+        """
+        start, end = to_datetime(start), to_datetime(end)
+        if start is None or end is None:
+            raise ValueError("start and end must be valid ISO dates")
+
+        with self._lock:
+            dog_ids = [str(dog_id)] if dog_id is not None else sorted(set(self._dogs) | set(self._series))
+            per_dog = {dog: self._bookings(dog, start, end) for dog in dog_ids}
+
+        conflicts = []
+        for dog, bookings in per_dog.items():
+            bookings.sort(key=lambda b: (b[0], b[1]))
+            # Sweep in start order, keeping the bookings that are still running
+            active: List[Tuple[datetime.datetime, datetime.datetime, Dict[str, Any]]] = []
+            for booking in bookings:
+                active = [other for other in active if other[1] > booking[0]]
+                for other in active:
+                    conflicts.append({
+                        "dog_id": dog,
+                        "events": [other[2], booking[2]],
+                        "overlap_start": booking[0].isoformat(),
+                        "overlap_end": min(other[1], booking[1]).isoformat(),
+                    })
+                active.append(booking)
+        return conflicts
@@ -0,0 +1,246 @@
+"""
+event_generation.py
+
+Set-based generation of litter milestone and dam care events.
+
+The generator builds the full milestone plan for a litter in memory, loads the
+existing events of the litter and of its dam once, diffs the plan against them
+by (related_type, related_id, event_type, title) and bulk-inserts only the
+missing events. Birthday series are generated the same way for all dogs at once.
+"""
+
+import datetime
+import hashlib
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from server.database.db_interface import DatabaseInterface
+from server.config import debug_log
+from .dates import to_datetime
+from .recurrence import parse_rule
+
+LITTER_COLOR = "#4CAF50"  # Green for litter events
+DAM_COLOR = "#9C27B0"  # Purple for dam events
+BIRTHDAY_COLOR = "#FF5722"  # Orange for birthdays
+
+# `recurring` value of birthday rows created before birthdays became series
+LEGACY_BIRTHDAY_RECURRENCE = "yearly"
+
+# (days after whelping, title suffix, description, notify)
+LITTER_MILESTONES = [
+    # Puppy development milestones
+    (0, "Birth day", "Puppies born", True),
+    (7, "1 week old", "Puppies are 1 week old. Eyes should start opening.", False),
+    (14, "2 weeks old", "Puppies are 2 weeks old. Starting to crawl.", False),
+    (21, "3 weeks old", "Puppies are 3 weeks old. Begin weaning process.", False),
+    (28, "4 weeks old", "Puppies are 4 weeks old. First vaccinations.", False),
+    (35, "5 weeks old", "Puppies are 5 weeks old. Fully weaned.", False),
+    (42, "6 weeks old", "Puppies are 6 weeks old. Second vaccinations.", False),
+    (49, "7 weeks old", "Puppies are 7 weeks old. Temperament evaluations.", False),
+    (56, "8 weeks old", "Puppies are 8 weeks old. Ready to go to new homes.", True),
+
+    # Additional events
+    (3, "Dewclaw removal", "Schedule dewclaw removal if needed.", False),
+    (10, "Start puppy recordings", "Begin recording puppies for future families.", False),
+    (42, "Start transition to puppy food", "Begin transitioning to puppy food.", False),
+]
+
+# (days after whelping, title suffix, description, event type, notify)
+DAM_CARE_EVENTS = [
+    (0, "Post-whelp checkup", "Schedule a vet checkup for the dam after whelping.", "vet_appointment", True),
+    (14, "Special nutrition needs", "Dam needs extra nutrition during nursing period.", "dog_care", False),
+    (42, "Begin gradually reducing food", "Start reducing dam's food as puppies are weaned.", "dog_care", False),
+]
+
+
+def _event_key(event: Dict[str, Any]) -> Tuple[str, str, str, str]:
+    return (
+        str(event.get("related_type")),
+        str(event.get("related_id")),
+        str(event.get("event_type")),
+        str(event.get("title")),
+    )
+
+
+def idempotency_key(event: Dict[str, Any]) -> str:
+    """Stable key of a generated event; regenerating the same event yields the same key"""
+    return hashlib.sha1("|".join(_event_key(event)).encode("utf-8")).hexdigest()
+
+
+def litter_event_plan(litter: Dict[str, Any], dam: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """Build every milestone (and dam care) event a litter should have"""
+    whelp_date = to_datetime(litter.get("whelp_date") or litter.get("expected_date"))
+    if whelp_date is None:
+        raise ValueError("Litter has no whelp_date or expected_date")
+
+    litter_id = litter["id"]
+    litter_name = litter.get("litter_name") or f"Litter #{litter_id}"
+
+    def event(days, title, description, event_type, related_type, related_id, color, notify):
+        event_date = (whelp_date + datetime.timedelta(days=days)).isoformat()
+        return {
+            "title": title,
+            "description": description,
+            "start_date": event_date,
+            "end_date": event_date,  # Same day events
+            "all_day": True,
+            "event_type": event_type,
+            "related_type": related_type,
+            "related_id": related_id,
+            "color": color,
+            "notify": notify,
+            "notify_days_before": 1 if notify else 0,
+            "recurring": "none",
+        }
+
+    plan = [
+        event(days, f"{litter_name} - {suffix}", description, "litter_milestone",
+              "litter", litter_id, LITTER_COLOR, notify)
+        for days, suffix, description, notify in LITTER_MILESTONES
+    ]
+
+    if dam:
+        dam_name = dam.get("call_name") or f"Dam #{dam['id']}"
+        plan.extend(
+            event(days, f"{dam_name} - {suffix}", description, event_type,
+                  "dog", dam["id"], DAM_COLOR, notify)
+            for days, suffix, description, event_type, notify in DAM_CARE_EVENTS
+        )
+
+    return plan
+
+
+def generate_litter_events(db: DatabaseInterface, litter_id: int) -> Dict[str, Any]:
+    """
+    Create the missing milestone events of a litter.
+
+    Raises LookupError if the litter does not exist and ValueError if it has no
+    whelp or expected date. Returns the created events with created/skipped counts.
+    """
+    litter = db.get("litters", litter_id)
+    if not litter:
+        raise LookupError(f"Litter with ID {litter_id} not found")
+
+    dam = db.get("dogs", litter["dam_id"]) if litter.get("dam_id") else None
+    plan = litter_event_plan(litter, dam)
+
+    # One read per related entity instead of one duplicate check per milestone
+    existing = db.find_by_field_values("events", {"related_type": "litter", "related_id": litter_id})
+    if dam:
+        existing = existing + db.find_by_field_values("events", {"related_type": "dog", "related_id": dam["id"]})
+    existing_keys = {_event_key(event) for event in existing}
+
+    missing = []
+    for event in plan:
+        key = _event_key(event)
+        if key not in existing_keys:
+            existing_keys.add(key)
+            missing.append(event)
+
+    created = db.create_many("events", missing) if missing else []
+    debug_log(f"Litter {litter_id}: created {len(created)} events, skipped {len(plan) - len(missing)}")
+
+    return {
+        "litter_id": litter_id,
+        "created": len(created),
+        "skipped": len(plan) - len(missing),
+        "events": created,
+    }
+
+
+def is_recurring(event: Dict[str, Any]) -> bool:
+    try:
+        return parse_rule(event.get("recurring")) is not None
+    except ValueError:
+        return False
+
+
+def is_legacy_birthday(event: Dict[str, Any]) -> bool:
+    """
+    Whether an event is a birthday written by the old generator.
+
+    Those rows say `recurring: "yearly"` but carry a fixed age in the title
+    ("Bella's 3st Birthday"), so they are shown once on their own date rather
+    than expanded, and do not count as a birthday series.
+    """
+    return (event.get("event_type") == "birthday"
+            and str(event.get("recurring") or "").strip().lower() == LEGACY_BIRTHDAY_RECURRENCE)
+
+
+def is_birthday_series(event: Dict[str, Any]) -> bool:
+    return event.get("event_type") == "birthday" and is_recurring(event) and not is_legacy_birthday(event)
+
+
+def birthday_event(dog: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    The yearly birthday series of a dog, or None without a birth date.
+
+    The series starts at the first birthday; the calendar expands it into the
+    visible years, filling in the age per occurrence.
+    """
+    birth_date = to_datetime(dog.get("birth_date"))
+    if birth_date is None:
+        return None
+
+    dog_name = dog.get("call_name") or f"Dog #{dog['id']}"
+    try:
+        first_birthday = birth_date.replace(year=birth_date.year + 1)
+    except ValueError:
+        # Born on February 29th
+        first_birthday = birth_date.replace(year=birth_date.year + 1, day=28)
+    first_birthday = datetime.datetime(first_birthday.year, first_birthday.month, first_birthday.day).isoformat()
+
+    return {
+        "title": f"{dog_name}'s {{occurrence_ordinal}} Birthday",
+        "description": f"{dog_name} turns {{occurrence}} years old!",
+        "start_date": first_birthday,
+        "end_date": first_birthday,
+        "all_day": True,
+        "event_type": "birthday",
+        "related_type": "dog",
+        "related_id": dog["id"],
+        "color": BIRTHDAY_COLOR,
+        "notify": True,
+        "notify_days_before": 7,
+        "recurring": "RRULE:FREQ=YEARLY",
+    }
+
+
+def generate_birthday_events(db: DatabaseInterface, dogs: Optional[List[Dict[str, Any]]] = None,
+                             progress: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+    """
+    Create a birthday series for every active dog that does not have one yet.
+
+    Existing birthday series are read with one query and the new series are
+    inserted with one bulk write. A legacy birthday row of the dog (see
+    is_legacy_birthday) is migrated in place to the series instead.
+    """
+    if dogs is None:
+        dogs = db.find_by_field_values("dogs", {"status": "Active"})
+
+    existing = db.find_by_field_values("events", {"related_type": "dog", "event_type": "birthday"})
+    has_series = {str(event.get("related_id")) for event in existing if is_birthday_series(event)}
+    legacy = {}
+    for event in existing:
+        if is_legacy_birthday(event):
+            legacy.setdefault(str(event.get("related_id")), event)
+
+    missing, migrated = [], []
+    for done, dog in enumerate(dogs, 1):
+        if str(dog.get("id")) not in has_series:
+            event = birthday_event(dog)
+            if event is not None:
+                has_series.add(str(dog.get("id")))
+                old = legacy.get(str(dog.get("id")))
+                if old is not None:
+                    migrated.append(db.update("events", old["id"], event))
+                else:
+                    missing.append(event)
+        if progress:
+            progress(done, len(dogs))
+
+    created = db.create_many("events", missing) if missing else []
+    debug_log(f"Birthdays: created {len(created)} series and migrated {len(migrated)} legacy birthdays "
+              f"for {len(dogs)} dogs")
+
+    return {"created": len(created), "migrated": len(migrated),
+            "skipped": len(dogs) - len(created) - len(migrated), "events": created + migrated}
@@ -0,0 +1,235 @@
+"""
+event_rebuild.py
+
+Bulk regeneration of litter milestone and birthday events for a whole program.
+
+The rebuild reads litters, dogs and events once (page by page, so no rows are
+lost to the provider's response cap). It then splits the litters
+into batches that a bounded thread pool turns into event plans. Planned events
+are deduplicated against the existing events (and each other) by their
+idempotency key, and every batch is written with one create_many call. Completed
+litters are recorded in a JSON checkpoint after each batch, so an interrupted
+rebuild can resume where it stopped; re-running a finished rebuild creates
+nothing. Birthday rows written by the old generator are migrated to the dog's
+series (extra ones, and ones next to an existing series, are deleted) so no dog
+ends up with two birthdays.
+"""
+
+import datetime
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from server.database.db_interface import DatabaseInterface
+from server.config import debug_log
+from .event_generation import (
+    litter_event_plan, birthday_event, idempotency_key, is_birthday_series, is_legacy_birthday,
+)
+
+
+def _chunks(items: List[Any], size: int) -> List[List[Any]]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+class Checkpoint:
+    """Set of completed litter ids (plus the birthday pass) stored as JSON"""
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.litters_done = set()
+        self.birthdays_done = False
+        self._lock = threading.Lock()
+
+    def load(self) -> None:
+        if not self.path or not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        self.litters_done = {str(litter_id) for litter_id in data.get("litters_done", [])}
+        self.birthdays_done = bool(data.get("birthdays_done"))
+
+    def mark_litters(self, litter_ids: List[Any]) -> None:
+        with self._lock:
+            self.litters_done.update(str(litter_id) for litter_id in litter_ids)
+            self._save()
+
+    def mark_birthdays(self) -> None:
+        with self._lock:
+            self.birthdays_done = True
+            self._save()
+
+    def _save(self) -> None:
+        if not self.path:
+            return
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "litters_done": sorted(self.litters_done),
+                "birthdays_done": self.birthdays_done,
+                "updated_at": datetime.datetime.utcnow().isoformat(),
+            }, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self) -> None:
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class EventRebuilder:
+    """Regenerates missing litter and birthday events with a bounded worker pool"""
+
+    def __init__(self, db: DatabaseInterface, workers: int = 4, batch_size: int = 50,
+                 checkpoint_path: Optional[str] = None, resume: bool = False, dry_run: bool = False,
+                 log: Callable[[str], None] = print):
+        if workers < 1 or batch_size < 1:
+            raise ValueError("workers and batch_size must be at least 1")
+        self.db = db
+        self.workers = workers
+        self.batch_size = batch_size
+        self.checkpoint = Checkpoint(None if dry_run else checkpoint_path)
+        self.resume = resume
+        self.dry_run = dry_run
+        self.log = log
+        self._keys = set()
+        self._keys_lock = threading.Lock()
+        self.stats = {"litters": 0, "litters_skipped": 0, "created": 0, "existing": 0,
+                      "birthdays_created": 0, "birthdays_migrated": 0, "legacy_birthdays_removed": 0,
+                      "failed": []}
+        self._stats_lock = threading.Lock()
+
+    def _claim(self, events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Keep the events whose idempotency key is not taken yet, and take it"""
+        claimed = []
+        with self._keys_lock:
+            for event in events:
+                key = idempotency_key(event)
+                if key not in self._keys:
+                    self._keys.add(key)
+                    claimed.append(event)
+        return claimed
+
+    def _write(self, events: List[Dict[str, Any]]) -> int:
+        if not events or self.dry_run:
+            return len(events)
+        created = self.db.create_many("events", events, chunk_size=max(self.batch_size * 15, 100))
+        return len(created)
+
+    def _litter_batch(self, litters: List[Dict[str, Any]], dogs: Dict[str, Dict[str, Any]]) -> None:
+        plan: List[Dict[str, Any]] = []
+        done: List[Any] = []
+        for litter in litters:
+            try:
+                dam = dogs.get(str(litter.get("dam_id"))) if litter.get("dam_id") else None
+                plan.extend(litter_event_plan(litter, dam))
+                done.append(litter["id"])
+            except ValueError as e:
+                with self._stats_lock:
+                    self.stats["failed"].append({"litter_id": litter.get("id"), "error": str(e)})
+                # Nothing to generate until the litter gets a date; do not retry on resume
+                done.append(litter["id"])
+
+        missing = self._claim(plan)
+        created = self._write(missing)
+        self.checkpoint.mark_litters(done)
+
+        with self._stats_lock:
+            self.stats["litters"] += len(litters)
+            self.stats["created"] += created
+            self.stats["existing"] += len(plan) - len(missing)
+
+    def _birthdays(self, dogs: List[Dict[str, Any]], events: List[Dict[str, Any]]) -> None:
+        has_series = set()
+        legacy: Dict[str, List[Dict[str, Any]]] = {}
+        for event in events:
+            if event.get("related_type") != "dog":
+                continue
+            if is_birthday_series(event):
+                has_series.add(str(event.get("related_id")))
+            elif is_legacy_birthday(event):
+                legacy.setdefault(str(event.get("related_id")), []).append(event)
+
+        planned: List[Dict[str, Any]] = []
+        migrations: List[Tuple[Any, Dict[str, Any]]] = []
+        removals: List[Any] = []
+        for dog in dogs:
+            dog_id = str(dog.get("id"))
+            old = legacy.get(dog_id, [])
+            if dog_id in has_series:
+                # The series already covers these dates
+                removals.extend(row["id"] for row in old)
+                continue
+            if dog.get("status") != "Active":
+                continue
+            event = birthday_event(dog)
+            if event is None:
+                continue
+            if old:
+                # Convert the legacy row into the series, as generate_birthday_events does
+                migrations.append((old[0]["id"], event))
+                removals.extend(row["id"] for row in old[1:])
+            else:
+                planned.append(event)
+
+        created = 0
+        for batch in _chunks(self._claim(planned), self.batch_size):
+            created += self._write(batch)
+        if not self.dry_run:
+            for event_id, event in migrations:
+                self.db.update("events", event_id, event)
+            for event_id in removals:
+                self.db.delete("events", event_id)
+        self.checkpoint.mark_birthdays()
+        with self._stats_lock:
+            self.stats["birthdays_created"] = created
+            self.stats["birthdays_migrated"] = len(migrations)
+            self.stats["legacy_birthdays_removed"] = len(removals)
+
+    def run(self, litters_only: bool = False, birthdays_only: bool = False) -> Dict[str, Any]:
+        """Run the rebuild and return its statistics"""
+        if self.resume:
+            self.checkpoint.load()
+
+        litters = list(self.db.scan("litters"))
+        dogs = list(self.db.scan("dogs"))
+        events = list(self.db.scan("events"))
+        self._keys = {idempotency_key(event) for event in events}
+        dogs_by_id = {str(dog["id"]): dog for dog in dogs if dog.get("id") is not None}
+        self.log(f"Loaded {len(litters)} litters, {len(dogs)} dogs and {len(events)} events")
+
+        pending = [litter for litter in litters if str(litter.get("id")) not in self.checkpoint.litters_done]
+        self.stats["litters_skipped"] = len(litters) - len(pending)
+
+        if not birthdays_only and pending:
+            batches = _chunks(pending, self.batch_size)
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                futures = {pool.submit(self._litter_batch, batch, dogs_by_id): batch for batch in batches}
+                for done, future in enumerate(as_completed(futures), 1):
+                    batch = futures[future]
+                    try:
+                        future.result()
+                    except Exception as e:
+                        # The batch stays out of the checkpoint and is retried by --resume
+                        with self._stats_lock:
+                            self.stats["failed"].extend(
+                                {"litter_id": litter.get("id"), "error": str(e)} for litter in batch
+                            )
+                        debug_log(f"EventRebuilder: batch failed: {str(e)}")
+                    self.log(f"Litter batches: {done}/{len(batches)}")
+
+        if not litters_only and not self.checkpoint.birthdays_done:
+            self._birthdays(dogs, events)
+
+        write_failures = [failure for failure in self.stats["failed"]
+                          if str(failure["litter_id"]) not in self.checkpoint.litters_done]
+        if not write_failures and not self.dry_run:
+            self.checkpoint.clear()
+
+        self.log(
+            f"Created {self.stats['created']} litter events and {self.stats['birthdays_created']} birthday "
+            f"series, migrated {self.stats['birthdays_migrated']} legacy birthdays "
+            f"({self.stats['existing']} already existed, {self.stats['litters_skipped']} litters "
+            f"skipped from checkpoint, {len(self.stats['failed'])} failures)"
+        )
+        return self.stats
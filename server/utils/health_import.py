@@ -0,0 +1,343 @@
+"""
+health_import.py
+
+Bulk import of vaccination and weight records from vet spreadsheet exports.
+
+Rows are streamed from the uploaded CSV/XLSX file and handled in chunks: each
+chunk is validated column by column (dates go through a memoised parser, since
+vet exports repeat the same handful of dates), dogs and puppies are resolved
+from their microchip numbers using a lookup built once per import, and the
+valid rows of each chunk are written with one bulk insert per table. The
+result is a per-row error report alongside the counts of imported records.
+"""
+
+import csv
+import datetime
+import io
+import os
+from functools import lru_cache
+from itertools import islice
+from typing import Any, Dict, IO, Iterator, List, Optional
+
+from server.database.db_interface import DatabaseInterface
+from server.config import debug_log
+
+RECORD_VACCINATION = "vaccination"
+RECORD_WEIGHT = "weight"
+
+TABLES = {
+    RECORD_VACCINATION: "vaccinations",
+    RECORD_WEIGHT: "weight_records",
+}
+
+# Header spellings seen in vet exports, mapped to our column names
+COLUMN_ALIASES = {
+    "microchip_number": "microchip",
+    "microchip_no": "microchip",
+    "chip": "microchip",
+    "chip_number": "microchip",
+    "type": "record_type",
+    "vaccine": "vaccine_name",
+    "vaccination": "vaccine_name",
+    "date_given": "administration_date",
+    "date_administered": "administration_date",
+    "administered": "administration_date",
+    "next_due": "next_due_date",
+    "due_date": "next_due_date",
+    "expires": "expiration_date",
+    "expiry_date": "expiration_date",
+    "lot": "lot_number",
+    "vet": "administered_by",
+    "veterinarian": "administered_by",
+    "weight_date": "measurement_date",
+    "weighed_on": "measurement_date",
+    "weight_unit": "unit",
+}
+
+REQUIRED_FIELDS = {
+    RECORD_VACCINATION: ["vaccine_name", "administration_date"],
+    RECORD_WEIGHT: ["weight", "measurement_date"],
+}
+
+DATE_FIELDS = {
+    RECORD_VACCINATION: ["administration_date", "expiration_date", "next_due_date"],
+    RECORD_WEIGHT: ["measurement_date"],
+}
+
+TEXT_FIELDS = {
+    RECORD_VACCINATION: ["vaccine_name", "lot_number", "administered_by", "notes"],
+    RECORD_WEIGHT: ["unit", "notes"],
+}
+
+DATE_FORMATS = ["%Y-%m-%d", "%m/%d/%Y", "%m/%d/%y", "%Y/%m/%d", "%d.%m.%Y", "%d-%b-%Y", "%b %d, %Y"]
+
+CHUNK_SIZE = 500
+
+
+class ImportFormatError(Exception):
+    """Raised when the uploaded file cannot be read as a spreadsheet"""
+    pass
+
+
+@lru_cache(maxsize=4096)
+def parse_date(value: str) -> Optional[str]:
+    """Parse a spreadsheet date into an ISO date string (memoised per distinct value)"""
+    value = value.strip()
+    if not value:
+        return None
+
+    try:
+        return datetime.datetime.fromisoformat(value.replace('Z', '+00:00')).date().isoformat()
+    except ValueError:
+        pass
+
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, fmt).date().isoformat()
+        except ValueError:
+            continue
+    raise ValueError(f"unrecognised date '{value}'")
+
+
+def parse_weight(value: str) -> float:
+    """Parse a spreadsheet weight, accepting thousands separators and decimal commas"""
+    value = value.replace(" ", "").replace("\u00a0", "")
+    if "," in value and "." in value:
+        # Whichever separator comes last is the decimal mark, the other groups thousands
+        thousands = "," if value.rfind(",") < value.rfind(".") else "."
+        value = value.replace(thousands, "")
+    return float(value.replace(",", "."))
+
+
+def normalize_header(header: Any) -> str:
+    """Lowercase a header and map known aliases to our column names"""
+    name = str(header or "").strip().lower().replace(" ", "_").replace("-", "_")
+    return COLUMN_ALIASES.get(name, name)
+
+
+def iter_rows(stream: IO, filename: str) -> Iterator[Dict[str, str]]:
+    """Stream rows from a CSV or XLSX upload as dicts keyed by normalised headers"""
+    ext = os.path.splitext(filename or "")[1].lower()
+
+    if ext in (".xlsx", ".xlsm"):
+        try:
+            from openpyxl import load_workbook
+        except ImportError:
+            raise ImportFormatError("XLSX import requires the openpyxl package; upload a CSV instead")
+
+        try:
+            workbook = load_workbook(stream, read_only=True, data_only=True)
+        except Exception as e:
+            raise ImportFormatError(f"Could not read spreadsheet: {str(e)}")
+
+        rows = workbook.active.iter_rows(values_only=True)
+        headers = [normalize_header(h) for h in next(rows, [])]
+        for values in rows:
+            if values is None or all(v is None for v in values):
+                continue
+            yield {
+                header: _cell_to_text(value)
+                for header, value in zip(headers, values) if header
+            }
+        workbook.close()
+        return
+
+    if ext not in (".csv", ".txt", ""):
+        raise ImportFormatError(f"Unsupported file type '{ext}'; upload a CSV or XLSX file")
+
+    text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+    reader = csv.reader(text)
+    headers = [normalize_header(h) for h in next(reader, [])]
+    for values in reader:
+        if not any(v.strip() for v in values):
+            continue
+        yield {header: value for header, value in zip(headers, values) if header}
+
+
+def _cell_to_text(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return str(value)
+
+
+class HealthRecordImporter:
+    """Validates spreadsheet rows and bulk-inserts them into the health tables"""
+
+    def __init__(self, db: DatabaseInterface, default_record_type: Optional[str] = None,
+                 dry_run: bool = False, chunk_size: int = CHUNK_SIZE):
+        self.db = db
+        self.default_record_type = default_record_type
+        self.dry_run = dry_run
+        self.chunk_size = chunk_size
+        self._microchips: Optional[Dict[str, Dict[str, Any]]] = None
+
+    def _microchip_index(self) -> Dict[str, Dict[str, Any]]:
+        """Build microchip -> {dog_id|puppy_id} once per import"""
+        if self._microchips is None:
+            index = {}
+            for table, key in (("puppies", "puppy_id"), ("dogs", "dog_id")):
+                try:
+                    records = self.db.find_by_field_values(table, {})
+                except Exception as e:
+                    debug_log(f"Health import: could not load {table}: {str(e)}")
+                    continue
+                for record in records or []:
+                    chip = str(record.get("microchip") or "").strip()
+                    if chip:
+                        # Dogs win over puppy records sharing a chip (a kept puppy becomes a dog)
+                        index[chip] = {key: record["id"]}
+            self._microchips = index
+        return self._microchips
+
+    def run(self, rows: Iterator[Dict[str, str]]) -> Dict[str, Any]:
+        """Import all rows and return the report"""
+        report = {
+            "total_rows": 0,
+            "imported": {table: 0 for table in TABLES.values()},
+            "errors": [],
+            "dry_run": self.dry_run,
+        }
+        created_vaccinations: List[Dict[str, Any]] = []
+
+        row_number = 1  # header row
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                break
+
+            numbers = list(range(row_number + 1, row_number + 1 + len(chunk)))
+            row_number += len(chunk)
+            report["total_rows"] += len(chunk)
+
+            valid, errors = self._validate_chunk(chunk, numbers)
+            report["errors"].extend(errors)
+
+            for record_type, records in valid.items():
+                if not records:
+                    continue
+                table = TABLES[record_type]
+                if self.dry_run:
+                    report["imported"][table] += len(records)
+                    continue
+                try:
+                    created = self.db.create_many(table, [record for _number, record in records])
+                except Exception as e:
+                    debug_log(f"Health import: bulk insert into {table} failed: {str(e)}")
+                    report["errors"].extend(
+                        {"row": number, "errors": [f"Insert failed: {str(e)}"]}
+                        for number, _record in records
+                    )
+                    continue
+                report["imported"][table] += len(created)
+                if record_type == RECORD_VACCINATION:
+                    created_vaccinations.extend(created)
+
+        report["errors"].sort(key=lambda error: error["row"])
+        report["created_vaccinations"] = created_vaccinations
+        return report
+
+    def _validate_chunk(self, chunk: List[Dict[str, str]], numbers: List[int]):
+        """Validate a chunk column by column; returns (valid records by type, errors)"""
+        size = len(chunk)
+        row_errors: List[List[str]] = [[] for _ in range(size)]
+
+        # Resolve the record type of every row
+        types = []
+        for index, row in enumerate(chunk):
+            record_type = (row.get("record_type") or self.default_record_type or "").strip().lower()
+            if record_type in ("vaccine", "vaccinations"):
+                record_type = RECORD_VACCINATION
+            elif record_type in ("weights", "weight_record", "weight_records"):
+                record_type = RECORD_WEIGHT
+            elif not record_type:
+                if (row.get("vaccine_name") or "").strip():
+                    record_type = RECORD_VACCINATION
+                elif (row.get("weight") or "").strip():
+                    record_type = RECORD_WEIGHT
+            if record_type not in TABLES:
+                row_errors[index].append("Could not determine record type (vaccination or weight)")
+                record_type = None
+            types.append(record_type)
+
+        records: List[Dict[str, Any]] = [{} for _ in range(size)]
+
+        # Subject resolution: explicit ids first, then microchip lookup
+        microchips = None
+        for index, row in enumerate(chunk):
+            for key in ("dog_id", "puppy_id"):
+                value = (row.get(key) or "").strip()
+                if value:
+                    try:
+                        records[index][key] = int(value)
+                    except ValueError:
+                        row_errors[index].append(f"{key} must be an integer")
+            if "dog_id" in records[index] or "puppy_id" in records[index]:
+                continue
+
+            chip = (row.get("microchip") or "").strip()
+            if not chip:
+                row_errors[index].append("Row needs a microchip, dog_id or puppy_id")
+                continue
+            if microchips is None:
+                microchips = self._microchip_index()
+            subject = microchips.get(chip)
+            if subject is None:
+                row_errors[index].append(f"Unknown microchip '{chip}'")
+            else:
+                records[index].update(subject)
+
+        # Column-wise checks per record type
+        for record_type in TABLES:
+            indexes = [i for i, t in enumerate(types) if t == record_type]
+            if not indexes:
+                continue
+
+            for field in REQUIRED_FIELDS[record_type]:
+                for i in indexes:
+                    if not (chunk[i].get(field) or "").strip():
+                        row_errors[i].append(f"Missing required field: {field}")
+
+            for field in DATE_FIELDS[record_type]:
+                for i in indexes:
+                    raw = chunk[i].get(field)
+                    if raw is None or not raw.strip():
+                        continue
+                    try:
+                        records[i][field] = parse_date(raw)
+                    except ValueError as e:
+                        row_errors[i].append(f"{field}: {str(e)}")
+
+            for field in TEXT_FIELDS[record_type]:
+                for i in indexes:
+                    value = (chunk[i].get(field) or "").strip()
+                    if value:
+                        records[i][field] = value
+
+            if record_type == RECORD_WEIGHT:
+                for i in indexes:
+                    raw = (chunk[i].get("weight") or "").strip()
+                    if not raw:
+                        continue
+                    try:
+                        weight = parse_weight(raw)
+                        if weight <= 0:
+                            raise ValueError
+                        records[i]["weight"] = weight
+                    except ValueError:
+                        row_errors[i].append(f"weight: '{raw}' is not a positive number")
+
+        now = datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+        valid = {record_type: [] for record_type in TABLES}
+        errors = []
+        for i in range(size):
+            if row_errors[i]:
+                errors.append({"row": numbers[i], "errors": row_errors[i]})
+                continue
+            records[i]["created_at"] = now
+            records[i]["updated_at"] = now
+            valid[types[i]].append((numbers[i], records[i]))
+
+        return valid, errors
@@ -0,0 +1,219 @@
+"""
+health_reports.py
+
+Analytics reports over the columnar health snapshot.
+
+Every report scans the memory-mapped snapshot columns directly and groups by
+dictionary code, so even large historical reports never touch the live
+database or materialise row dicts.
+"""
+
+import datetime
+import math
+from collections import defaultdict
+from typing import Any, Callable, Dict, Optional, Sequence
+
+from .columnar_snapshot import (
+    ColumnarSnapshotStore, SnapshotTable, NULL_CODE, NULL_DATE, date_to_day, day_to_date
+)
+
+
+def _selected_rows(table: SnapshotTable, date_column: str,
+                   start: Optional[str], end: Optional[str]) -> Sequence[int]:
+    """Row indexes, or a filtered list of them when a date range is given"""
+    rows = range(table.rows)
+    column = table.column(date_column)
+    if column is None or (not start and not end):
+        return rows
+
+    days = column.values
+    low = date_to_day(start) if start else None
+    high = date_to_day(end) if end else None
+    return [
+        i for i in rows
+        if days[i] != NULL_DATE
+        and (low is None or days[i] >= low)
+        and (high is None or days[i] <= high)
+    ]
+
+
+def _count_by(table: SnapshotTable, column_name: str, rows) -> Dict[str, int]:
+    """Count rows per value of a dictionary-encoded column"""
+    column = table.column(column_name)
+    if column is None:
+        return {}
+    if column.dictionary is None:
+        counts = defaultdict(int)
+        for i in rows:
+            counts[str(column.decode(i))] += 1
+        return dict(counts)
+
+    codes = column.values
+    counts = [0] * (len(column.dictionary) + 1)
+    for i in rows:
+        counts[codes[i]] += 1  # NULL_CODE (-1) lands in the last slot
+    result = {value: counts[code] for code, value in enumerate(column.dictionary) if counts[code]}
+    if counts[NULL_CODE]:
+        result["unknown"] = counts[NULL_CODE]
+    return result
+
+
+def _count_by_year(table: SnapshotTable, date_column: str, rows) -> Dict[str, int]:
+    column = table.column(date_column)
+    if column is None:
+        return {}
+    days = column.values
+    counts = defaultdict(int)
+    for i in rows:
+        if days[i] != NULL_DATE:
+            counts[str(day_to_date(days[i]).year)] += 1
+    return dict(sorted(counts.items()))
+
+
+def _subject_reader(table: SnapshotTable):
+    """Per-row subject label ('dog:<id>' / 'puppy:<id>') readers"""
+    readers = []
+    for field, prefix in (("dog_id", "dog"), ("puppy_id", "puppy")):
+        column = table.column(field)
+        if column is not None:
+            readers.append((prefix, column))
+
+    def subject(i: int) -> Optional[str]:
+        for prefix, column in readers:
+            value = column.decode(i)
+            if value is not None:
+                if isinstance(value, float) and value.is_integer():
+                    value = int(value)
+                return f"{prefix}:{value}"
+        return None
+
+    return subject
+
+
+def vaccination_report(store: ColumnarSnapshotStore, start: Optional[str] = None,
+                       end: Optional[str] = None) -> Dict[str, Any]:
+    """Vaccinations administered per vaccine and per year, plus due/overdue totals"""
+    table = store.table("vaccinations")
+    if table is None:
+        return {"total": 0}
+
+    rows = _selected_rows(table, "administration_date", start, end)
+    today = date_to_day(datetime.date.today())
+    due_soon = overdue = 0
+    next_due = table.column("next_due_date")
+    if next_due is not None and next_due.type == "date":
+        days = next_due.values
+        for i in rows:
+            if days[i] == NULL_DATE:
+                continue
+            if days[i] < today:
+                overdue += 1
+            elif days[i] <= today + 30:
+                due_soon += 1
+
+    return {
+        "total": len(rows),
+        "by_vaccine": _count_by(table, "vaccine_name", rows),
+        "by_year": _count_by_year(table, "administration_date", rows),
+        "due_next_30_days": due_soon,
+        "overdue": overdue,
+    }
+
+
+def weight_report(store: ColumnarSnapshotStore, start: Optional[str] = None,
+                  end: Optional[str] = None) -> Dict[str, Any]:
+    """Weight statistics and latest measurement per dog/puppy"""
+    table = store.table("weight_records")
+    if table is None or table.column("weight") is None:
+        return {"total": 0, "subjects": {}}
+
+    rows = _selected_rows(table, "measurement_date", start, end)
+    weights = table.column("weight").values
+    date_column = table.column("measurement_date")
+    days = date_column.values if date_column is not None else None
+    subject_of = _subject_reader(table)
+
+    stats: Dict[str, Dict[str, Any]] = {}
+    for i in rows:
+        weight = weights[i]
+        subject = subject_of(i)
+        if subject is None or math.isnan(weight):
+            continue
+        day = days[i] if days is not None else NULL_DATE
+        entry = stats.get(subject)
+        if entry is None:
+            stats[subject] = {"count": 1, "min": weight, "max": weight, "sum": weight,
+                              "latest": weight, "latest_day": day}
+            continue
+        entry["count"] += 1
+        entry["sum"] += weight
+        entry["min"] = min(entry["min"], weight)
+        entry["max"] = max(entry["max"], weight)
+        if day >= entry["latest_day"]:
+            entry["latest"], entry["latest_day"] = weight, day
+
+    subjects = {}
+    for subject, entry in stats.items():
+        latest_date = day_to_date(entry["latest_day"])
+        subjects[subject] = {
+            "count": entry["count"],
+            "min": entry["min"],
+            "max": entry["max"],
+            "average": round(entry["sum"] / entry["count"], 2),
+            "latest": entry["latest"],
+            "latest_date": latest_date.isoformat() if latest_date else None,
+        }
+    return {"total": len(rows), "subjects": subjects}
+
+
+def medication_report(store: ColumnarSnapshotStore, start: Optional[str] = None,
+                      end: Optional[str] = None) -> Dict[str, Any]:
+    """Medication courses per medication and how many are still running"""
+    table = store.table("medication_records")
+    if table is None:
+        return {"total": 0}
+
+    rows = _selected_rows(table, "start_date", start, end)
+    today = date_to_day(datetime.date.today())
+    active = 0
+    end_column = table.column("end_date")
+    if end_column is None:
+        active = len(rows)
+    elif end_column.type == "date":
+        days = end_column.values
+        active = sum(1 for i in rows if days[i] == NULL_DATE or days[i] >= today)
+    else:
+        # No end dates recorded at all, so every course is open-ended
+        active = sum(1 for i in rows if end_column.decode(i) is None)
+
+    name_column = "medication_name" if "medication_name" in table else "name"
+    return {
+        "total": len(rows),
+        "by_medication": _count_by(table, name_column, rows),
+        "active": active,
+    }
+
+
+def condition_report(store: ColumnarSnapshotStore, start: Optional[str] = None,
+                     end: Optional[str] = None) -> Dict[str, Any]:
+    """Diagnosed conditions per condition and per status"""
+    table = store.table("health_conditions")
+    if table is None:
+        return {"total": 0}
+
+    rows = _selected_rows(table, "diagnosis_date", start, end)
+    name_column = "condition_name" if "condition_name" in table else "name"
+    return {
+        "total": len(rows),
+        "by_condition": _count_by(table, name_column, rows),
+        "by_status": _count_by(table, "status", rows),
+        "by_year": _count_by_year(table, "diagnosis_date", rows),
+    }
+
+
+REPORTS: Dict[str, Callable[..., Dict[str, Any]]] = {
+    "vaccinations": vaccination_report,
+    "weights": weight_report,
+    "medications": medication_report,
+    "conditions": condition_report,
+}
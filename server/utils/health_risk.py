@@ -0,0 +1,330 @@
+"""
+health_risk.py
+
+Hereditary health risk matching for the dogs in the program.
+
+Condition templates are indexed by breed and by condition (template id, and
+breed plus normalised condition name), diagnosed conditions are indexed by dog, and the
+pedigree is indexed by sire/dam so that every dog can be evaluated in a single
+batch pass without per-dog queries. Computed summaries are cached per dog and
+invalidated by the health and dogs endpoints when conditions, templates or
+pedigrees change.
+"""
+
+import threading
+import weakref
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from server.database.db_interface import DatabaseInterface
+from server.config import debug_log
+
+# How much a diagnosis counts towards a dog's risk, by how closely related the affected dog is
+RELATION_WEIGHTS = {
+    "self": 1.0,
+    "parent": 0.5,
+    "grandparent": 0.25,
+}
+BREED_PREDISPOSITION_WEIGHT = 0.1
+
+RISK_LEVELS = [(1.0, "high"), (0.5, "moderate"), (0.0, "low")]
+
+
+def condition_key(name: Any) -> str:
+    """Normalise a condition name so templates and diagnoses can be matched"""
+    return " ".join(str(name or "").lower().split())
+
+
+class HealthRiskEngine:
+    """Matches breed condition templates against each dog's own and family history"""
+
+    def __init__(self, db: DatabaseInterface):
+        self.db = db
+        self._lock = threading.RLock()
+        self.loaded = False
+
+        self._templates: Dict[str, Dict[str, Any]] = {}
+        self._templates_by_breed: Dict[Any, Dict[str, Dict[str, Any]]] = defaultdict(dict)
+        self._templates_by_key: Dict[tuple, Dict[str, Any]] = {}
+
+        self._dogs: Dict[Any, Dict[str, Any]] = {}
+        self._children: Dict[Any, Set[Any]] = defaultdict(set)
+
+        self._conditions: Dict[str, Dict[str, Any]] = {}
+        self._conditions_by_dog: Dict[Any, Set[str]] = defaultdict(set)
+
+        self._summaries: Dict[Any, Dict[str, Any]] = {}
+
+    # ----- Loading -----
+
+    def load(self) -> None:
+        """(Re)build every index from the database and drop cached summaries"""
+        with self._lock:
+            self._load_templates()
+            self._load_dogs()
+
+            self._conditions = {}
+            self._conditions_by_dog = defaultdict(set)
+            for condition in self._fetch("health_conditions"):
+                self._index_condition(condition)
+
+            self._summaries = {}
+            self.loaded = True
+            debug_log(f"HealthRiskEngine: indexed {len(self._templates)} templates, "
+                      f"{len(self._dogs)} dogs, {len(self._conditions)} conditions")
+
+    def _fetch(self, table: str) -> List[Dict[str, Any]]:
+        try:
+            return list(self.db.scan(table))
+        except Exception as e:
+            debug_log(f"HealthRiskEngine: could not load {table}: {str(e)}")
+            return []
+
+    def _load_templates(self) -> None:
+        self._templates = {}
+        self._templates_by_breed = defaultdict(dict)
+        self._templates_by_key = {}
+        for template in self._fetch("health_condition_templates"):
+            self._index_template(template)
+
+    def _load_dogs(self) -> None:
+        self._dogs = {}
+        self._children = defaultdict(set)
+        for dog in self._fetch("dogs"):
+            self._index_dog(dog)
+
+    def _ensure_loaded(self) -> None:
+        if not self.loaded:
+            self.load()
+
+    def _index_dog(self, dog: Dict[str, Any]) -> None:
+        self._dogs[dog.get("id")] = dog
+        for parent in ("sire_id", "dam_id"):
+            if dog.get(parent):
+                self._children[dog[parent]].add(dog.get("id"))
+
+    def _unindex_dog(self, dog_id: Any) -> Optional[Dict[str, Any]]:
+        dog = self._dogs.pop(dog_id, None)
+        if dog is not None:
+            for parent in ("sire_id", "dam_id"):
+                if dog.get(parent):
+                    self._children[dog[parent]].discard(dog_id)
+        return dog
+
+    def _index_template(self, template: Dict[str, Any]) -> None:
+        template_id = str(template.get("id"))
+        key = condition_key(template.get("condition_name") or template.get("name"))
+        self._templates[template_id] = template
+        self._templates_by_breed[template.get("breed_id")][template_id] = template
+        if key:
+            self._templates_by_key[(template.get("breed_id"), key)] = template
+
+    def _unindex_template(self, template_id: Any) -> Optional[Dict[str, Any]]:
+        template = self._templates.pop(str(template_id), None)
+        if template is not None:
+            self._templates_by_breed[template.get("breed_id")].pop(str(template_id), None)
+            key = (template.get("breed_id"),
+                   condition_key(template.get("condition_name") or template.get("name")))
+            if self._templates_by_key.get(key) is template:
+                del self._templates_by_key[key]
+        return template
+
+    def _index_condition(self, condition: Dict[str, Any]) -> None:
+        if condition.get("id") is None or not condition.get("dog_id"):
+            return
+        self._conditions[str(condition["id"])] = condition
+        self._conditions_by_dog[condition["dog_id"]].add(str(condition["id"]))
+
+    def _unindex_condition(self, condition_id: Any) -> Optional[Dict[str, Any]]:
+        condition = self._conditions.pop(str(condition_id), None)
+        if condition is not None:
+            self._conditions_by_dog[condition.get("dog_id")].discard(str(condition_id))
+        return condition
+
+    # ----- Invalidation hooks -----
+
+    def _drop_lineage(self, dog_ids: Iterable[Any]) -> None:
+        """Drop cached summaries of the given dogs and their children and grandchildren"""
+        pending = list(dog_ids)
+        for _generation in range(len(RELATION_WEIGHTS)):
+            descendants = []
+            for dog_id in pending:
+                if dog_id is None:
+                    continue
+                self._summaries.pop(dog_id, None)
+                descendants.extend(self._children.get(dog_id, ()))
+            pending = descendants
+
+    def upsert_condition(self, condition: Optional[Dict[str, Any]]) -> None:
+        """Track a created or updated health condition"""
+        if not condition or condition.get("id") is None:
+            return
+        with self._lock:
+            if not self.loaded:
+                return
+            previous = self._unindex_condition(condition["id"])
+            self._index_condition(condition)
+            self._drop_lineage([condition.get("dog_id"), previous and previous.get("dog_id")])
+
+    def remove_condition(self, condition_id: Any) -> None:
+        """Stop tracking a deleted health condition"""
+        with self._lock:
+            previous = self._unindex_condition(condition_id)
+            if previous is not None:
+                self._drop_lineage([previous.get("dog_id")])
+
+    def upsert_template(self, template: Optional[Dict[str, Any]]) -> None:
+        """Track a created or updated condition template"""
+        if not template or template.get("id") is None:
+            return
+        with self._lock:
+            if not self.loaded:
+                return
+            self._unindex_template(template["id"])
+            self._index_template(template)
+            # Templates change what every diagnosis matches, so start over
+            self._summaries = {}
+
+    def remove_template(self, template_id: Any) -> None:
+        """Stop tracking a deleted condition template"""
+        with self._lock:
+            if self._unindex_template(template_id) is not None:
+                self._summaries = {}
+
+    def upsert_dog(self, dog: Optional[Dict[str, Any]]) -> None:
+        """Track a created or updated dog (breed or parents may have changed)"""
+        if not dog or dog.get("id") is None:
+            return
+        with self._lock:
+            if not self.loaded:
+                return
+            self._unindex_dog(dog["id"])
+            self._index_dog(dog)
+            self._drop_lineage([dog["id"]])
+
+    def remove_dog(self, dog_id: Any) -> None:
+        """Stop tracking a deleted dog"""
+        with self._lock:
+            if self._unindex_dog(dog_id) is not None:
+                self._drop_lineage([dog_id])
+
+    # ----- Evaluation -----
+
+    def summary_for(self, dog_id: Any) -> Optional[Dict[str, Any]]:
+        """Return the cached risk summary of one dog, computing it if needed"""
+        with self._lock:
+            self._ensure_loaded()
+            if dog_id not in self._dogs:
+                return None
+            summary = self._summaries.get(dog_id)
+            if summary is None:
+                summary = self._evaluate(self._dogs[dog_id])
+                self._summaries[dog_id] = summary
+            return summary
+
+    def evaluate_all(self) -> List[Dict[str, Any]]:
+        """Return risk summaries for every dog, evaluating only those not cached"""
+        with self._lock:
+            self._ensure_loaded()
+            summaries = []
+            for dog_id, dog in self._dogs.items():
+                summary = self._summaries.get(dog_id)
+                if summary is None:
+                    summary = self._evaluate(dog)
+                    self._summaries[dog_id] = summary
+                summaries.append(summary)
+            return summaries
+
+    def _relatives(self, dog: Dict[str, Any]) -> List[tuple]:
+        """(dog_id, relation) for the dog, its parents and grandparents"""
+        relatives = [(dog.get("id"), "self")]
+        for parent_field in ("sire_id", "dam_id"):
+            parent_id = dog.get(parent_field)
+            if not parent_id:
+                continue
+            relatives.append((parent_id, "parent"))
+            parent = self._dogs.get(parent_id) or {}
+            for grandparent_field in ("sire_id", "dam_id"):
+                if parent.get(grandparent_field):
+                    relatives.append((parent[grandparent_field], "grandparent"))
+        return relatives
+
+    def _match_template(self, condition: Dict[str, Any], breed_id: Any) -> Optional[Dict[str, Any]]:
+        """The template a diagnosis refers to, by id or by name among the breed's templates"""
+        template_id = condition.get("template_id")
+        if template_id is not None and str(template_id) in self._templates:
+            return self._templates[str(template_id)]
+        return self._templates_by_key.get(
+            (breed_id, condition_key(condition.get("condition_name") or condition.get("name")))
+        )
+
+    def _evaluate(self, dog: Dict[str, Any]) -> Dict[str, Any]:
+        matches: Dict[str, Dict[str, Any]] = {}
+
+        # Breed predispositions first, so family history can upgrade them
+        breed_templates = self._templates_by_breed.get(dog.get("breed_id"), {}) if dog.get("breed_id") else {}
+        for template_id, template in breed_templates.items():
+            matches[f"template:{template_id}"] = {
+                "template_id": template.get("id"),
+                "condition_name": template.get("condition_name") or template.get("name"),
+                "status": "breed_predisposition",
+                "score": BREED_PREDISPOSITION_WEIGHT,
+                "affected_relatives": [],
+            }
+
+        for relative_id, relation in self._relatives(dog):
+            for condition_id in self._conditions_by_dog.get(relative_id, ()):
+                condition = self._conditions[condition_id]
+                template = self._match_template(condition, dog.get("breed_id"))
+                if template is not None:
+                    key = f"template:{template.get('id')}"
+                    name = template.get("condition_name") or template.get("name")
+                elif relation == "self":
+                    # Untemplated diagnoses are only reported for the dog itself
+                    key = f"condition:{condition_key(condition.get('condition_name') or condition.get('name'))}"
+                    name = condition.get("condition_name") or condition.get("name")
+                else:
+                    continue
+
+                match = matches.setdefault(key, {
+                    "template_id": template.get("id") if template else None,
+                    "condition_name": name,
+                    "status": "breed_predisposition",
+                    "score": 0.0,
+                    "affected_relatives": [],
+                })
+                weight = RELATION_WEIGHTS[relation]
+                if relation == "self":
+                    match["status"] = "affected"
+                elif match["status"] != "affected":
+                    match["status"] = "family_history"
+                    match["affected_relatives"].append({"dog_id": relative_id, "relation": relation})
+                match["score"] = max(match["score"], weight)
+
+        conditions = sorted(matches.values(), key=lambda m: (-m["score"], str(m["condition_name"])))
+        risk_score = round(sum(m["score"] for m in conditions), 2)
+        highest = conditions[0]["score"] if conditions else 0.0
+        risk_level = next(level for threshold, level in RISK_LEVELS if highest >= threshold)
+
+        return {
+            "dog_id": dog.get("id"),
+            "call_name": dog.get("call_name"),
+            "breed_id": dog.get("breed_id"),
+            "risk_score": risk_score,
+            "risk_level": risk_level,
+            "conditions": conditions,
+        }
+
+
+_engines: "weakref.WeakKeyDictionary[Any, HealthRiskEngine]" = weakref.WeakKeyDictionary()
+_engines_lock = threading.Lock()
+
+
+def get_health_risk_engine(db: DatabaseInterface) -> HealthRiskEngine:
+    """Return the risk engine shared by every blueprint using this database"""
+    with _engines_lock:
+        engine = _engines.get(db)
+        if engine is None:
+            engine = HealthRiskEngine(db)
+            _engines[db] = engine
+        return engine
@@ -0,0 +1,259 @@
+"""
+heat_prediction.py
+
+Heat cycle forecasts for the dams in the program.
+
+Heat start dates are held as int32 day numbers (see columnar_snapshot) in one
+column sorted by dog and date, so the cycle intervals of every dam come out of
+a single pass of element-wise differences, and per-dam mean, spread and count
+are reduced from that interval column in one more pass. Each dam's next heat
+is forecast as her last recorded heat plus her mean interval, with a window of
+mean +/- WINDOW_Z standard deviations; dams with little history borrow the
+default interval and spread.
+
+Forecasts are computed once at load and cached per dog. The heats endpoints
+call upsert_heat()/remove_heat() after each write, which recomputes only the
+affected dam, so the heats API, the calendar and the dashboard read cached
+forecasts instead of re-deriving them on every request.
+"""
+
+import datetime
+import math
+import threading
+import weakref
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from server.database.db_interface import DatabaseInterface
+from server.config import debug_log
+from .columnar_snapshot import date_to_day, day_to_date, NULL_DATE
+
+# Typical interval between heats, used until a dam has her own history
+DEFAULT_CYCLE_DAYS = 180
+DEFAULT_SPREAD_DAYS = 21
+
+# Intervals outside this range are split heats or unrecorded cycles and are ignored
+MIN_CYCLE_DAYS = 90
+MAX_CYCLE_DAYS = 400
+
+# Only the most recent intervals count, since cycles drift with age
+RECENT_INTERVALS = 6
+
+# Window half-width in standard deviations (~90% two-sided)
+WINDOW_Z = 1.645
+MIN_WINDOW_DAYS = 7
+
+CONFIDENCE_HIGH = "high"
+CONFIDENCE_MEDIUM = "medium"
+CONFIDENCE_LOW = "low"
+
+
+def heat_columns(heats: Iterable[Dict[str, Any]]) -> Tuple[List[str], array]:
+    """
+    Return (dog_ids, start_days) for heats with a dog and start date,
+    sorted by dog and then start date.
+    """
+    rows = sorted(
+        (str(heat["dog_id"]), day)
+        for heat in heats
+        if heat.get("dog_id") is not None
+        for day in [date_to_day(heat.get("start_date"))]
+        if day != NULL_DATE
+    )
+    return [dog for dog, _ in rows], array("i", (day for _, day in rows))
+
+
+def cycle_statistics(dog_ids: List[str], days: array) -> Dict[str, Dict[str, Any]]:
+    """
+    Per-dog cycle statistics from sorted (dog, start day) columns.
+
+    Returns {dog_id: {"last_day", "heats", "intervals", "mean", "std"}}; mean
+    and std are None when a dog has no usable interval.
+    """
+    count = len(days)
+    # Element-wise differences of the day column; only pairs from the same dog are intervals
+    gaps = array("i", (days[i + 1] - days[i] for i in range(count - 1)))
+    same_dog = [dog_ids[i] == dog_ids[i + 1] for i in range(count - 1)]
+
+    stats: Dict[str, Dict[str, Any]] = {}
+    start = 0
+    for end in range(1, count + 1):
+        if end < count and same_dog[end - 1]:
+            continue
+        # [start, end) is one dog's heats; its intervals are gaps[start:end - 1]
+        intervals = [gap for gap in gaps[start:end - 1] if MIN_CYCLE_DAYS <= gap <= MAX_CYCLE_DAYS]
+        intervals = intervals[-RECENT_INTERVALS:]
+        n = len(intervals)
+        mean = std = None
+        if n:
+            mean = sum(intervals) / n
+            std = math.sqrt(sum((gap - mean) ** 2 for gap in intervals) / (n - 1)) if n > 1 else None
+        stats[dog_ids[start]] = {
+            "last_day": days[end - 1],
+            "heats": end - start,
+            "intervals": n,
+            "mean": mean,
+            "std": std,
+        }
+        start = end
+    return stats
+
+
+def forecast(dog_id: str, stats: Dict[str, Any]) -> Dict[str, Any]:
+    """Next heat window for one dog from her cycle statistics"""
+    n = stats["intervals"]
+    mean = stats["mean"] if n else DEFAULT_CYCLE_DAYS
+    if n >= 2:
+        # Blend towards the default spread while history is short
+        spread = (stats["std"] * (n - 1) + DEFAULT_SPREAD_DAYS) / n
+    else:
+        spread = DEFAULT_SPREAD_DAYS
+    half_width = max(WINDOW_Z * spread, MIN_WINDOW_DAYS)
+
+    if n >= 3 and spread <= 0.1 * mean:
+        confidence = CONFIDENCE_HIGH
+    elif n >= 2:
+        confidence = CONFIDENCE_MEDIUM
+    else:
+        confidence = CONFIDENCE_LOW
+
+    last_day = stats["last_day"]
+    expected = last_day + int(round(mean))
+    return {
+        "dog_id": dog_id,
+        "last_heat_date": day_to_date(last_day).isoformat(),
+        "expected_date": day_to_date(expected).isoformat(),
+        "window_start": day_to_date(expected - int(round(half_width))).isoformat(),
+        "window_end": day_to_date(expected + int(round(half_width))).isoformat(),
+        "cycle_days": round(mean, 1),
+        "cycle_std_days": round(stats["std"], 1) if stats["std"] is not None else None,
+        "based_on_intervals": n,
+        "heats_recorded": stats["heats"],
+        "confidence": confidence,
+    }
+
+
+def forecast_event(prediction: Dict[str, Any]) -> Dict[str, Any]:
+    """Shape a forecast like a calendar event so calendar views can show it"""
+    return {
+        "id": f"heat-forecast:{prediction['dog_id']}",
+        "title": "Expected heat",
+        "event_type": "heat_forecast",
+        "start_date": prediction["window_start"],
+        "end_date": prediction["window_end"],
+        "all_day": True,
+        "related_type": "dog",
+        "related_id": prediction["dog_id"],
+        "expected_date": prediction["expected_date"],
+        "confidence": prediction["confidence"],
+    }
+
+
+class HeatPredictor:
+    """Cached next-heat forecasts per dam, kept current by the heats endpoints"""
+
+    def __init__(self, db: DatabaseInterface):
+        self.db = db
+        self._lock = threading.RLock()
+        self._heats: Dict[str, Tuple[str, int]] = {}  # heat id -> (dog id, start day)
+        self._forecasts: Dict[str, Dict[str, Any]] = {}
+        self.loaded = False
+
+    def load(self) -> None:
+        """(Re)build every forecast from the heats table in one batch"""
+        heats = self.db.find_by_field_values("heats", {}) or []
+        with self._lock:
+            self._heats = {}
+            for heat in heats:
+                self._index(heat)
+            dog_ids, days = heat_columns(heats)
+            self._forecasts = {
+                dog_id: forecast(dog_id, stats)
+                for dog_id, stats in cycle_statistics(dog_ids, days).items()
+            }
+            self.loaded = True
+        debug_log(f"HeatPredictor: forecast {len(self._forecasts)} dams from {len(self._heats)} heats")
+
+    def _index(self, heat: Dict[str, Any]) -> None:
+        day = date_to_day(heat.get("start_date"))
+        if heat.get("id") is None or heat.get("dog_id") is None or day == NULL_DATE:
+            return
+        self._heats[str(heat["id"])] = (str(heat["dog_id"]), day)
+
+    def _recompute(self, dog_id: str) -> None:
+        days = array("i", sorted(day for owner, day in self._heats.values() if owner == dog_id))
+        if not days:
+            self._forecasts.pop(dog_id, None)
+            return
+        stats = cycle_statistics([dog_id] * len(days), days)
+        self._forecasts[dog_id] = forecast(dog_id, stats[dog_id])
+
+    def _ensure_loaded(self) -> bool:
+        if not self.loaded:
+            try:
+                self.load()
+            except Exception as e:
+                debug_log(f"HeatPredictor: could not load heats: {str(e)}")
+        return self.loaded
+
+    # ----- Write hooks -----
+
+    def upsert_heat(self, heat: Optional[Dict[str, Any]]) -> None:
+        if not heat or heat.get("id") is None:
+            return
+        with self._lock:
+            if not self.loaded:
+                return
+            previous = self._heats.pop(str(heat["id"]), None)
+            self._index(heat)
+            current = self._heats.get(str(heat["id"]))
+            for dog_id in {entry[0] for entry in (previous, current) if entry is not None}:
+                self._recompute(dog_id)
+
+    def remove_heat(self, heat_id: Any) -> None:
+        with self._lock:
+            previous = self._heats.pop(str(heat_id), None)
+            if previous is not None:
+                self._recompute(previous[0])
+
+    # ----- Queries -----
+
+    def forecast_for(self, dog_id: Any) -> Optional[Dict[str, Any]]:
+        self._ensure_loaded()
+        with self._lock:
+            prediction = self._forecasts.get(str(dog_id))
+            return dict(prediction) if prediction else None
+
+    def forecasts(self) -> List[Dict[str, Any]]:
+        """Every dam's forecast, ordered by expected date"""
+        self._ensure_loaded()
+        with self._lock:
+            predictions = [dict(p) for p in self._forecasts.values()]
+        return sorted(predictions, key=lambda p: p["expected_date"])
+
+    def between(self, start: Any, end: Any) -> List[Dict[str, Any]]:
+        """Forecasts whose window overlaps [start, end], ordered by expected date"""
+        start_day, end_day = date_to_day(start), date_to_day(end)
+        if start_day == NULL_DATE or end_day == NULL_DATE:
+            raise ValueError("start and end must be valid ISO dates")
+        first, last = day_to_date(start_day).isoformat(), day_to_date(end_day).isoformat()
+        return [p for p in self.forecasts() if p["window_start"] <= last and p["window_end"] >= first]
+
+    def upcoming(self, days: int = 90, today: Optional[datetime.date] = None) -> List[Dict[str, Any]]:
+        """Forecasts whose window is still open or opens within the next days"""
+        today = today or datetime.date.today()
+        return self.between(today.isoformat(), (today + datetime.timedelta(days=days)).isoformat())
+
+
+_predictors: "weakref.WeakKeyDictionary[Any, HeatPredictor]" = weakref.WeakKeyDictionary()
+_predictors_lock = threading.Lock()
+
+
+def get_heat_predictor(db: DatabaseInterface) -> HeatPredictor:
+    """Return the predictor shared by every blueprint using this database"""
+    with _predictors_lock:
+        predictor = _predictors.get(db)
+        if predictor is None:
+            predictor = HeatPredictor(db)
+            _predictors[db] = predictor
+        return predictor
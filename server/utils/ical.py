@@ -0,0 +1,207 @@
+"""
+ical.py
+
+iCalendar (RFC 5545) rendering of calendar events for subscription feeds.
+
+Feeds are generated as a stream of text chunks: the calendar header, one
+VEVENT block per event and the footer. Rendered VEVENT blocks are cached per
+event and keyed by a fingerprint of the event row, so regenerating a feed after
+a single change only re-renders the changed events; everything else is served
+from the cache.
+
+Recurring events are emitted once with an RRULE, except series whose title or
+description carry {occurrence} placeholders (e.g. birthdays with the dog's
+age). Those cannot be expressed by an RRULE and are expanded into individual
+occurrences inside the feed window instead.
+"""
+
+import datetime
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .dates import to_datetime
+from .recurrence import parse_rule, RecurrenceRule, WEEKDAYS
+
+PRODUCT_ID = "-//Dog Breeding App//Events//EN"
+UID_DOMAIN = "dog-breeding-app"
+
+# Occurrences of placeholder series are expanded from this far back ...
+FEED_PAST = datetime.timedelta(days=365)
+# ... up to this far ahead
+FEED_FUTURE = datetime.timedelta(days=2 * 365)
+
+
+def escape_text(value: Any) -> str:
+    """Escape a TEXT property value"""
+    text = "" if value is None else str(value)
+    return (text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+                .replace("\r\n", "\\n").replace("\n", "\\n"))
+
+
+def fold(line: str) -> str:
+    """Fold a content line to 75 octets per physical line, as required by RFC 5545"""
+    encoded = line.encode("utf-8")
+    if len(encoded) <= 75:
+        return line + "\r\n"
+
+    parts = []
+    limit = 75
+    while encoded:
+        cut = min(limit, len(encoded))
+        # Never split inside a multi-byte UTF-8 sequence
+        while cut < len(encoded) and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode("utf-8"))
+        encoded = encoded[cut:]
+        limit = 74  # continuation lines start with a space
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def _format_datetime(value: datetime.datetime) -> str:
+    return value.strftime("%Y%m%dT%H%M%SZ")
+
+
+def _format_date(value: datetime.date) -> str:
+    return value.strftime("%Y%m%d")
+
+
+def rule_to_rrule(rule: RecurrenceRule) -> str:
+    parts = [f"FREQ={rule.freq}"]
+    if rule.interval != 1:
+        parts.append(f"INTERVAL={rule.interval}")
+    if rule.count is not None:
+        parts.append(f"COUNT={rule.count}")
+    if rule.until is not None:
+        parts.append(f"UNTIL={_format_datetime(rule.until)}")
+    if rule.byday:
+        parts.append("BYDAY=" + ",".join(WEEKDAYS[day] for day in rule.byday))
+    return ";".join(parts)
+
+
+def _has_placeholders(event: Dict[str, Any]) -> bool:
+    return any("{occurrence" in str(event.get(field) or "") for field in ("title", "description"))
+
+
+def _fingerprint(event: Dict[str, Any]) -> str:
+    payload = repr(sorted((key, str(value)) for key, value in event.items()))
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def render_vevent(event: Dict[str, Any], dtstamp: datetime.datetime,
+                  rule: Optional[RecurrenceRule] = None) -> str:
+    """Render one event (or occurrence) as a VEVENT block"""
+    start = to_datetime(event.get("start_date"))
+    end = to_datetime(event.get("end_date")) or start
+    if end < start:
+        end = start
+
+    uid_key = event.get("occurrence_key") or event.get("id")
+    lines = [
+        "BEGIN:VEVENT",
+        f"UID:event-{uid_key}@{UID_DOMAIN}",
+        f"DTSTAMP:{_format_datetime(dtstamp)}",
+    ]
+    if event.get("all_day", True):
+        lines.append(f"DTSTART;VALUE=DATE:{_format_date(start.date())}")
+        # DTEND is exclusive for all-day events
+        lines.append(f"DTEND;VALUE=DATE:{_format_date(end.date() + datetime.timedelta(days=1))}")
+    else:
+        lines.append(f"DTSTART:{_format_datetime(start)}")
+        lines.append(f"DTEND:{_format_datetime(end)}")
+
+    lines.append(f"SUMMARY:{escape_text(event.get('title') or 'Event')}")
+    if event.get("description"):
+        lines.append(f"DESCRIPTION:{escape_text(event['description'])}")
+    if event.get("event_type"):
+        lines.append(f"CATEGORIES:{escape_text(event['event_type'])}")
+    if event.get("status"):
+        lines.append(f"X-BREEDER-STATUS:{escape_text(event['status'])}")
+    if rule is not None:
+        lines.append(f"RRULE:{rule_to_rrule(rule)}")
+    if event.get("notify") and event.get("notify_days_before") is not None:
+        lines.extend([
+            "BEGIN:VALARM",
+            "ACTION:DISPLAY",
+            f"DESCRIPTION:{escape_text(event.get('title') or 'Event')}",
+            f"TRIGGER:-P{int(event.get('notify_days_before') or 0)}D",
+            "END:VALARM",
+        ])
+    lines.append("END:VEVENT")
+    return "".join(fold(line) for line in lines)
+
+
+class ICalRenderer:
+    """Renders feeds from event rows, re-rendering only events that changed"""
+
+    def __init__(self, max_entries: int = 20000):
+        self.max_entries = max_entries
+        self._blocks: "OrderedDict[str, Tuple[str, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.renders = 0
+
+    def _cached(self, key: str, fingerprint: str, render) -> str:
+        with self._lock:
+            cached = self._blocks.get(key)
+            if cached is not None and cached[0] == fingerprint:
+                self._blocks.move_to_end(key)
+                return cached[1]
+
+        block = render()
+        with self._lock:
+            self.renders += 1
+            self._blocks[key] = (fingerprint, block)
+            self._blocks.move_to_end(key)
+            while len(self._blocks) > self.max_entries:
+                self._blocks.popitem(last=False)
+        return block
+
+    def event_blocks(self, event: Dict[str, Any], expand_occurrences, dtstamp: datetime.datetime) -> List[str]:
+        """
+        VEVENT blocks for one stored event.
+
+        expand_occurrences(event) returns the occurrences of a placeholder series
+        inside the feed window.
+        """
+        if to_datetime(event.get("start_date")) is None:
+            return []
+        try:
+            rule = parse_rule(event.get("recurring"))
+        except ValueError:
+            rule = None
+
+        if rule is not None and _has_placeholders(event):
+            return [
+                self._cached(f"occurrence:{occurrence['occurrence_key']}", _fingerprint(occurrence),
+                             lambda occurrence=occurrence: render_vevent(occurrence, dtstamp))
+                for occurrence in expand_occurrences(event)
+            ]
+
+        return [self._cached(f"event:{event.get('id')}", _fingerprint(event),
+                             lambda: render_vevent(event, dtstamp, rule))]
+
+    def stream(self, name: str, events: Iterable[Dict[str, Any]], expand_occurrences,
+               dtstamp: Optional[datetime.datetime] = None) -> Iterator[str]:
+        """Yield the feed as text chunks: header, VEVENT blocks, footer"""
+        dtstamp = dtstamp or datetime.datetime.utcnow().replace(microsecond=0)
+        yield "".join(fold(line) for line in [
+            "BEGIN:VCALENDAR",
+            "VERSION:2.0",
+            f"PRODID:{PRODUCT_ID}",
+            "CALSCALE:GREGORIAN",
+            "METHOD:PUBLISH",
+            f"X-WR-CALNAME:{escape_text(name)}",
+            "REFRESH-INTERVAL;VALUE=DURATION:PT1H",
+        ])
+        for event in events:
+            for block in self.event_blocks(event, expand_occurrences, dtstamp):
+                yield block
+        yield "END:VCALENDAR\r\n"
+
+
+def feed_window(today: Optional[datetime.date] = None) -> Tuple[datetime.datetime, datetime.datetime]:
+    """Window in which placeholder series are expanded"""
+    today = today or datetime.date.today()
+    anchor = datetime.datetime(today.year, today.month, today.day)
+    return anchor - FEED_PAST, anchor + FEED_FUTURE
@@ -0,0 +1,317 @@
+"""
+image_derivatives.py
+
+Thumbnail, medium and large renditions of uploaded photos.
+
+Phone photos are stored as uploaded (often 5-12 MB), which is far more than a
+puppy grid needs. After an upload the photo is handed to a process pool that
+decodes it once and writes WebP and JPEG renditions at each size in
+DERIVATIVE_SIZES, largest first, each resized from the previous one. When the
+renditions are written their URLs are recorded in the photo's `derivatives`
+column as {size: {format: url}}, and list endpoints pick the size a view asks
+for with select_url().
+
+Before rendering, the same worker job normalises the photo (upright pixels,
+whitelisted EXIF, capture date, dimensions and perceptual hash; see
+image_normalization). A photo that had to be rewritten is stored as a new
+blob, and its row is moved to that blob, which releases the original. The row
+keeps the original's hash in source_hash, so uploading the same file again
+reuses the normalised blob and its renditions instead of storing and
+processing it once more.
+
+Photos are read from, and renditions written to, the "uploads" storage
+backend. On local disk the worker works on the files in place; on a remote
+backend it downloads the photo to a scratch file and uploads the renditions.
+
+Rendering needs Pillow, which is in requirements.txt. The import is guarded
+only so the module stays importable where it is missing (minimal test
+environments); there uploads work as before and photos are served at their
+original size.
+"""
+
+import concurrent.futures
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from server.database.db_interface import DatabaseInterface
+from server.config import debug_log
+from server.storage import CHUNK_SIZE, StorageBackend
+from .image_normalization import normalize_image
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # pragma: no cover - required, see requirements.txt
+    Image = None
+    ImageOps = None
+    features = None
+
+# Longest edge in pixels for each rendition
+DERIVATIVE_SIZES = {
+    "thumbnail": 320,
+    "medium": 960,
+    "large": 1920,
+}
+SIZE_ORIGINAL = "original"
+
+FORMAT_WEBP = "webp"
+FORMAT_JPEG = "jpeg"
+_EXTENSIONS = {FORMAT_WEBP: "webp", FORMAT_JPEG: "jpg"}
+_QUALITY = {FORMAT_WEBP: 80, FORMAT_JPEG: 82}
+
+# Renditions live next to the originals, under uploads/<DERIVATIVES_DIR>/
+DERIVATIVES_DIR = "derivatives"
+
+IMAGE_EXTENSIONS = {"png", "jpg", "jpeg", "gif", "webp"}
+
+
+def pillow_available() -> bool:
+    return Image is not None
+
+
+def output_formats() -> Tuple[str, ...]:
+    """Formats the installed Pillow can write"""
+    if Image is None:
+        return ()
+    if features is not None and features.check("webp"):
+        return (FORMAT_WEBP, FORMAT_JPEG)
+    return (FORMAT_JPEG,)
+
+
+def target_size(width: int, height: int, max_edge: int) -> Tuple[int, int]:
+    """Scale (width, height) so the longest edge is at most max_edge, never upscaling"""
+    longest = max(width, height)
+    if longest <= max_edge:
+        return width, height
+    scale = max_edge / float(longest)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def derivative_filename(stem: str, size: str, image_format: str) -> str:
+    return f"{stem}_{size}.{_EXTENSIONS[image_format]}"
+
+
+def render_derivatives(source_path: str, target_dir: str, stem: str,
+                       formats: Tuple[str, ...]) -> Dict[str, Dict[str, str]]:
+    """
+    Write every rendition of one image and return {size: {format: filename}}.
+
+    Runs in a worker process, so it only takes and returns plain values.
+    """
+    os.makedirs(target_dir, exist_ok=True)
+    written: Dict[str, Dict[str, str]] = {}
+
+    with Image.open(source_path) as source:
+        # JPEG can decode straight at a reduced scale, which is most of the cost
+        largest = max(DERIVATIVE_SIZES.values())
+        source.draft("RGB", (largest, largest))
+        image = ImageOps.exif_transpose(source)
+        image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+
+    for size, max_edge in sorted(DERIVATIVE_SIZES.items(), key=lambda item: -item[1]):
+        dimensions = target_size(image.width, image.height, max_edge)
+        if dimensions != (image.width, image.height):
+            image = image.resize(dimensions, Image.LANCZOS)
+        written[size] = {}
+        for image_format in formats:
+            filename = derivative_filename(stem, size, image_format)
+            rendition = image.convert("RGB") if image_format == FORMAT_JPEG and image.mode != "RGB" else image
+            rendition.save(os.path.join(target_dir, filename), image_format.upper(),
+                           quality=_QUALITY[image_format], optimize=image_format == FORMAT_JPEG)
+            written[size][image_format] = filename
+    return written
+
+
+def process_photo(storage: StorageBackend, key: str, stem: str, formats: Tuple[str, ...],
+                  render: Callable[..., Dict[str, Dict[str, str]]] = render_derivatives,
+                  normalize: Optional[Callable[..., Dict[str, Any]]] = normalize_image,
+                  incoming_dir: Optional[str] = None) -> Dict[str, Any]:
+    """
+    The worker job for one photo: normalise it, then render its renditions.
+
+    Returns {"derivatives", "metadata", "normalized"}. Renditions of a
+    rewritten photo are rendered from, and named after, the rewritten file.
+    A photo that cannot be normalised is still rendered as it is.
+    """
+    if storage.local:
+        return _process_file(storage.local_path(key), storage.local_path(DERIVATIVES_DIR), stem, formats,
+                             render, normalize, incoming_dir)
+
+    scratch = tempfile.mkdtemp(dir=incoming_dir)
+    try:
+        source_path = os.path.join(scratch, os.path.basename(key))
+        with storage.open(key) as source, open(source_path, "wb") as f:
+            shutil.copyfileobj(source, f, CHUNK_SIZE)
+        target_dir = os.path.join(scratch, DERIVATIVES_DIR)
+        result = _process_file(source_path, target_dir, stem, formats, render, normalize, incoming_dir)
+        for renditions in result["derivatives"].values():
+            for filename in renditions.values():
+                storage.put_file(f"{DERIVATIVES_DIR}/{filename}", os.path.join(target_dir, filename), move=True)
+        return result
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def _process_file(source_path: str, target_dir: str, stem: str, formats: Tuple[str, ...],
+                  render: Callable[..., Dict[str, Dict[str, str]]],
+                  normalize: Optional[Callable[..., Dict[str, Any]]],
+                  incoming_dir: Optional[str]) -> Dict[str, Any]:
+    result: Dict[str, Any] = {"metadata": {}, "normalized": None}
+    if normalize is not None:
+        try:
+            result.update(normalize(source_path, incoming_dir))
+        except Exception as e:
+            result["normalize_error"] = str(e)
+
+    normalized = result["normalized"]
+    if normalized:
+        source_path, stem = normalized["path"], normalized["content_hash"]
+    try:
+        result["derivatives"] = render(source_path, target_dir, stem, formats)
+    except Exception:
+        if normalized:
+            os.unlink(normalized["path"])
+        raise
+    return result
+
+
+def select_url(photo: Dict[str, Any], size: Optional[str], accept_webp: bool = True) -> Optional[str]:
+    """The URL of the rendition closest to size, falling back to the original"""
+    if not size or size == SIZE_ORIGINAL:
+        return photo.get("url")
+    derivatives = photo.get("derivatives") or {}
+    rendition = derivatives.get(size) or {}
+    if accept_webp and rendition.get(FORMAT_WEBP):
+        return rendition[FORMAT_WEBP]
+    return rendition.get(FORMAT_JPEG) or rendition.get(FORMAT_WEBP) or photo.get("url")
+
+
+def with_display_urls(photos, size: Optional[str], accept_webp: bool = True):
+    """Add a display_url for the requested size to each photo"""
+    for photo in photos:
+        photo["display_url"] = select_url(photo, size, accept_webp)
+    return photos
+
+
+class DerivativePipeline:
+    """Renders photo renditions in a process pool and records them on the photos rows"""
+
+    def __init__(self, db: DatabaseInterface, workers: Optional[int] = None,
+                 executor: Optional[concurrent.futures.Executor] = None,
+                 render: Callable[..., Dict[str, Dict[str, str]]] = render_derivatives,
+                 normalize: Optional[Callable[..., Dict[str, Any]]] = normalize_image):
+        self.db = db
+        self.workers = workers or int(os.getenv("IMAGE_WORKERS", max(1, (os.cpu_count() or 2) - 1)))
+        self.render = render
+        self.normalize = normalize
+        # Called with (photo_id, changes) after a photo's row is updated
+        self.on_recorded: List[Callable[[Any, Dict[str, Any]], None]] = []
+        self._executor = executor
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self) -> concurrent.futures.Executor:
+        with self._lock:
+            if self._executor is None:
+                # Spawned workers do not inherit the server's threads and connections
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    def submit(self, photo: Dict[str, Any], storage: Optional[StorageBackend] = None,
+               formats: Optional[Tuple[str, ...]] = None) -> Optional[concurrent.futures.Future]:
+        """
+        Queue normalisation and renditions for a stored photo; returns None
+        when it cannot be rendered.
+
+        storage is the backend the photo's URL points into (the blob store's
+        by default). Only content-addressed photos are rewritten; older ones
+        just get their metadata recorded.
+        """
+        from .blob_store import INCOMING_DIR, get_blob_store
+        formats = formats if formats is not None else output_formats()
+        storage = storage if storage is not None else get_blob_store(self.db).storage
+        key = storage.key_for(photo.get("url"))
+        if not formats or photo.get("id") is None or key is None:
+            return None
+        if key.rsplit(".", 1)[-1].lower() not in IMAGE_EXTENSIONS:
+            return None
+
+        stem = os.path.splitext(os.path.basename(key))[0]
+        incoming_dir = None
+        if photo.get("content_hash") or not storage.local:
+            # Rewritten photos (and downloads) are written next to the blobs they will be moved into
+            incoming_dir = os.path.join(get_blob_store(self.db).root, INCOMING_DIR)
+            os.makedirs(incoming_dir, exist_ok=True)
+        future = self.executor.submit(process_photo, storage, key, stem, formats,
+                                      self.render, self.normalize, incoming_dir)
+        future.add_done_callback(lambda done: self._record(photo, storage, done))
+        return future
+
+    def _record(self, photo: Dict[str, Any], storage: StorageBackend, future: concurrent.futures.Future) -> None:
+        photo_id = photo["id"]
+        try:
+            result = future.result()
+        except Exception as e:
+            debug_log(f"DerivativePipeline: could not render photo {photo_id}: {str(e)}")
+            return
+        if result.get("normalize_error"):
+            debug_log(f"DerivativePipeline: could not normalise photo {photo_id}: {result['normalize_error']}")
+
+        changes = dict(result.get("metadata") or {})
+        changes["derivatives"] = {
+            size: {image_format: storage.url(f"{DERIVATIVES_DIR}/{filename}")
+                   for image_format, filename in renditions.items()}
+            for size, renditions in result["derivatives"].items()
+        }
+
+        store = None
+        normalized = result.get("normalized")
+        if normalized:
+            from .blob_store import get_blob_store
+            store = get_blob_store(self.db)
+            blob = store.adopt(normalized["path"], normalized["content_hash"], normalized["extension"])
+            changes.update(url=blob["url"], content_hash=blob["content_hash"])
+            if not photo.get("source_hash"):
+                changes["source_hash"] = photo.get("content_hash")
+
+        try:
+            self.db.update("photos", photo_id, changes)
+        except Exception as e:
+            debug_log(f"DerivativePipeline: could not record renditions of photo {photo_id}: {str(e)}")
+            return
+        finally:
+            if store is not None:
+                # adopt() pinned the rewritten blob until the row points at it
+                store.unpin(changes["content_hash"])
+        for listener in self.on_recorded:
+            listener(photo_id, changes)
+
+        # The original, with its EXIF, goes once no other row uses it
+        if store is not None and photo.get("content_hash") != changes["content_hash"]:
+            from .blob_store import normalise_extension
+            store.release(photo.get("content_hash"), normalise_extension(photo["url"]))
+
+    def shutdown(self, wait: bool = True) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
+
+
+_pipelines: "weakref.WeakKeyDictionary[Any, DerivativePipeline]" = weakref.WeakKeyDictionary()
+_pipelines_lock = threading.Lock()
+
+
+def get_derivative_pipeline(db: DatabaseInterface) -> DerivativePipeline:
+    """Return the pipeline shared by every blueprint using this database"""
+    with _pipelines_lock:
+        pipeline = _pipelines.get(db)
+        if pipeline is None:
+            pipeline = DerivativePipeline(db)
+            _pipelines[db] = pipeline
+        return pipeline
@@ -0,0 +1,195 @@
+"""
+image_normalization.py
+
+Orientation, EXIF clean-up and metadata of uploaded photos.
+
+Phones store photos sideways with an EXIF Orientation tag, and embed GPS
+coordinates and other EXIF that nobody asked us to publish. normalize_image()
+runs in the derivative process pool after an upload and:
+- rotates the pixels upright, so no client has to honour the tag,
+- keeps only the EXIF tags in the whitelists below (no GPS, no XMP),
+- reads the capture date and upright dimensions, and
+- computes a 64-bit difference hash (dHash) of the picture.
+
+Photos that are already upright and clean are left alone, so nothing is
+re-encoded without need. A rewritten photo gets a new content hash and the
+pipeline moves the row over to it (see DerivativePipeline).
+
+The dHash of two photos of the same shot (re-saved, resized, lightly edited)
+differ in only a few bits, so galleries can hide near-duplicates by comparing
+the stored hashes without re-reading any file.
+"""
+
+import datetime
+import hashlib
+import os
+import tempfile
+from typing import Any, Dict, Iterable, List, Optional
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - required, see requirements.txt
+    Image = None
+    ImageOps = None
+
+# EXIF tags
+ORIENTATION = 0x0112
+DATETIME = 0x0132
+EXIF_IFD = 0x8769
+GPS_IFD = 0x8825
+DATETIME_ORIGINAL = 0x9003
+OFFSET_TIME_ORIGINAL = 0x9011
+
+# Tags kept from IFD0 (camera identification) ...
+KEPT_TAGS = {
+    0x010F,  # Make
+    0x0110,  # Model
+    DATETIME,
+}
+# ... and from the Exif sub-IFD (capture date and exposure)
+KEPT_EXIF_TAGS = {
+    DATETIME_ORIGINAL,
+    OFFSET_TIME_ORIGINAL,
+    0x829A,  # ExposureTime
+    0x829D,  # FNumber
+    0x8827,  # ISOSpeedRatings
+    0x920A,  # FocalLength
+    0xA434,  # LensModel
+}
+
+# Formats that are rewritten when needed; GIFs may be animated and are left as they are
+REWRITTEN_FORMATS = {"JPEG": "jpg", "MPO": "jpg", "PNG": "png", "WEBP": "webp"}
+JPEG_QUALITY = 92
+
+# dHash distance up to which two photos count as the same shot
+NEAR_DUPLICATE_DISTANCE = int(os.getenv("NEAR_DUPLICATE_DISTANCE", 6))
+
+_HASH_SIZE = 8
+_CHUNK_SIZE = 1024 * 1024
+
+
+def capture_date(exif) -> Optional[str]:
+    """ISO 8601 capture time from EXIF, with the UTC offset when the camera wrote one"""
+    details = exif.get_ifd(EXIF_IFD)
+    value = details.get(DATETIME_ORIGINAL) or exif.get(DATETIME)
+    if not value:
+        return None
+    try:
+        taken = datetime.datetime.strptime(str(value).strip("\x00 "), "%Y:%m:%d %H:%M:%S")
+    except ValueError:
+        return None
+    offset = str(details.get(OFFSET_TIME_ORIGINAL) or "").strip("\x00 ")
+    return taken.isoformat() + (offset if len(offset) == 6 and offset[0] in "+-" else "")
+
+
+def difference_hash(image) -> str:
+    """64-bit dHash as 16 hex digits: whether each pixel is brighter than its right neighbour"""
+    small = image.convert("L").resize((_HASH_SIZE + 1, _HASH_SIZE), Image.LANCZOS)
+    pixels = small.tobytes()
+    bits = 0
+    for row in range(_HASH_SIZE):
+        for col in range(_HASH_SIZE):
+            left = pixels[row * (_HASH_SIZE + 1) + col]
+            bits = (bits << 1) | (left > pixels[row * (_HASH_SIZE + 1) + col + 1])
+    return f"{bits:016x}"
+
+
+def hamming_distance(first: str, second: str) -> int:
+    return bin(int(first, 16) ^ int(second, 16)).count("1")
+
+
+def skip_near_duplicates(photos: Iterable[Dict[str, Any]],
+                         max_distance: int = NEAR_DUPLICATE_DISTANCE) -> List[Dict[str, Any]]:
+    """Photos in order, leaving out any within max_distance of one already kept"""
+    kept: List[Dict[str, Any]] = []
+    hashes: List[str] = []
+    for photo in photos:
+        phash = photo.get("phash")
+        if phash and any(hamming_distance(phash, seen) <= max_distance for seen in hashes):
+            continue
+        kept.append(photo)
+        if phash:
+            hashes.append(phash)
+    return kept
+
+
+def _needs_cleaning(exif, image) -> bool:
+    if exif.get(ORIENTATION, 1) != 1 or "xmp" in image.info or "XML:com.adobe.xmp" in image.info:
+        return True
+    if any(tag not in KEPT_TAGS | {EXIF_IFD} for tag in exif):
+        return True
+    return any(tag not in KEPT_EXIF_TAGS for tag in exif.get_ifd(EXIF_IFD))
+
+
+def _clean_exif(exif):
+    clean = Image.Exif()
+    for tag in KEPT_TAGS:
+        if tag in exif:
+            clean[tag] = exif[tag]
+    details = {tag: value for tag, value in exif.get_ifd(EXIF_IFD).items() if tag in KEPT_EXIF_TAGS}
+    if details:
+        clean[EXIF_IFD] = details
+    return clean
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def normalize_image(source_path: str, incoming_dir: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Read a photo's metadata and, when incoming_dir is given, write an upright
+    copy with whitelisted EXIF there if the photo needs one.
+
+    Returns {"metadata": {...}, "normalized": None or {"path", "content_hash",
+    "extension"}}. Runs in a worker process, so it only takes and returns
+    plain values.
+    """
+    if Image is None:
+        return {"metadata": {}, "normalized": None}
+
+    normalized = None
+    with Image.open(source_path) as source:
+        exif = source.getexif()
+        metadata: Dict[str, Any] = {"taken_at": capture_date(exif)}
+        extension = REWRITTEN_FORMATS.get(source.format)
+        rewrite = (incoming_dir is not None and extension is not None
+                   and not getattr(source, "is_animated", False) and _needs_cleaning(exif, source))
+
+        if rewrite:
+            image = ImageOps.exif_transpose(source)
+            os.makedirs(incoming_dir, exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=incoming_dir, suffix=f".{extension}", delete=False) as tmp:
+                path = tmp.name
+            try:
+                options = {"exif": _clean_exif(exif).tobytes()}
+                if source.info.get("icc_profile"):
+                    options["icc_profile"] = source.info["icc_profile"]
+                if extension == "jpg":
+                    if image.mode not in ("RGB", "L", "CMYK"):
+                        image = image.convert("RGB")
+                    options.update(quality=JPEG_QUALITY, optimize=True)
+                elif extension == "webp":
+                    options.update(quality=JPEG_QUALITY)
+                image.save(path, "JPEG" if extension == "jpg" else source.format, **options)
+                normalized = {"path": path, "content_hash": _sha256(path), "extension": extension}
+            except Exception:
+                os.unlink(path)
+                raise
+        else:
+            # Only the hash is needed: JPEG can decode straight at a reduced scale
+            width, height = source.size
+            source.draft("RGB", (width // 8 or 1, height // 8 or 1))
+            image = ImageOps.exif_transpose(source)
+            if exif.get(ORIENTATION, 1) in (5, 6, 7, 8):
+                width, height = height, width
+
+        if normalized:
+            width, height = image.size
+        metadata.update(width=width, height=height, phash=difference_hash(image))
+
+    return {"metadata": metadata, "normalized": normalized}
@@ -0,0 +1,164 @@
+"""
+interval_index.py
+
+Static interval index for overlap queries.
+
+Intervals are kept sorted by start, with a segment tree over the interval ends
+that stores the maximum end of every subtree. An overlap query for [lo, hi]
+binary-searches the last interval starting at or before hi and then descends
+the tree, skipping every subtree whose maximum end lies before lo, so it runs
+in O(log n + k) for k matches.
+
+Writes do not touch the tree. An added interval goes to a pending set that
+queries scan linearly, and a removed or replaced one is tombstoned and skipped
+when it matches. The tree is only rebuilt once this backlog grows past about
+sqrt(n) entries, so a run of writes costs one rebuild rather than one per
+query, and queries stay O(log n + sqrt(n) + k) in between.
+"""
+
+import bisect
+import heapq
+import math
+import threading
+from typing import Any, Dict, Hashable, List, Set, Tuple
+
+# Writes buffered before the tree is rebuilt, at the least
+MIN_BACKLOG = 32
+
+
+class IntervalIndex:
+    """Answers "which intervals overlap [lo, hi]" for comparable endpoints"""
+
+    def __init__(self):
+        self._intervals: Dict[Hashable, Tuple[Any, Any, Any]] = {}
+        self._starts: List[Any] = []
+        self._ends: List[Any] = []
+        self._keys: List[Hashable] = []
+        self._tree: List[Any] = []
+        self._size = 0
+        # Intervals added since the last rebuild, and tree entries since removed or replaced
+        self._pending: Dict[Hashable, Tuple[Any, Any, Any]] = {}
+        self._removed: Set[Hashable] = set()
+        self._built: Set[Hashable] = set()
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._intervals)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._intervals
+
+    def add(self, key: Hashable, start: Any, end: Any, value: Any = None) -> None:
+        """Insert or replace the interval stored under key (end defaults to start)"""
+        if end is None or end < start:
+            end = start
+        with self._lock:
+            self._intervals[key] = (start, end, value)
+            self._pending[key] = (start, end, value)
+            if key in self._built:
+                self._removed.add(key)
+
+    def remove(self, key: Hashable) -> None:
+        with self._lock:
+            if self._intervals.pop(key, None) is None:
+                return
+            self._pending.pop(key, None)
+            if key in self._built:
+                self._removed.add(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._intervals = {}
+            self._pending = {}
+            self._removed = set()
+            self._built = set()
+            self._keys, self._starts, self._ends = [], [], []
+            self._tree, self._size = [], 0
+
+    def get(self, key: Hashable) -> Any:
+        entry = self._intervals.get(key)
+        return entry[2] if entry else None
+
+    def _rebuild(self) -> None:
+        ordered = sorted(self._intervals.items(), key=lambda item: (item[1][0], item[1][1]))
+        self._keys = [key for key, _ in ordered]
+        self._starts = [interval[0] for _, interval in ordered]
+        self._ends = [interval[1] for _, interval in ordered]
+
+        # Iterative segment tree: leaves at [size, 2 * size), internal nodes hold the max end
+        size = 1
+        while size < len(ordered):
+            size *= 2
+        tree: List[Any] = [None] * (2 * size)
+        tree[size:size + len(ordered)] = self._ends
+        for node in range(size - 1, 0, -1):
+            left, right = tree[2 * node], tree[2 * node + 1]
+            if left is None:
+                tree[node] = right
+            elif right is None:
+                tree[node] = left
+            else:
+                tree[node] = left if left >= right else right
+        self._tree = tree
+        self._size = size
+        self._built = set(self._keys)
+        self._pending = {}
+        self._removed = set()
+
+    def _ensure_built(self) -> None:
+        backlog = len(self._pending) + len(self._removed)
+        if backlog > max(MIN_BACKLOG, math.isqrt(len(self._built))):
+            self._rebuild()
+
+    def _pending_ordered(self, lo: Any = None, hi: Any = None) -> List[Tuple[Any, Any, Any]]:
+        """Pending (start, end, value) entries, optionally only those overlapping [lo, hi]"""
+        found = [interval for interval in self._pending.values()
+                 if lo is None or (interval[0] <= hi and interval[1] >= lo)]
+        found.sort(key=lambda interval: (interval[0], interval[1]))
+        return found
+
+    def _merge(self, built: List[int], pending: List[Tuple[Any, Any, Any]]) -> List[Any]:
+        """Values of the live tree entries at built, merged with pending by start"""
+        entries = [(self._starts[i], self._ends[i], self._intervals[self._keys[i]][2])
+                   for i in built if self._keys[i] not in self._removed]
+        if not pending:
+            return [entry[2] for entry in entries]
+        ordered = heapq.merge(entries, pending, key=lambda interval: (interval[0], interval[1]))
+        return [entry[2] for entry in ordered]
+
+    def overlapping(self, lo: Any, hi: Any) -> List[Any]:
+        """Values of intervals with start <= hi and end >= lo, ordered by start"""
+        with self._lock:
+            self._ensure_built()
+            pending = self._pending_ordered(lo, hi)
+            limit = bisect.bisect_right(self._starts, hi)
+            if limit == 0:
+                return [entry[2] for entry in pending]
+
+            matches: List[int] = []
+            stack = [(1, 0, self._size)]
+            while stack:
+                node, node_lo, node_hi = stack.pop()
+                if node_lo >= limit:
+                    continue
+                best = self._tree[node]
+                if best is None or best < lo:
+                    continue
+                if node >= self._size:
+                    matches.append(node - self._size)
+                    continue
+                middle = (node_lo + node_hi) // 2
+                # Push the right child first so leaves come out in start order
+                stack.append((2 * node + 1, middle, node_hi))
+                stack.append((2 * node, node_lo, middle))
+
+            return self._merge(matches, pending)
+
+    def any_overlap(self, lo: Any, hi: Any) -> bool:
+        return bool(self.overlapping(lo, hi))
+
+    def values(self) -> List[Any]:
+        """All values ordered by start"""
+        with self._lock:
+            self._ensure_built()
+            return self._merge(range(len(self._keys)), self._pending_ordered())
@@ -0,0 +1,315 @@
+"""
+jobs.py
+
+In-process background job runner.
+
+Long-running work (event generation, rule processing, bulk rebuilds) is
+submitted as a job and returns a job id immediately. A small pool of daemon
+worker threads drains an in-memory queue and runs the handler registered for
+the job's type. Job state and progress are kept in memory and mirrored to the
+`jobs` table, so status survives restarts and can be read by other processes;
+progress writes are throttled to at most one per PROGRESS_INTERVAL seconds. If
+the table is unavailable the runner keeps working from memory alone.
+
+On startup, recover() re-queues jobs that never started and marks jobs that
+were running when the previous process stopped as failed.
+"""
+
+import datetime
+import os
+import queue
+import threading
+import time
+import traceback
+import uuid
+import weakref
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+from server.database.db_interface import DatabaseInterface
+from server.config import debug_log
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_SUCCEEDED = "succeeded"
+STATUS_FAILED = "failed"
+STATUS_CANCELLED = "cancelled"
+FINISHED_STATUSES = (STATUS_SUCCEEDED, STATUS_FAILED, STATUS_CANCELLED)
+
+JOBS_TABLE = "jobs"
+
+# Seconds between persisted progress updates of one job
+PROGRESS_INTERVAL = 1.0
+
+# Finished jobs kept in memory
+MAX_FINISHED_JOBS = 200
+
+
+class JobCancelled(Exception):
+    """Raised inside a handler (via JobContext.check_cancelled) to stop a cancelled job"""
+
+
+class UnknownJobType(ValueError):
+    """Raised when submitting a job type without a registered handler"""
+
+
+def _now() -> str:
+    return datetime.datetime.utcnow().isoformat()
+
+
+class JobContext:
+    """Passed to handlers for progress reporting and cancellation checks"""
+
+    def __init__(self, runner: "JobRunner", job_id: str):
+        self._runner = runner
+        self.job_id = job_id
+        self._last_persist = 0.0
+
+    def progress(self, done: int, total: Optional[int] = None, message: Optional[str] = None) -> None:
+        changes: Dict[str, Any] = {"progress": done}
+        if total is not None:
+            changes["total"] = total
+        if message is not None:
+            changes["message"] = message
+
+        now = time.monotonic()
+        persist = now - self._last_persist >= PROGRESS_INTERVAL or (total is not None and done >= total)
+        if persist:
+            self._last_persist = now
+        self._runner._update(self.job_id, changes, persist=persist)
+        self.check_cancelled()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._runner._is_cancel_requested(self.job_id)
+
+    def check_cancelled(self) -> None:
+        if self.cancelled:
+            raise JobCancelled()
+
+
+Handler = Callable[[Dict[str, Any], JobContext], Any]
+
+
+class JobRunner:
+    """Queue plus worker threads executing registered job handlers"""
+
+    def __init__(self, db: Optional[DatabaseInterface], workers: Optional[int] = None):
+        self.db = db
+        self.workers = workers or int(os.environ.get("JOB_WORKERS", "2"))
+        self._handlers: Dict[str, Handler] = {}
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._cancel_requested = set()
+        self._queue: "queue.Queue[Optional[str]]" = queue.Queue()
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.RLock()
+        self.persistent = db is not None
+
+    # ----- Registration and submission -----
+
+    def register(self, job_type: str, handler: Handler) -> None:
+        """Register (or replace) the handler for a job type"""
+        with self._lock:
+            self._handlers[job_type] = handler
+
+    def submit(self, job_type: str, payload: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Queue a job and return its record"""
+        if job_type not in self._handlers:
+            raise UnknownJobType(f"Unknown job type '{job_type}'")
+
+        job = {
+            "id": uuid.uuid4().hex,
+            "job_type": job_type,
+            "status": STATUS_QUEUED,
+            "payload": payload or {},
+            "progress": 0,
+            "total": None,
+            "message": None,
+            "result": None,
+            "error": None,
+            "created_at": _now(),
+            "started_at": None,
+            "finished_at": None,
+        }
+        with self._lock:
+            self._jobs[job["id"]] = job
+        self._persist(job, create=True)
+
+        self._ensure_workers()
+        self._queue.put(job["id"])
+        debug_log(f"JobRunner: queued {job_type} job {job['id']}")
+        return dict(job)
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Cancel a job. Queued jobs are cancelled immediately; running jobs stop at
+        their next progress report.
+        """
+        job = self.get(job_id)
+        if job is None:
+            return None
+        if job["status"] == STATUS_QUEUED:
+            self._update(job_id, {"status": STATUS_CANCELLED, "finished_at": _now()})
+        elif job["status"] == STATUS_RUNNING:
+            with self._lock:
+                self._cancel_requested.add(job_id)
+        return self.get(job_id)
+
+    # ----- Queries -----
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return dict(job)
+        if self.persistent:
+            try:
+                rows = self.db.find_by_field_values(JOBS_TABLE, {"id": job_id})
+                return rows[0] if rows else None
+            except Exception as e:
+                debug_log(f"JobRunner: could not read job {job_id}: {str(e)}")
+        return None
+
+    def list(self, status: Optional[str] = None, job_type: Optional[str] = None,
+             limit: int = 50) -> List[Dict[str, Any]]:
+        """Most recent jobs first"""
+        with self._lock:
+            jobs = [dict(job) for job in reversed(self._jobs.values())]
+        if status:
+            jobs = [job for job in jobs if job["status"] == status]
+        if job_type:
+            jobs = [job for job in jobs if job["job_type"] == job_type]
+        return jobs[:limit]
+
+    # ----- Workers -----
+
+    def _ensure_workers(self) -> None:
+        with self._lock:
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work, name=f"job-worker-{len(self._threads)}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self) -> None:
+        while True:
+            job_id = self._queue.get()
+            try:
+                if job_id is None:
+                    return
+                self._run(job_id)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job_id: str) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job["status"] != STATUS_QUEUED:
+                return
+            handler = self._handlers.get(job["job_type"])
+            payload = job["payload"]
+
+        self._update(job_id, {"status": STATUS_RUNNING, "started_at": _now()})
+        try:
+            if handler is None:
+                raise UnknownJobType(f"No handler registered for '{job['job_type']}'")
+            result = handler(payload, JobContext(self, job_id))
+            self._update(job_id, {"status": STATUS_SUCCEEDED, "result": result, "finished_at": _now()})
+            debug_log(f"JobRunner: job {job_id} succeeded")
+        except JobCancelled:
+            self._update(job_id, {"status": STATUS_CANCELLED, "finished_at": _now()})
+            debug_log(f"JobRunner: job {job_id} cancelled")
+        except Exception as e:
+            self._update(job_id, {"status": STATUS_FAILED, "error": str(e), "finished_at": _now()})
+            debug_log(f"JobRunner: job {job_id} failed: {str(e)}\n{traceback.format_exc()}")
+        finally:
+            with self._lock:
+                self._cancel_requested.discard(job_id)
+            self._trim()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the queue is drained (used by tests and scripts)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def shutdown(self) -> None:
+        with self._lock:
+            threads = list(self._threads)
+        for _ in threads:
+            self._queue.put(None)
+        for thread in threads:
+            thread.join(timeout=5)
+
+    # ----- State -----
+
+    def _is_cancel_requested(self, job_id: str) -> bool:
+        with self._lock:
+            return job_id in self._cancel_requested
+
+    def _update(self, job_id: str, changes: Dict[str, Any], persist: bool = True) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job.update(changes)
+            snapshot = dict(job)
+        if persist:
+            self._persist(snapshot)
+
+    def _persist(self, job: Dict[str, Any], create: bool = False) -> None:
+        if not self.persistent:
+            return
+        try:
+            if create:
+                self.db.create(JOBS_TABLE, job)
+            else:
+                self.db.update(JOBS_TABLE, job["id"], {k: v for k, v in job.items() if k != "id"})
+        except Exception as e:
+            # The queue keeps working from memory when the table is missing
+            debug_log(f"JobRunner: could not persist job {job['id']}: {str(e)}")
+
+    def _trim(self) -> None:
+        with self._lock:
+            finished = [job_id for job_id, job in self._jobs.items() if job["status"] in FINISHED_STATUSES]
+            for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+                del self._jobs[job_id]
+
+    def recover(self) -> int:
+        """Resume queued jobs from the jobs table; returns the number re-queued"""
+        if not self.persistent:
+            return 0
+        requeued = 0
+        for job in self.db.find_by_field_values(JOBS_TABLE, {}) or []:
+            if job.get("status") == STATUS_RUNNING:
+                with self._lock:
+                    self._jobs[job["id"]] = dict(job)
+                self._update(job["id"], {"status": STATUS_FAILED, "error": "Interrupted by server restart",
+                                         "finished_at": _now()})
+            elif job.get("status") == STATUS_QUEUED and job.get("job_type") in self._handlers:
+                with self._lock:
+                    if job["id"] in self._jobs:
+                        continue
+                    self._jobs[job["id"]] = dict(job, payload=job.get("payload") or {})
+                self._ensure_workers()
+                self._queue.put(job["id"])
+                requeued += 1
+        debug_log(f"JobRunner: recovered {requeued} queued jobs")
+        return requeued
+
+
+_runners: "weakref.WeakKeyDictionary[Any, JobRunner]" = weakref.WeakKeyDictionary()
+_runners_lock = threading.Lock()
+
+
+def get_job_runner(db: DatabaseInterface) -> JobRunner:
+    """Return the job runner shared by every blueprint using this database"""
+    with _runners_lock:
+        runner = _runners.get(db)
+        if runner is None:
+            runner = JobRunner(db)
+            _runners[db] = runner
+        return runner
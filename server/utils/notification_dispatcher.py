@@ -0,0 +1,391 @@
+"""
+notification_dispatcher.py
+
+Scheduled delivery of event reminders (events with notify=true).
+
+Each event that asks for a notification gets a reminder at
+start_date - notify_days_before days; recurring events get one per occurrence
+inside the scheduling horizon. Pending reminders are kept in a min-heap ordered
+by reminder time, and a single daemon thread sleeps until the earliest one is
+due instead of polling the events table. Event writes call upsert()/remove(),
+which re-schedule the event and wake the thread if the next due time moved.
+
+Everything due at the same moment is delivered as one batch: the delivery
+records and then the notifications rows are written with create_many, then
+reminder emails are sent in chunks over one SMTP connection each. Every
+reminder has a deterministic key (event, occurrence date, lead time) recorded
+in the event_reminder_deliveries table before anything is shown or sent, so a
+restart never delivers the same reminder twice. Only the delivery records of
+events with reminders inside the horizon are read at startup, and keys that are
+already recorded are skipped by the insert (ON CONFLICT DO NOTHING), so one
+stale key cannot hold back the rest of its batch.
+"""
+
+import datetime
+import heapq
+import html
+import itertools
+import os
+import threading
+import weakref
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from server.database.db_interface import DatabaseInterface
+from server.config import debug_log
+from .dates import to_datetime
+from .recurrence import parse_rule, expand, format_occurrence_text
+from .event_generation import is_legacy_birthday
+
+DELIVERIES_TABLE = "event_reminder_deliveries"
+
+# Event ids per delivery record lookup (they are sent in the query string)
+LOOKUP_CHUNK_SIZE = 200
+
+STATUS_NOTIFIED = "notified"
+STATUS_EMAILED = "emailed"
+STATUS_EMAIL_FAILED = "email_failed"
+
+# Index positions inside a heap entry (a list, so entries can be invalidated in place)
+_DUE, _SEQ, _KEY, _EVENT, _OCCURRENCE, _INDEX, _ACTIVE = range(7)
+
+# (recipient, subject, html, text) -> sent?
+EmailSender = Callable[[List[Tuple[str, str, str, str]]], List[bool]]
+
+
+def reminder_key(event_id: Any, occurrence_start: datetime.datetime, days_before: int) -> str:
+    return f"{event_id}:{occurrence_start.date().isoformat()}:{days_before}"
+
+
+class NotificationDispatcher:
+    """Min-heap of pending event reminders drained by a sleeping worker thread"""
+
+    def __init__(self, db: DatabaseInterface, send_emails: Optional[EmailSender] = None,
+                 horizon_days: int = 60, email_chunk_size: int = 50,
+                 reload_interval: datetime.timedelta = datetime.timedelta(hours=12)):
+        self.db = db
+        self.send_emails = send_emails
+        self.horizon = datetime.timedelta(days=horizon_days)
+        self.email_chunk_size = email_chunk_size
+        self.reload_interval = reload_interval
+        self.fallback_email = os.environ.get("REMINDER_EMAIL")
+        self._heap: List[list] = []
+        self._by_event: Dict[str, List[list]] = {}
+        self._delivered: set = set()
+        self._counter = itertools.count()
+        self._wakeup = threading.Condition(threading.RLock())
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self._horizon_end: Optional[datetime.datetime] = None
+        self._loaded_at: Optional[datetime.datetime] = None
+        self.loaded = False
+
+    # ----- Loading -----
+
+    def load(self, now: Optional[datetime.datetime] = None) -> None:
+        """(Re)build the reminder heap from the events and delivery tables"""
+        now = now or datetime.datetime.utcnow()
+        # find_in reads in pages, past the provider's row cap
+        events = self.db.find_in("events", "notify", [True]) or []
+        with self._wakeup:
+            self._horizon_end = now + self.horizon
+            upcoming = [event["id"] for event in events if self._reminders_for(event, now)]
+        delivered = self._delivered_keys(upcoming)
+
+        with self._wakeup:
+            self._delivered |= delivered
+            self._heap = []
+            self._by_event = {}
+            self._loaded_at = now
+            for event in events:
+                self._schedule(event, now, push=False)
+            heapq.heapify(self._heap)
+            self.loaded = True
+            self._wakeup.notify_all()
+        debug_log(f"NotificationDispatcher: {len(self._heap)} pending reminders")
+
+    def _delivered_keys(self, event_ids: List[Any]) -> set:
+        """Keys of the reminders already delivered for the events with reminders inside the horizon"""
+        delivered = set()
+        for offset in range(0, len(event_ids), LOOKUP_CHUNK_SIZE):
+            chunk = event_ids[offset:offset + LOOKUP_CHUNK_SIZE]
+            try:
+                delivered.update(row.get("reminder_key") for row in self.db.find_in(DELIVERIES_TABLE, "event_id", chunk))
+            except Exception as e:
+                # create_many skips keys that are already recorded, so nothing is sent twice
+                debug_log(f"NotificationDispatcher: could not read delivery records: {str(e)}")
+        return delivered
+
+    def _reminders_for(self, event: Dict[str, Any],
+                       now: datetime.datetime) -> List[Tuple[datetime.datetime, str, datetime.datetime, int]]:
+        """(remind_at, key, occurrence_start, occurrence_index) of the undelivered reminders of an event"""
+        if not event.get("notify") or event.get("id") is None:
+            return []
+        start = to_datetime(event.get("start_date"))
+        if start is None:
+            return []
+        days_before = int(event.get("notify_days_before") or 0)
+        lead = datetime.timedelta(days=days_before)
+
+        try:
+            # Legacy birthdays have a fixed age in the title: remind once, on their own date
+            rule = None if is_legacy_birthday(event) else parse_rule(event.get("recurring"))
+        except ValueError:
+            rule = None
+        if rule is None:
+            occurrences = [(0, start)] if start >= now else []
+        else:
+            # Occurrences that have not started yet and whose reminder falls inside the horizon
+            occurrences = list(expand(start, rule, now, self._horizon_end + lead))
+
+        reminders = []
+        for index, occurrence in occurrences:
+            key = reminder_key(event["id"], occurrence, days_before)
+            remind_at = occurrence - lead
+            if key not in self._delivered and remind_at <= self._horizon_end:
+                reminders.append((remind_at, key, occurrence, index))
+        return reminders
+
+    def _schedule(self, event: Dict[str, Any], now: datetime.datetime, push: bool = True) -> None:
+        entries = []
+        for remind_at, key, occurrence, index in self._reminders_for(event, now):
+            entry = [remind_at, next(self._counter), key, event, occurrence, index, True]
+            entries.append(entry)
+            if push:
+                heapq.heappush(self._heap, entry)
+            else:
+                self._heap.append(entry)
+        if entries:
+            self._by_event[str(event["id"])] = entries
+
+    def _unschedule(self, event_id: Any) -> None:
+        for entry in self._by_event.pop(str(event_id), []):
+            entry[_ACTIVE] = False
+
+    # ----- Write hooks -----
+
+    def upsert(self, event: Optional[Dict[str, Any]]) -> None:
+        if not event or event.get("id") is None or not self.loaded:
+            return
+        with self._wakeup:
+            self._unschedule(event["id"])
+            self._schedule(event, datetime.datetime.utcnow())
+            self._wakeup.notify_all()
+
+    def upsert_many(self, events: List[Dict[str, Any]]) -> None:
+        for event in events or []:
+            self.upsert(event)
+
+    def remove(self, event_id: Any) -> None:
+        with self._wakeup:
+            self._unschedule(event_id)
+
+    # ----- Delivery -----
+
+    def next_due(self) -> Optional[datetime.datetime]:
+        with self._wakeup:
+            while self._heap and not self._heap[0][_ACTIVE]:
+                heapq.heappop(self._heap)
+            return self._heap[0][_DUE] if self._heap else None
+
+    def _pop_due(self, now: datetime.datetime) -> List[list]:
+        due = []
+        with self._wakeup:
+            while self._heap and self._heap[0][_DUE] <= now:
+                entry = heapq.heappop(self._heap)
+                if entry[_ACTIVE] and entry[_KEY] not in self._delivered:
+                    due.append(entry)
+                    entry[_ACTIVE] = False
+        return due
+
+    @staticmethod
+    def _notification(entry: list, now: datetime.datetime) -> Dict[str, Any]:
+        event, occurrence = entry[_EVENT], entry[_OCCURRENCE]
+        # Series titles carry {occurrence}/{occurrence_ordinal} placeholders (e.g. birthdays)
+        title = format_occurrence_text(event.get("title"), entry[_INDEX]) or "Upcoming event"
+        days = (occurrence.date() - now.date()).days
+        when = "today" if days <= 0 else "tomorrow" if days == 1 else f"in {days} days"
+        return {
+            "user_id": event.get("user_id"),
+            "type": "event_reminder",
+            "title": title,
+            "message": f"{title} is {when} ({occurrence.date().isoformat()})",
+            "entity_type": "event",
+            "entity_id": event.get("id"),
+            "date": now.isoformat(),
+            "read": False,
+        }
+
+    def _recipients(self, entries: List[list]) -> Dict[str, Optional[str]]:
+        """Email address per user id, looked up once per batch"""
+        recipients: Dict[str, Optional[str]] = {}
+        for entry in entries:
+            user_id = entry[_EVENT].get("user_id")
+            if user_id is None or str(user_id) in recipients:
+                continue
+            try:
+                users = self.db.find_by_field_values("users", {"id": user_id})
+                recipients[str(user_id)] = users[0].get("email") if users else None
+            except Exception as e:
+                debug_log(f"NotificationDispatcher: could not look up user {user_id}: {str(e)}")
+                recipients[str(user_id)] = None
+        return recipients
+
+    def dispatch_due(self, now: Optional[datetime.datetime] = None) -> int:
+        """Deliver every reminder due at `now`; returns the number delivered"""
+        now = now or datetime.datetime.utcnow()
+        entries = self._pop_due(now)
+        if not entries:
+            return 0
+
+        # Record delivery first: a crash from here on may lose a reminder, never duplicate one
+        deliveries = [{
+            "reminder_key": entry[_KEY],
+            "event_id": entry[_EVENT].get("id"),
+            "occurrence_start": entry[_OCCURRENCE].isoformat(),
+            "remind_at": entry[_DUE].isoformat(),
+            "status": STATUS_NOTIFIED,
+            "delivered_at": now.isoformat(),
+        } for entry in entries]
+        with self._wakeup:
+            self._delivered.update(entry[_KEY] for entry in entries)
+        try:
+            # Keys recorded by an earlier run or another worker are skipped, not a failed batch
+            records = self.db.create_many(DELIVERIES_TABLE, deliveries, on_conflict="reminder_key")
+        except Exception as e:
+            debug_log(f"NotificationDispatcher: could not record deliveries: {str(e)}")
+            # Nothing went out: reschedule the batch so the next attempt retries it
+            self._requeue(entries)
+            raise
+
+        recorded = {record.get("reminder_key") for record in records or []}
+        entries = [entry for entry in entries if entry[_KEY] in recorded]
+        if not entries:
+            return 0
+
+        notifications = [self._notification(entry, now) for entry in entries]
+        try:
+            self.db.create_many("notifications", notifications)
+        except Exception as e:
+            debug_log(f"NotificationDispatcher: could not create notifications: {str(e)}")
+
+        if self.send_emails is not None:
+            self._email(entries, notifications, records)
+
+        debug_log(f"NotificationDispatcher: delivered {len(entries)} reminders")
+        return len(entries)
+
+    def _requeue(self, entries: List[list]) -> None:
+        """Put popped entries back on the heap unless their event was re-scheduled meanwhile"""
+        with self._wakeup:
+            self._delivered.difference_update(entry[_KEY] for entry in entries)
+            for entry in entries:
+                scheduled = self._by_event.get(str(entry[_EVENT].get("id")), [])
+                if any(current is entry for current in scheduled):
+                    entry[_ACTIVE] = True
+                    heapq.heappush(self._heap, entry)
+
+    def _email(self, entries: List[list], notifications: List[Dict[str, Any]],
+               records: List[Dict[str, Any]]) -> None:
+        recipients = self._recipients(entries)
+        record_ids = {record.get("reminder_key"): record.get("id") for record in records or []}
+
+        outgoing = []
+        for entry, notification in zip(entries, notifications):
+            user_id = entry[_EVENT].get("user_id")
+            email = recipients.get(str(user_id)) if user_id is not None else None
+            email = email or self.fallback_email
+            if email:
+                text = notification["message"]
+                outgoing.append((entry[_KEY], (email, f"Reminder: {notification['title']}", f"<p>{html.escape(text)}</p>", text)))
+
+        for offset in range(0, len(outgoing), self.email_chunk_size):
+            chunk = outgoing[offset:offset + self.email_chunk_size]
+            try:
+                results = self.send_emails([message for _key, message in chunk])
+            except Exception as e:
+                debug_log(f"NotificationDispatcher: email chunk failed: {str(e)}")
+                results = [False] * len(chunk)
+
+            for (key, _message), sent in zip(chunk, results):
+                record_id = record_ids.get(key)
+                if record_id is None:
+                    continue
+                try:
+                    self.db.update(DELIVERIES_TABLE, record_id,
+                                   {"status": STATUS_EMAILED if sent else STATUS_EMAIL_FAILED})
+                except Exception as e:
+                    debug_log(f"NotificationDispatcher: could not update delivery {record_id}: {str(e)}")
+
+    # ----- Worker thread -----
+
+    def _wait_time(self, now: datetime.datetime) -> float:
+        """Seconds until the next reminder or the next horizon reload"""
+        wake_at = self._loaded_at + self.reload_interval if self._loaded_at else now
+        next_due = self.next_due()
+        if next_due is not None and next_due < wake_at:
+            wake_at = next_due
+        return max(0.0, (wake_at - now).total_seconds())
+
+    def _run(self, context_factory) -> None:
+        while True:
+            with self._wakeup:
+                if self._stopping:
+                    return
+                now = datetime.datetime.utcnow()
+                if not self.loaded or now >= self._loaded_at + self.reload_interval:
+                    wait = 0.0
+                else:
+                    wait = self._wait_time(now)
+                if wait > 0:
+                    self._wakeup.wait(timeout=wait)
+                    continue
+            try:
+                with context_factory():
+                    now = datetime.datetime.utcnow()
+                    if not self.loaded or now >= self._loaded_at + self.reload_interval:
+                        self.load(now)
+                    self.dispatch_due(now)
+            except Exception as e:
+                debug_log(f"NotificationDispatcher: dispatch failed: {str(e)}")
+                with self._wakeup:
+                    self._wakeup.wait(timeout=60)
+
+    def start(self, app=None) -> None:
+        """Start the worker thread (inside the app context when an app is given)"""
+        with self._wakeup:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping = False
+            context_factory = app.app_context if app is not None else _NullContext
+            self._thread = threading.Thread(target=self._run, args=(context_factory,),
+                                            name="event-reminders", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        with self._wakeup:
+            self._stopping = True
+            self._wakeup.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+
+
+class _NullContext:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_dispatchers: "weakref.WeakKeyDictionary[Any, NotificationDispatcher]" = weakref.WeakKeyDictionary()
+_dispatchers_lock = threading.Lock()
+
+
+def get_notification_dispatcher(db: DatabaseInterface) -> NotificationDispatcher:
+    """Return the dispatcher shared by every blueprint using this database"""
+    with _dispatchers_lock:
+        dispatcher = _dispatchers.get(db)
+        if dispatcher is None:
+            dispatcher = NotificationDispatcher(db)
+            _dispatchers[db] = dispatcher
+        return dispatcher
@@ -0,0 +1,189 @@
+"""
+recurrence.py
+
+Lazy expansion of recurring events.
+
+A recurring event is stored once, with its first occurrence in start_date and
+its rule in the `recurring` column. Rules are either the legacy keywords
+('daily', 'weekly', 'monthly', 'yearly', 'none') or an RRULE subset:
+
+    RRULE:FREQ=YEARLY;INTERVAL=1;COUNT=10;UNTIL=20300101;BYDAY=MO,WE
+
+Occurrences are only generated for the window being queried. Expansion jumps
+straight to the first period that can reach the window (except for COUNT rules,
+which must be counted from the start) and results are memoised per
+(start, rule, window), so repeated month/week views cost a dictionary lookup.
+"""
+
+import datetime
+from functools import lru_cache
+from typing import List, NamedTuple, Optional, Tuple
+
+FREQUENCIES = ("DAILY", "WEEKLY", "MONTHLY", "YEARLY")
+WEEKDAYS = ("MO", "TU", "WE", "TH", "FR", "SA", "SU")
+
+# Upper bound on generated occurrences per expansion, as a guard against huge windows
+MAX_OCCURRENCES = 5000
+
+
+class RecurrenceRule(NamedTuple):
+    freq: str
+    interval: int = 1
+    count: Optional[int] = None
+    until: Optional[datetime.datetime] = None
+    byday: Tuple[int, ...] = ()
+
+
+def _parse_until(value: str) -> datetime.datetime:
+    value = value.rstrip("Z")
+    for fmt in ("%Y%m%dT%H%M%S", "%Y%m%d"):
+        try:
+            return datetime.datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    return datetime.datetime.fromisoformat(value)
+
+
+@lru_cache(maxsize=256)
+def parse_rule(recurring: Optional[str]) -> Optional[RecurrenceRule]:
+    """Parse a `recurring` column value; None means the event does not repeat"""
+    if not recurring:
+        return None
+    text = str(recurring).strip()
+    if text.lower() in ("none", "never", "false", ""):
+        return None
+    if text.upper() in FREQUENCIES:
+        return RecurrenceRule(freq=text.upper())
+
+    if text.upper().startswith("RRULE:"):
+        text = text[len("RRULE:"):]
+
+    parts = {}
+    for part in text.split(";"):
+        if "=" not in part:
+            continue
+        key, value = part.split("=", 1)
+        parts[key.strip().upper()] = value.strip()
+
+    freq = parts.get("FREQ", "").upper()
+    if freq not in FREQUENCIES:
+        raise ValueError(f"Unsupported recurrence '{recurring}'")
+
+    interval = int(parts.get("INTERVAL", 1))
+    if interval < 1:
+        raise ValueError("INTERVAL must be at least 1")
+
+    byday = ()
+    if parts.get("BYDAY"):
+        byday = tuple(sorted(WEEKDAYS.index(day.strip().upper()[-2:]) for day in parts["BYDAY"].split(",")))
+
+    return RecurrenceRule(
+        freq=freq,
+        interval=interval,
+        count=int(parts["COUNT"]) if parts.get("COUNT") else None,
+        until=_parse_until(parts["UNTIL"]) if parts.get("UNTIL") else None,
+        byday=byday,
+    )
+
+
+def _add_months(start: datetime.datetime, months: int) -> Optional[datetime.datetime]:
+    """Shift by whole months, or None if the day does not exist (e.g. Feb 30, Feb 29 off leap years)"""
+    month_index = start.month - 1 + months
+    year, month = start.year + month_index // 12, month_index % 12 + 1
+    try:
+        return start.replace(year=year, month=month)
+    except ValueError:
+        return None
+
+
+def _period_starts(start: datetime.datetime, rule: RecurrenceRule, first_period: int):
+    """Yield (period_number, occurrence) pairs from first_period on, in order"""
+    period = first_period
+    while True:
+        if rule.freq == "DAILY":
+            yield period, start + datetime.timedelta(days=period * rule.interval)
+        elif rule.freq == "WEEKLY":
+            week_start = start + datetime.timedelta(weeks=period * rule.interval)
+            if not rule.byday:
+                yield period, week_start
+            else:
+                monday = week_start - datetime.timedelta(days=week_start.weekday())
+                for weekday in rule.byday:
+                    occurrence = monday + datetime.timedelta(days=weekday)
+                    if occurrence >= start:
+                        yield period, occurrence
+        else:
+            months = period * rule.interval * (12 if rule.freq == "YEARLY" else 1)
+            occurrence = _add_months(start, months)
+            if occurrence is not None:
+                yield period, occurrence
+        period += 1
+
+
+def _period_length(rule: RecurrenceRule) -> datetime.timedelta:
+    """Shortest possible length of one period, used to skip ahead"""
+    days = {"DAILY": 1, "WEEKLY": 7, "MONTHLY": 28, "YEARLY": 365}[rule.freq]
+    return datetime.timedelta(days=days * rule.interval)
+
+
+@lru_cache(maxsize=4096)
+def _expand_cached(start: datetime.datetime, rule: RecurrenceRule,
+                   window_start: datetime.datetime, window_end: datetime.datetime,
+                   duration: datetime.timedelta) -> Tuple[Tuple[int, datetime.datetime], ...]:
+    first_period = 0
+    if rule.count is None and window_start - duration > start:
+        # Skip periods that end before the window; step back one for month-length slack
+        first_period = max(0, (window_start - duration - start) // _period_length(rule) - 1)
+
+    occurrences: List[Tuple[int, datetime.datetime]] = []
+    seen = 0
+    # BYDAY occurrences before the start in the first week are not part of the series
+    skipped = sum(1 for weekday in rule.byday if weekday < start.weekday())
+    for period, occurrence in _period_starts(start, rule, first_period):
+        if rule.count is not None:
+            seen += 1
+            if seen > rule.count:
+                break
+        if rule.until is not None and occurrence > rule.until:
+            break
+        if occurrence > window_end:
+            break
+        if occurrence + duration >= window_start:
+            if rule.count is not None:
+                index = seen - 1
+            elif rule.byday:
+                index = period * len(rule.byday) + rule.byday.index(occurrence.weekday()) - skipped
+            else:
+                index = period
+            occurrences.append((index, occurrence))
+            if len(occurrences) >= MAX_OCCURRENCES:
+                break
+    return tuple(occurrences)
+
+
+def expand(start: datetime.datetime, rule: RecurrenceRule,
+           window_start: datetime.datetime, window_end: datetime.datetime,
+           duration: datetime.timedelta = datetime.timedelta(0)) -> List[Tuple[int, datetime.datetime]]:
+    """
+    Return (occurrence_index, start) for every occurrence overlapping the window.
+
+    occurrence_index counts occurrences from the series start (0 = first).
+    """
+    return list(_expand_cached(start, rule, window_start, window_end, duration))
+
+
+def ordinal(number: int) -> str:
+    """1 -> '1st', 2 -> '2nd', 11 -> '11th', 23 -> '23rd'"""
+    if 10 <= number % 100 <= 20:
+        suffix = "th"
+    else:
+        suffix = {1: "st", 2: "nd", 3: "rd"}.get(number % 10, "th")
+    return f"{number}{suffix}"
+
+
+def format_occurrence_text(text: Optional[str], index: int) -> Optional[str]:
+    """Fill {occurrence} / {occurrence_ordinal} placeholders with the 1-based occurrence number"""
+    if not text or "{occurrence" not in text:
+        return text
+    return (text.replace("{occurrence_ordinal}", ordinal(index + 1))
+                .replace("{occurrence}", str(index + 1)))
@@ -0,0 +1,128 @@
+"""
+response_cache.py
+
+Conditional-GET support and body caching for frequently polled read endpoints.
+
+A ResponseCache is declared with the tables its endpoint reads. Each request
+derives a version stamp from the per-table change counters (plus today's date,
+since dashboards count "upcoming" items relative to today). The stamp yields
+the ETag and Last-Modified headers; clients presenting a matching
+If-None-Match/If-Modified-Since get an empty 304, and other clients get the
+serialised body cached since the last write, so the view only runs again after
+one of its tables changed.
+"""
+
+import datetime
+import hashlib
+import threading
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from functools import wraps
+from typing import Callable, Iterable, Optional, Tuple
+
+from flask import request, make_response, Response
+
+from server.database.change_tracker import change_tracker, ChangeTracker
+
+
+def validators(key: str, tables: Iterable[str],
+               tracker: ChangeTracker = change_tracker) -> Tuple[str, str, float]:
+    """
+    Return (stamp, etag, last_modified) for a response derived from tables.
+
+    Today's date is part of the stamp, since views count "upcoming" items
+    relative to today.
+    """
+    stamp, last_modified = tracker.snapshot(tables)
+    today = datetime.date.today()
+    stamp = f"{stamp}|{today.isoformat()}"
+    last_modified = max(last_modified, datetime.datetime(today.year, today.month, today.day).timestamp())
+    digest = hashlib.sha1(f"{key}|{stamp}".encode("utf-8")).hexdigest()[:20]
+    return stamp, f'"{digest}"', last_modified
+
+
+def is_not_modified(etag: str, last_modified: float) -> bool:
+    """Whether the request's If-None-Match/If-Modified-Since match the validators"""
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match:
+        candidates = [tag.strip() for tag in if_none_match.split(",")]
+        return etag in candidates or f"W/{etag}" in candidates or "*" in candidates
+
+    if_modified_since = request.headers.get("If-Modified-Since")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        # HTTP dates have one-second resolution
+        return int(last_modified) <= since
+    return False
+
+
+def with_validators(response: Response, etag: str, last_modified: float) -> Response:
+    response.headers["ETag"] = etag
+    response.headers["Last-Modified"] = formatdate(last_modified, usegmt=True)
+    # Always revalidate: the ETag makes revalidation nearly free
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+class ResponseCache:
+    """Caches serialised responses of a view until one of its tables changes"""
+
+    def __init__(self, tables: Iterable[str], max_entries: int = 32,
+                 tracker: ChangeTracker = change_tracker):
+        self.tables = list(tables)
+        self.max_entries = max_entries
+        self.tracker = tracker
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self) -> str:
+        return request.full_path
+
+    def respond(self, build: Callable[[], object]) -> Response:
+        """Return a 304, the cached body, or the freshly built response"""
+        key = self._key()
+        stamp, etag, last_modified = validators(key, self.tables, self.tracker)
+
+        if is_not_modified(etag, last_modified):
+            return with_validators(make_response("", 304), etag, last_modified)
+
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None and cached[0] == stamp:
+                self._entries.move_to_end(key)
+                _stamp, body, mimetype = cached
+                return with_validators(Response(body, 200, mimetype=mimetype), etag, last_modified)
+
+        response = make_response(build())
+        if response.status_code != 200:
+            return response
+
+        with self._lock:
+            self._entries[key] = (stamp, response.get_data(), response.mimetype)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+        return with_validators(response, etag, last_modified)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+def cached_response(tables: Iterable[str], cache: Optional[ResponseCache] = None):
+    """Decorator applying a ResponseCache to a GET view"""
+    cache = cache or ResponseCache(tables)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != "GET":
+                return view(*args, **kwargs)
+            return cache.respond(lambda: view(*args, **kwargs))
+        wrapper.response_cache = cache
+        return wrapper
+    return decorator
@@ -0,0 +1,205 @@
+"""
+resumable_uploads.py
+
+Resumable, chunked uploads for large files such as whelping videos.
+
+The protocol follows tus (https://tus.io) in spirit: a client creates a
+session with the total length, then sends the bytes in PATCH requests that
+each carry the offset they start at. Every chunk is streamed from the request
+body straight into the session's .part file in CHUNK_SIZE pieces, so memory
+use does not depend on the file size. The size of the .part file is the
+acknowledged offset: after a dropped connection the client asks for it and
+continues from there instead of starting over.
+
+When the last byte arrives the file is hashed (again in chunks) and adopted
+by the content-addressed BlobStore, so the finished upload can be attached to
+a photo, document or other row by its content_hash like any other upload.
+Sessions live next to the blobs (uploads/.sessions) and survive restarts;
+abandoned sessions are removed after SESSION_TTL.
+"""
+
+import datetime
+import hashlib
+import json
+import os
+import re
+import threading
+import uuid
+import weakref
+from typing import Any, BinaryIO, Dict, List, Optional
+
+from server.config import debug_log
+from .blob_store import BlobStore, CHUNK_SIZE, normalise_extension
+
+SESSIONS_DIR = ".sessions"
+SESSION_TTL = datetime.timedelta(hours=int(os.getenv("UPLOAD_SESSION_TTL_HOURS", 24)))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_RESUMABLE_UPLOAD_BYTES", 2 * 1024 ** 3))
+
+_SESSION_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+class UploadSessionError(Exception):
+    """A request that does not fit the session's state; carries an HTTP status"""
+
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+
+class UploadSessions:
+    """Upload sessions stored as a JSON sidecar plus a .part file each"""
+
+    def __init__(self, store: BlobStore, max_bytes: int = MAX_UPLOAD_BYTES):
+        self.store = store
+        self.max_bytes = max_bytes
+        self.directory = os.path.join(store.root, SESSIONS_DIR)
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+
+    # ----- Files -----
+
+    def _meta_path(self, session_id: str) -> str:
+        return os.path.join(self.directory, f"{session_id}.json")
+
+    def _part_path(self, session_id: str) -> str:
+        return os.path.join(self.directory, f"{session_id}.part")
+
+    def _lock_for(self, session_id: str) -> threading.Lock:
+        with self._locks_lock:
+            return self._locks.setdefault(session_id, threading.Lock())
+
+    def _write_meta(self, session: Dict[str, Any]) -> None:
+        path = self._meta_path(session["id"])
+        with open(path + ".tmp", "w") as f:
+            json.dump(session, f)
+        os.replace(path + ".tmp", path)
+
+    def _discard(self, session_id: str) -> None:
+        for path in (self._meta_path(session_id), self._part_path(session_id)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        with self._locks_lock:
+            self._locks.pop(session_id, None)
+
+    # ----- Sessions -----
+
+    def create(self, length: int, filename: str, metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        if length is None or length <= 0:
+            raise UploadSessionError("Upload-Length must be a positive integer")
+        if length > self.max_bytes:
+            raise UploadSessionError(f"Uploads are limited to {self.max_bytes} bytes", 413)
+
+        os.makedirs(self.directory, exist_ok=True)
+        now = datetime.datetime.utcnow()
+        session = {
+            "id": uuid.uuid4().hex,
+            "length": length,
+            "filename": filename,
+            "metadata": metadata or {},
+            "created_at": now.isoformat(),
+            "expires_at": (now + SESSION_TTL).isoformat(),
+        }
+        open(self._part_path(session["id"]), "wb").close()
+        self._write_meta(session)
+        return dict(session, offset=0)
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """The session with its acknowledged offset, or None"""
+        if not _SESSION_ID.match(session_id or ""):
+            return None
+        try:
+            with open(self._meta_path(session_id)) as f:
+                session = json.load(f)
+            session["offset"] = os.path.getsize(self._part_path(session_id))
+        except (OSError, ValueError):
+            return None
+        return session
+
+    def append(self, session_id: str, offset: int, stream: BinaryIO,
+               content_length: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Write a chunk starting at offset and return the updated session.
+
+        A finished session additionally carries the stored "blob".
+        """
+        lock = self._lock_for(session_id)
+        if not lock.acquire(blocking=False):
+            raise UploadSessionError("Another chunk is being written to this upload", 409)
+        try:
+            session = self.get(session_id)
+            if session is None:
+                raise UploadSessionError("Upload not found", 404)
+            if offset != session["offset"]:
+                raise UploadSessionError(f"Upload-Offset must be {session['offset']}", 409)
+
+            remaining = session["length"] - offset
+            if content_length is not None and content_length > remaining:
+                raise UploadSessionError("Chunk extends past Upload-Length", 413)
+
+            written = 0
+            with open(self._part_path(session_id), "ab") as part:
+                while written < remaining:
+                    chunk = stream.read(min(CHUNK_SIZE, remaining - written))
+                    if not chunk:
+                        break
+                    part.write(chunk)
+                    written += len(chunk)
+                part.flush()
+                os.fsync(part.fileno())
+            session["offset"] = offset + written
+
+            if session["offset"] == session["length"]:
+                session["blob"] = self._finish(session)
+            return session
+        finally:
+            lock.release()
+
+    def _finish(self, session: Dict[str, Any]) -> Dict[str, Any]:
+        part_path = self._part_path(session["id"])
+        digest = hashlib.sha256()
+        with open(part_path, "rb") as part:
+            for chunk in iter(lambda: part.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+        blob = self.store.adopt(part_path, digest.hexdigest(), normalise_extension(session["filename"]))
+        self._discard(session["id"])
+        debug_log(f"UploadSessions: finished upload {session['id']} as blob {blob['content_hash']}")
+        return blob
+
+    def terminate(self, session_id: str) -> bool:
+        if self.get(session_id) is None:
+            return False
+        self._discard(session_id)
+        return True
+
+    def expire(self, now: Optional[datetime.datetime] = None) -> List[str]:
+        """Remove sessions past their expiry; returns their ids"""
+        now = now or datetime.datetime.utcnow()
+        expired = []
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return expired
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            session = self.get(name[:-len(".json")])
+            if session and datetime.datetime.fromisoformat(session["expires_at"]) <= now:
+                self._discard(session["id"])
+                expired.append(session["id"])
+        return expired
+
+
+_sessions: "weakref.WeakKeyDictionary[Any, UploadSessions]" = weakref.WeakKeyDictionary()
+_sessions_lock = threading.Lock()
+
+
+def get_upload_sessions(store: BlobStore) -> UploadSessions:
+    """Return the upload sessions writing into a blob store"""
+    with _sessions_lock:
+        sessions = _sessions.get(store)
+        if sessions is None:
+            sessions = UploadSessions(store)
+            _sessions[store] = sessions
+        return sessions
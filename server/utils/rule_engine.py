@@ -0,0 +1,379 @@
+"""
+rule_engine.py
+
+Evaluation of event_rules against dogs, litters and other entities.
+
+Rule conditions are compiled once into predicate closures and the active rules
+are indexed by (trigger_type, entity_type). The compiled index is cached until
+the event_rules table changes (tracked through the shared change counters), so
+processing an entity costs one dictionary lookup plus one predicate call per
+candidate rule. All events produced by one evaluation are checked against the
+entity's existing events with a single read and inserted with one bulk write.
+
+Conditions are JSON and may take any of these forms:
+
+    {"sex": "Female", "status": {"in": ["Active", "Breeding"]}}
+    [{"field": "weight", "operator": "gte", "value": 20}]
+    {"all": [...]}, {"any": [...]}, {"not": {...}}
+
+A field mapping to a dict of operators applies all of them. Supported operators
+are eq, ne, gt, gte, lt, lte, in, not_in, contains, exists and between.
+Dotted field names read nested values.
+"""
+
+import datetime
+import json
+import threading
+import weakref
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from server.database.db_interface import DatabaseInterface
+from server.database.change_tracker import change_tracker, ChangeTracker
+from server.config import debug_log
+from .dates import to_datetime
+
+Predicate = Callable[[Dict[str, Any]], bool]
+
+# Date each entity type's rule delays are counted from
+BASE_DATE_FIELDS = {
+    "litter": ("whelp_date", "expected_date"),
+    "dog": ("birth_date",),
+    "puppy": ("birth_date",),
+}
+
+ACTION_CREATE_EVENT = "create_event"
+
+
+class RuleConditionError(ValueError):
+    """Raised when a rule's conditions cannot be compiled"""
+
+
+def _lookup(entity: Dict[str, Any], field: str) -> Any:
+    value: Any = entity
+    for part in field.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+def _coerce_pair(actual: Any, expected: Any) -> Tuple[Any, Any]:
+    """Make stored values comparable with condition values (numbers, dates, strings)"""
+    if isinstance(expected, bool) or isinstance(actual, bool):
+        return actual, expected
+    if isinstance(expected, (int, float)) and isinstance(actual, str):
+        try:
+            return float(actual), expected
+        except ValueError:
+            return actual, expected
+    if isinstance(expected, str) and not isinstance(actual, str) and actual is not None:
+        if isinstance(actual, (datetime.date, datetime.datetime)):
+            return to_datetime(actual), to_datetime(expected)
+        return str(actual), expected
+    if isinstance(expected, str) and isinstance(actual, str):
+        expected_date, actual_date = to_datetime(expected), to_datetime(actual)
+        if expected_date is not None and actual_date is not None and len(expected) >= 10:
+            return actual_date, expected_date
+    return actual, expected
+
+
+def _compare(op: Callable[[Any, Any], bool]) -> Callable[[Any, Any], bool]:
+    def compare(actual, expected):
+        if actual is None:
+            return False
+        actual, expected = _coerce_pair(actual, expected)
+        try:
+            return op(actual, expected)
+        except TypeError:
+            return False
+    return compare
+
+
+def _equals(actual, expected):
+    if actual is None or expected is None:
+        return actual is expected
+    actual, expected = _coerce_pair(actual, expected)
+    return actual == expected
+
+
+def _contains(actual, expected):
+    if actual is None:
+        return False
+    if isinstance(actual, str):
+        return str(expected).lower() in actual.lower()
+    try:
+        return expected in actual
+    except TypeError:
+        # Numbers, dates and other non-containers never contain anything
+        return False
+
+
+def _between(actual, expected):
+    if not isinstance(expected, (list, tuple)) or len(expected) != 2:
+        raise RuleConditionError("between expects [low, high]")
+    return _compare(lambda a, low: a >= low)(actual, expected[0]) and \
+        _compare(lambda a, high: a <= high)(actual, expected[1])
+
+
+OPERATORS: Dict[str, Callable[[Any, Any], bool]] = {
+    "eq": _equals,
+    "ne": lambda actual, expected: not _equals(actual, expected),
+    "gt": _compare(lambda a, b: a > b),
+    "gte": _compare(lambda a, b: a >= b),
+    "lt": _compare(lambda a, b: a < b),
+    "lte": _compare(lambda a, b: a <= b),
+    "in": lambda actual, expected: any(_equals(actual, item) for item in expected),
+    "not_in": lambda actual, expected: not any(_equals(actual, item) for item in expected),
+    "contains": _contains,
+    "exists": lambda actual, expected: (actual not in (None, "")) == bool(expected),
+    "between": _between,
+}
+
+OPERATOR_ALIASES = {
+    "==": "eq", "=": "eq", "equals": "eq",
+    "!=": "ne", "not_equals": "ne",
+    ">": "gt", ">=": "gte", "<": "lt", "<=": "lte",
+}
+
+
+def _field_predicate(field: str, operator: str, expected: Any) -> Predicate:
+    operator = OPERATOR_ALIASES.get(operator, operator)
+    compare = OPERATORS.get(operator)
+    if compare is None:
+        raise RuleConditionError(f"Unknown operator '{operator}'")
+    if operator in ("in", "not_in"):
+        if not isinstance(expected, (list, tuple, set)):
+            raise RuleConditionError(f"'{operator}' expects a list")
+        expected = tuple(expected)
+    if operator == "between" and (not isinstance(expected, (list, tuple)) or len(expected) != 2):
+        raise RuleConditionError("between expects [low, high]")
+
+    def predicate(entity):
+        return compare(_lookup(entity, field), expected)
+    return predicate
+
+
+def _all(predicates: List[Predicate]) -> Predicate:
+    if len(predicates) == 1:
+        return predicates[0]
+    return lambda entity: all(predicate(entity) for predicate in predicates)
+
+
+def compile_conditions(conditions: Any) -> Predicate:
+    """Compile a rule's conditions into a predicate over entity dicts"""
+    if isinstance(conditions, str):
+        if not conditions.strip():
+            return lambda entity: True
+        try:
+            conditions = json.loads(conditions)
+        except json.JSONDecodeError as e:
+            raise RuleConditionError(f"Invalid conditions JSON: {str(e)}")
+
+    if not conditions:
+        return lambda entity: True
+
+    if isinstance(conditions, list):
+        return _all([compile_conditions(condition) for condition in conditions])
+
+    if not isinstance(conditions, dict):
+        raise RuleConditionError(f"Unsupported condition: {conditions!r}")
+
+    if "field" in conditions:
+        return _field_predicate(
+            conditions["field"],
+            conditions.get("operator", conditions.get("op", "eq")),
+            conditions.get("value"),
+        )
+
+    predicates: List[Predicate] = []
+    for key, value in conditions.items():
+        if key == "all":
+            predicates.append(_all([compile_conditions(c) for c in value] or [lambda entity: True]))
+        elif key == "any":
+            options = [compile_conditions(c) for c in value]
+            predicates.append(lambda entity, options=options: any(option(entity) for option in options))
+        elif key == "not":
+            inner = compile_conditions(value)
+            predicates.append(lambda entity, inner=inner: not inner(entity))
+        elif isinstance(value, dict):
+            predicates.extend(_field_predicate(key, operator, expected) for operator, expected in value.items())
+        elif isinstance(value, list):
+            predicates.append(_field_predicate(key, "in", value))
+        else:
+            predicates.append(_field_predicate(key, "eq", value))
+
+    return _all(predicates) if predicates else (lambda entity: True)
+
+
+def _json_field(value: Any) -> Any:
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except json.JSONDecodeError:
+            return value
+    return value
+
+
+def _is_active(rule: Dict[str, Any]) -> bool:
+    active = rule.get("active", rule.get("is_active", True))
+    return active is None or bool(active)
+
+
+class CompiledRule(NamedTuple):
+    rule: Dict[str, Any]
+    predicate: Predicate
+    action_type: str
+    action_data: Dict[str, Any]
+
+
+def _rule_entity_type(rule: Dict[str, Any], action_data: Dict[str, Any]) -> Optional[str]:
+    """The entity type a rule is limited to, or None if it applies to every entity"""
+    return rule.get("entity_type") or action_data.get("entity_type") or None
+
+
+class RuleEngine:
+    """Compiled, indexed event_rules kept in sync with the table's change counter"""
+
+    def __init__(self, db: DatabaseInterface, tracker: ChangeTracker = change_tracker):
+        self.db = db
+        self.tracker = tracker
+        self._index: Dict[Tuple[str, Optional[str]], List[CompiledRule]] = {}
+        self._version: Optional[int] = None
+        self._lock = threading.RLock()
+        self.invalid_rules: Dict[Any, str] = {}
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._version = None
+
+    def _ensure_loaded(self) -> None:
+        version = self.tracker.version("event_rules")
+        with self._lock:
+            if self._version == version:
+                return
+            rules = self.db.find_by_field_values("event_rules", {})
+            index: Dict[Tuple[str, Optional[str]], List[CompiledRule]] = {}
+            invalid: Dict[Any, str] = {}
+            for rule in rules or []:
+                if not _is_active(rule) or not rule.get("trigger_type"):
+                    continue
+                action_data = _json_field(rule.get("action_data")) or {}
+                if not isinstance(action_data, dict):
+                    action_data = {"data": action_data}
+                try:
+                    predicate = compile_conditions(_json_field(rule.get("conditions")))
+                except RuleConditionError as e:
+                    invalid[rule.get("id")] = str(e)
+                    debug_log(f"RuleEngine: skipping rule {rule.get('id')}: {str(e)}")
+                    continue
+                key = (rule["trigger_type"], _rule_entity_type(rule, action_data))
+                index.setdefault(key, []).append(
+                    CompiledRule(rule, predicate, rule.get("action_type") or ACTION_CREATE_EVENT, action_data)
+                )
+            self._index = index
+            self.invalid_rules = invalid
+            self._version = version
+        debug_log(f"RuleEngine: compiled {sum(len(v) for v in index.values())} rules")
+
+    def rules_for(self, trigger_type: str, entity_type: str) -> List[CompiledRule]:
+        """Active rules for a trigger that apply to the entity type"""
+        self._ensure_loaded()
+        with self._lock:
+            return self._index.get((trigger_type, entity_type), []) + self._index.get((trigger_type, None), [])
+
+    @staticmethod
+    def _event_for(compiled: CompiledRule, entity_type: str, entity: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        action_data = compiled.action_data
+        fields = [action_data["base_date_field"]] if action_data.get("base_date_field") \
+            else BASE_DATE_FIELDS.get(entity_type, ())
+        base_date = None
+        for field in fields:
+            base_date = to_datetime(entity.get(field))
+            if base_date is not None:
+                break
+        if base_date is None:
+            return None
+
+        event_date = (base_date + datetime.timedelta(days=action_data.get("days_delay", 0))).isoformat()
+        return {
+            "title": action_data.get("title", "Event"),
+            "description": action_data.get("description", ""),
+            "start_date": event_date,
+            "end_date": event_date,
+            "all_day": action_data.get("all_day", True),
+            "event_type": action_data.get("event_type", "custom"),
+            "related_type": entity_type,
+            "related_id": entity.get("id"),
+            "color": action_data.get("color", "#2196F3"),
+            "notify": action_data.get("notify", False),
+            "notify_days_before": action_data.get("notify_days_before", 0),
+            "recurring": action_data.get("recurring", "none"),
+        }
+
+    def evaluate(self, trigger_type: str, entity_type: str, entity: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Run every matching rule against an entity in one pass.
+
+        Returns {"results": [...per rule...], "events": [created events]}.
+        """
+        results: List[Dict[str, Any]] = []
+        planned: List[Tuple[CompiledRule, Dict[str, Any]]] = []
+
+        for compiled in self.rules_for(trigger_type, entity_type):
+            rule = compiled.rule
+            if not compiled.predicate(entity):
+                continue
+            if compiled.action_type != ACTION_CREATE_EVENT:
+                results.append({"rule_id": rule.get("id"), "rule_name": rule.get("name"),
+                                "action": compiled.action_type, "result": "Unsupported action type"})
+                continue
+            event = self._event_for(compiled, entity_type, entity)
+            if event is None:
+                results.append({"rule_id": rule.get("id"), "rule_name": rule.get("name"),
+                                "action": ACTION_CREATE_EVENT, "result": "No base date"})
+                continue
+            planned.append((compiled, event))
+
+        if not planned:
+            return {"results": results, "events": []}
+
+        # One duplicate check for the whole evaluation
+        existing = self.db.find_by_field_values("events", {
+            "related_type": entity_type,
+            "related_id": entity.get("id"),
+        })
+        seen = {(str(e.get("title")), str(e.get("event_type"))) for e in existing or []}
+
+        to_create: List[Dict[str, Any]] = []
+        creators: List[CompiledRule] = []
+        for compiled, event in planned:
+            key = (str(event["title"]), str(event["event_type"]))
+            if key in seen:
+                results.append({"rule_id": compiled.rule.get("id"), "rule_name": compiled.rule.get("name"),
+                                "action": ACTION_CREATE_EVENT, "result": "Event already exists"})
+                continue
+            seen.add(key)
+            to_create.append(event)
+            creators.append(compiled)
+
+        created = self.db.create_many("events", to_create) if to_create else []
+        for compiled, event in zip(creators, created):
+            results.append({"rule_id": compiled.rule.get("id"), "rule_name": compiled.rule.get("name"),
+                            "action": ACTION_CREATE_EVENT,
+                            "result": "Created event with ID " + str(event.get("id"))})
+
+        return {"results": results, "events": created}
+
+
+_engines: "weakref.WeakKeyDictionary[Any, RuleEngine]" = weakref.WeakKeyDictionary()
+_engines_lock = threading.Lock()
+
+
+def get_rule_engine(db: DatabaseInterface) -> RuleEngine:
+    """Return the rule engine shared by every blueprint using this database"""
+    with _engines_lock:
+        engine = _engines.get(db)
+        if engine is None:
+            engine = RuleEngine(db)
+            _engines[db] = engine
+        return engine
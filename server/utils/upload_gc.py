@@ -0,0 +1,279 @@
+"""
+upload_gc.py
+
+Garbage collection of uploaded files that no row refers to.
+
+Deleted rows do not always take their files with them, and failed uploads
+leave files with no row at all, so the uploads store only grows. The
+collector builds the set of referenced keys and content hashes from every
+table that points at uploads (reading each table page by page), then walks
+the store in key order, one page at a time, so the listing is never held in
+memory:
+
+1. Scan: files that are older than GRACE_PERIOD (an upload may still be
+   writing its row) and unreferenced are moved to
+   quarantine/<timestamp>/<key>. Blobs are re-checked against the database
+   and the blob store's pins under its lock just before the move, as
+   release() does. Expired pins are removed.
+2. Purge: quarantined files older than QUARANTINE_PERIOD are deleted and
+   their bytes counted as reclaimed; files that became referenced again are
+   moved back instead.
+
+Each page is recorded in a JSON checkpoint, so an interrupted run resumes
+after the last key it finished. dry_run reports what would be quarantined and
+deleted without touching anything.
+"""
+
+import datetime
+import json
+import os
+from typing import Any, Callable, Dict, Iterable, Optional, Set
+
+from server.database.db_interface import DatabaseInterface
+from server.config import debug_log
+from server.storage import STORES
+from .blob_store import BlobStore, is_content_hash, REFERENCE_TABLES, PINS_TABLE, PIN_TTL
+from .dates import to_datetime
+from .cover_photos import ENTITY_TABLES
+
+QUARANTINE_DIR = "quarantine"
+
+# Files younger than this are never collected
+GRACE_PERIOD = datetime.timedelta(hours=float(os.getenv("UPLOAD_GC_GRACE_HOURS", 24)))
+# How long collected files stay in quarantine before they are deleted
+QUARANTINE_PERIOD = datetime.timedelta(days=float(os.getenv("UPLOAD_GC_QUARANTINE_DAYS", 7)))
+
+PAGE_SIZE = 1000
+
+# Rows of these tables hold upload URLs and content hashes (in any column)
+GC_REFERENCE_TABLES = REFERENCE_TABLES + tuple(ENTITY_TABLES.values())
+
+# Other stores kept under the uploads directory have their own references
+SKIPPED_DIRS = frozenset(name for name in STORES if name != "uploads") | {QUARANTINE_DIR}
+
+_STAMP_FORMAT = "%Y%m%dT%H%M%S"
+
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.utcnow()
+
+
+def key_hash(key: str) -> Optional[str]:
+    """The content hash a blob, rendition or compressed sibling is named after, if any"""
+    name = key.rsplit("/", 1)[-1]
+    return name[:64] if len(name) >= 64 and is_content_hash(name[:64]) else None
+
+
+class References:
+    """Keys and content hashes referenced by database rows"""
+
+    def __init__(self, key_for: Callable[[Optional[str]], Optional[str]]):
+        self.key_for = key_for
+        self.keys: Set[str] = set()
+        # 32 raw bytes per hash rather than a 64-character string
+        self.hashes: Set[bytes] = set()
+
+    def add(self, value: Any) -> None:
+        """Record every URL or content hash in a column value (walking JSON columns)"""
+        if isinstance(value, dict):
+            for item in value.values():
+                self.add(item)
+        elif isinstance(value, (list, tuple)):
+            for item in value:
+                self.add(item)
+        elif isinstance(value, str):
+            if is_content_hash(value):
+                self.hashes.add(bytes.fromhex(value))
+                return
+            key = self.key_for(value) if value.startswith(("/", "http")) else None
+            if key is not None:
+                self.keys.add(key)
+                digest = key_hash(key)
+                if digest:
+                    self.hashes.add(bytes.fromhex(digest))
+
+    def __contains__(self, key: str) -> bool:
+        if key in self.keys:
+            return True
+        digest = key_hash(key)
+        return digest is not None and bytes.fromhex(digest) in self.hashes
+
+
+class GCCheckpoint:
+    """Phase, last finished key and totals of a collection run, stored as JSON"""
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.state: Dict[str, Any] = {}
+
+    def load(self) -> Dict[str, Any]:
+        if self.path and os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.state = json.load(f)
+        return self.state
+
+    def save(self, **state: Any) -> None:
+        self.state.update(state)
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(dict(self.state, updated_at=_now().isoformat()), f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self) -> None:
+        self.state = {}
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class UploadCollector:
+    """Quarantines, then deletes, uploaded files that no row references"""
+
+    def __init__(self, db: DatabaseInterface, store: BlobStore,
+                 grace_period: datetime.timedelta = GRACE_PERIOD,
+                 quarantine_period: datetime.timedelta = QUARANTINE_PERIOD,
+                 page_size: int = PAGE_SIZE, checkpoint_path: Optional[str] = None,
+                 reference_tables: Iterable[str] = GC_REFERENCE_TABLES, dry_run: bool = False,
+                 progress: Optional[Callable[..., None]] = None, now: Callable[[], datetime.datetime] = _now):
+        if page_size < 1:
+            raise ValueError("page_size must be at least 1")
+        self.db = db
+        self.store = store
+        self.storage = store.storage
+        self.grace_period = grace_period
+        self.quarantine_period = quarantine_period
+        self.page_size = page_size
+        self.reference_tables = tuple(reference_tables)
+        self.dry_run = dry_run
+        self.checkpoint = GCCheckpoint(None if dry_run else checkpoint_path)
+        self.progress = progress or (lambda done, total=None, message=None: None)
+        self.now = now
+        self.stats = {"scanned": 0, "scanned_bytes": 0, "young": 0, "quarantined": 0, "quarantined_bytes": 0,
+                      "deleted": 0, "reclaimed_bytes": 0, "restored": 0, "expired_pins": 0}
+
+    def references(self) -> References:
+        """Read every reference table page by page; a table that cannot be read stops the run"""
+        references = References(self.storage.key_for)
+        for table in self.reference_tables:
+            rows = 0
+            for row in self.db.scan(table, page_size=self.page_size):
+                for column, value in row.items():
+                    if column != "id":
+                        references.add(value)
+                rows += 1
+            debug_log(f"UploadCollector: read {rows} rows of {table}")
+        return references
+
+    def run(self, resume: bool = True) -> Dict[str, Any]:
+        state = self.checkpoint.load() if resume else {}
+        if state.get("phase") == "done" or not resume:
+            self.checkpoint.clear()
+            state = {}
+        self.stats.update(state.get("stats") or {})
+        started = state.get("started_at") or self.now().strftime(_STAMP_FORMAT)
+        self.checkpoint.save(started_at=started)
+
+        # Always fresh: rows may have changed while a run was interrupted
+        references = self.references()
+        if state.get("phase", "scan") == "scan":
+            self._scan(references, datetime.datetime.strptime(started, _STAMP_FORMAT), state.get("last_key"))
+            state = {}
+        self._purge(references, state.get("last_key"))
+        self._expire_pins()
+
+        self.checkpoint.save(phase="done", last_key=None, stats=self.stats)
+        return dict(self.stats, dry_run=self.dry_run)
+
+    def _pages(self, prefix: str, last_key: Optional[str]):
+        while True:
+            page = self.storage.list(prefix, start_after=last_key, limit=self.page_size)
+            if not page:
+                return
+            yield page
+            last_key = page[-1]["key"]
+            if len(page) < self.page_size:
+                return
+
+    def _scan(self, references: References, started: datetime.datetime, last_key: Optional[str]) -> None:
+        cutoff = (started - self.grace_period).replace(tzinfo=datetime.timezone.utc).timestamp()
+        stamp = started.strftime(_STAMP_FORMAT)
+        for page in self._pages("", last_key):
+            for stored in page:
+                key = stored["key"]
+                if key.split("/", 1)[0] in SKIPPED_DIRS:
+                    continue
+                self.stats["scanned"] += 1
+                self.stats["scanned_bytes"] += stored["size"]
+                if stored["modified"] is None or stored["modified"] > cutoff:
+                    self.stats["young"] += 1
+                elif key not in references and self._quarantine(key, stamp):
+                    self.stats["quarantined"] += 1
+                    self.stats["quarantined_bytes"] += stored["size"]
+            self.checkpoint.save(phase="scan", last_key=page[-1]["key"], stats=self.stats)
+            self.progress(self.stats["scanned"], None, f"Scanned up to {page[-1]['key']}")
+
+    def _quarantine(self, key: str, stamp: str) -> bool:
+        if self.dry_run:
+            return True
+        digest = key_hash(key)
+        # The same lock as BlobStore.release(): an upload cannot re-reference the blob mid-move
+        with self.store._lock:
+            if digest and self.store.in_use(digest):
+                return False
+            try:
+                self.storage.move(key, f"{QUARANTINE_DIR}/{stamp}/{key}")
+            except FileNotFoundError:
+                return False
+        return True
+
+    def _purge(self, references: References, last_key: Optional[str]) -> None:
+        expired = (self.now() - self.quarantine_period).strftime(_STAMP_FORMAT)
+        for page in self._pages(f"{QUARANTINE_DIR}/", last_key):
+            for stored in page:
+                _, stamp, key = stored["key"].split("/", 2)
+                if stamp > expired:
+                    # Keys sort by quarantine time: everything after this is newer
+                    self.checkpoint.save(phase="purge", last_key=None, stats=self.stats)
+                    return
+                self._expire(stored, key, references)
+            self.checkpoint.save(phase="purge", last_key=page[-1]["key"], stats=self.stats)
+            self.progress(self.stats["scanned"], None, f"Purged up to {page[-1]['key']}")
+
+    def _expire(self, stored: Dict[str, Any], key: str, references: References) -> None:
+        digest = key_hash(key)
+        if self.dry_run:
+            if key not in references:
+                self.stats["deleted"] += 1
+                self.stats["reclaimed_bytes"] += stored["size"]
+            return
+        with self.store._lock:
+            referenced = key in references or bool(digest and self.store.in_use(digest))
+            if referenced and not self.storage.exists(key):
+                self.storage.move(stored["key"], key)
+                self.stats["restored"] += 1
+                return
+            # Unreferenced, or stored again since it was quarantined
+            if self.storage.delete(stored["key"]):
+                self.stats["deleted"] += 1
+                self.stats["reclaimed_bytes"] += stored["size"]
+
+    def _expire_pins(self) -> None:
+        """Remove blob pins left behind by workers that never wrote their row"""
+        cutoff = self.now() - PIN_TTL
+        try:
+            expired = [row["id"] for row in self.db.scan(PINS_TABLE, page_size=self.page_size)
+                       if (to_datetime(row.get("pinned_at")) or datetime.datetime.min) <= cutoff]
+        except Exception as e:
+            debug_log(f"UploadCollector: could not read {PINS_TABLE}: {str(e)}")
+            return
+        if self.dry_run:
+            self.stats["expired_pins"] += len(expired)
+            return
+        for row_id in expired:
+            try:
+                self.db.delete(PINS_TABLE, row_id)
+                self.stats["expired_pins"] += 1
+            except Exception as e:
+                debug_log(f"UploadCollector: could not remove pin {row_id}: {str(e)}")
@@ -0,0 +1,141 @@
+"""
+upload_serving.py
+
+Serving of files under /uploads.
+
+Content-addressed blobs (and renditions named after them) never change, so
+they are sent with a year-long `Cache-Control: immutable` and their content
+hash as a strong ETag; browsers and CDNs then never ask again. Other uploads
+are revalidated with a conditional request. Range requests (video seeking,
+resumed downloads) and 304 responses are answered by send_file.
+
+When a front proxy is configured the worker does not stream bytes at all:
+- UPLOADS_ACCEL_REDIRECT=/internal-uploads/ answers with an X-Accel-Redirect
+  header for nginx to serve the file from an internal location, and
+- UPLOADS_X_SENDFILE=true lets send_file emit X-Sendfile for Apache/lighttpd.
+
+Compressible documents are stored with .br/.gz siblings (see BlobStore), which
+are served with Content-Encoding when the client accepts them.
+
+When uploads live on a remote backend (S3) without a public URL, /uploads
+answers with a redirect to a short-lived presigned download instead; files
+still on local disk from before the move are served as above.
+"""
+
+import mimetypes
+import os
+import re
+from typing import Optional
+
+from flask import Response, jsonify, redirect, request, send_file
+from werkzeug.security import safe_join
+
+from server.storage import StorageBackend, StorageError
+
+from .blob_store import BLOBS_DIR, COMPRESSED_VARIANTS
+from .image_derivatives import DERIVATIVES_DIR
+from .upload_gc import QUARANTINE_DIR
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+MUTABLE_MAX_AGE = 60 * 60
+# Lifetime of the presigned downloads /uploads redirects to; the redirect is cached for less
+PRESIGNED_GET_EXPIRES = 60 * 60
+
+_HASH_NAME = re.compile(r"^([0-9a-f]{64})(?:_[a-z]+)?\.[0-9a-z]+$")
+
+
+def content_hash_of(filename: str) -> Optional[str]:
+    """The content hash a blob or rendition path is named after, if any"""
+    parts = filename.split("/")
+    if parts[0] not in (BLOBS_DIR, DERIVATIVES_DIR):
+        return None
+    match = _HASH_NAME.match(parts[-1])
+    return match.group(1) if match else None
+
+
+def is_private(filename: str) -> bool:
+    """
+    Whether a path points into the store's own bookkeeping: dot-directories
+    (upload sessions, multipart parts, GC checkpoints, incoming files) and
+    quarantined files, which are kept only so they can be restored.
+    """
+    parts = filename.split("/")
+    return parts[0] == QUARANTINE_DIR or any(part.startswith(".") for part in parts)
+
+
+def cache_control(immutable: bool) -> str:
+    if immutable:
+        return f"public, max-age={IMMUTABLE_MAX_AGE}, immutable"
+    return f"public, max-age={MUTABLE_MAX_AGE}, must-revalidate"
+
+
+def _accepted_encodings() -> set:
+    header = request.headers.get("Accept-Encoding", "")
+    return {part.split(";")[0].strip().lower() for part in header.split(",") if part.strip()}
+
+
+def _precompressed(path: str, filename: str):
+    """(path, encoding) of a stored compressed variant the client accepts, if any"""
+    if os.path.splitext(filename)[1].lower().lstrip(".") not in COMPRESSED_VARIANTS:
+        return None, None
+    accepted = _accepted_encodings()
+    for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+        if encoding in accepted and os.path.isfile(path + suffix):
+            return path + suffix, encoding
+    return None, None
+
+
+def serve_upload(root: str, filename: str, accel_prefix: Optional[str] = None) -> Response:
+    """Send one file from the uploads directory"""
+    path = safe_join(root, filename)
+    if path is None or is_private(filename):
+        return jsonify({"error": "File not found"}), 404
+
+    digest = content_hash_of(filename)
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+    if accel_prefix:
+        # nginx serves the bytes (with ranges and its own 404) from an internal location
+        response = Response(status=200, mimetype=mimetype)
+        response.headers["X-Accel-Redirect"] = accel_prefix.rstrip("/") + "/" + filename
+        response.headers["Cache-Control"] = cache_control(digest is not None)
+        return response
+
+    send_path, encoding = _precompressed(path, filename)
+    try:
+        response = send_file(
+            send_path or path,
+            mimetype=mimetype,
+            conditional=True,
+            etag=f"{digest}{'-' + encoding if encoding else ''}" if digest else True,
+            max_age=IMMUTABLE_MAX_AGE if digest else MUTABLE_MAX_AGE,
+        )
+    except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+        return jsonify({"error": "File not found"}), 404
+
+    response.headers["Cache-Control"] = cache_control(digest is not None)
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    if os.path.splitext(filename)[1].lower().lstrip(".") in COMPRESSED_VARIANTS:
+        response.vary.add("Accept-Encoding")
+    return response
+
+
+def serve_stored(storage: StorageBackend, root: str, filename: str,
+                 accel_prefix: Optional[str] = None) -> Response:
+    """Send one upload from local disk, or redirect to it on a remote backend"""
+    if is_private(filename):
+        return jsonify({"error": "File not found"}), 404
+    path = safe_join(root, filename)
+    if storage.local or (path is not None and os.path.isfile(path)):
+        return serve_upload(root, filename, accel_prefix)
+
+    try:
+        url = storage.presigned_get(filename, PRESIGNED_GET_EXPIRES) if storage.exists(filename) else None
+    except StorageError:
+        url = None
+    if not url:
+        return jsonify({"error": "File not found"}), 404
+    response = redirect(url, 302)
+    response.headers["Cache-Control"] = f"private, max-age={PRESIGNED_GET_EXPIRES // 2}"
+    return response